@@ -1,15 +1,41 @@
-import os, requests, re, pytz, logging
-from flask import Flask, request, abort
+import os, requests, re, pytz, threading, logging, time
+from contextvars import copy_context
+from typing import Any
+from bstrong.config import LOG_CONFIGURE_ON_IMPORT
+from bstrong.logs import configure_logging, sample_request, end_request
+if LOG_CONFIGURE_ON_IMPORT:
+    configure_logging()  # first, so every line logged while the app loads is formatted
+from bstrong.compat import init_cooperative
+init_cooperative()  # before any gRPC-based Google client exists
+from flask import Flask, request, abort, g
 from datetime import datetime, timedelta, timezone
-from bstrong.config import Config
-from bstrong.utils import send_sms, send_Dev, fix_phone_number
+from bstrong.config import Config, VENDOR_RATE_LIMITS, CATALOG_REFRESH_SECONDS, PIN_INDEX_REFRESH_SECONDS, PIN_INDEX_MAX_AGE_SECONDS, GUEST_POOL_SIZE, GUEST_POOL_REFRESH_SECONDS, RATE_LIMIT_BACKEND
+from bstrong.config import TICKET_FILTER_CAPACITY, TICKET_FILTER_FP_RATE, TICKET_FILTER_REFRESH_SECONDS
+from bstrong.config import DEAD_LETTER_REPLAY_SECONDS, DEAD_LETTER_MAX_ATTEMPTS, DEAD_LETTER_BACKOFF_SECONDS, DEAD_LETTER_MAX_BACKOFF_SECONDS, WEBHOOK_MAX_BYTES
+from bstrong.config import SINGLE_FLIGHT_LEASE_SECONDS, FORM_WAIT_SECONDS, FORM_VAGARO_PREFETCH
+from bstrong.config import FIRESTORE_JOURNAL_PATH, FIRESTORE_WRITE_BUDGET_SECONDS, FIRESTORE_JOURNAL_REPLAY_SECONDS
+from bstrong.ratelimit import use_firestore_backend, get_limiter
+from bstrong import metrics
+from bstrong.tracing import begin_trace, end_trace, TRACE_HEADER
+from bstrong import logs
+from bstrong.metrics import stage, outcome
+from bstrong.guest_pool import GuestPool
+from bstrong.bulk_ops import BulkOperation, JOB_COLLECTION
+from bstrong.catalog import membership_catalog
+from bstrong.pin_index import PinIndex
+from bstrong.ticket_filter import TicketFilter
+from bstrong.deadletter import DeadLetterQueue, PermanentFailure
+from bstrong.singleflight import SingleFlight
+from bstrong.form_waiter import FormWaiter
+from bstrong.payloads import FormEvent, InvalidPayload, TransactionEvent, WAIVER_FORM_ID, ignorable_form, ignorable_transaction, parse_form, parse_transaction
+from bstrong.utils import send_sms, send_Dev, send_Owners, alerts, fix_phone_number, parse_form_answers
 from bstrong.services import create_door_code, extend_remotelock_code, get_next_month_anniversary
 from bstrong.database import Database
+from bstrong.journal import WriteJournal, JournaledDatabase
 from bstrong.api_clients import RemoteLockClient, VagaroClient, PinConflictError
 from google.cloud import firestore
 from twilio.request_validator import RequestValidator
 
-logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s %(message)s")
 logging.getLogger('twilio.http_client').setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
@@ -19,8 +45,98 @@ Owner1 = Config.get("OWNER_PHONE_NUMBER_1")
 Owner2 = Config.get("OWNER_PHONE_NUMBER_2")
 miscCustomerID = Config.get("MISC_PERSON_CUSTID")
 dataBase = Database()
-rl_client = RemoteLockClient()
+write_journal = WriteJournal(FIRESTORE_JOURNAL_PATH) if FIRESTORE_JOURNAL_PATH else None
+if write_journal:
+    dataBase = JournaledDatabase(dataBase, write_journal, FIRESTORE_WRITE_BUDGET_SECONDS)
+if RATE_LIMIT_BACKEND == "firestore":
+    use_firestore_backend(dataBase)
+pin_index = PinIndex()
+rl_client = RemoteLockClient(pin_index=pin_index)
 vagaro_client = VagaroClient()
+guest_pool = GuestPool(dataBase, rl_client, GUEST_POOL_SIZE) if GUEST_POOL_SIZE > 0 else None
+ticket_filter = TicketFilter(TICKET_FILTER_CAPACITY, TICKET_FILTER_FP_RATE)
+transaction_flights = SingleFlight("transaction", dataBase, SINGLE_FLIGHT_LEASE_SECONDS)
+customer_flights = SingleFlight("customer")
+form_waiter = FormWaiter(FORM_WAIT_SECONDS)
+# The replay and give-up handlers are defined below, next to the webhook they share code with.
+dead_letters = DeadLetterQueue(
+    dataBase, lambda key, entry: replay_transaction(key, entry), lambda key, entry: dead_letter_failed(key, entry),
+    max_attempts=DEAD_LETTER_MAX_ATTEMPTS, backoff=DEAD_LETTER_BACKOFF_SECONDS, max_backoff=DEAD_LETTER_MAX_BACKOFF_SECONDS,
+)
+
+if CATALOG_REFRESH_SECONDS > 0:
+    membership_catalog.start_refresh(dataBase, CATALOG_REFRESH_SECONDS)
+if PIN_INDEX_REFRESH_SECONDS > 0:
+    pin_index.start_refresh(rl_client, PIN_INDEX_REFRESH_SECONDS)
+if guest_pool:
+    guest_pool.start_replenisher(GUEST_POOL_REFRESH_SECONDS)
+if TICKET_FILTER_REFRESH_SECONDS > 0:
+    ticket_filter.start_refresh(dataBase, TICKET_FILTER_REFRESH_SECONDS)
+if DEAD_LETTER_REPLAY_SECONDS > 0:
+    dead_letters.start(DEAD_LETTER_REPLAY_SECONDS)
+if form_waiter.enabled:
+    form_waiter.start_listening(dataBase)
+if write_journal and FIRESTORE_JOURNAL_REPLAY_SECONDS > 0:
+    dataBase.start_replay(FIRESTORE_JOURNAL_REPLAY_SECONDS)
+
+metrics.COMPONENT_GAUGES.set_function(pin_index.staleness, component="pin_index", field="staleness_seconds")
+metrics.COMPONENT_GAUGES.set_function(lambda: pin_index.stats()["pins"], component="pin_index", field="pins")
+for _vendor in VENDOR_RATE_LIMITS:
+    metrics.COMPONENT_GAUGES.set_function(lambda v=_vendor: get_limiter(v).waited_seconds, component=f"ratelimit_{_vendor}", field="waited_seconds")
+    metrics.COMPONENT_GAUGES.set_function(lambda v=_vendor: get_limiter(v).rejected, component=f"ratelimit_{_vendor}", field="rejected")
+if guest_pool:
+    metrics.COMPONENT_GAUGES.set_function(lambda: guest_pool.claimed, component="guest_pool", field="claimed")
+    metrics.COMPONENT_GAUGES.set_function(lambda: guest_pool.misses, component="guest_pool", field="misses")
+for _field in ("entries", "removed", "memory_bytes", "estimated_fp_rate", "observed_fp_rate", "skipped", "false_positives"):
+    metrics.COMPONENT_GAUGES.set_function(lambda f=_field: ticket_filter.stats()[f], component="ticket_filter", field=_field)
+metrics.COMPONENT_GAUGES.set_function(form_waiter.waiting, component="form_waiter", field="waiting")
+if write_journal:
+    metrics.COMPONENT_GAUGES.set_function(write_journal.pending, component="write_journal", field="pending")
+metrics.COMPONENT_GAUGES.set_function(lambda: logs.stats()["queued"], component="logging", field="queued")
+metrics.COMPONENT_GAUGES.set_function(lambda: logs.stats()["dropped"], component="logging", field="dropped")
+metrics.COMPONENT_GAUGES.set_function(lambda: alerts.stats()["queued"], component="alerts", field="queued")
+metrics.COMPONENT_GAUGES.set_function(lambda: alerts.stats()["held"], component="alerts", field="held")
+
+
+def alert_owners(body: str) -> None:
+    send_Owners((Owner1, Owner2), body)
+
+
+# Probe and scrape endpoints are not worth a trace each.
+UNTRACED_ROUTES = {"/health", "/metrics"}
+
+
+@app.before_request
+def _begin_request() -> None:
+    g.metrics_route = request.url_rule.rule if request.url_rule else "unmatched"
+    g.metrics_started = time.perf_counter()
+    metrics.IN_FLIGHT.inc(route=g.metrics_route)
+    g.log_token = sample_request(g.metrics_route)
+    if g.metrics_route not in UNTRACED_ROUTES:
+        g.trace, g.trace_token = begin_trace(f"{request.method} {g.metrics_route}", request.headers.get(TRACE_HEADER))
+
+
+@app.after_request
+def _tag_response(response):
+    g.metrics_status = response.status_code
+    if "trace" in g:
+        response.headers[TRACE_HEADER] = g.trace.trace_id
+    return response
+
+
+@app.teardown_request
+def _finish_request(exc: BaseException | None) -> None:
+    started = g.pop("metrics_started", None)
+    if started is None:
+        return
+    route = g.metrics_route
+    metrics.IN_FLIGHT.dec(route=route)
+    status = g.pop("metrics_status", 500)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, route=route, status=str(status))
+    if "trace" in g:
+        end_trace(g.pop("trace"), g.pop("trace_token"), status=status)
+    end_request(g.pop("log_token"))
+
 
 # --- Daily Cron Job for Expirations ----------------------
 @app.route("/cron-expire", methods=['POST'])
@@ -46,14 +162,34 @@ def cron_expire_memberships():
             dataBase.delete('active_autopays', doc.id)
             count += 1
 
-        logger.info(f"Cron success. Processed and texted {count} expired autopay members.")
+        logger.info("Cron success. Processed and texted %s expired autopay members.", count)
         return f"Processed {count} expirations.", 200
 
     except Exception as e:
-        logger.error(f"Error during expiration cron job: {e}")
+        logger.error("Error during expiration cron job: %s", e)
         send_Dev(f"Expiration cron job failed: {e}")
         return "Error during cron execution", 500
 
+# --- Vagaro Webhook Bodies ---------------------------------------------
+def webhook_body() -> bytes | None:
+    """The raw body of a Vagaro webhook, None unless it is JSON. Oversized bodies are refused before they are read."""
+    if (request.content_length or 0) > WEBHOOK_MAX_BYTES:
+        abort(413)
+    if not request.is_json:
+        return None
+    body = request.stream.read(WEBHOOK_MAX_BYTES + 1)
+    if len(body) > WEBHOOK_MAX_BYTES:
+        abort(413)
+    return body
+
+
+class WebhookRejected(Exception):
+    """A webhook answered without doing any work. str() is the response body, `status` its code."""
+
+    def __init__(self, response: str, status: int):
+        super().__init__(response)
+        self.status = status
+
 # --- Form Webhook Handler ----------------------------------------------
 @app.route("/webhook-form", methods=['POST'])
 def form_webhook():
@@ -62,62 +198,141 @@ def form_webhook():
     if received_token != expected_token:
         abort(403, "Invalid X-Vagaro-Signature")
 
-    data = request.get_json(silent=True)
-    if not data or "payload" not in data:
-        return "No valid payload found", 400
+    try:
+        event = waiver_form(webhook_body())
+    except WebhookRejected as e:
+        return str(e), e.status
 
-    payload = data["payload"]
+    customer_id = event.customer_id
+    try:
+        Person = pending_form(event)
+        dataBase.add(collection='pending_customers', key=customer_id, data=Person)
+        form_stored(customer_id, Person)
+        return "Success", 200
 
-    if payload.get("formId") != "67842fd8f276412c07c20490":
-        logger.info(f"Ignoring form webhook for formId: {payload.get('formId')}, wrong form")
-        return "Not the correct form, ignoring.", 200
+    except Exception as e:
+        return form_failed(customer_id, e)
 
-    customer_id = payload.get("customerId")
-    if not customer_id:
-        logger.warning("No customerId found in form webhook.")
-        return "Missing customerId", 400
 
+def waiver_form(body: bytes | None) -> FormEvent:
+    """The waiver form a form webhook carries, with its customerId. Raises WebhookRejected for anything else."""
+    if body is None:
+        raise WebhookRejected("No valid payload found", 400)
+    if ignorable_form(body):
+        logger.info("Ignoring form webhook for another form.")
+        raise WebhookRejected("Not the correct form, ignoring.", 200)
     try:
-        questions = payload["questionsAndAnswers"]
+        event = parse_form(body)
+    except InvalidPayload as e:
+        logger.warning("Rejected form webhook: %s", e)
+        raise WebhookRejected("No valid payload found", 400) from e
 
-        first_name = None
-        last_name = None
-        phone_number = None
-        for q in questions:
-            question_text = q.get("question", "")
-            answers_list = q.get("answer", [])
+    if event.form_id != WAIVER_FORM_ID:
+        logger.info("Ignoring form webhook for formId: %s, wrong form", event.form_id)
+        raise WebhookRejected("Not the correct form, ignoring.", 200)
 
-            if not answers_list:
-                continue
+    if not event.customer_id:
+        logger.warning("No customerId found in form webhook.")
+        raise WebhookRejected("Missing customerId", 400)
+    return event
+
+
+def pending_form(event: FormEvent) -> dict:
+    """The pending_customers record for a waiver form."""
+    if event.questions is None:
+        raise KeyError("questionsAndAnswers")
+    answers = parse_form_answers(event.questions)
+    first_name = answers["first_name"]
+    last_name = answers["last_name"]
+    phone_number = answers["phone_number"]
+
+    return {
+        'first_name' : first_name,
+        'last_name' : last_name,
+        'phone_number': phone_number,
+        **resolve_form(first_name, last_name, phone_number),
+        'timestamp': firestore.SERVER_TIMESTAMP
+    }
+
+
+def form_stored(customer_id: str, person: dict) -> None:
+    """Wake the transactions waiting for this form, and start filling it from Vagaro if it is unresolved."""
+    form_waiter.notify(customer_id)
+    logger.info("Stored pending form data for customer %s: %s %s", customer_id, person['first_name'], person['last_name'])
+    if not person['resolved'] and FORM_VAGARO_PREFETCH:
+        start_prefetch(customer_id, person['first_name'], person['last_name'])
+
+
+def form_failed(customer_id: str, e: Exception) -> tuple[str, int]:
+    logger.error("Error processing form webhook for customer %s: %s", customer_id, e)
+    send_Dev(f"Failed to process form for customer {customer_id}: {e}")
+    return "Error processing form data", 500
+
+
+def resolve_form(first: str | None, last: str | None, phone_raw: str | None) -> dict:
+    """
+    Fields added to a pending form when it is stored: `phone` in E.164 when the
+    number is valid, and `resolved` once name and phone are all usable, so the
+    transaction can take the record as is.
+    """
+    fields = {'resolved': False}
+    try:
+        result = fix_phone_number(phone_raw)
+    except Exception as e:
+        logger.warning("Error parsing phone from form: %s. The transaction will use the API for it.", e)
+        return fields
+    if result.get('valid'):
+        fields['phone'] = result.get('number')
+        fields['resolved'] = bool(first and last)
+    return fields
 
-            try:
-                raw_answer = answers_list[0]
-                clean_answer = re.sub(r'<[^>]+>', '', raw_answer).strip()
-
-                if "First Name" in question_text:
-                    first_name = clean_answer
-                elif "Last Name" in question_text:
-                    last_name = clean_answer
-                elif "CELL #" in question_text:
-                    phone_number = clean_answer
-            except IndexError:
-                logger.warning(f"IndexError on form question: {q}")
-
-        Person = {
-            'first_name' : first_name,
-            'last_name' : last_name,
-            'phone_number': phone_number,
-            'timestamp': firestore.SERVER_TIMESTAMP
-        }
 
-        dataBase.add(collection='pending_customers', key=customer_id, data=Person)
-        logger.info(f"Stored pending form data for customer {customer_id}: {first_name} {last_name}")
-        return "Success", 200
+def start_prefetch(customer_id: str, first: str | None, last: str | None) -> None:
+    """Fill an unresolved pending form from the Vagaro profile on a background thread."""
+    threading.Thread(target=copy_context().run, args=(prefetch_customer, customer_id, first, last),
+                     name=f"form-prefetch-{customer_id}", daemon=True).start()
+
+
+def prefetch_customer(customer_id: str, first: str | None, last: str | None) -> None:
+    """Resolve a pending form's missing name or phone from Vagaro and store them on the form."""
+    try:
+        with stage("form", "vagaro_prefetch"):
+            first, last, phone = resolve_from_vagaro(customer_id, first, last)
+    except Exception as e:
+        logger.warning("Vagaro prefetch failed for customer %s; the transaction will retry it: %s", customer_id, e)
+        outcome("form", "prefetch_failed")
+        return
+    if not (first and last and phone):
+        logger.warning("Vagaro prefetch for customer %s left incomplete data: first=%s, last=%s", customer_id, first, last)
+        outcome("form", "prefetch_failed")
+        return
 
+    try:
+        # update() fails if the transaction already consumed the form, which is what we want.
+        dataBase.update('pending_customers', customer_id, {'first_name': first, 'last_name': last, 'phone': phone, 'resolved': True})
     except Exception as e:
-        logger.error(f"Error processing form webhook for customer {customer_id}: {e}")
-        send_Dev(f"Failed to process form for customer {customer_id}: {e}")
-        return "Error processing form data", 500
+        logger.info("Pending form for customer %s was gone before the prefetch finished: %s", customer_id, e)
+        return
+    logger.info("Prefetched Vagaro profile for customer %s.", customer_id)
+    outcome("form", "prefetched")
+
+
+def pending_customer(customer_id: str, customer_data: dict) -> tuple[str | None, str | None, str | None]:
+    """Name and phone from a pending form; the phone is None unless it is usable. Resolved forms are used as stored."""
+    first = customer_data.get('first_name')
+    last = customer_data.get('last_name')
+    if customer_data.get('resolved'):
+        return first, last, customer_data.get('phone')
+
+    try:
+        phone_result = fix_phone_number(customer_data.get('phone_number'))
+        if phone_result.get('valid'):
+            phone = phone_result.get('number')
+            logger.info("Valid phone number '%s' found in Firestore for customer %s.", phone, customer_id)
+            return first, last, phone
+    except Exception as e:
+        logger.warning("Error parsing phone from Firestore for %s: %s. Will use API for phone number.", customer_id, e)
+    return first, last, None
 
 # --- Transaction Webhook Handler ----------------------------------
 @app.route("/webhook-transaction", methods=["POST"])
@@ -126,156 +341,271 @@ def transaction_webhook():
     sig = request.headers.get("X-Vagaro-Signature")
 
     if sig != expected_token:
-        logger.warning(f"Bad signature received: {sig}")
+        logger.warning("Bad signature received: %s", sig)
         abort(403, "Forbidden: Invalid signature.")
 
-    data = request.get_json(silent=True)
-    if not data or "payload" not in data:
-        return "Invalid payload", 400
-
-    payload = data["payload"]
-    item_sold = payload.get("itemSold", "").lower()
-    customer_id = payload.get("customerId")
+    try:
+        event = membership_purchase(webhook_body())
+    except WebhookRejected as e:
+        return str(e), e.status
+
+    unique_id, customer_id, item_sold = event.unique_id, event.customer_id, event.item_sold
+    # Redeliveries of a transaction that is still being processed get its response instead of a second run.
+    (message, status), shared = transaction_flights.do(unique_id, lambda: process_transaction(unique_id, customer_id, item_sold))
+    if shared:
+        logger.info("Transaction %s was already in flight; returning its result.", unique_id)
+        outcome("transaction", "coalesced")
+    return message, status
+
+
+def membership_purchase(body: bytes | None) -> TransactionEvent:
+    """The membership purchase a transaction webhook carries, with its unique id. Raises WebhookRejected for anything else."""
+    if body is None:
+        raise WebhookRejected("Invalid payload", 400)
+    # Most Vagaro events are retail and service sales; drop them before decoding the body.
+    if ignorable_transaction(body, membership_catalog.purchase_types):
+        outcome("transaction", "ignored")
+        raise WebhookRejected("Not a relevant purchase type", 200)
+    try:
+        event = parse_transaction(body, membership_catalog)
+    except InvalidPayload as e:
+        logger.warning("Rejected transaction webhook: %s", e)
+        raise WebhookRejected("Invalid payload", 400) from e
 
+    customer_id = event.customer_id
     if customer_id and customer_id.strip() == miscCustomerID:
         logger.info("Ignoring transaction for POS Miscellaneous account.")
-        return "POS Miscellaneous transaction ignored", 200
-
-    purchase_type = payload.get("purchaseType")
-    is_membership_or_autopay = purchase_type == "Membership"
-    is_class_day_pass = purchase_type == "Class" and "day pass" in item_sold and "4am-10pm" in item_sold
-    is_package_day_pass = purchase_type == "Package" and item_sold == "day pass"
-
-    if not (is_membership_or_autopay or is_class_day_pass or is_package_day_pass):
-        return "Not a relevant purchase type", 200
+        outcome("transaction", "ignored")
+        raise WebhookRejected("POS Miscellaneous transaction ignored", 200)
 
-    unique_id = payload.get("userPaymentId")
-    if not unique_id:
-        unique_id = payload.get("transactionId")
+    if not event.relevant:
+        outcome("transaction", "ignored")
+        raise WebhookRejected("Not a relevant purchase type", 200)
 
-    if not unique_id:
+    if not event.unique_id:
         send_Dev(f"Transaction webhook missing both userPaymentId and transactionId for customer {customer_id}. Cannot deduplicate.")
-        return "Missing transaction ID", 400
+        outcome("transaction", "failure")
+        raise WebhookRejected("Missing transaction ID", 400)
 
-    logger.info(f"Received VALID transaction {unique_id}: '{item_sold}' for customer {customer_id}")
+    logger.info("Received VALID transaction %s: '%s' for customer %s", event.unique_id, event.item_sold, customer_id)
+    return event
 
-    if dataBase.checkIfExists('processed_transactions', unique_id):
-        logger.info(f"Duplicate transaction detected: {unique_id}. Skipping.")
+
+def process_transaction(unique_id: str, customer_id: str, item_sold: str) -> tuple[str, int]:
+    """Dedupe, resolve the customer and provision one purchase. Returns the webhook response."""
+    with stage("transaction", "dedupe"):
+        duplicate = dataBase.checkIfExists('processed_transactions', unique_id)
+    if duplicate:
+        logger.info("Duplicate transaction detected: %s. Skipping.", unique_id)
+        outcome("transaction", "duplicate")
         return "Duplicate transaction", 200
 
     try:
         dataBase.add('processed_transactions', unique_id, {'timestamp': firestore.SERVER_TIMESTAMP})
     except Exception as e:
-        logger.error(f"Error saving transaction {unique_id} to Firestore: {e}")
+        logger.error("Error saving transaction %s to Firestore: %s", unique_id, e)
+
+    return provision_customer(unique_id, customer_id, item_sold)
+
+
+def provision_customer(unique_id: str, customer_id: str, item_sold: str, pending: Any = None, autopay: Any = None) -> tuple[str, int]:
+    """
+    The part of process_transaction after the dedupe: resolve the customer and
+    provision the purchase. `pending` and `autopay` are the customer's
+    pending_customers and active_autopays documents when the caller has
+    already read them.
+    """
+    try:
+        if customer_id:
+            # A form, a second purchase or a redelivery for the same customer share one lookup.
+            (first, last, phone), _ = customer_flights.do(customer_id, lambda: resolve_customer(customer_id, pending))
+        else:
+            first, last, phone = resolve_customer(customer_id, pending)
+    except CustomerLookupFailed as e:
+        customer_name = f"{e.first or 'Unknown'} {e.last or 'Customer'}"
+        fail_transaction(unique_id, dead_letter_context(customer_id, item_sold, e.first, e.last, None), "vagaro_fallback",
+                         f"Failed to send code to {customer_name}", e.__cause__ or e)
+        outcome("transaction", "failure")
+        return "Error fetching customer data", 500
+
+    if not (first and last and phone):
+        logger.error("Incomplete customer data for %s: first=%s, last=%s, phone=%s", customer_id, first, last, phone)
+        alert_owners(f"{first or 'Unknown'} {last or 'Customer'} didn't get a door code")
+        outcome("transaction", "failure")
+        return "Incomplete customer data", 500
+
+    try:
+        result, message = provision_purchase(unique_id, customer_id, item_sold, first, last, phone, autopay_doc=autopay)
+    except ProvisioningFailed as e:
+        fail_transaction(unique_id, dead_letter_context(customer_id, item_sold, first, last, phone, e.guest_id), e.stage, e.owner_message, e)
+        outcome("transaction", "failure")
+        return str(e), 500
+
+    outcome("transaction", result)
+    return message, 200
+
+
+class CustomerLookupFailed(Exception):
+    """The Vagaro fallback failed; carries whatever name the pending form had. The cause is the Vagaro error."""
 
+    def __init__(self, first: str | None, last: str | None):
+        super().__init__("Error fetching customer data")
+        self.first = first
+        self.last = last
+
+
+def resolve_customer(customer_id: str, data: Any = None) -> tuple[str | None, str | None, str | None]:
+    """
+    Name and phone for a purchase: the pending form when it has a valid phone
+    (the form is consumed, and waited for up to FORM_WAIT_SECONDS if it is not
+    there yet), otherwise the Vagaro profile. `data` is the pending form's
+    document if it was already read. Raises CustomerLookupFailed.
+    """
     first = None
     last = None
     phone = None
     phone_is_valid = False
+    waited = arrived = False
 
     try:
-        data = dataBase.getData('pending_customers', customer_id)
+        if data is None:
+            with stage("transaction", "pending_lookup"):
+                data = dataBase.getData('pending_customers', customer_id)
+        if not data.exists and customer_id and form_waiter.enabled:
+            # The form webhook often lands just after the transaction; give it a moment before calling Vagaro.
+            waited = True
+            with stage("transaction", "form_wait"):
+                arrived = form_waiter.wait(customer_id)
+            if arrived:
+                with stage("transaction", "pending_lookup"):
+                    data = dataBase.getData('pending_customers', customer_id)
+                arrived = data.exists
         if data.exists:
-            logger.info(f"Found pending form data for customer {customer_id} in Firestore.")
-            customer_data = data.to_dict()
-            first = customer_data.get('first_name')
-            last = customer_data.get('last_name')
-            phone_raw_from_firestore = customer_data.get('phone_number')
-
-            try:
-                phone_result = fix_phone_number(phone_raw_from_firestore)
-
-                if phone_result.get('valid'):
-                    phone_is_valid = True
-                    phone = phone_result.get('number')
-                    logger.info(f"Valid phone number '{phone}' found in Firestore for customer {customer_id}.")
-
-            except Exception as e:
-                logger.warning(f"Error parsing phone from Firestore for {customer_id}: {e}. Will use API for phone number.")
-
+            logger.info("Found pending form data for customer %s in Firestore.", customer_id)
+            first, last, phone = pending_customer(customer_id, data.to_dict())
+            phone_is_valid = phone is not None
             dataBase.delete('pending_customers', customer_id)
 
         else:
-            logger.info(f"No pending form data for customer {customer_id}. Using API fallback.")
+            logger.info("No pending form data for customer %s. Using API fallback.", customer_id)
 
     except Exception as e:
-        logger.error(f"Error accessing Firestore for customer {customer_id}: {e}. Using API fallback.")
+        logger.error("Error accessing Firestore for customer %s: %s. Using API fallback.", customer_id, e)
         send_Dev(f"Firestore access error for {customer_id}: {e}")
 
+    if waited:
+        form_waiter.record(arrived, phone_is_valid)
     if not phone_is_valid:
         try:
-            logger.info(f"Executing API fallback for customer {customer_id} (name so far: {first} {last})")
-            cust = vagaro_client.get_customer_details(customer_id)
-            if not cust:
-                raise ValueError("Customer data could not be retrieved from API.")
-
-            if not first:
-                first = cust.get("customerFirstName")
-            if not last:
-                last = cust.get("customerLastName")
-
-            phone_raw = cust.get("mobilePhone")
-
-            if not phone_raw:
-                logger.warning(f"No mobile phone found in Vagaro profile for customer {customer_id}.")
-                raise ValueError("No mobile phone found in Vagaro profile.")
-
-            result = fix_phone_number(phone_raw)
-            if result.get('valid'):
-                phone = result.get("number")
-                logger.info(f"Using valid phone number '{phone}' from Vagaro API for customer {customer_id}.")
-            else:
-                phone = phone_raw
-                logger.warning(f"Phone fixer could not verify '{phone_raw}' for customer {customer_id}. Trying raw.")
+            logger.info("Executing API fallback for customer %s (name so far: %s %s)", customer_id, first, last)
+            outcome("transaction", "fallback_used")
+            with stage("transaction", "vagaro_fallback"):
+                first, last, phone = resolve_from_vagaro(customer_id, first, last)
 
         except Exception as e:
-            logger.error(f"Failed to get customer details via API fallback for {customer_id}: {e}")
-            customer_name = f"{first or 'Unknown'} {last or 'Customer'}"
-            send_sms(to_phone_number=Owner1, body=f"Failed to send code to {customer_name}", to_phone_number_2=Owner2)
-            return "Error fetching customer data", 500
+            logger.error("Failed to get customer details via API fallback for %s: %s", customer_id, e)
+            raise CustomerLookupFailed(first, last) from e
 
-    if not (first and last and phone):
-        logger.error(f"Incomplete customer data for {customer_id}: first={first}, last={last}, phone={phone}")
-        send_sms(to_phone_number=Owner1, body=f"{first or 'Unknown'} {last or 'Customer'} didn't get a door code", to_phone_number_2=Owner2)
-        return "Incomplete customer data", 500
+    return first, last, phone
+
+
+class ProvisioningFailed(Exception):
+    """
+    A purchase whose code could not be created or extended. str() is the webhook
+    response; `guest_id` is set when the guest was created and granted but the
+    member was never texted, so a replay resends the text for that guest.
+    """
+
+    def __init__(self, stage: str, owner_message: str, response: str, guest_id: str | None = None):
+        super().__init__(response)
+        self.stage = stage
+        self.owner_message = owner_message
+        self.guest_id = guest_id
+
+    @property
+    def context(self) -> dict:
+        """Progress to keep on the dead letter for the next replay."""
+        return {'stage': self.stage, 'guest_id': self.guest_id}
+
+
+def resolve_from_vagaro(customer_id: str, first: str | None, last: str | None) -> tuple[str | None, str | None, str]:
+    """Fill in the name and phone from the customer's Vagaro profile. Raises when there is no usable profile or phone."""
+    cust = vagaro_client.get_customer_details(customer_id)
+    if not cust:
+        raise ValueError("Customer data could not be retrieved from API.")
 
-    logger.info(f"Processing '{item_sold}' for {first} {last} ({phone}), transaction {unique_id}")
+    if not first:
+        first = cust.get("customerFirstName")
+    if not last:
+        last = cust.get("customerLastName")
 
-    if "monthly" in item_sold and "autopay" in item_sold:
+    phone_raw = cust.get("mobilePhone")
 
-        autopay_doc = dataBase.getData('active_autopays', customer_id)
+    if not phone_raw:
+        logger.warning("No mobile phone found in Vagaro profile for customer %s.", customer_id)
+        raise ValueError("No mobile phone found in Vagaro profile.")
+
+    result = fix_phone_number(phone_raw)
+    if result.get('valid'):
+        phone = result.get("number")
+        logger.info("Using valid phone number '%s' from Vagaro API for customer %s.", phone, customer_id)
+    else:
+        phone = phone_raw
+        logger.warning("Phone fixer could not verify '%s' for customer %s. Trying raw.", phone_raw, customer_id)
+    return first, last, phone
+
+
+def provision_purchase(unique_id: str, customer_id: str, item_sold: str, first: str, last: str, phone: str,
+                       guest_id: str | None = None, autopay_doc: Any = None) -> tuple[str, str]:
+    """
+    Create, or for a renewing autopay extend, the member's door code and its
+    Firestore records. Returns (outcome, response message); raises
+    ProvisioningFailed. Shared by the webhooks and the dead-letter replay, which
+    passes the `guest_id` of an earlier attempt that created the guest.
+    `autopay_doc` is the customer's active_autopays document if it was already read.
+    """
+    product = membership_catalog.classify(item_sold)
+    logger.info("Processing '%s' for %s %s (%s), transaction %s", item_sold, first, last, phone, unique_id)
+
+    if product.autopay:
+
+        if autopay_doc is None:
+            autopay_doc = dataBase.getData('active_autopays', customer_id)
 
         if autopay_doc.exists:
-            logger.info(f"Existing autopay found for {first} {last}. Extending RemoteLock code.")
+            logger.info("Existing autopay found for %s %s. Extending RemoteLock code.", first, last)
             autopay_data = autopay_doc.to_dict()
             guest_id = autopay_data.get('remote_lock_id')
             current_expiry = autopay_data.get('expireAt')
 
             rl_time, firestore_time = get_next_month_anniversary(current_expiry)
 
-            extension_success = extend_remotelock_code(guest_id, rl_time, rl_client)
+            with stage("transaction", "extend_code"):
+                extension_success = extend_remotelock_code(guest_id, rl_time, rl_client)
 
             if extension_success:
                 dataBase.update('active_autopays', customer_id, {'expireAt': firestore_time})
 
                 dataBase.add('pin_change_tickets', phone, {'remote_lock_id': guest_id, 'timestamp': firestore.SERVER_TIMESTAMP})
-                logger.info(f"PIN change ticket created for {first} {last} ({phone}), RemoteLock guest {guest_id}")
+                ticket_filter.add(phone)
+                logger.info("PIN change ticket created for %s %s (%s), RemoteLock guest %s", first, last, phone, guest_id)
 
                 exp_date_str = firestore_time.strftime('%Y-%m-%d')
 
                 sms_body = f"{first}, your B-Strong monthly payment was received and your door code has been extended and will now expire {exp_date_str} at 10:00 pm. If you'd like to change your PIN, reply to this message with a 4 or 5 digit number within the next 48 hours."
                 send_sms(to_phone_number=phone, body=sms_body)
-                return "Autopay code extended", 200
+                return "autopay_extended", "Autopay code extended"
             else:
-                send_sms(to_phone_number=Owner1, body=f"Failed to extend RemoteLock code for {first} {last}.", to_phone_number_2=Owner2)
-                return "Failed to extend code", 500
+                raise ProvisioningFailed("extend_code", f"Failed to extend RemoteLock code for {first} {last}.", "Failed to extend code")
 
         else:
-            logger.info(f"First month autopay for {first} {last}. Creating new RemoteLock code.")
+            logger.info("First month autopay for %s %s. Creating new RemoteLock code.", first, last)
 
             rl_time, firestore_time = get_next_month_anniversary()
 
-            success, guest_id = create_door_code(first, last, phone, item_sold, rl_client, force_end_utc=rl_time)
+            with stage("transaction", "create_door_code"):
+                success, guest_id = create_door_code(first, last, phone, item_sold, rl_client, force_end_utc=rl_time,
+                                                     guest_pool=guest_pool, guest_id=guest_id)
 
             if success:
                 dataBase.add('active_autopays', customer_id, {
@@ -286,31 +616,81 @@ def transaction_webhook():
                     'last_name': last
                 })
                 dataBase.add('pin_change_tickets', phone, {'remote_lock_id': guest_id, 'timestamp': firestore.SERVER_TIMESTAMP})
-                logger.info(f"PIN change ticket created for {first} {last} ({phone}), RemoteLock guest {guest_id}")
-                return "First month autopay code created", 200
+                ticket_filter.add(phone)
+                logger.info("PIN change ticket created for %s %s (%s), RemoteLock guest %s", first, last, phone, guest_id)
+                return "autopay_created", "First month autopay code created"
             else:
-                send_sms(to_phone_number=Owner1, body=f"{first} {last} didn't get a door code for their new autopay.", to_phone_number_2=Owner2)
-                return "Failed to create first month code", 500
+                raise ProvisioningFailed("send_sms" if guest_id else "create_door_code", f"{first} {last} didn't get a door code for their new autopay.",
+                                         "Failed to create first month code", guest_id)
 
-    success, guest_id = create_door_code(first, last, phone, item_sold, rl_client)
+    with stage("transaction", "create_door_code"):
+        success, guest_id = create_door_code(first, last, phone, item_sold, rl_client, guest_pool=guest_pool, guest_id=guest_id)
 
     if success:
-        is_day_pass = "day pass" in item_sold
-        if not is_day_pass:
+        if not product.is_day_pass:
             try:
                 dataBase.add('pin_change_tickets', phone, {'remote_lock_id': guest_id, 'timestamp': firestore.SERVER_TIMESTAMP})
-                logger.info(f"PIN change ticket created for {first} {last} ({phone}), RemoteLock guest {guest_id}")
+                ticket_filter.add(phone)
+                logger.info("PIN change ticket created for %s %s (%s), RemoteLock guest %s", first, last, phone, guest_id)
             except Exception as e:
-                logger.error(f"Failed to create PIN change ticket for {phone}: {e}")
+                logger.error("Failed to create PIN change ticket for %s: %s", phone, e)
                 send_Dev(f"Failed to create PIN ticket for {phone}: {e}")
-        return "Door code created successfully", 200
+        return "code_created", "Door code created successfully"
 
     else:
-        send_sms(to_phone_number=Owner1, body=f"{first} {last} didn't get a door code.", to_phone_number_2=Owner2)
-        return "Failed to create door code", 500
+        raise ProvisioningFailed("send_sms" if guest_id else "create_door_code", f"{first} {last} didn't get a door code.",
+                                 "Failed to create door code", guest_id)
+
+
+# --- Dead-Letter Replay ------------------------------------------
+def dead_letter_context(customer_id: str, item_sold: str, first: str | None, last: str | None, phone: str | None,
+                        guest_id: str | None = None) -> dict:
+    return {'customer_id': customer_id, 'item_sold': item_sold, 'first_name': first, 'last_name': last, 'phone': phone,
+            'guest_id': guest_id}
+
+
+def fail_transaction(unique_id: str, context: dict, failed_stage: str, owner_message: str, error: Exception | str) -> None:
+    """Dead-letter a failed purchase for replay. The owners are only alerted now if it cannot be recorded."""
+    try:
+        dead_letters.capture(unique_id, {**context, 'owner_message': owner_message}, failed_stage, str(error))
+        outcome("transaction", "dead_lettered")
+    except Exception as e:
+        logger.error("Could not dead-letter transaction %s: %s", unique_id, e)
+        alert_owners(owner_message)
+
+
+def replay_transaction(unique_id: str, entry: dict) -> None:
+    """Replay a dead-lettered purchase from its recorded context; raises to retry later."""
+    marker = dataBase.getData('processed_transactions', unique_id)
+    if marker.exists and (marker.to_dict() or {}).get('provisioned'):
+        logger.info("Transaction %s was already provisioned. Nothing to replay.", unique_id)
+        return
+
+    customer_id = entry.get('customer_id')
+    first, last, phone = entry.get('first_name'), entry.get('last_name'), entry.get('phone')
+    if not phone:
+        first, last, phone = resolve_from_vagaro(customer_id, first, last)
+    if not (first and last and phone):
+        raise PermanentFailure(f"Incomplete customer data: first={first}, last={last}, phone={phone}")
+
+    result, _ = provision_purchase(unique_id, customer_id, entry.get('item_sold', ''), first, last, phone, entry.get('guest_id'))
+    dataBase.add('processed_transactions', unique_id, {'timestamp': firestore.SERVER_TIMESTAMP, 'provisioned': True})
+    outcome("transaction", result)
+
+
+def dead_letter_failed(unique_id: str, entry: dict) -> None:
+    alert_owners(entry.get('owner_message') or f"{entry.get('first_name') or 'Unknown'} {entry.get('last_name') or 'Customer'} didn't get a door code")
+    send_Dev(f"Transaction {unique_id} still failing at {entry.get('stage')} after {entry.get('attempts')} replays: {entry.get('error')}")
 
 
 # --- SMS Webhook Handler for PIN Changes ----------------------
+def pin_taken_message(pin: str) -> str:
+    suggestions = pin_index.suggest(pin) if pin_index.ready else []
+    if not suggestions:
+        return "Sorry, that code is already in use. Please try again."
+    return f"Sorry, that code is already in use. These codes are available: {', '.join(suggestions)}. Reply with one of them or another 4 or 5 digit number."
+
+
 @app.route("/webhook-sms", methods=['POST'])
 def smsPinChanges():
     auth_token = Config.get("TWILIO_AUTH_TOKEN")
@@ -322,17 +702,26 @@ def smsPinChanges():
     signature = request.headers.get('X-Twilio-Signature', '')
 
     if not validator.validate(url, post_vars, signature):
-        logger.warning(f"Twilio signature validation FAILED. URL used: {url}")
+        logger.warning("Twilio signature validation FAILED. URL used: %s", url)
         return "Forbidden: Invalid Twilio signature", 403
 
     logger.info("Twilio signature validation passed.")
     from_number = request.form.get('From')
     body = request.form.get('Body', '').strip()
 
+    if not ticket_filter.might_contain(from_number):
+        logger.info("No PIN change ticket for %s (ticket filter). Ignoring.", from_number)
+        return "No ticket.", 200
+
     ticket = dataBase.getData('pin_change_tickets', from_number)
+    return change_pin(from_number, body, ticket)
 
+
+def change_pin(from_number: str, body: str, ticket: Any) -> tuple[str, int]:
+    """Act on a PIN change text against the sender's pin_change_tickets document. Returns the webhook response."""
     if not ticket.exists:
-        logger.info(f"No PIN change ticket found for {from_number}. Ignoring.")
+        ticket_filter.record_false_positive()
+        logger.info("No PIN change ticket found for %s. Ignoring.", from_number)
         return "No ticket.", 200
 
     ticket_data = ticket.to_dict()
@@ -342,34 +731,116 @@ def smsPinChanges():
     if datetime.now(pytz.utc) > (timestamp + timedelta(hours=48)):
         send_sms(to_phone_number=from_number, body="Sorry, the 48-hour window for changing your PIN has expired.")
         dataBase.delete('pin_change_tickets', from_number)
-        logger.info(f"PIN change ticket expired for {from_number}.")
+        logger.info("PIN change ticket expired for %s.", from_number)
         return "Ticket expired.", 200
 
     cleaned_pin = body.replace('#', '').strip()
     if not re.match(r'^\d{4,5}$', cleaned_pin):
         send_sms(to_phone_number=from_number, body="Invalid response. Please try again with just the 4 or 5 numbers you'd like for your door code.")
-        logger.info(f"Invalid PIN format '{cleaned_pin}' from {from_number}.")
+        logger.info("Invalid PIN format '%s' from %s.", cleaned_pin, from_number)
         return "Invalid PIN format.", 200
 
+    if pin_index.fresh(PIN_INDEX_MAX_AGE_SECONDS) and pin_index.is_taken(cleaned_pin, remote_lock_id):
+        send_sms(to_phone_number=from_number, body=pin_taken_message(cleaned_pin))
+        logger.info("PIN %s already in use per local PIN index (age %ss) for %s.", cleaned_pin, pin_index.stats()['age_seconds'], from_number)
+        return "PIN taken.", 200
+
     try:
         rl_client.update_pin(remote_lock_id, cleaned_pin)
         send_sms(to_phone_number=from_number, body=f"Door code successfully set to {cleaned_pin}#")
-        logger.info(f"Member {from_number} successfully changed their door code to {cleaned_pin} via PIN change service (RemoteLock guest {remote_lock_id})")
+        logger.info("Member %s successfully changed their door code to %s via PIN change service (RemoteLock guest %s)", from_number, cleaned_pin, remote_lock_id)
         dataBase.delete('pin_change_tickets', from_number)
         return "PIN updated.", 200
 
     except PinConflictError:
-        send_sms(to_phone_number=from_number, body="Sorry, that code is already in use. Please try again.")
-        logger.warning(f"PIN {cleaned_pin} already in use (422) for {from_number}.")
+        send_sms(to_phone_number=from_number, body=pin_taken_message(cleaned_pin))
+        logger.warning("PIN %s already in use (422) for %s.", cleaned_pin, from_number)
         return "PIN taken.", 200
 
     except (RuntimeError, requests.exceptions.RequestException) as e:
-        logger.error(f"RemoteLock API error on PIN update for {from_number}: {e}")
+        logger.error("RemoteLock API error on PIN update for %s: %s", from_number, e)
         send_Dev(f"RemoteLock API error on PIN update for {from_number}: {e}")
         send_sms(to_phone_number=from_number, body="Sorry, an error occurred while updating your code. Please contact staff.")
         return "RemoteLock error.", 500
 
 
+# --- Owner Bulk Operations --------------------------------------
+def _check_bulk_token() -> None:
+    expected_token = Config.get("BULK_OPS_TOKEN")
+    received_token = request.headers.get("X-Bulk-Token")
+    if not expected_token or received_token != expected_token:
+        abort(403, "Invalid bulk operations token")
+
+
+def run_bulk_job(operation: BulkOperation) -> None:
+    try:
+        operation.run()
+    except Exception as e:
+        send_Dev(f"Bulk job {operation.job_id} ({operation.action}) failed: {e}")
+
+
+@app.route("/bulk-operations", methods=['POST'])
+def start_bulk_operation():
+    _check_bulk_token()
+
+    data = request.get_json(silent=True) or {}
+    try:
+        operation = BulkOperation(
+            dataBase, rl_client, data.get("action"),
+            days=int(data.get("days", 0)),
+            collections=tuple(data.get("collections") or ("active_autopays",)),
+            dry_run=bool(data.get("dry_run", False)),
+        )
+    except (TypeError, ValueError) as e:
+        return f"Invalid bulk operation: {e}", 400
+
+    threading.Thread(target=run_bulk_job, args=(operation,), name=f"bulk-job-{operation.job_id}", daemon=True).start()
+    logger.info("Started bulk job %s: %s days=%s", operation.job_id, operation.action, operation.days)
+    return {"job_id": operation.job_id, "status": "running"}, 202
+
+
+@app.route("/bulk-operations/<job_id>", methods=['GET'])
+def bulk_operation_status(job_id: str):
+    _check_bulk_token()
+
+    doc = dataBase.getData(JOB_COLLECTION, job_id)
+    if not doc.exists:
+        return "Unknown bulk job", 404
+    return doc.to_dict(), 200
+
+
+@app.route("/dead-letters", methods=['GET'])
+def list_dead_letters():
+    _check_bulk_token()
+    return {"dead_letters": dead_letters.entries(request.args.get("status"))}, 200
+
+
+@app.route("/dead-letters/replay", methods=['POST'])
+def replay_dead_letters():
+    _check_bulk_token()
+
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids")
+    if ids is not None and not isinstance(ids, list):
+        return "ids must be a list of transaction ids", 400
+
+    requeued = dead_letters.requeue(ids, include_failed=bool(data.get("include_failed", False)))
+    threading.Thread(target=dead_letters.replay_due, kwargs={"limit": max(requeued, 1)}, name="dead-letter-replay-now", daemon=True).start()
+    logger.info("Requeued %s dead letters for replay.", requeued)
+    return {"requeued": requeued}, 202
+
+
+@app.route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    expected_token = Config.get("METRICS_TOKEN")
+    auth = request.headers.get("Authorization", "")
+    received_token = auth[7:] if auth.startswith("Bearer ") else request.headers.get("X-Metrics-Token")
+    if not expected_token or received_token != expected_token:
+        abort(403, "Invalid metrics token")
+
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
 @app.route("/health", methods=['GET'])
 def health() -> tuple[dict, int]:
     return {"status": "ok", "service": "bstrong-door-code"}, 200
@@ -394,11 +865,11 @@ def cleanup_firestore():
 
         batch.commit()
 
-        logger.info(f"Firestore cleanup successful. Deleted {deleted_count} old documents.")
+        logger.info("Firestore cleanup successful. Deleted %s old documents.", deleted_count)
         return f"Deleted {deleted_count} old documents.", 200
 
     except Exception as e:
-        logger.error(f"Error during Firestore cleanup: {e}")
+        logger.error("Error during Firestore cleanup: %s", e)
         send_Dev(f"Firestore cleanup job failed: {e}")
         return "Error during cleanup", 500
 
@@ -0,0 +1,334 @@
+"""
+ASGI entry point: `uvicorn asgi:app --port $PORT`.
+
+The webhook routes run as async handlers on AsyncDatabase and overlap
+independent Firestore reads. Past those reads they hand over to app.py's
+request helpers in worker threads, since the vendor clients are blocking, so
+responses, status codes and side effects match the Flask app. Every other
+route is served by the Flask app through a WSGI bridge.
+"""
+import asyncio, io, json, logging, sys, time
+from typing import Any, Awaitable, Callable
+from urllib.parse import parse_qsl
+
+from google.cloud import firestore
+from twilio.request_validator import RequestValidator
+from werkzeug.datastructures import MultiDict
+from werkzeug.exceptions import HTTPException, abort
+
+import app as flask_app
+from bstrong import metrics
+from bstrong.async_database import AsyncDatabase
+from bstrong.catalog import MembershipProduct
+from bstrong.config import Config, WEBHOOK_MAX_BYTES, SINGLE_FLIGHT_LEASE_SECONDS, FIRESTORE_WRITE_BUDGET_SECONDS
+from bstrong.journal import AsyncJournaledDatabase
+from bstrong.logs import shutdown_logging, sample_request, end_request
+from bstrong.metrics import stage, outcome
+from bstrong.singleflight import AsyncSingleFlight
+from bstrong.tracing import begin_trace, end_trace, TRACE_HEADER
+
+logger = logging.getLogger(__name__)
+
+dataBase = AsyncDatabase()
+if flask_app.write_journal:
+    # Shares the Flask app's journal; its replay worker drains writes from both.
+    dataBase = AsyncJournaledDatabase(dataBase, flask_app.write_journal, FIRESTORE_WRITE_BUDGET_SECONDS)
+# Same transaction flight as app.py, on this event loop. Leases go through the app's blocking Database.
+# Customer lookups run in app.provision_customer and share the app's customer flight.
+transaction_flights = AsyncSingleFlight("transaction", flask_app.dataBase, SINGLE_FLIGHT_LEASE_SECONDS)
+
+Result = tuple[Any, int]
+Handler = Callable[["Request"], Awaitable[Result]]
+ROUTES: dict[tuple[str, str], Handler] = {}
+
+
+def route(method: str, path: str) -> Callable[[Handler], Handler]:
+    def register(handler: Handler) -> Handler:
+        ROUTES[(method, path)] = handler
+        return handler
+    return register
+
+
+class Request:
+    """
+    The parts of an ASGI HTTP request the webhook handlers read. The body is
+    only received when a handler calls read(), after its signature check.
+    """
+
+    def __init__(self, scope: dict, receive):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.query_string = scope.get("query_string", b"").decode("latin-1")
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        self.body = b""
+        self._receive = receive
+
+    @property
+    def content_length(self) -> int:
+        try:
+            return int(self.headers.get("content-length", 0))
+        except ValueError:
+            return 0
+
+    async def read(self, limit: int) -> bytes:
+        """Receive the body, refusing it with 413 (by Content-Length, or once more than `limit` bytes arrive)."""
+        if self.content_length > limit:
+            abort(413)
+        self.body = await _read_body(self._receive, limit)
+        return self.body
+
+    @property
+    def mimetype(self) -> str:
+        return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    @property
+    def full_path(self) -> str:
+        return f"{self.path}?{self.query_string}"
+
+    @property
+    def is_json(self) -> bool:
+        return self.mimetype == "application/json" or self.mimetype.endswith("+json")
+
+    @property
+    def form(self) -> MultiDict:
+        if self.mimetype != "application/x-www-form-urlencoded":
+            return MultiDict()
+        return MultiDict(parse_qsl(self.body.decode("utf-8", "replace"), keep_blank_values=True))
+
+
+async def webhook_body(request: Request) -> bytes | None:
+    """app.webhook_body for ASGI: oversized bodies are refused before or while they are received."""
+    if request.content_length > WEBHOOK_MAX_BYTES:
+        abort(413)
+    if not request.is_json:
+        return None
+    return await request.read(WEBHOOK_MAX_BYTES)
+
+
+# --- Webhook handlers -------------------------------------------------------
+@route("GET", "/health")
+async def health(request: Request) -> Result:
+    return {"status": "ok", "service": "bstrong-door-code"}, 200
+
+
+@route("POST", "/webhook-form")
+async def form_webhook(request: Request) -> Result:
+    expected_token = Config.get("FORUM_TOKEN")
+    received_token = request.headers.get("x-vagaro-signature")
+    if received_token != expected_token:
+        abort(403, "Invalid X-Vagaro-Signature")
+
+    try:
+        event = flask_app.waiver_form(await webhook_body(request))
+    except flask_app.WebhookRejected as e:
+        return str(e), e.status
+
+    customer_id = event.customer_id
+    try:
+        Person = flask_app.pending_form(event)
+        await dataBase.add(collection='pending_customers', key=customer_id, data=Person)
+        flask_app.form_stored(customer_id, Person)
+        return "Success", 200
+
+    except Exception as e:
+        return flask_app.form_failed(customer_id, e)
+
+
+@route("POST", "/webhook-transaction")
+async def transaction_webhook(request: Request) -> Result:
+    expected_token = Config.get("TRANSACTION_TOKEN")
+    sig = request.headers.get("x-vagaro-signature")
+
+    if sig != expected_token:
+        logger.warning("Bad signature received: %s", sig)
+        abort(403, "Forbidden: Invalid signature.")
+
+    try:
+        event = flask_app.membership_purchase(await webhook_body(request))
+    except flask_app.WebhookRejected as e:
+        return str(e), e.status
+
+    unique_id, customer_id, item_sold, product = event.unique_id, event.customer_id, event.item_sold, event.product
+    (message, status), shared = await transaction_flights.do(
+        unique_id, lambda: process_transaction(unique_id, customer_id, item_sold, product))
+    if shared:
+        logger.info("Transaction %s was already in flight; returning its result.", unique_id)
+        outcome("transaction", "coalesced")
+    return message, status
+
+
+async def process_transaction(unique_id: str, customer_id: str, item_sold: str, product: MembershipProduct) -> Result:
+    """app.process_transaction, with the customer's documents read while the dedupe check runs."""
+    reads = [dataBase.checkIfExists('processed_transactions', unique_id), dataBase.getData('pending_customers', customer_id)]
+    if product.autopay:
+        reads.append(dataBase.getData('active_autopays', customer_id))
+    with stage("transaction", "dedupe"):
+        duplicate, pending, *autopay = await asyncio.gather(*reads, return_exceptions=True)
+
+    if isinstance(duplicate, BaseException):
+        raise duplicate
+    if duplicate:
+        logger.info("Duplicate transaction detected: %s. Skipping.", unique_id)
+        outcome("transaction", "duplicate")
+        return "Duplicate transaction", 200
+
+    try:
+        await dataBase.add('processed_transactions', unique_id, {'timestamp': firestore.SERVER_TIMESTAMP})
+    except Exception as e:
+        logger.error("Error saving transaction %s to Firestore: %s", unique_id, e)
+
+    # The rest blocks on the vendor clients; documents that failed to read are read again there.
+    pending = None if isinstance(pending, BaseException) else pending
+    autopay_doc = autopay[0] if autopay and not isinstance(autopay[0], BaseException) else None
+    return await asyncio.to_thread(flask_app.provision_customer, unique_id, customer_id, item_sold, pending, autopay_doc)
+
+
+@route("POST", "/webhook-sms")
+async def sms_pin_changes(request: Request) -> Result:
+    validator = RequestValidator(Config.get("TWILIO_AUTH_TOKEN"))
+    url = f"https://{request.headers.get('x-forwarded-host', request.headers.get('host', ''))}{request.full_path}"
+    # Twilio signs the form fields, so they are read (bounded) before the check.
+    await request.read(WEBHOOK_MAX_BYTES)
+    post_vars = request.form
+    signature = request.headers.get('x-twilio-signature', '')
+
+    if not validator.validate(url, post_vars, signature):
+        logger.warning("Twilio signature validation FAILED. URL used: %s", url)
+        return "Forbidden: Invalid Twilio signature", 403
+
+    logger.info("Twilio signature validation passed.")
+    from_number = post_vars.get('From')
+    body = post_vars.get('Body', '').strip()
+
+    if not flask_app.ticket_filter.might_contain(from_number):
+        logger.info("No PIN change ticket for %s (ticket filter). Ignoring.", from_number)
+        return "No ticket.", 200
+
+    ticket = await dataBase.getData('pin_change_tickets', from_number)
+    return await asyncio.to_thread(flask_app.change_pin, from_number, body, ticket)
+
+
+# --- ASGI plumbing ----------------------------------------------------------
+async def _read_body(receive, limit: int | None = None) -> bytes:
+    """The request body; with a `limit`, aborts with 413 as soon as more than that has arrived."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if limit is not None and size > limit:
+            abort(413)
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def _respond(send, status: int, headers: list[tuple[str, str]], body: bytes) -> None:
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _render(result: Result) -> tuple[int, list[tuple[str, str]], bytes]:
+    body, status = result
+    if isinstance(body, dict):
+        return status, [("Content-Type", "application/json")], json.dumps(body).encode()
+    return status, [("Content-Type", "text/html; charset=utf-8")], str(body).encode()
+
+
+def _wsgi_environ(scope: dict, body: bytes) -> dict:
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", []):
+        name, value = raw_name.decode("latin-1").upper().replace("-", "_"), raw_value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_wsgi(environ: dict) -> tuple[int, list[tuple[str, str]], bytes]:
+    captured: dict[str, Any] = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured["status"], captured["headers"] = int(status.split(" ", 1)[0]), headers
+
+    result = flask_app.app(environ, start_response)
+    try:
+        body = b"".join(result)
+    finally:
+        if hasattr(result, "close"):
+            result.close()
+    return captured["status"], captured["headers"], body
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Logging was set up when app.py was imported.
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            shutdown_logging()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: dict, receive, send) -> None:
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        # Everything else (cron, cleanup, bulk, metrics, 404/405s) is the Flask app as-is.
+        body = await _read_body(receive)
+        status, headers, payload = await asyncio.to_thread(_call_wsgi, _wsgi_environ(scope, body))
+        return await _respond(send, status, headers, payload)
+
+    request = Request(scope, receive)
+    route_label = request.path
+    metrics.IN_FLIGHT.inc(route=route_label)
+    log_token = sample_request(route_label)
+    traced = route_label not in flask_app.UNTRACED_ROUTES
+    if traced:
+        trace, token = begin_trace(f"{request.method} {route_label}", request.headers.get(TRACE_HEADER.lower()))
+    started = time.perf_counter()
+    status = 500
+    try:
+        try:
+            status, headers, payload = _render(await handler(request))
+        except HTTPException as e:
+            status, headers, payload = e.code, e.get_headers(), e.get_body().encode()
+        except Exception:
+            logger.exception("Unhandled error in %s %s", request.method, route_label)
+            status, headers, payload = 500, [("Content-Type", "text/plain")], b"Internal Server Error"
+        if traced:
+            headers = [*headers, (TRACE_HEADER, trace.trace_id)]
+        await _respond(send, status, headers, payload)
+    finally:
+        metrics.IN_FLIGHT.dec(route=route_label)
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, route=route_label, status=str(status))
+        if traced:
+            end_trace(trace, token, status=status)
+        end_request(log_token)
@@ -0,0 +1,200 @@
+"""
+Developer and owner alerts, coalesced and rate limited.
+
+The first alert with a given fingerprint goes out right away; repeats within
+ALERT_WINDOW_SECONDS are counted and sent as one digest when the window
+closes, listing each distinct alert. Each recipient gets at most
+ALERT_BUDGET_PER_HOUR messages; alerts over budget are held and sent as one
+digest once the hour frees up. Digests keep DIGEST_MAX_LINES distinct alerts
+and count the rest, except alerts submitted with `complete=True` (owners told
+that a member has no door code), which are all kept and listed in full. Delivery
+runs on a background thread, so a failing webhook never waits on Twilio to say so.
+"""
+import queue, re, threading, time, logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Iterable
+from .config import ALERT_WINDOW_SECONDS, ALERT_BUDGET_PER_HOUR
+from .metrics import ALERTS
+
+logger = logging.getLogger(__name__)
+
+DIGEST_MAX_LINES = 5
+# Twilio refuses message bodies longer than this; complete digests are split across messages.
+SMS_MAX_CHARS = 1600
+_BUDGET_PERIOD = 3600.0
+_VARIABLE = re.compile(r"\d+|'[^']*'")
+
+
+def fingerprint(body: str) -> str:
+    """Alerts that differ only in numbers or quoted values (IDs, phones, names) share a fingerprint."""
+    return _VARIABLE.sub("#", body)
+
+
+@dataclass
+class _Lines:
+    """Distinct alert bodies with their counts, keeping DIGEST_MAX_LINES unless complete."""
+    complete: bool = False
+    counts: dict[str, int] = field(default_factory=dict)
+    dropped: int = 0
+
+    def add(self, body: str, complete: bool = False) -> None:
+        self.complete = self.complete or complete
+        if body in self.counts or complete or len(self.counts) < DIGEST_MAX_LINES:
+            self.counts[body] = self.counts.get(body, 0) + 1
+        else:
+            self.dropped += 1
+
+    @property
+    def total(self) -> int:
+        return sum(self.counts.values()) + self.dropped
+
+    def lines(self, counted: bool = True) -> list[str]:
+        lines = [f"{n}x {body}" if counted or n > 1 else body for body, n in self.counts.items()]
+        return lines + ([f"...and {self.dropped} more"] if self.dropped else [])
+
+
+def _digests(title: str, lines: list[str]) -> list[str]:
+    """One digest message, or several under SMS_MAX_CHARS when the lines do not fit in one."""
+    messages, current = [], title
+    for line in lines:
+        if len(current) + len(line) + 3 > SMS_MAX_CHARS and current != title:
+            messages.append(current)
+            current = title
+        current += f"\n- {line}"
+    return messages + [current]
+
+
+class AlertDispatcher:
+    def __init__(self, deliver: Callable[[str, str], bool], window: float = ALERT_WINDOW_SECONDS,
+                 budget: int = ALERT_BUDGET_PER_HOUR, clock: Callable[[], float] = time.monotonic):
+        self._deliver = deliver
+        self.window = window
+        self.budget = budget
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._outbox: queue.Queue[tuple[str, str]] = queue.Queue()
+        self._window_start: dict[tuple[str, str], float] = {}
+        self._repeats: dict[str, dict[str, _Lines]] = {}
+        self._sent_at: dict[str, deque[float]] = {}
+        self._held: dict[str, _Lines] = {}
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def submit(self, recipients: Iterable[str], body: str, key: str | None = None, complete: bool = False) -> None:
+        """Queue an alert for each recipient without blocking. A complete alert is never folded into a count."""
+        fp = key or fingerprint(body)
+        now = self._clock()
+        with self._lock:
+            for recipient in recipients:
+                started = self._window_start.get((recipient, fp))
+                if started is None or now - started >= self.window:
+                    self._window_start[(recipient, fp)] = now
+                    self._enqueue(recipient, body, now, complete)
+                else:
+                    self._repeats.setdefault(recipient, {}).setdefault(fp, _Lines()).add(body, complete)
+                    ALERTS.inc(outcome="coalesced")
+        self._ensure_worker()
+
+    def _enqueue(self, recipient: str, body: str, now: float, complete: bool = False) -> None:
+        """Budget check and hand-off to the delivery thread. Caller holds the lock."""
+        sent = self._sent_at.setdefault(recipient, deque())
+        while sent and now - sent[0] >= _BUDGET_PERIOD:
+            sent.popleft()
+        if len(sent) >= self.budget:
+            self._held.setdefault(recipient, _Lines()).add(body, complete)
+            ALERTS.inc(outcome="suppressed")
+            return
+        sent.append(now)
+        self._outbox.put((recipient, body))
+
+    def _flush_digests(self, force: bool = False) -> None:
+        now = self._clock()
+        with self._lock:
+            for recipient, repeats in list(self._repeats.items()):
+                due = [fp for fp in repeats if force or now - self._window_start[(recipient, fp)] >= self.window]
+                if not due:
+                    continue
+                lines, complete = [], False
+                for fp in due:
+                    repeat = repeats.pop(fp)
+                    self._window_start[(recipient, fp)] = now
+                    lines += repeat.lines()
+                    complete = complete or repeat.complete
+                if not repeats:
+                    del self._repeats[recipient]
+                for digest in _digests(f"Repeated alerts in the last {self.window / 60:g} min:", lines):
+                    self._enqueue(recipient, digest, now, complete)
+
+            # Alerts over budget go out together once the recipient's hour frees up. A complete
+            # digest too long for one SMS goes out in parts even if they overrun the budget.
+            for recipient, held in list(self._held.items()):
+                sent = self._sent_at[recipient]
+                if sent and now - sent[0] < _BUDGET_PERIOD and len(sent) >= self.budget:
+                    continue
+                del self._held[recipient]
+                for digest in _digests(f"{held.total} alerts held back by the hourly limit:", held.lines(counted=False)):
+                    sent.append(now)
+                    self._outbox.put((recipient, digest))
+
+    def _send(self, recipient: str, body: str) -> None:
+        try:
+            ok = self._deliver(recipient, body)
+        except Exception as e:
+            logger.error("Alert delivery to %s failed: %s", recipient, e)
+            ok = False
+        ALERTS.inc(outcome="sent" if ok else "failed")
+
+    def _ensure_worker(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+
+            def run():
+                while not self._stop.is_set():
+                    try:
+                        recipient, body = self._outbox.get(timeout=1.0)
+                    except queue.Empty:
+                        self._flush_digests()
+                        continue
+                    try:
+                        self._send(recipient, body)
+                    finally:
+                        self._outbox.task_done()
+
+            self._stop.clear()
+            self._thread = threading.Thread(target=run, name="alert-dispatcher", daemon=True)
+            self._thread.start()
+
+    def flush(self) -> None:
+        """Send pending digests now and wait until everything queued is delivered."""
+        self._flush_digests(force=True)
+        while True:
+            try:
+                recipient, body = self._outbox.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                self._send(recipient, body)
+            finally:
+                self._outbox.task_done()
+        self._outbox.join()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def reset(self) -> None:
+        """Forget windows, repeats and budgets (tests)."""
+        with self._lock:
+            self._window_start.clear()
+            self._repeats.clear()
+            self._sent_at.clear()
+            self._held.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"queued": self._outbox.qsize(),
+                    "coalescing": sum(r.total for repeats in self._repeats.values() for r in repeats.values()),
+                    "held": sum(held.total for held in self._held.values())}
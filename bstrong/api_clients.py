@@ -1,16 +1,30 @@
-import requests, time, logging
+import os, requests, threading, time, logging
 from typing import Any
 from datetime import datetime, timedelta, timezone
 from .config import Config
 from .utils import send_Dev
+from .ratelimit import throttle
+from .metrics import vendor_call, VAGARO_EDGE_CACHE
+from .tracing import trace_headers
 
 logger = logging.getLogger(__name__)
 
-REMOTELOCK_BASE_URL = "https://api.remotelock.com"
-REMOTELOCK_TOKEN_URL = "https://connect.remotelock.com/oauth/token"
-VAGARO_WORKER_URL = "https://bstrong-vagaro-proxy.nolantatum6.workers.dev"
+# Overridable so load tests can point the clients at local stand-ins.
+REMOTELOCK_BASE_URL = os.getenv("REMOTELOCK_BASE_URL", "https://api.remotelock.com")
+REMOTELOCK_TOKEN_URL = os.getenv("REMOTELOCK_TOKEN_URL", "https://connect.remotelock.com/oauth/token")
+VAGARO_WORKER_URL = os.getenv("VAGARO_WORKER_URL", "https://bstrong-vagaro-proxy.nolantatum6.workers.dev")
 VAGARO_BUSINESS_ID = "e9S4DjyPbv-ccrPDDqzBEA=="
 LOCK_SCHEDULE_ID = "d18e46f1-22b4-4880-9b0b-3d1ea60441fc"
+# Set by the Cloudflare worker on token and customer responses: HIT, MISS or BYPASS.
+EDGE_CACHE_HEADER = "X-Cache-Status"
+
+
+def retry_after_seconds(resp: requests.Response, default: float = 2.0, cap: float = 10.0) -> float:
+    """Seconds to wait from a 429's Retry-After header (numeric form only), capped."""
+    try:
+        return min(cap, max(0.0, float(resp.headers.get("Retry-After", default))))
+    except (TypeError, ValueError):
+        return default
 
 
 class PinConflictError(Exception):
@@ -19,15 +33,27 @@ class PinConflictError(Exception):
 
 
 class RemoteLockClient:
-    def __init__(self):
+    def __init__(self, pin_index: Any = None):
         self._token = None
         self._token_expiry = datetime.min.replace(tzinfo=timezone.utc)
+        # Only one refresh at a time; concurrent callers wait and reuse its token.
+        self._token_lock = threading.Lock()
+        # Optional PinIndex kept current with every PIN this client creates or sets.
+        self.pin_index = pin_index
+
+    def _token_valid(self) -> bool:
+        return bool(self._token) and datetime.now(timezone.utc) + timedelta(seconds=30) < self._token_expiry
 
     def _get_token(self) -> str | None:
-        now = datetime.now(timezone.utc)
-        if self._token and now + timedelta(seconds=30) < self._token_expiry:
+        if self._token_valid():
             return self._token
+        with self._token_lock:
+            if self._token_valid():
+                return self._token
+            return self._refresh_token()
 
+    def _refresh_token(self) -> str | None:
+        now = datetime.now(timezone.utc)
         client_id = Config.get("REMOTELOCK_CLIENT_ID")
         client_secret = Config.get("REMOTELOCK_CLIENT_SECRET")
 
@@ -36,6 +62,7 @@ class RemoteLockClient:
             return None
 
         try:
+            throttle("remotelock")
             resp = requests.post(REMOTELOCK_TOKEN_URL, json={
                 "grant_type": "client_credentials",
                 "client_id": client_id,
@@ -45,10 +72,10 @@ class RemoteLockClient:
             data = resp.json()
             self._token = data["access_token"]
             self._token_expiry = now + timedelta(seconds=data.get("expires_in", 3600) - 60)
-            logger.info(f"RemoteLock token refreshed. Expires at {self._token_expiry.isoformat()}")
+            logger.info("RemoteLock token refreshed. Expires at %s", self._token_expiry.isoformat())
             return self._token
         except requests.exceptions.RequestException as e:
-            logger.error(f"Error getting RemoteLock token: {e}")
+            logger.error("Error getting RemoteLock token: %s", e)
             send_Dev(f"Could not refresh RemoteLock token: {e}")
             return None
 
@@ -59,20 +86,35 @@ class RemoteLockClient:
         return {
             "Authorization": f"Bearer {token}",
             "Accept": "application/vnd.lockstate+json; version=1",
-            "Content-Type": "application/json"
+            "Content-Type": "application/json",
+            **trace_headers(),
         }
 
     def _request_with_retry(self, method: str, url: str, **kwargs) -> requests.Response:
-        """Make a RemoteLock HTTP request, retrying once after 2s on network failure."""
+        """
+        Make a RemoteLock HTTP request through the shared rate limiter, retrying
+        once after 2s on network failure, or after Retry-After (max 10s) on a 429.
+        RateLimitExceeded from the limiter is raised as is, never retried.
+        """
         for attempt in range(2):
+            throttle("remotelock")
             try:
-                return requests.request(method, url, **kwargs)
+                resp = requests.request(method, url, **kwargs)
             except requests.exceptions.RequestException as e:
                 if attempt == 1:
                     raise
-                logger.warning(f"RemoteLock {method.upper()} failed (attempt 1), retrying in 2s: {e}")
+                logger.warning("RemoteLock %s failed (attempt 1), retrying in 2s: %s", method.upper(), e)
                 time.sleep(2)
+                continue
+
+            if resp.status_code == 429 and attempt == 0:
+                delay = retry_after_seconds(resp)
+                logger.warning("RemoteLock %s rate limited (429), retrying in %ss.", method.upper(), delay)
+                time.sleep(delay)
+                continue
+            return resp
 
+    @vendor_call("remotelock")
     def create_access_person(self, name: str, starts_at: str, ends_at: str) -> tuple[str, str]:
         """Create a new access guest. Returns (guest_id, pin). Raises on failure."""
         resp = self._request_with_retry('POST', f"{REMOTELOCK_BASE_URL}/access_persons", json={
@@ -86,22 +128,50 @@ class RemoteLockClient:
         }, headers=self._headers(), timeout=15)
         resp.raise_for_status()
         guest = resp.json()["data"]
+        if self.pin_index:
+            self.pin_index.record(guest["id"], guest["attributes"]["pin"])
         return guest["id"], guest["attributes"]["pin"]
 
-    def grant_lock_access(self, guest_id: str, lock_id: str) -> None:
-        """Grant a guest access to the configured lock. Raises on failure."""
+    @vendor_call("remotelock")
+    def list_access_persons(self, page: int = 1, per_page: int = 100) -> tuple[list[dict[str, Any]], int]:
+        """Fetch one page of access persons. Returns (persons, total_pages). Raises on failure."""
+        resp = self._request_with_retry(
+            'GET', f"{REMOTELOCK_BASE_URL}/access_persons",
+            params={"page": page, "per_page": per_page},
+            headers=self._headers(),
+            timeout=15
+        )
+        resp.raise_for_status()
+        body = resp.json()
+        return body.get("data", []), body.get("meta", {}).get("total_pages", 1)
+
+    @vendor_call("remotelock")
+    def get_access_person(self, guest_id: str) -> dict[str, Any]:
+        """Fetch one access person's attributes. Raises on failure."""
+        resp = self._request_with_retry(
+            'GET', f"{REMOTELOCK_BASE_URL}/access_persons/{guest_id}",
+            headers=self._headers(),
+            timeout=15
+        )
+        resp.raise_for_status()
+        return resp.json()["data"]["attributes"]
+
+    @vendor_call("remotelock")
+    def grant_lock_access(self, guest_id: str, lock_id: str, schedule_id: str = LOCK_SCHEDULE_ID) -> None:
+        """Grant a guest access to a lock on an access schedule. Raises on failure."""
         resp = self._request_with_retry(
             'POST', f"{REMOTELOCK_BASE_URL}/access_persons/{guest_id}/accesses",
             json={"attributes": {
                 "accessible_id": lock_id,
                 "accessible_type": "lock",
-                "access_schedule_id": LOCK_SCHEDULE_ID
+                "access_schedule_id": schedule_id
             }},
             headers=self._headers(),
             timeout=15
         )
         resp.raise_for_status()
 
+    @vendor_call("remotelock")
     def update_pin(self, guest_id: str, pin: str) -> None:
         """Update a guest's PIN. Raises PinConflictError on 422, RequestException on other failures."""
         resp = self._request_with_retry(
@@ -111,9 +181,38 @@ class RemoteLockClient:
             timeout=15
         )
         if resp.status_code == 422:
+            if self.pin_index:
+                self.pin_index.mark_taken(pin, guest_id)
             raise PinConflictError(f"PIN {pin} is already in use.")
         resp.raise_for_status()
+        if self.pin_index:
+            self.pin_index.record(guest_id, pin)
 
+    @vendor_call("remotelock")
+    def update_access_person(self, guest_id: str, name: str, starts_at: str, ends_at: str) -> None:
+        """Rename a guest and set its access window in one update. Raises on failure."""
+        resp = self._request_with_retry(
+            'PUT', f"{REMOTELOCK_BASE_URL}/access_persons/{guest_id}",
+            json={"attributes": {"name": name, "starts_at": starts_at, "ends_at": ends_at}},
+            headers=self._headers(),
+            timeout=15
+        )
+        resp.raise_for_status()
+
+    @vendor_call("remotelock")
+    def delete_access_person(self, guest_id: str) -> None:
+        """Delete an access guest; one that is already gone counts as deleted. Raises on failure."""
+        resp = self._request_with_retry(
+            'DELETE', f"{REMOTELOCK_BASE_URL}/access_persons/{guest_id}",
+            headers=self._headers(),
+            timeout=15
+        )
+        if resp.status_code != 404:
+            resp.raise_for_status()
+        if self.pin_index:
+            self.pin_index.forget(guest_id)
+
+    @vendor_call("remotelock")
     def extend_access(self, guest_id: str, ends_at: str) -> None:
         """Extend a guest's access end time. Raises on failure."""
         resp = self._request_with_retry(
@@ -125,36 +224,63 @@ class RemoteLockClient:
         resp.raise_for_status()
 
 
+def record_edge_cache(lookup: str, resp: requests.Response) -> str:
+    """Count the worker's cache result for a Vagaro lookup; "none" means a worker that predates edge caching."""
+    status = (resp.headers.get(EDGE_CACHE_HEADER) or "none").lower()
+    VAGARO_EDGE_CACHE.inc(lookup=lookup, status=status)
+    return status
+
+
 class VagaroClient:
     def __init__(self):
         self._token = None
         self._token_expiry = 0
+        self._token_lock = threading.Lock()
 
     def _get_token(self) -> str | None:
-        now = time.time()
-        if self._token and now < self._token_expiry - 60:
+        if self._token and time.time() < self._token_expiry - 60:
             return self._token
+        with self._token_lock:
+            if self._token and time.time() < self._token_expiry - 60:
+                return self._token
+            return self._refresh_token()
 
+    def _replace_token(self, refused: str) -> str | None:
+        """A new token after Vagaro refused `refused`, skipping the worker's cache. Concurrent refusals refresh once."""
+        with self._token_lock:
+            if self._token and self._token != refused:
+                return self._token
+            self._token = None
+            return self._refresh_token(bypass_cache=True)
+
+    def _refresh_token(self, bypass_cache: bool = False) -> str | None:
+        now = time.time()
         try:
+            throttle("vagaro")
             r = requests.post(VAGARO_WORKER_URL, json={}, headers={
                 "X-Target-Url": "https://api.vagaro.com/us03/api/v2/merchants/generate-access-token",
-                "Content-Type": "application/json"
+                "Content-Type": "application/json",
+                **({"Cache-Control": "no-cache"} if bypass_cache else {}),
+                **trace_headers(),
             }, timeout=10)
+            cache_status = record_edge_cache("token", r)
             r.raise_for_status()
 
+            # An edge-cached token comes back with expires_in counted down to what is left of it.
             data = r.json().get("data", {})
             self._token = data.get("access_token")
             expires_in = data.get("expires_in", 3600)
             self._token_expiry = now + expires_in
-            logger.info(f"Vagaro token refreshed. Expires in {expires_in}s.")
+            logger.info("Vagaro token refreshed (edge cache %s). Expires in %ss.", cache_status, expires_in)
             return self._token
 
         except requests.exceptions.RequestException as e:
             error_text = e.response.text if hasattr(e, 'response') and e.response is not None else str(e)
-            logger.error(f"Error getting Vagaro token via Worker: {error_text}")
+            logger.error("Error getting Vagaro token via Worker: %s", error_text)
             send_Dev(f"Could not refresh Vagaro token: {error_text}")
             return None
 
+    @vendor_call("vagaro")
     def get_customer_details(self, cust_id: str) -> dict[str, Any] | None:
         """Fetch customer details from Vagaro. Returns customer dict or None."""
         token = self._get_token()
@@ -164,18 +290,31 @@ class VagaroClient:
             return None
 
         try:
-            resp = requests.post(VAGARO_WORKER_URL, json={
-                "businessId": VAGARO_BUSINESS_ID,
-                "customerId": cust_id
-            }, headers={
-                "accessToken": token.strip(),
-                "X-Target-Url": "https://api.vagaro.com/us03/api/v2/customers",
-                "Content-Type": "application/json"
-            }, timeout=10)
+            resp = self._customer_request(cust_id, token)
+            if resp.status_code == 401:
+                # Revoked before its expiry, or a stale copy from the worker's cache: get a new one and try once more.
+                logger.warning("Vagaro refused the access token for customer %s. Refreshing it.", cust_id)
+                token = self._replace_token(token)
+                if token:
+                    resp = self._customer_request(cust_id, token)
             resp.raise_for_status()
             return resp.json().get("data")
         except requests.exceptions.RequestException as e:
             error_text = e.response.text if hasattr(e, 'response') and e.response is not None else str(e)
-            logger.error(f"Vagaro API error fetching customer {cust_id}: {error_text}")
+            logger.error("Vagaro API error fetching customer %s: %s", cust_id, error_text)
             send_Dev(f"STOP GUESSING. VAGARO SAID: {error_text}")
             return None
+
+    def _customer_request(self, cust_id: str, token: str) -> requests.Response:
+        throttle("vagaro")
+        resp = requests.post(VAGARO_WORKER_URL, json={
+            "businessId": VAGARO_BUSINESS_ID,
+            "customerId": cust_id
+        }, headers={
+            "accessToken": token.strip(),
+            "X-Target-Url": "https://api.vagaro.com/us03/api/v2/customers",
+            "Content-Type": "application/json",
+            **trace_headers(),
+        }, timeout=10)
+        record_edge_cache("customer", resp)
+        return resp
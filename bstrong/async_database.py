@@ -0,0 +1,60 @@
+import asyncio, pytz, logging
+from typing import Any
+from datetime import datetime, timedelta
+from google.cloud import firestore
+from google.cloud.firestore_v1.base_query import FieldFilter
+from .database import _deadline
+from .metrics import vendor_call
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatabase:
+    """Database on Firestore's AsyncClient: the same operations, awaitable."""
+
+    def __init__(self):
+        self.database = firestore.AsyncClient(database="bstrong2")
+
+    @vendor_call("firestore")
+    async def checkIfExists(self, collection: str, key: str) -> bool:
+        snapshot = await self.database.collection(collection).document(key).get()
+        if snapshot.exists:
+            logger.info("Duplicate transaction item ignored: %s", key)
+            return True
+        return False
+
+    @vendor_call("firestore")
+    async def add(self, collection: str, key: str, data: dict[str, Any] | None = None, timeout: float | None = None) -> None:
+        await self.database.collection(collection).document(key).set(data or {}, **_deadline(timeout))
+
+    @vendor_call("firestore")
+    async def update(self, collection: str, key: str, data: dict[str, Any], timeout: float | None = None) -> None:
+        await self.database.collection(collection).document(key).update(data, **_deadline(timeout))
+
+    @vendor_call("firestore")
+    async def getData(self, collection: str, key: str) -> Any:
+        return await self.database.collection(collection).document(key).get()
+
+    @vendor_call("firestore")
+    async def delete(self, collection: str, key: str, timeout: float | None = None) -> None:
+        await self.database.collection(collection).document(key).delete(**_deadline(timeout))
+
+    @vendor_call("firestore")
+    async def getAllOldDocs(self) -> list[Any]:
+        two_days_ago = datetime.now(pytz.utc) - timedelta(days=2)
+        filter_condition = FieldFilter('timestamp', '<', two_days_ago)
+        results = await asyncio.gather(*(
+            self.database.collection(name).where(filter=filter_condition).get()
+            # Leases are deleted when released; only those of crashed requests are left behind.
+            for name in ('pending_customers', 'pin_change_tickets', 'processed_transactions', 'flight_leases')
+        ))
+        return [doc for docs in results for doc in docs]
+
+    @vendor_call("firestore")
+    async def getExpiredAutopays(self) -> list[Any]:
+        now = datetime.now(pytz.utc)
+        filter_condition = FieldFilter('expireAt', '<=', now)
+        return await self.database.collection('active_autopays').where(filter=filter_condition).get()
+
+    def getBatch(self) -> Any:
+        return self.database.batch()
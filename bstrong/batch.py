@@ -0,0 +1,152 @@
+import os, threading, time, logging
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class Checkpoint:
+    """
+    Append-only file of finished item keys so an interrupted bulk run can be
+    resumed. Each key is flushed as soon as it is done. Work that has to
+    survive a crash before the item is done (such as a guest already created
+    for it) is noted as a "key<TAB>value" line and read back with noted().
+    """
+
+    def __init__(self, path: str | None):
+        self.path = path
+        self.done: set[str] = set()
+        self.notes: dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            if os.path.exists(path):
+                with open(path) as f:
+                    for line in f:
+                        key, tab, value = line.strip().partition("\t")
+                        if tab:
+                            self.notes[key] = value
+                        elif key:
+                            self.done.add(key)
+            self._file = open(path, "a")
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.done
+
+    def mark(self, key: str) -> None:
+        with self._lock:
+            self.done.add(key)
+            if self._file:
+                self._file.write(f"{key}\n")
+                self._file.flush()
+
+    def note(self, key: str, value: str) -> None:
+        with self._lock:
+            self.notes[key] = value
+            if self._file:
+                self._file.write(f"{key}\t{value}\n")
+                self._file.flush()
+
+    def noted(self, key: str) -> str | None:
+        return self.notes.get(key)
+
+    def close(self) -> None:
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class Throughput:
+    """Thread-safe counters with an items/second summary for bulk jobs."""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def summary(self, unit: str) -> dict[str, Any]:
+        elapsed = time.monotonic() - self.started
+        done = self.counts.get(unit, 0)
+        return {
+            **self.counts,
+            "elapsed_seconds": round(elapsed, 3),
+            f"{unit}_per_second": round(done / elapsed, 2) if elapsed else 0.0,
+        }
+
+
+class BatchWriter:
+    """
+    Buffers Firestore writes and commits them in batches of up to `limit`
+    operations (Firestore caps a batch at 500). Safe to share across threads.
+    """
+
+    def __init__(self, db: Any, limit: int = 400):
+        self.db = db
+        self.limit = limit
+        self.committed = 0
+        self._lock = threading.Lock()
+        self._batch = None
+        self._pending = 0
+
+    def _add(self, op: str, collection: str, key: str, data: dict[str, Any] | None = None) -> None:
+        with self._lock:
+            if self._batch is None:
+                self._batch = self.db.getBatch()
+            reference = self.db.getReference(collection, key)
+            if op == "delete":
+                self._batch.delete(reference)
+            else:
+                getattr(self._batch, op)(reference, data)
+            self._pending += 1
+            if self._pending >= self.limit:
+                self._commit_locked()
+
+    def set(self, collection: str, key: str, data: dict[str, Any]) -> None:
+        self._add("set", collection, key, data)
+
+    def update(self, collection: str, key: str, data: dict[str, Any]) -> None:
+        self._add("update", collection, key, data)
+
+    def delete(self, collection: str, key: str) -> None:
+        self._add("delete", collection, key)
+
+    def _commit_locked(self) -> None:
+        if self._batch is not None and self._pending:
+            self._batch.commit()
+            self.committed += self._pending
+        self._batch = None
+        self._pending = 0
+
+    def flush(self) -> None:
+        with self._lock:
+            self._commit_locked()
+
+
+def run_bounded(func: Callable[[Any], Any], items: Iterable[Any], concurrency: int) -> Iterator[tuple[Any, Any, Exception | None]]:
+    """
+    Apply func to items with at most `concurrency` calls in flight, consuming
+    `items` lazily. Yields (item, result, error) in completion order.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        pending = {}
+        iterator = iter(items)
+        exhausted = False
+        while pending or not exhausted:
+            while not exhausted and len(pending) < max(1, concurrency):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending[pool.submit(func, item)] = item
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                item = pending.pop(future)
+                error = future.exception()
+                yield item, None if error else future.result(), error
@@ -0,0 +1,213 @@
+"""
+Bulk extend or revoke door codes, e.g. to compensate members after a storm
+or holiday closure.
+
+Targets come from `active_autopays` and, optionally, the other tracked codes
+in `pin_change_tickets`. RemoteLock calls fan out with bounded concurrency
+and a rate limit, Firestore changes are committed in batches, and progress
+is written to a `bulk_jobs/{job_id}` status document. A failure on one
+guest is recorded and the job carries on.
+
+    python -m bstrong.bulk_ops extend --days 2
+    python -m bstrong.bulk_ops revoke --collection pin_change_tickets --dry-run
+"""
+import argparse, json, sys, time, uuid, logging
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Iterator
+from google.cloud import firestore
+from .api_clients import RemoteLockClient
+from .ratelimit import TokenBucket
+from .batch import BatchWriter, Throughput, run_bounded
+from .services import AccessWindowPlanner, access_planner, format_remotelock_time, parse_remotelock_time
+
+logger = logging.getLogger(__name__)
+
+EXTEND = "extend"
+REVOKE = "revoke"
+ACTIONS = (EXTEND, REVOKE)
+TARGET_COLLECTIONS = ("active_autopays", "pin_change_tickets")
+JOB_COLLECTION = "bulk_jobs"
+MAX_RECORDED_ERRORS = 50
+
+
+@dataclass
+class BulkTarget:
+    collection: str
+    key: str
+    guest_id: str
+    expire_at: datetime | None = None
+    # Other documents tracking the same guest, which a revoke deletes as well.
+    others: list[tuple[str, str]] = field(default_factory=list)
+
+
+class BulkOperation:
+    def __init__(
+        self,
+        db: Any,
+        rl_client: RemoteLockClient,
+        action: str,
+        days: int = 0,
+        collections: tuple[str, ...] = ("active_autopays",),
+        concurrency: int = 4,
+        rate: float = 5.0,
+        dry_run: bool = False,
+        job_id: str | None = None,
+        planner: AccessWindowPlanner = access_planner,
+        progress_interval: float = 2.0,
+    ):
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown bulk action '{action}', expected one of {ACTIONS}.")
+        if action == EXTEND and days <= 0:
+            raise ValueError("Extending requires a positive number of days.")
+        unknown = set(collections) - set(TARGET_COLLECTIONS)
+        if unknown:
+            raise ValueError(f"Unsupported collections: {sorted(unknown)}")
+
+        self.db = db
+        self.rl_client = rl_client
+        self.action = action
+        self.days = days
+        self.collections = tuple(collections)
+        self.concurrency = concurrency
+        self.dry_run = dry_run
+        self.job_id = job_id or uuid.uuid4().hex
+        self.planner = planner
+        self.limiter = TokenBucket("bulk_ops", rate, capacity=1)
+        self.writer = BatchWriter(db)
+        self.stats = Throughput()
+        self.errors: list[dict[str, str]] = []
+        self._progress_interval = progress_interval
+        self._last_progress = 0.0
+
+    def targets(self) -> Iterator[BulkTarget]:
+        """
+        Stream targets from the selected collections, each RemoteLock guest once.
+        A revoke reads every collection first, so that each target carries all
+        the documents tracking its guest.
+        """
+        seen: dict[str, BulkTarget] = {}
+        for collection in self.collections:
+            for doc in self.db.getCollection(collection):
+                data = doc.to_dict()
+                guest_id = data.get("remote_lock_id")
+                if not guest_id:
+                    continue
+                if guest_id in seen:
+                    seen[guest_id].others.append((collection, doc.id))
+                    continue
+                target = seen[guest_id] = BulkTarget(collection, doc.id, guest_id, data.get("expireAt"))
+                if self.action == EXTEND:
+                    yield target
+        if self.action == REVOKE:
+            yield from seen.values()
+
+    def _extend(self, target: BulkTarget) -> None:
+        if target.expire_at:
+            ends, new_expiry = self.planner.shift_expiry(target.expire_at, self.days)
+        else:
+            self.limiter.acquire()
+            current = parse_remotelock_time(self.rl_client.get_access_person(target.guest_id).get("ends_at"))
+            if current is None:
+                raise ValueError(f"RemoteLock guest {target.guest_id} has no ends_at to extend.")
+            ends, new_expiry = current + timedelta(days=self.days), None
+
+        if self.dry_run:
+            return
+        self.limiter.acquire()
+        self.rl_client.extend_access(target.guest_id, format_remotelock_time(ends))
+        if new_expiry is not None:
+            self.writer.update(target.collection, target.key, {'expireAt': new_expiry})
+
+    def _revoke(self, target: BulkTarget) -> None:
+        if self.dry_run:
+            return
+        # RemoteLock reads a "Z" time as Eastern wall time (the "fake UTC" of services.py).
+        ends = datetime.now(self.planner.tz).replace(microsecond=0, tzinfo=timezone.utc)
+        self.limiter.acquire()
+        starts = parse_remotelock_time(self.rl_client.get_access_person(target.guest_id).get("starts_at"))
+        if starts is not None and ends < starts:
+            ends = starts
+        self.limiter.acquire()
+        self.rl_client.extend_access(target.guest_id, format_remotelock_time(ends))
+        for collection, key in [(target.collection, target.key), *target.others]:
+            self.writer.delete(collection, key)
+
+    def _apply(self, target: BulkTarget) -> None:
+        if self.action == EXTEND:
+            self._extend(target)
+        else:
+            self._revoke(target)
+
+    def _report(self, status: str, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_progress < self._progress_interval:
+            return
+        self._last_progress = now
+        try:
+            self.db.add(JOB_COLLECTION, self.job_id, {
+                'action': self.action,
+                'days': self.days,
+                'collections': list(self.collections),
+                'dry_run': self.dry_run,
+                'status': status,
+                **self.stats.summary("processed"),
+                'errors': self.errors,
+                'updated': firestore.SERVER_TIMESTAMP,
+            })
+        except Exception as e:
+            logger.error("Failed to write status for bulk job %s: %s", self.job_id, e)
+
+    def run(self) -> dict[str, Any]:
+        logger.info("Bulk job %s: %s days=%s collections=%s dry_run=%s", self.job_id, self.action, self.days, self.collections, self.dry_run)
+        self._report("running", force=True)
+        try:
+            for target, _, error in run_bounded(self._apply, self.targets(), self.concurrency):
+                self.stats.incr("processed")
+                if error:
+                    self.stats.incr("failed")
+                    logger.error("Bulk job %s: %s failed for guest %s: %s", self.job_id, self.action, target.guest_id, error)
+                    if len(self.errors) < MAX_RECORDED_ERRORS:
+                        self.errors.append({'guest_id': target.guest_id, 'key': target.key, 'error': str(error)})
+                else:
+                    self.stats.incr("succeeded")
+                self._report("running")
+            self.writer.flush()
+        except Exception as e:
+            logger.error("Bulk job %s aborted: %s", self.job_id, e)
+            self.errors.append({'error': str(e)})
+            self._report("failed", force=True)
+            raise
+
+        status = "completed_with_errors" if self.stats.counts.get("failed") else "completed"
+        self._report(status, force=True)
+        logger.info("Bulk job %s %s: %s", self.job_id, status, self.stats.counts)
+        return {'job_id': self.job_id, 'status': status, **self.stats.summary("processed")}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bstrong.bulk_ops", description=__doc__.split("\n\n")[0])
+    parser.add_argument("action", choices=ACTIONS)
+    parser.add_argument("--days", type=int, default=0, help="days to extend each code by")
+    parser.add_argument("--collection", action="append", choices=TARGET_COLLECTIONS,
+                        help="collection to select codes from (repeatable, default active_autopays)")
+    parser.add_argument("--concurrency", type=int, default=4, help="max RemoteLock calls in flight (default 4)")
+    parser.add_argument("--rate", type=float, default=5.0, help="max RemoteLock requests per second, 0 for unlimited (default 5)")
+    parser.add_argument("--dry-run", action="store_true", help="select targets and report without changing anything")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s %(message)s")
+    from .database import Database
+
+    operation = BulkOperation(
+        Database(), RemoteLockClient(), args.action, days=args.days,
+        collections=tuple(args.collection or ("active_autopays",)),
+        concurrency=args.concurrency, rate=args.rate, dry_run=args.dry_run,
+    )
+    summary = operation.run()
+    print(json.dumps(summary, indent=2))
+    return 1 if summary.get("failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
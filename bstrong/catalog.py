@@ -0,0 +1,164 @@
+import threading, logging
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any
+from .config import MEMBERSHIP_DURATIONS
+
+logger = logging.getLogger(__name__)
+
+CATALOG_COLLECTION = "membership_catalog"
+
+# Access window kinds.
+DAY_PASS = "day_pass"
+MONTHLY = "monthly"
+FIXED = "fixed"
+UNKNOWN = "unknown"
+
+# Fallback pattern table, checked in order for items with no exact match.
+FALLBACK_PATTERNS: tuple[tuple[tuple[str, ...], str], ...] = (
+    (("day pass",), DAY_PASS),
+    (("1 month",), MONTHLY),
+)
+AUTOPAY_PATTERN = ("monthly", "autopay")
+CLASS_DAY_PASS_PATTERN = ("day pass", "4am-10pm")
+PACKAGE_DAY_PASS = "day pass"
+# Every purchase type the patterns above can admit for an item with no catalog entry.
+PATTERN_PURCHASE_TYPES = frozenset({"Membership", "Class", "Package"})
+
+
+@dataclass(frozen=True)
+class MembershipProduct:
+    key: str
+    kind: str
+    duration: timedelta = timedelta(0)
+    autopay: bool = False
+    purchase_types: frozenset[str] = frozenset({"Membership"})
+
+    @property
+    def is_day_pass(self) -> bool:
+        return self.kind == DAY_PASS
+
+
+def normalize_item(item: str | None) -> str:
+    """Lowercase and collapse whitespace so Vagaro item names match exactly."""
+    return " ".join((item or "").lower().split())
+
+
+def _matches(key: str, pattern: tuple[str, ...]) -> bool:
+    return all(part in key for part in pattern)
+
+
+def compile_product(key: str, duration: timedelta | None = None, overrides: dict[str, Any] | None = None) -> MembershipProduct:
+    """Build a product from the fallback patterns, a known duration and any explicit overrides."""
+    overrides = overrides or {}
+
+    kind = next((k for pattern, k in FALLBACK_PATTERNS if _matches(key, pattern)), None)
+    if kind is None:
+        kind = FIXED if duration is not None else UNKNOWN
+
+    purchase_types = {"Membership"}
+    if _matches(key, CLASS_DAY_PASS_PATTERN):
+        purchase_types.add("Class")
+    if key == PACKAGE_DAY_PASS:
+        purchase_types.add("Package")
+
+    if "days" in overrides:
+        duration = timedelta(days=int(overrides["days"]))
+    if "purchase_types" in overrides:
+        purchase_types = set(overrides["purchase_types"]) | {"Membership"}
+
+    return MembershipProduct(
+        key=key,
+        kind=overrides.get("kind", kind),
+        duration=duration or timedelta(0),
+        autopay=bool(overrides.get("autopay", _matches(key, AUTOPAY_PATTERN))),
+        purchase_types=frozenset(purchase_types),
+    )
+
+
+class MembershipCatalog:
+    """
+    Membership classification compiled into an exact-match index on normalized
+    item names. Items with no exact entry fall through the pattern table, and
+    every raw item string is memoized after its first classification. Entries can be added or overridden from the
+    Firestore `membership_catalog` collection and refreshed in the background.
+    """
+
+    def __init__(self, durations: dict[str, timedelta] | None = None, max_learned: int = 1024):
+        self._durations = MEMBERSHIP_DURATIONS if durations is None else durations
+        self._max_learned = max_learned
+        self._index = self._compile([])
+        self.purchase_types = self._purchase_types(self._index)
+        self._learned: dict[str, MembershipProduct] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.loaded_entries = 0
+
+    def _compile(self, docs: list[dict[str, Any]]) -> dict[str, MembershipProduct]:
+        index = {}
+        for name, duration in self._durations.items():
+            key = normalize_item(name)
+            index[key] = compile_product(key, duration)
+        for doc in docs:
+            key = normalize_item(doc.get("name"))
+            if not key:
+                continue
+            index[key] = compile_product(key, self._durations.get(key), doc)
+        return index
+
+    @staticmethod
+    def _purchase_types(index: dict[str, MembershipProduct]) -> frozenset[str]:
+        """Purchase types relevant for at least one item; events of any other type can be ignored unread."""
+        return PATTERN_PURCHASE_TYPES.union(*(product.purchase_types for product in index.values()))
+
+    def classify(self, item: str | None) -> MembershipProduct:
+        # Raw item strings repeat across webhooks, so they are memoized as-is
+        # and only normalized on the first sighting.
+        product = self._learned.get(item)
+        if product is None:
+            key = normalize_item(item)
+            product = self._index.get(key) or compile_product(key)
+            if len(self._learned) >= self._max_learned:
+                self._learned = {}
+            self._learned[item] = product
+        return product
+
+    def is_relevant(self, purchase_type: str | None, item: str | None) -> bool:
+        return purchase_type in self.classify(item).purchase_types
+
+    def load(self, db: Any) -> int:
+        """Recompile from the Firestore catalog. Keeps the current index on failure."""
+        try:
+            docs = [doc.to_dict() for doc in db.getCollection(CATALOG_COLLECTION)]
+            index = self._compile(docs)
+        except Exception as e:
+            logger.error("Failed to load membership catalog from Firestore: %s", e)
+            return 0
+
+        self.purchase_types = self._purchase_types(index)
+        self._index = index
+        self._learned = {}
+        self.loaded_entries = len(docs)
+        logger.info("Membership catalog compiled: %s products (%s from Firestore).", len(index), len(docs))
+        return len(docs)
+
+    def start_refresh(self, db: Any, interval: float) -> None:
+        """Load now and then every `interval` seconds on a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while True:
+                self.load(db)
+                if self._stop.wait(interval):
+                    return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="membership-catalog-refresh", daemon=True)
+        self._thread.start()
+
+    def stop_refresh(self) -> None:
+        self._stop.set()
+
+
+membership_catalog = MembershipCatalog()
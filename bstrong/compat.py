@@ -0,0 +1,32 @@
+"""
+Cooperative (gevent) worker support. gunicorn's gevent worker monkeypatches the
+standard library before importing the app; gRPC (used by the Firestore and
+Secret Manager clients) does its own I/O in C and must be told to yield to the
+gevent hub, or a single Firestore call blocks every greenlet on the instance.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+_initialized = False
+
+
+def cooperative() -> bool:
+    """True when the process runs under gevent with the socket module patched."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched("socket")
+
+
+def init_cooperative() -> bool:
+    """Make gRPC gevent-aware if the process is monkeypatched. Call before any Google client is created."""
+    global _initialized
+    if _initialized or not cooperative():
+        return _initialized
+    from grpc.experimental import gevent as grpc_gevent
+    grpc_gevent.init_gevent()
+    _initialized = True
+    logger.info("gevent detected: gRPC switched to cooperative polling.")
+    return True
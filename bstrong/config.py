@@ -1,4 +1,4 @@
-import os, logging
+import os, logging, threading, time
 from typing import Any
 from google.cloud import secretmanager
 from datetime import timedelta
@@ -7,6 +7,109 @@ logger = logging.getLogger(__name__)
 
 GCP_PROJECT_ID = os.getenv("GCP_PROJECT_ID")
 
+# Seconds between membership catalog reloads from Firestore (0 disables).
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "300"))
+
+
+def _rate_limit(vendor: str, default: str) -> tuple[float, float]:
+    """Parse RATE_LIMIT_<VENDOR> as "<requests per second>,<burst>". A rate of 0 disables the limit."""
+    rate, _, burst = os.getenv(f"RATE_LIMIT_{vendor.upper()}", default).partition(",")
+    return float(rate), float(burst or max(1.0, float(rate)))
+
+
+# Outbound request budgets per vendor, shared by every client in the instance.
+VENDOR_RATE_LIMITS = {
+    "remotelock": _rate_limit("remotelock", "5,10"),
+    "vagaro": _rate_limit("vagaro", "2,5"),
+    "twilio": _rate_limit("twilio", "5,10"),
+}
+RATE_LIMIT_TIMEOUT_SECONDS = float(os.getenv("RATE_LIMIT_TIMEOUT_SECONDS", "10"))
+# "local" (per instance) or "firestore" (coordinated across Cloud Run instances).
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local")
+
+# Pre-provisioned RemoteLock guests kept ready for purchases (0 disables the pool).
+GUEST_POOL_SIZE = int(os.getenv("GUEST_POOL_SIZE", "0"))
+GUEST_POOL_REFRESH_SECONDS = float(os.getenv("GUEST_POOL_REFRESH_SECONDS", "60"))
+
+# JSON lock topology (locations, locks, schedules and per-membership rules); unset means the single LOCK_ID secret.
+LOCK_TOPOLOGY = os.getenv("LOCK_TOPOLOGY", "")
+# Attempts per lock when granting access, with exponential backoff starting at LOCK_GRANT_BACKOFF_SECONDS.
+LOCK_GRANT_ATTEMPTS = int(os.getenv("LOCK_GRANT_ATTEMPTS", "3"))
+LOCK_GRANT_BACKOFF_SECONDS = float(os.getenv("LOCK_GRANT_BACKOFF_SECONDS", "0.5"))
+# Lock grants in flight at once across all purchases in the instance.
+LOCK_GRANT_CONCURRENCY = int(os.getenv("LOCK_GRANT_CONCURRENCY", "8"))
+
+# Seconds between full rebuilds of the local RemoteLock PIN index (0 disables).
+PIN_INDEX_REFRESH_SECONDS = float(os.getenv("PIN_INDEX_REFRESH_SECONDS", "900"))
+# A PIN the index says is taken is refused without asking RemoteLock only while the
+# last rebuild is at most this old; otherwise RemoteLock's 422 decides.
+PIN_INDEX_MAX_AGE_SECONDS = float(os.getenv("PIN_INDEX_MAX_AGE_SECONDS", "1800"))
+
+# Bloom filter of phones with a PIN change ticket, consulted before the Firestore read on /webhook-sms.
+TICKET_FILTER_CAPACITY = int(os.getenv("TICKET_FILTER_CAPACITY", "20000"))
+TICKET_FILTER_FP_RATE = float(os.getenv("TICKET_FILTER_FP_RATE", "0.01"))
+# Seconds between full rebuilds (0 disables the filter); a Firestore listener applies changes in between.
+TICKET_FILTER_REFRESH_SECONDS = float(os.getenv("TICKET_FILTER_REFRESH_SECONDS", "3600"))
+
+# Failed provisioning is replayed from `dead_letters` every DEAD_LETTER_REPLAY_SECONDS (0 disables the worker),
+# backing off from DEAD_LETTER_BACKOFF_SECONDS up to DEAD_LETTER_MAX_BACKOFF_SECONDS, and the owners are
+# alerted once an entry has failed DEAD_LETTER_MAX_ATTEMPTS replays.
+DEAD_LETTER_REPLAY_SECONDS = float(os.getenv("DEAD_LETTER_REPLAY_SECONDS", "30"))
+DEAD_LETTER_MAX_ATTEMPTS = int(os.getenv("DEAD_LETTER_MAX_ATTEMPTS", "6"))
+DEAD_LETTER_BACKOFF_SECONDS = float(os.getenv("DEAD_LETTER_BACKOFF_SECONDS", "60"))
+DEAD_LETTER_MAX_BACKOFF_SECONDS = float(os.getenv("DEAD_LETTER_MAX_BACKOFF_SECONDS", "1800"))
+
+# Concurrent webhooks for the same transaction or customer share one run in-process. With a lease of this many
+# seconds (0 disables), a Firestore lease per transaction also makes other instances wait for it.
+SINGLE_FLIGHT_LEASE_SECONDS = float(os.getenv("SINGLE_FLIGHT_LEASE_SECONDS", "0"))
+
+# Seconds a transaction with no pending form waits for the form webhook before calling the Vagaro API (0 disables).
+# Keep it well under Vagaro's webhook timeout; a Firestore listener on pending_customers covers other instances.
+FORM_WAIT_SECONDS = float(os.getenv("FORM_WAIT_SECONDS", "0"))
+
+# Fill waiver forms that lack a name or a valid phone from the Vagaro profile in the background, so the
+# transaction finds a resolved record instead of calling Vagaro itself.
+FORM_VAGARO_PREFETCH = os.getenv("FORM_VAGARO_PREFETCH", "false").lower() in ("1", "true", "yes")
+
+# Firestore writes that fail or take longer than FIRESTORE_WRITE_BUDGET_SECONDS are kept in a local SQLite journal at
+# FIRESTORE_JOURNAL_PATH (unset disables it) and replayed in order every FIRESTORE_JOURNAL_REPLAY_SECONDS.
+FIRESTORE_JOURNAL_PATH = os.getenv("FIRESTORE_JOURNAL_PATH", "")
+FIRESTORE_WRITE_BUDGET_SECONDS = float(os.getenv("FIRESTORE_WRITE_BUDGET_SECONDS", "2"))
+FIRESTORE_JOURNAL_REPLAY_SECONDS = float(os.getenv("FIRESTORE_JOURNAL_REPLAY_SECONDS", "5"))
+
+# Vagaro webhook bodies larger than this are refused with 413 before they are read or parsed.
+WEBHOOK_MAX_BYTES = int(os.getenv("WEBHOOK_MAX_BYTES", "65536"))
+
+# Repeats of an alert within this many seconds are folded into one digest SMS per recipient.
+ALERT_WINDOW_SECONDS = float(os.getenv("ALERT_WINDOW_SECONDS", "300"))
+# Alert SMS per recipient per hour; beyond it alerts are held for one digest when the hour frees up.
+ALERT_BUDGET_PER_HOUR = int(os.getenv("ALERT_BUDGET_PER_HOUR", "10"))
+
+# Log output: "json" (one object per line, for Cloud Logging) or "text".
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Set up logging as soon as app.py is imported, before anything it logs while loading. Tests set 0 to keep pytest's handlers.
+LOG_CONFIGURE_ON_IMPORT = os.getenv("LOG_CONFIGURE_ON_IMPORT", "1") == "1"
+# Records buffered between request threads and the log writer thread; overflow is dropped, never waited on.
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+
+def _sample_rates(spec: str) -> dict[str, float]:
+    """Parse LOG_SAMPLE_RATES as "<route>=<fraction>,...", e.g. "/webhook-sms=0.25,/health=0"."""
+    rates = {}
+    for entry in filter(None, (e.strip() for e in spec.split(","))):
+        route, _, rate = entry.partition("=")
+        rates[route.strip()] = float(rate)
+    return rates
+
+
+# Fraction of requests per route whose INFO logs are kept; warnings and errors always are.
+LOG_SAMPLE_RATES = _sample_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+
+# Seconds a failed Secret Manager fetch is remembered; Config.get returns None for the key meanwhile
+# instead of calling Secret Manager again on every request.
+CONFIG_FAILURE_TTL_SECONDS = float(os.getenv("CONFIG_FAILURE_TTL_SECONDS", "30"))
+
 MEMBERSHIP_DURATIONS = {
     "weekend warrior": timedelta(days=2),
     "1 week pass": timedelta(weeks=1),
@@ -20,18 +123,36 @@ MEMBERSHIP_DURATIONS = {
 
 class Config:
     _secrets = {}
+    # One Secret Manager fetch per key even when many threads/greenlets miss at once; a slow
+    # fetch only holds up callers of the same key.
+    _locks: dict[str, threading.Lock] = {}
+    _locks_lock = threading.Lock()
+    _failures: dict[str, float] = {}  # key -> monotonic time of its last failed fetch
+
+    @classmethod
+    def _lock_for(cls, key: str) -> threading.Lock:
+        with cls._locks_lock:
+            return cls._locks.setdefault(key, threading.Lock())
 
     @classmethod
     def get(cls, key: str) -> str | None:
         if key in cls._secrets:
             return cls._secrets[key]
-        try:
-            val = get_secret(key)
+        with cls._lock_for(key):
+            if key in cls._secrets:
+                return cls._secrets[key]
+            failed = cls._failures.get(key)
+            if failed is not None and time.monotonic() - failed < CONFIG_FAILURE_TTL_SECONDS:
+                return None
+            try:
+                val = get_secret(key)
+            except Exception as e:
+                cls._failures[key] = time.monotonic()
+                logger.error("Failed to fetch config key '%s': %s", key, e)
+                return None
+            cls._failures.pop(key, None)
             cls._secrets[key] = val
             return val
-        except Exception as e:
-            logger.error(f"Failed to fetch config key '{key}': {e}")
-            return None
 
 
 def get_secret(secret_id: str, version_id: str = "latest") -> str:
@@ -45,5 +166,5 @@ def get_secret(secret_id: str, version_id: str = "latest") -> str:
         response = client.access_secret_version(request={"name": name})
         return response.payload.data.decode("UTF-8")
     except Exception as e:
-        logger.error(f"Error accessing secret '{secret_id}': {e}")
+        logger.error("Error accessing secret '%s': %s", secret_id, e)
         raise e
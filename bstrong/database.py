@@ -1,43 +1,142 @@
 import pytz, logging
-from typing import Any
+from typing import Any, Callable
 from datetime import datetime, timedelta
 from google.cloud import firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
+from .metrics import vendor_call
 
 logger = logging.getLogger(__name__)
 
 
+def _deadline(timeout: float | None) -> dict[str, Any]:
+    """Call options for a write bounded by `timeout`: one attempt, no client retries."""
+    return {} if timeout is None else {'retry': None, 'timeout': timeout}
+
+
 class Database:
     def __init__(self):
         self.database = firestore.Client(database="bstrong2")
 
+    @vendor_call("firestore")
     def checkIfExists(self, collection: str, key: str) -> bool:
         reference = self.database.collection(collection).document(key)
         if reference.get().exists:
-            logger.info(f"Duplicate transaction item ignored: {key}")
+            logger.info("Duplicate transaction item ignored: %s", key)
             return True
         else:
             return False
 
-    def add(self, collection: str, key: str, data: dict[str, Any] | None = None) -> None:
+    @vendor_call("firestore")
+    def add(self, collection: str, key: str, data: dict[str, Any] | None = None, timeout: float | None = None) -> None:
         reference = self.database.collection(collection).document(key)
         if data:
-            reference.set(data)
+            reference.set(data, **_deadline(timeout))
         else:
-            reference.set({})
+            reference.set({}, **_deadline(timeout))
 
-    def update(self, collection: str, key: str, data: dict[str, Any]) -> None:
+    @vendor_call("firestore")
+    def update(self, collection: str, key: str, data: dict[str, Any], timeout: float | None = None) -> None:
         reference = self.database.collection(collection).document(key)
-        reference.update(data)
+        reference.update(data, **_deadline(timeout))
 
+    @vendor_call("firestore")
     def getData(self, collection: str, key: str) -> Any:
         reference = self.database.collection(collection).document(key)
         return reference.get()
 
-    def delete(self, collection: str, key: str) -> None:
+    def getCollection(self, collection: str) -> Any:
+        return self.database.collection(collection).stream()
+
+    @vendor_call("firestore")
+    def listKeys(self, collection: str) -> list[str]:
+        """Document IDs only; no fields are read."""
+        return [doc.id for doc in self.database.collection(collection).select([]).stream()]
+
+    def watchCollection(self, collection: str, on_change: Callable[[list[str], list[str]], None]) -> Any:
+        """Call on_change(added_ids, removed_ids) for every change to a collection. Returns the watch."""
+        def on_snapshot(_docs, changes, _read_time):
+            added = [c.document.id for c in changes if c.type.name == "ADDED"]
+            removed = [c.document.id for c in changes if c.type.name == "REMOVED"]
+            on_change(added, removed)
+
+        return self.database.collection(collection).on_snapshot(on_snapshot)
+
+    @vendor_call("firestore")
+    def countDocuments(self, collection: str) -> int:
+        result = self.database.collection(collection).count().get()
+        return int(result[0][0].value)
+
+    @vendor_call("firestore")
+    def claimOne(self, collection: str) -> Any | None:
+        """Atomically take (read and delete) the oldest document in a collection, or None if empty."""
+        query = self.database.collection(collection).order_by('created').limit(1)
+
+        @firestore.transactional
+        def claim(transaction):
+            docs = list(query.stream(transaction=transaction))
+            if not docs:
+                return None
+            transaction.delete(docs[0].reference)
+            return docs[0]
+
+        return claim(self.database.transaction())
+
+    @vendor_call("firestore")
+    def claimDue(self, collection: str, now: datetime, lease_until: datetime) -> Any | None:
+        """
+        Atomically take the pending document with the earliest `next_attempt` at
+        or before `now`, pushing its `next_attempt` to `lease_until`. None if none are due.
+        """
+        query = (self.database.collection(collection)
+                 .where(filter=FieldFilter('status', '==', 'pending'))
+                 .where(filter=FieldFilter('next_attempt', '<=', now))
+                 .order_by('next_attempt').limit(1))
+
+        @firestore.transactional
+        def claim(transaction):
+            docs = list(query.stream(transaction=transaction))
+            if not docs:
+                return None
+            transaction.update(docs[0].reference, {'next_attempt': lease_until})
+            return docs[0]
+
+        return claim(self.database.transaction())
+
+    @vendor_call("firestore")
+    def acquireLease(self, collection: str, key: str, owner: str, now: datetime, until: datetime) -> bool:
+        """Take or renew the lease document `key` for `owner` until `until`, unless another owner's lease is still live."""
+        reference = self.database.collection(collection).document(key)
+
+        @firestore.transactional
+        def acquire(transaction):
+            snapshot = reference.get(transaction=transaction)
+            data = snapshot.to_dict() if snapshot.exists else None
+            if data and data.get('owner') != owner and data.get('expires') > now:
+                return False
+            transaction.set(reference, {'owner': owner, 'expires': until, 'timestamp': firestore.SERVER_TIMESTAMP})
+            return True
+
+        return acquire(self.database.transaction())
+
+    @vendor_call("firestore")
+    def releaseLease(self, collection: str, key: str, owner: str) -> None:
+        """Delete the lease document `key` if `owner` still holds it."""
         reference = self.database.collection(collection).document(key)
-        reference.delete()
 
+        @firestore.transactional
+        def release(transaction):
+            snapshot = reference.get(transaction=transaction)
+            if snapshot.exists and snapshot.to_dict().get('owner') == owner:
+                transaction.delete(reference)
+
+        release(self.database.transaction())
+
+    @vendor_call("firestore")
+    def delete(self, collection: str, key: str, timeout: float | None = None) -> None:
+        reference = self.database.collection(collection).document(key)
+        reference.delete(**_deadline(timeout))
+
+    @vendor_call("firestore")
     def getAllOldDocs(self) -> list[Any]:
         two_days_ago = datetime.now(pytz.utc) - timedelta(days=2)
         filter_condition = FieldFilter('timestamp', '<', two_days_ago)
@@ -45,11 +144,20 @@ class Database:
         docs_pending = self.database.collection('pending_customers').where(filter=filter_condition).get()
         docs_tickets = self.database.collection('pin_change_tickets').where(filter=filter_condition).get()
         docs_transactions = self.database.collection('processed_transactions').where(filter=filter_condition).get()
-        return docs_pending + docs_tickets + docs_transactions
+        # Leases are deleted when released; only those of crashed requests are left behind.
+        docs_leases = self.database.collection('flight_leases').where(filter=filter_condition).get()
+        return docs_pending + docs_tickets + docs_transactions + docs_leases
+
+    def getReference(self, collection: str, key: str) -> Any:
+        return self.database.collection(collection).document(key)
+
+    def getTransaction(self) -> Any:
+        return self.database.transaction()
 
     def getBatch(self) -> Any:
         return self.database.batch()
 
+    @vendor_call("firestore")
     def getExpiredAutopays(self) -> list[Any]:
         now = datetime.now(pytz.utc)
         filter_condition = FieldFilter('expireAt', '<=', now)
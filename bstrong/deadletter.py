@@ -0,0 +1,163 @@
+import threading, logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+from google.cloud import firestore
+from .metrics import DEAD_LETTERS
+
+logger = logging.getLogger(__name__)
+
+DEAD_LETTER_COLLECTION = "dead_letters"
+
+PENDING = "pending"
+RESOLVED = "resolved"
+FAILED = "failed"
+
+
+class PermanentFailure(Exception):
+    """Raised by a replay handler when retrying can never succeed."""
+
+
+class DeadLetterQueue:
+    """
+    Failed provisioning captured with its resolved context in the Firestore
+    `dead_letters` collection, keyed by transaction id. A worker claims due
+    entries one at a time (the claim pushes `next_attempt` out, so a crashed
+    replay is retried after the lease and instances never replay the same
+    entry at once), retries with exponential backoff, and calls
+    `on_permanent_failure` once when an entry gives up. A replay error with a
+    `context` dict (progress such as a guest already created) is merged into
+    the entry, so the next replay resumes instead of starting over.
+    """
+
+    def __init__(
+        self,
+        db: Any,
+        replay: Callable[[str, dict[str, Any]], None],
+        on_permanent_failure: Callable[[str, dict[str, Any]], None],
+        max_attempts: int = 6,
+        backoff: float = 60.0,
+        max_backoff: float = 1800.0,
+        lease: float = 300.0,
+        clock: Callable[[], datetime] = lambda: datetime.now(timezone.utc),
+    ):
+        self.db = db
+        self.replay = replay
+        self.on_permanent_failure = on_permanent_failure
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.lease = lease
+        self._clock = clock
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def _delay(self, attempts: int) -> timedelta:
+        return timedelta(seconds=min(self.max_backoff, self.backoff * 2 ** max(0, attempts - 1)))
+
+    def capture(self, key: str, context: dict[str, Any], stage: str, error: str) -> None:
+        """Record a failed transaction for replay. Raises if Firestore is unavailable."""
+        self.db.add(DEAD_LETTER_COLLECTION, key, {
+            **context,
+            'stage': stage,
+            'error': error,
+            'status': PENDING,
+            'attempts': 0,
+            'next_attempt': self._clock() + self._delay(1),
+            'created': firestore.SERVER_TIMESTAMP,
+        })
+        DEAD_LETTERS.inc(outcome="captured")
+        logger.warning("Dead-lettered transaction %s at stage %s: %s", key, stage, error)
+
+    def _give_up(self, key: str, entry: dict[str, Any], attempts: int, error: str, progress: dict[str, Any] | None = None) -> None:
+        self.db.update(DEAD_LETTER_COLLECTION, key, {**(progress or {}), 'status': FAILED, 'attempts': attempts, 'error': error})
+        DEAD_LETTERS.inc(outcome="failed")
+        logger.error("Dead letter %s failed permanently after %s attempts: %s", key, attempts, error)
+        self.on_permanent_failure(key, {**entry, **(progress or {}), 'attempts': attempts, 'error': error})
+
+    def replay_one(self, key: str, entry: dict[str, Any]) -> str:
+        """Replay a claimed entry and record the result. Returns the new status."""
+        attempts = entry.get('attempts', 0) + 1
+        try:
+            self.replay(key, entry)
+        except PermanentFailure as e:
+            self._give_up(key, entry, attempts, str(e))
+            return FAILED
+        except Exception as e:
+            progress = getattr(e, 'context', None) or {}
+            if attempts >= self.max_attempts:
+                self._give_up(key, entry, attempts, str(e), progress)
+                return FAILED
+            self.db.update(DEAD_LETTER_COLLECTION, key, {
+                **progress,
+                'attempts': attempts,
+                'error': str(e),
+                'next_attempt': self._clock() + self._delay(attempts + 1),
+            })
+            DEAD_LETTERS.inc(outcome="retried")
+            logger.warning("Replay of dead letter %s failed (attempt %s): %s", key, attempts, e)
+            return PENDING
+
+        self.db.update(DEAD_LETTER_COLLECTION, key, {'status': RESOLVED, 'attempts': attempts, 'resolved': firestore.SERVER_TIMESTAMP})
+        DEAD_LETTERS.inc(outcome="resolved")
+        logger.info("Dead letter %s replayed successfully on attempt %s.", key, attempts)
+        return RESOLVED
+
+    def replay_due(self, limit: int = 50) -> dict[str, int]:
+        """Claim and replay due entries until none are left or `limit` is reached."""
+        counts = {PENDING: 0, RESOLVED: 0, FAILED: 0}
+        for _ in range(limit):
+            now = self._clock()
+            doc = self.db.claimDue(DEAD_LETTER_COLLECTION, now, now + timedelta(seconds=self.lease))
+            if doc is None:
+                break
+            counts[self.replay_one(doc.id, doc.to_dict())] += 1
+        return counts
+
+    def requeue(self, keys: list[str] | None = None, include_failed: bool = False) -> int:
+        """Make entries due now, optionally reviving permanently failed ones. Returns the number requeued."""
+        statuses = (PENDING, FAILED) if include_failed else (PENDING,)
+        requeued = 0
+        for doc in self.db.getCollection(DEAD_LETTER_COLLECTION):
+            data = doc.to_dict()
+            if (keys is not None and doc.id not in keys) or data.get('status') not in statuses:
+                continue
+            update = {'status': PENDING, 'next_attempt': self._clock()}
+            if data.get('status') == FAILED:
+                update['attempts'] = 0
+            self.db.update(DEAD_LETTER_COLLECTION, doc.id, update)
+            requeued += 1
+        if requeued:
+            self._wake.set()
+        return requeued
+
+    def entries(self, status: str | None = None) -> list[dict[str, Any]]:
+        return [
+            {'id': doc.id, **doc.to_dict()}
+            for doc in self.db.getCollection(DEAD_LETTER_COLLECTION)
+            if status is None or doc.to_dict().get('status') == status
+        ]
+
+    def start(self, interval: float) -> None:
+        """Replay due entries every `interval` seconds, and right after a requeue, on a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.is_set():
+                self._wake.wait(interval)
+                self._wake.clear()
+                if self._stop.is_set():
+                    break
+                try:
+                    self.replay_due()
+                except Exception as e:
+                    logger.error("Dead letter replay pass failed: %s", e)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="dead-letter-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,99 @@
+import threading, time, logging
+from typing import Any
+from .metrics import FORM_WAIT
+
+logger = logging.getLogger(__name__)
+
+PENDING_COLLECTION = "pending_customers"
+
+
+class FormWaiter:
+    """
+    Lets a transaction wait a short while for its customer's waiver form.
+    Online signups often deliver the transaction webhook just before the form
+    webhook; instead of going straight to the rate-limited Vagaro API, the
+    transaction waits up to `timeout` seconds for the form to be stored.
+
+    Forms stored by this instance notify waiters directly; with a Firestore
+    listener on pending_customers, forms stored by other instances do too.
+    Arrivals are remembered for one window, so a form that lands between the
+    pending lookup and the wait is not missed.
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._waiters: dict[str, list[threading.Event]] = {}
+        self._arrived: dict[str, float] = {}  # customer_id -> monotonic arrival time, oldest first
+        self._watch: Any = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.timeout > 0
+
+    def notify(self, customer_id: str) -> None:
+        """A form for `customer_id` was stored; wake its waiters."""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._arrived.pop(customer_id, None)
+            self._arrived[customer_id] = now
+            for key, at in list(self._arrived.items()):
+                if now - at <= self.timeout:
+                    break
+                del self._arrived[key]
+            waiters = self._waiters.pop(customer_id, [])
+        for event in waiters:
+            event.set()
+
+    def apply_changes(self, added: list[str], removed: list[str]) -> None:
+        """Firestore listener callback for pending_customers."""
+        for customer_id in added:
+            self.notify(customer_id)
+
+    def wait(self, customer_id: str) -> bool:
+        """Block until a form for `customer_id` is stored or the window closes. True if it arrived."""
+        event = threading.Event()
+        with self._lock:
+            at = self._arrived.get(customer_id)
+            if at is not None and time.monotonic() - at <= self.timeout:
+                return True
+            self._waiters.setdefault(customer_id, []).append(event)
+        arrived = event.wait(self.timeout)
+        if not arrived:
+            with self._lock:
+                waiters = self._waiters.get(customer_id, [])
+                if event in waiters:
+                    waiters.remove(event)
+                if not waiters:
+                    self._waiters.pop(customer_id, None)
+        return arrived
+
+    @staticmethod
+    def record(arrived: bool, usable: bool) -> None:
+        """Count how a wait ended: "avoided" means the form spared a Vagaro call."""
+        if not arrived:
+            FORM_WAIT.inc(result="missed")
+        elif usable:
+            FORM_WAIT.inc(result="avoided")
+        else:
+            FORM_WAIT.inc(result="unusable")
+
+    def waiting(self) -> int:
+        with self._lock:
+            return sum(len(w) for w in self._waiters.values())
+
+    def start_listening(self, db: Any) -> None:
+        """Hear about forms stored by other instances through a Firestore listener."""
+        if self._watch is not None:
+            return
+        try:
+            self._watch = db.watchCollection(PENDING_COLLECTION, self.apply_changes)
+        except Exception as e:
+            logger.error("Form listener failed to start, only forms stored here will end a wait: %s", e)
+
+    def stop(self) -> None:
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
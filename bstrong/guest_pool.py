@@ -0,0 +1,136 @@
+import threading, uuid, logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple
+import requests
+from google.cloud import firestore
+from .singleflight import LEASE_COLLECTION, INSTANCE_ID
+from .topology import get_topology, grant_locks
+
+logger = logging.getLogger(__name__)
+
+POOL_COLLECTION = "guest_pool"
+POOL_GUEST_NAME = "B-STRONG POOL"
+
+# Pooled guests are parked with a window far in the future, so their PINs do
+# not open the door until a purchase claims them and sets the real window.
+PARKED_START_OFFSET = timedelta(days=5 * 365)
+
+# One instance at a time tops the pool up. The lease is renewed before each
+# guest, so it only has to outlast a single create and grant.
+REPLENISH_LEASE_KEY = "guest_pool:replenish"
+REPLENISH_LEASE = timedelta(minutes=2)
+
+
+class PooledGuest(NamedTuple):
+    guest_id: str
+    pin: str
+
+
+def _remotelock_time(value: datetime) -> str:
+    return value.replace(microsecond=0).isoformat().replace("+00:00", "Z")
+
+
+class GuestPool:
+    """
+    Warm pool of RemoteLock access guests that already have a PIN and lock
+    access. Purchases claim one and activate it with a single update instead
+    of create_access_person + grant_lock_access. Pool membership lives in the
+    Firestore `guest_pool` collection so claims are atomic across instances.
+    """
+
+    def __init__(self, db: Any, rl_client: Any, target_size: int):
+        self.db = db
+        self.rl_client = rl_client
+        self.target_size = target_size
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.claimed = 0
+        self.misses = 0
+
+    def claim(self) -> PooledGuest | None:
+        """Take a ready guest from the pool, or None if empty or Firestore fails."""
+        try:
+            doc = self.db.claimOne(POOL_COLLECTION)
+        except Exception as e:
+            logger.error("Failed to claim pooled RemoteLock guest: %s", e)
+            doc = None
+
+        if doc is None:
+            self.misses += 1
+            logger.info("Guest pool empty, provisioning a new RemoteLock guest.")
+            self._wake.set()
+            return None
+
+        self.claimed += 1
+        self._wake.set()
+        return PooledGuest(doc.id, doc.to_dict()["pin"])
+
+    def provision_one(self) -> PooledGuest:
+        """Create a parked guest with a PIN and lock access and add it to the pool."""
+        topology = get_topology()
+        if topology is None:
+            raise RuntimeError("Missing LOCK_ID in config.")
+
+        starts = datetime.now(timezone.utc) + PARKED_START_OFFSET
+        guest_id, pin = self.rl_client.create_access_person(
+            name=f"{POOL_GUEST_NAME} {uuid.uuid4().hex[:8]}",
+            starts_at=_remotelock_time(starts),
+            ends_at=_remotelock_time(starts + timedelta(days=1)),
+        )
+        grants = grant_locks(self.rl_client, guest_id, topology.default_locks())
+        if grants.failed:
+            try:
+                self.rl_client.delete_access_person(guest_id)
+            except (RuntimeError, requests.exceptions.RequestException) as e:
+                logger.error("Could not delete ungranted pool guest %s: %s", guest_id, e)
+            raise RuntimeError(f"Could not grant pooled guest {guest_id}: {grants.describe_failures()}")
+        self.db.add(POOL_COLLECTION, guest_id, {'pin': pin, 'created': firestore.SERVER_TIMESTAMP})
+        logger.info("Added RemoteLock guest %s to the warm pool.", guest_id)
+        return PooledGuest(guest_id, pin)
+
+    def _hold_lease(self) -> bool:
+        now = datetime.now(timezone.utc)
+        return self.db.acquireLease(LEASE_COLLECTION, REPLENISH_LEASE_KEY, INSTANCE_ID, now, now + REPLENISH_LEASE)
+
+    def replenish(self) -> int:
+        """
+        Top the pool up to its target size. Returns the number of guests added;
+        0 while another instance holds the replenish lease, so instances that
+        count the pool at the same time do not both fill the gap.
+        """
+        if not self._hold_lease():
+            return 0
+        try:
+            missing = self.target_size - self.db.countDocuments(POOL_COLLECTION)
+            added = 0
+            for _ in range(max(0, missing)):
+                if added and not self._hold_lease():
+                    break
+                self.provision_one()
+                added += 1
+            return added
+        finally:
+            self.db.releaseLease(LEASE_COLLECTION, REPLENISH_LEASE_KEY, INSTANCE_ID)
+
+    def start_replenisher(self, interval: float) -> None:
+        """Replenish every `interval` seconds, and right after each claim, on a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.is_set():
+                try:
+                    self.replenish()
+                except Exception as e:
+                    logger.error("Guest pool replenish failed: %s", e)
+                self._wake.wait(interval)
+                self._wake.clear()
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="guest-pool-replenisher", daemon=True)
+        self._thread.start()
+
+    def stop_replenisher(self) -> None:
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,309 @@
+"""
+Bulk-import existing members from a Vagaro customer export and provision
+their door codes, e.g. when onboarding or after a RemoteLock account
+migration.
+
+Rows come from a CSV or JSON-lines file. Phones are normalized up front,
+access windows come from the membership catalog (or the row's own expiry),
+RemoteLock guests are created with bounded concurrency and a rate limit,
+and Firestore records are committed in batches. A member is added to the
+checkpoint only once their batch is committed, so a rerun after a crash
+skips everyone already done. Each new guest is noted in the checkpoint as
+soon as it holds its locks, before the member is texted, so a rerun reuses
+it instead of creating a second guest with a different PIN.
+
+    python -m bstrong.importer members.csv --checkpoint import.progress
+    python -m bstrong.importer members.jsonl --notify --report failures.jsonl
+"""
+import argparse, csv, json, sys, logging
+from dataclasses import dataclass, asdict, field
+from datetime import date, datetime
+from typing import Any, Iterable, Iterator
+from google.cloud import firestore
+from .api_clients import RemoteLockClient
+from .ratelimit import TokenBucket
+from .batch import BatchWriter, Checkpoint, Throughput, run_bounded
+from .catalog import DAY_PASS, UNKNOWN
+from .services import AccessWindow, AccessWindowPlanner, access_planner, delete_guest, door_code_sms_body
+from .topology import Lock, LockTopology, get_topology, grant_locks
+from .utils import fix_phone_number, send_sms
+
+logger = logging.getLogger(__name__)
+
+IMPORTED = "imported"
+PARTIAL = "imported_missing_locks"
+INVALID_PHONE = "invalid_phone"
+UNKNOWN_MEMBERSHIP = "unknown_membership"
+EXPIRED = "expired"
+INCOMPLETE = "incomplete"
+DUPLICATE = "duplicate"
+FAILED = "failed"
+
+# Export column names accepted for each field, first match wins.
+FIELD_ALIASES = {
+    "customer_id": ("customer_id", "customerId", "CustomerID"),
+    "first": ("first_name", "firstName", "First Name"),
+    "last": ("last_name", "lastName", "Last Name"),
+    "phone": ("phone", "mobilePhone", "Mobile Phone", "cellPhone"),
+    "membership": ("membership", "itemSold", "Membership"),
+    "expires": ("expires", "expireAt", "Expiration Date"),
+}
+
+
+@dataclass
+class MemberRow:
+    customer_id: str
+    first: str
+    last: str
+    phone: str | None
+    membership: str
+    expires: date | None = None
+
+
+@dataclass
+class ImportResult:
+    customer_id: str
+    status: str
+    phone: str | None = None
+    guest_id: str | None = None
+    missing_locks: list[str] = field(default_factory=list)
+    error: str | None = None
+
+
+def _field(record: dict[str, Any], name: str) -> str:
+    for alias in FIELD_ALIASES[name]:
+        value = record.get(alias)
+        if value not in (None, ""):
+            return str(value).strip()
+    return ""
+
+
+def read_members(path: str) -> Iterator[MemberRow]:
+    """Rows of a CSV export, or a JSON-lines export when the file ends in .jsonl/.json."""
+    with open(path, newline="") as f:
+        if path.endswith((".jsonl", ".json")):
+            records: Iterable[dict[str, Any]] = (json.loads(line) for line in f if line.strip())
+        else:
+            records = csv.DictReader(f)
+        for record in records:
+            expires = _field(record, "expires")
+            yield MemberRow(
+                customer_id=_field(record, "customer_id"),
+                first=_field(record, "first"),
+                last=_field(record, "last"),
+                phone=_field(record, "phone") or None,
+                membership=_field(record, "membership"),
+                expires=date.fromisoformat(expires[:10]) if expires else None,
+            )
+
+
+def normalize_phones(rows: Iterable[MemberRow]) -> dict[str, str | None]:
+    """E.164 number per distinct raw phone (None when invalid), each parsed once."""
+    normalized: dict[str, str | None] = {}
+    for row in rows:
+        if row.phone and row.phone not in normalized:
+            result = fix_phone_number(row.phone)
+            normalized[row.phone] = result['number'] if result['valid'] else None
+    return normalized
+
+
+@dataclass
+class _Plan:
+    row: MemberRow
+    phone: str
+    window: AccessWindow
+    autopay: bool
+    locks: tuple[Lock, ...]
+    expire_at: datetime | None
+
+
+class MemberImporter:
+    def __init__(
+        self,
+        db: Any,
+        rl_client: RemoteLockClient,
+        topology: LockTopology,
+        planner: AccessWindowPlanner = access_planner,
+        concurrency: int = 4,
+        rate: float = 5.0,
+        batch_size: int = 100,
+        notify: bool = False,
+        dry_run: bool = False,
+        checkpoint: Checkpoint | None = None,
+    ):
+        self.db = db
+        self.rl_client = rl_client
+        self.topology = topology
+        self.planner = planner
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.notify = notify
+        self.dry_run = dry_run
+        self.limiter = TokenBucket("importer", rate, capacity=1)
+        self.writer = BatchWriter(db)
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.stats = Throughput()
+        self.failures: list[ImportResult] = []
+        self._uncommitted: list[str] = []
+
+    def _plan(self, row: MemberRow, phones: dict[str, str | None]) -> _Plan | ImportResult:
+        if not (row.customer_id and row.first and row.last and row.membership):
+            return ImportResult(row.customer_id, INCOMPLETE, error="missing customer id, name or membership")
+        phone = phones.get(row.phone) if row.phone else None
+        if not phone:
+            return ImportResult(row.customer_id, INVALID_PHONE, phone=row.phone)
+        product = self.planner.catalog.classify(row.membership)
+        if product.kind == UNKNOWN and not (product.autopay or row.expires):
+            return ImportResult(row.customer_id, UNKNOWN_MEMBERSHIP, phone=phone, error=row.membership)
+
+        if row.expires and row.expires < self.planner.start_day():
+            return ImportResult(row.customer_id, EXPIRED, phone=phone, error=f"expired {row.expires.isoformat()}")
+
+        expire_at = None
+        if row.expires:
+            end_utc, expire_at = self.planner.expiry_on(row.expires)
+        elif product.autopay:
+            end_utc, expire_at = self.planner.next_month_anniversary()
+        else:
+            end_utc = None
+        window = self.planner.plan(row.membership, force_end_utc=end_utc)
+        return _Plan(row, phone, window, product.autopay, self.topology.locks_for(product), expire_at)
+
+    def plans(self, rows: list[MemberRow]) -> Iterator[_Plan]:
+        """Members still to provision; rows that cannot be imported are counted and reported here."""
+        phones = normalize_phones(row for row in rows if row.customer_id not in self.checkpoint)
+        seen: set[str] = set()
+        for row in rows:
+            if row.customer_id in self.checkpoint:
+                self.stats.incr("skipped")
+                continue
+            if row.customer_id and row.customer_id in seen:
+                self._record(ImportResult(row.customer_id, DUPLICATE))
+                continue
+            seen.add(row.customer_id)
+            plan = self._plan(row, phones)
+            if isinstance(plan, ImportResult):
+                self._record(plan)
+            else:
+                yield plan
+
+    def _provision(self, plan: _Plan) -> ImportResult:
+        row = plan.row
+        if self.dry_run:
+            return ImportResult(row.customer_id, IMPORTED, phone=plan.phone)
+
+        guest_id = self.checkpoint.noted(row.customer_id)
+        if guest_id:
+            # Created and granted by an earlier run that stopped before committing this member.
+            pin = self.rl_client.get_access_person(guest_id)["pin"]
+            result = ImportResult(row.customer_id, IMPORTED, phone=plan.phone, guest_id=guest_id)
+        else:
+            self.limiter.acquire()
+            guest_id, pin = self.rl_client.create_access_person(
+                name=f"{row.first} {row.last}",
+                starts_at=plan.window.start_utc.isoformat(),
+                ends_at=plan.window.end_utc.isoformat().replace("+00:00", "Z"),
+            )
+            grants = grant_locks(self.rl_client, guest_id, plan.locks)
+            if not grants.ok:
+                delete_guest(self.rl_client, guest_id, f"import of customer {row.customer_id} could not grant its locks")
+                raise RuntimeError(f"RemoteLock guest {guest_id} could not be granted: {grants.describe_failures()}")
+            self.checkpoint.note(row.customer_id, guest_id)
+            result = ImportResult(row.customer_id, PARTIAL if grants.failed else IMPORTED, phone=plan.phone, guest_id=guest_id,
+                                  missing_locks=[lock.label for lock in grants.failed])
+        if self.notify:
+            send_sms(to_phone_number=plan.phone, body=door_code_sms_body(pin, plan.window), first_name=row.first, last_name=row.last)
+        return result
+
+    def _write(self, plan: _Plan, result: ImportResult) -> None:
+        row = plan.row
+        if plan.autopay:
+            self.writer.set('active_autopays', row.customer_id, {
+                'remote_lock_id': result.guest_id,
+                'expireAt': plan.expire_at,
+                'phone': plan.phone,
+                'first_name': row.first,
+                'last_name': row.last,
+            })
+        if self.notify and plan.window.kind != DAY_PASS:
+            self.writer.set('pin_change_tickets', plan.phone, {'remote_lock_id': result.guest_id, 'timestamp': firestore.SERVER_TIMESTAMP})
+        self._uncommitted.append(row.customer_id)
+        if len(self._uncommitted) >= self.batch_size:
+            self._commit()
+
+    def _commit(self) -> None:
+        self.writer.flush()
+        for customer_id in self._uncommitted:
+            self.checkpoint.mark(customer_id)
+        self._uncommitted.clear()
+
+    def _record(self, result: ImportResult) -> None:
+        self.stats.incr(result.status)
+        if result.status not in (IMPORTED, PARTIAL):
+            self.failures.append(result)
+            logger.warning("%s: customer %s %s", result.status, result.customer_id, result.error or '')
+
+    def run(self, rows: Iterable[MemberRow]) -> dict[str, Any]:
+        rows = list(rows)
+        self.stats.incr("rows", len(rows))
+        for plan, result, error in run_bounded(self._provision, self.plans(rows), self.concurrency):
+            self.stats.incr("processed")
+            if error:
+                self._record(ImportResult(plan.row.customer_id, FAILED, phone=plan.phone, error=str(error)))
+                continue
+            self._record(result)
+            if result.missing_locks:
+                self.failures.append(result)
+            if not self.dry_run:
+                self._write(plan, result)
+        if not self.dry_run:
+            self._commit()
+
+        summary = self.stats.summary("processed")
+        summary["dry_run"] = self.dry_run
+        return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bstrong.importer", description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", help="CSV export, or JSON lines when the name ends in .jsonl")
+    parser.add_argument("--notify", action="store_true", help="text each member their new code and open a PIN change ticket")
+    parser.add_argument("--dry-run", action="store_true", help="validate rows and plan access windows without provisioning")
+    parser.add_argument("--concurrency", type=int, default=4, help="max members provisioned at once (default 4)")
+    parser.add_argument("--rate", type=float, default=5.0, help="max new RemoteLock guests per second, 0 for unlimited (default 5)")
+    parser.add_argument("--batch-size", type=int, default=100, help="members per Firestore commit and checkpoint (default 100)")
+    parser.add_argument("--checkpoint", help="progress file; reruns skip members already recorded in it")
+    parser.add_argument("--report", help="write rows that were not fully imported to this JSON-lines file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s %(message)s")
+    from .database import Database
+
+    db = Database()
+    access_planner.catalog.load(db)
+    topology = get_topology()
+    if topology is None:
+        parser.error("no lock topology configured (LOCK_TOPOLOGY or the LOCK_ID secret)")
+
+    checkpoint = Checkpoint(args.checkpoint)
+    importer = MemberImporter(
+        db, RemoteLockClient(), topology,
+        concurrency=args.concurrency, rate=args.rate, batch_size=args.batch_size,
+        notify=args.notify, dry_run=args.dry_run, checkpoint=checkpoint,
+    )
+    try:
+        summary = importer.run(read_members(args.path))
+    finally:
+        checkpoint.close()
+
+    if args.report:
+        with open(args.report, "w") as f:
+            for result in importer.failures:
+                f.write(json.dumps(asdict(result)) + "\n")
+
+    print(json.dumps(summary, indent=2))
+    return 1 if summary.get(FAILED) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
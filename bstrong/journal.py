@@ -0,0 +1,350 @@
+import asyncio, json, sqlite3, threading, logging
+from datetime import datetime, timezone
+from typing import Any, NamedTuple
+from google.api_core import exceptions as api_exceptions
+from google.cloud import firestore
+from .metrics import FIRESTORE_JOURNAL
+
+logger = logging.getLogger(__name__)
+
+SET = "set"
+UPDATE = "update"
+DELETE = "delete"
+
+# Firestore allows 500 writes per batch.
+REPLAY_BATCH_SIZE = 200
+
+# Errors no retry can fix: the write is raised to the caller instead of journaled, and dropped on replay.
+PERMANENT_ERRORS = (
+    api_exceptions.NotFound, api_exceptions.AlreadyExists, api_exceptions.InvalidArgument,
+    api_exceptions.FailedPrecondition, api_exceptions.PermissionDenied,
+)
+
+_UNKNOWN = object()
+
+
+def _encode(data: dict[str, Any] | None, journaled_at: datetime) -> str | None:
+    """JSON for a mutation. SERVER_TIMESTAMP becomes the time it was journaled."""
+    def default(value):
+        if value is firestore.SERVER_TIMESTAMP:
+            value = journaled_at
+        if isinstance(value, datetime):
+            return {"$datetime": value.isoformat()}
+        raise TypeError(f"Cannot journal a {type(value).__name__}")
+
+    return None if data is None else json.dumps(data, default=default)
+
+
+def _decode(text: str | None) -> dict[str, Any] | None:
+    def hook(obj):
+        if obj.keys() == {"$datetime"}:
+            return datetime.fromisoformat(obj["$datetime"])
+        return obj
+
+    return None if text is None else json.loads(text, object_hook=hook)
+
+
+def _journal_write(journal: "WriteJournal", collection: str, key: str, op: str, data: dict[str, Any] | None,
+                   error: Exception | None) -> None:
+    """Journal a write that Firestore failed (`error`) or that must queue behind the journal. Re-raises if it cannot."""
+    try:
+        journal.append(collection, key, op, data)
+    except Exception as e:
+        logger.error("Could not journal %s of %s/%s: %s", op, collection, key, e)
+        if error is not None:
+            raise error from e
+        raise
+    if error is not None:
+        logger.warning("Firestore %s of %s/%s failed, journaled for replay: %s", op, collection, key, error)
+    FIRESTORE_JOURNAL.inc(outcome="journaled")
+
+
+class Mutation(NamedTuple):
+    seq: int
+    collection: str
+    key: str
+    op: str
+    data: dict[str, Any] | None
+
+
+class JournaledSnapshot:
+    """A document as the journal leaves it, shaped like a Firestore snapshot."""
+
+    def __init__(self, key: str, data: dict[str, Any] | None):
+        self.id = key
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> dict[str, Any] | None:
+        return dict(self._data) if self._data is not None else None
+
+
+class WriteJournal:
+    """
+    Durable, ordered log of Firestore mutations in a local SQLite file. Each
+    append is committed (and fsynced) before it returns, so a journaled write
+    survives a crash of the process; on Cloud Run /tmp lives in memory, so it
+    does not survive the instance.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS mutations ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, collection TEXT NOT NULL, key TEXT NOT NULL,"
+            " op TEXT NOT NULL, data TEXT, journaled_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS mutations_by_key ON mutations (collection, key, seq)")
+        self._pending = self._conn.execute("SELECT COUNT(*) FROM mutations").fetchone()[0]
+        if self._pending:
+            logger.warning("Write journal %s has %s mutations from a previous run to replay.", path, self._pending)
+
+    def pending(self) -> int:
+        return self._pending
+
+    def append(self, collection: str, key: str, op: str, data: dict[str, Any] | None = None) -> None:
+        now = datetime.now(timezone.utc)
+        encoded = _encode(data, now)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO mutations (collection, key, op, data, journaled_at) VALUES (?, ?, ?, ?, ?)",
+                (collection, key, op, encoded, now.timestamp()))
+            self._pending += 1
+
+    def lookup(self, collection: str, key: str) -> JournaledSnapshot | None:
+        """The document after its journaled mutations, or None if the journal cannot tell (no entries, or only updates)."""
+        if not self._pending:
+            return None
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT op, data FROM mutations WHERE collection = ? AND key = ? ORDER BY seq", (collection, key)).fetchall()
+        if not rows:
+            return None
+        doc: Any = _UNKNOWN
+        for op, data in rows:
+            if op == SET:
+                doc = _decode(data)
+            elif op == DELETE:
+                doc = None
+            elif doc is None:
+                continue  # Firestore refuses updates to a deleted document, so replay drops it and it stays deleted.
+            elif doc is not _UNKNOWN:
+                doc.update(_decode(data))
+            # An update on top of what only Firestore knows leaves the document unknown.
+        return None if doc is _UNKNOWN else JournaledSnapshot(key, doc)
+
+    def head(self, limit: int) -> list[Mutation]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, collection, key, op, data FROM mutations ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [Mutation(seq, collection, key, op, _decode(data)) for seq, collection, key, op, data in rows]
+
+    def remove_through(self, seq: int) -> None:
+        """Forget every mutation up to and including `seq`."""
+        with self._lock:
+            self._conn.execute("DELETE FROM mutations WHERE seq <= ?", (seq,))
+            self._pending = self._conn.execute("SELECT COUNT(*) FROM mutations").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JournaledDatabase:
+    """
+    Database whose add, update and delete fall back to a WriteJournal when
+    Firestore fails or takes longer than `budget` seconds, instead of losing
+    the write. Until the journal is replayed, writes queue behind it (so they
+    reach Firestore in order) and reads of journaled keys are answered from
+    it, which keeps dedupe and PIN change tickets working through an outage.
+    Errors in PERMANENT_ERRORS still raise. Everything else is the wrapped
+    Database unchanged; queries and listeners only see journaled writes once
+    they are replayed.
+
+    A write that times out may still land in Firestore. Replaying it again is
+    harmless: sets and deletes are idempotent and updates rewrite the same fields.
+    """
+
+    def __init__(self, db: Any, journal: WriteJournal, budget: float, batch_size: int = REPLAY_BATCH_SIZE):
+        self.db = db
+        self.journal = journal
+        self.budget = budget
+        self.batch_size = batch_size
+        self._replay_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.db, name)
+
+    def _write(self, collection: str, key: str, op: str, data: dict[str, Any] | None, call) -> None:
+        if self.journal.pending():
+            _journal_write(self.journal, collection, key, op, data, None)
+            return
+        try:
+            call()
+        except PERMANENT_ERRORS:
+            raise
+        except Exception as e:
+            _journal_write(self.journal, collection, key, op, data, e)
+
+    def add(self, collection: str, key: str, data: dict[str, Any] | None = None) -> None:
+        self._write(collection, key, SET, data or {}, lambda: self.db.add(collection, key, data, timeout=self.budget))
+
+    def update(self, collection: str, key: str, data: dict[str, Any]) -> None:
+        self._write(collection, key, UPDATE, data, lambda: self.db.update(collection, key, data, timeout=self.budget))
+
+    def delete(self, collection: str, key: str) -> None:
+        self._write(collection, key, DELETE, None, lambda: self.db.delete(collection, key, timeout=self.budget))
+
+    def getData(self, collection: str, key: str) -> Any:
+        snapshot = self.journal.lookup(collection, key)
+        if snapshot is not None:
+            FIRESTORE_JOURNAL.inc(outcome="read")
+            return snapshot
+        return self.db.getData(collection, key)
+
+    def checkIfExists(self, collection: str, key: str) -> bool:
+        snapshot = self.journal.lookup(collection, key)
+        if snapshot is not None:
+            FIRESTORE_JOURNAL.inc(outcome="read")
+            return snapshot.exists
+        return self.db.checkIfExists(collection, key)
+
+    def _apply(self, batch: Any, mutation: Mutation) -> None:
+        reference = self.db.getReference(mutation.collection, mutation.key)
+        if mutation.op == SET:
+            batch.set(reference, mutation.data)
+        elif mutation.op == UPDATE:
+            batch.update(reference, mutation.data)
+        else:
+            batch.delete(reference)
+
+    def replay(self) -> int:
+        """Apply journaled mutations to Firestore oldest first, one batch per commit. Returns how many were applied."""
+        applied = 0
+        with self._replay_lock:
+            while True:
+                mutations = self.journal.head(self.batch_size)
+                if not mutations:
+                    break
+                try:
+                    batch = self.db.getBatch()
+                    for mutation in mutations:
+                        self._apply(batch, mutation)
+                    batch.commit()
+                except PERMANENT_ERRORS:
+                    # Batches are atomic; find the bad mutation by committing one at a time.
+                    done, stopped = self._replay_singly(mutations)
+                    applied += done
+                    if stopped:
+                        break
+                    continue
+                except Exception as e:
+                    logger.warning("Write journal replay paused, Firestore still unavailable: %s", e)
+                    break
+                self.journal.remove_through(mutations[-1].seq)
+                applied += len(mutations)
+                FIRESTORE_JOURNAL.inc(len(mutations), outcome="replayed")
+        if applied:
+            logger.info("Replayed %s journaled Firestore writes; %s left.", applied, self.journal.pending())
+        return applied
+
+    def _replay_singly(self, mutations: list[Mutation]) -> tuple[int, bool]:
+        """Commit mutations one by one, dropping those Firestore refuses for good. Returns (applied, stopped early)."""
+        applied = 0
+        for mutation in mutations:
+            try:
+                batch = self.db.getBatch()
+                self._apply(batch, mutation)
+                batch.commit()
+            except PERMANENT_ERRORS as e:
+                logger.error("Dropping journaled %s of %s/%s: %s", mutation.op, mutation.collection, mutation.key, e)
+                FIRESTORE_JOURNAL.inc(outcome="dropped")
+            except Exception as e:
+                logger.warning("Write journal replay paused, Firestore still unavailable: %s", e)
+                return applied, True
+            else:
+                applied += 1
+                FIRESTORE_JOURNAL.inc(outcome="replayed")
+            self.journal.remove_through(mutation.seq)
+        return applied, False
+
+    def start_replay(self, interval: float) -> None:
+        """Replay the journal every `interval` seconds on a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while not self._stop.wait(interval):
+                if not self.journal.pending():
+                    continue
+                try:
+                    self.replay()
+                except Exception as e:
+                    logger.error("Write journal replay pass failed: %s", e)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="write-journal-replay", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+class AsyncJournaledDatabase:
+    """
+    JournaledDatabase for AsyncDatabase, sharing the journal. Replay is left to the synchronous wrapper.
+    Journal appends (a synced SQLite commit) and lookups run in a worker thread, off the event loop.
+    """
+
+    def __init__(self, db: Any, journal: WriteJournal, budget: float):
+        self.db = db
+        self.journal = journal
+        self.budget = budget
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.db, name)
+
+    async def _write(self, collection: str, key: str, op: str, data: dict[str, Any] | None, call) -> None:
+        if self.journal.pending():
+            await asyncio.to_thread(_journal_write, self.journal, collection, key, op, data, None)
+            return
+        try:
+            await asyncio.wait_for(call(), self.budget)
+        except PERMANENT_ERRORS:
+            raise
+        except Exception as e:
+            await asyncio.to_thread(_journal_write, self.journal, collection, key, op, data, e)
+
+    async def add(self, collection: str, key: str, data: dict[str, Any] | None = None) -> None:
+        await self._write(collection, key, SET, data or {}, lambda: self.db.add(collection, key, data, timeout=self.budget))
+
+    async def update(self, collection: str, key: str, data: dict[str, Any]) -> None:
+        await self._write(collection, key, UPDATE, data, lambda: self.db.update(collection, key, data, timeout=self.budget))
+
+    async def delete(self, collection: str, key: str) -> None:
+        await self._write(collection, key, DELETE, None, lambda: self.db.delete(collection, key, timeout=self.budget))
+
+    async def _lookup(self, collection: str, key: str) -> JournaledSnapshot | None:
+        # An empty journal answers without touching SQLite, so the common case skips the thread hop.
+        if not self.journal.pending():
+            return None
+        return await asyncio.to_thread(self.journal.lookup, collection, key)
+
+    async def getData(self, collection: str, key: str) -> Any:
+        snapshot = await self._lookup(collection, key)
+        if snapshot is not None:
+            FIRESTORE_JOURNAL.inc(outcome="read")
+            return snapshot
+        return await self.db.getData(collection, key)
+
+    async def checkIfExists(self, collection: str, key: str) -> bool:
+        snapshot = await self._lookup(collection, key)
+        if snapshot is not None:
+            FIRESTORE_JOURNAL.inc(outcome="read")
+            return snapshot.exists
+        return await self.db.checkIfExists(collection, key)
@@ -0,0 +1,141 @@
+"""
+Non-blocking structured logging. Request threads only filter a record and put
+it on a queue; a QueueListener thread formats it (JSON by default), redacts
+phone numbers and door PINs, and writes it to stderr.
+"""
+import atexit, json, logging, queue, random, re, sys
+from contextvars import ContextVar, Token
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from .config import LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SAMPLE_RATES
+from .tracing import TraceIdFilter
+
+TEXT_FORMAT = "%(levelname)s %(name)s [%(trace_id)s] %(message)s"
+
+_PHONE = re.compile(r"(?<!\d)(?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?(\d{4})(?!\d)")
+# A 4-5 digit number shortly after "pin" or "code": "pin=1234", "PIN 1234 already", "door code to 12345".
+_PIN = re.compile(r"(?i)(\b(?:pin|code)\b\D{0,24}?)\d{4,5}(?![\d-])")
+
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=True)
+_sample_rates: dict[str, float] = dict(LOG_SAMPLE_RATES)
+_handler: "LazyQueueHandler | None" = None
+_listener: QueueListener | None = None
+
+
+def redact(text: str) -> str:
+    """Mask phone numbers down to their last four digits and PINs entirely."""
+    text = _PHONE.sub(lambda m: f"***-***-{m.group(1)}", text)
+    return _PIN.sub(r"\1****", text)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the field names Cloud Logging picks up."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "severity": record.levelname,
+            "logger": record.name,
+            "trace_id": getattr(record, "trace_id", "-"),
+            "message": redact(record.getMessage()),
+        }
+        if record.exc_info:
+            entry["exception"] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, default=str)
+
+
+class RedactingFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class SamplingFilter(logging.Filter):
+    """Drops records below WARNING for requests that were not sampled (see sample_request)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Enqueues records unformatted, so msg % args runs on the listener thread.
+    A full queue drops the record and counts it instead of blocking the request.
+    """
+
+    def __init__(self, queue_: queue.Queue):
+        super().__init__(queue_)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _StderrHandler(logging.StreamHandler):
+    """Writes to whatever sys.stderr is at emit time."""
+
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def sample_request(route: str) -> Token:
+    """Decide whether this request's INFO logs are kept. Pass the token to end_request."""
+    rate = _sample_rates.get(route, 1.0)
+    return _sampled.set(rate >= 1.0 or random.random() < rate)
+
+
+def end_request(token: Token) -> None:
+    try:
+        _sampled.reset(token)
+    except ValueError:
+        pass  # reset from a different context, like end_trace
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, sample_rates: dict[str, float] | None = None,
+                      queue_size: int = LOG_QUEUE_SIZE, output: logging.Handler | None = None) -> QueueListener:
+    """Route the root logger through a queue to a background writer, replacing any earlier setup."""
+    global _handler, _listener
+    shutdown_logging()
+    if sample_rates is not None:
+        _sample_rates.clear()
+        _sample_rates.update(sample_rates)
+
+    output = output or _StderrHandler()
+    output.setFormatter(JsonFormatter() if fmt == "json" else RedactingFormatter(TEXT_FORMAT))
+    _handler = LazyQueueHandler(queue.Queue(queue_size))
+    _handler.addFilter(TraceIdFilter())
+    _handler.addFilter(SamplingFilter())
+    _listener = QueueListener(_handler.queue, output)
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(_handler)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and detach the queue handler."""
+    global _handler, _listener
+    if _listener:
+        _listener.stop()
+    if _handler:
+        logging.getLogger().removeHandler(_handler)
+    _handler = _listener = None
+
+
+def stats() -> dict:
+    return {"queued": _handler.queue.qsize() if _handler else 0, "dropped": _handler.dropped if _handler else 0}
+
+
+atexit.register(shutdown_logging)
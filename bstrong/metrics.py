@@ -0,0 +1,247 @@
+"""
+In-process metrics rendered in the Prometheus text format. Updates are a
+perf_counter call plus a short lock, cheap enough to leave on in production.
+"""
+import bisect, functools, inspect, threading, time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator
+from .tracing import span
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._callbacks: list[tuple[tuple[str, ...], Callable[[], float | None]]] = []
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, func: Callable[[], float | None], **labels: str) -> None:
+        """Read the value from `func` at scrape time (None omits the sample)."""
+        with self._lock:
+            self._callbacks = [(k, f) for k, f in self._callbacks if k != self._key(labels)]
+            self._callbacks.append((self._key(labels), func))
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def total(self) -> float:
+        """Sum of the set values across all label combinations."""
+        with self._lock:
+            return sum(self._values.values())
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+            callbacks = list(self._callbacks)
+        for key, func in callbacks:
+            try:
+                value = func()
+            except Exception:
+                value = None
+            if value is not None:
+                items.append((key, value))
+        return self.header() + [f"{self.name}{_format_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return series[2] if series else 0
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            items = [(k, (list(s[0]), s[1], s[2])) for k, s in self._series.items()]
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: list[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "bstrong_request_seconds", "Inbound request latency by route and status.", ("route", "status")))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "bstrong_requests_in_flight", "Inbound requests currently being handled.", ("route",)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "bstrong_stage_seconds", "Latency of each stage of a webhook.", ("route", "stage")))
+VENDOR_SECONDS = REGISTRY.register(Histogram(
+    "bstrong_vendor_request_seconds", "Latency of outbound vendor and Firestore calls.", ("vendor", "operation", "outcome")))
+OUTCOMES = REGISTRY.register(Counter(
+    "bstrong_webhook_outcomes_total", "Webhook results by outcome.", ("route", "outcome")))
+ALERTS = REGISTRY.register(Counter(
+    "bstrong_alerts_total", "Developer and owner alerts by outcome (sent, coalesced, suppressed, failed).", ("outcome",)))
+LOCK_GRANTS = REGISTRY.register(Counter(
+    "bstrong_lock_grants_total", "RemoteLock lock grants by location and outcome (granted, retried, failed).", ("location", "outcome")))
+DEAD_LETTERS = REGISTRY.register(Counter(
+    "bstrong_dead_letters_total", "Dead-lettered transactions by outcome (captured, retried, resolved, failed).", ("outcome",)))
+SINGLE_FLIGHT = REGISTRY.register(Counter(
+    "bstrong_single_flight_total", "Single-flight calls by flight and role (leader, follower, lease_wait).", ("flight", "role")))
+FORM_WAIT = REGISTRY.register(Counter(
+    "bstrong_form_wait_total", "Transactions that waited for their form, by result (avoided, unusable, missed).", ("result",)))
+FIRESTORE_JOURNAL = REGISTRY.register(Counter(
+    "bstrong_firestore_journal_total", "Firestore writes through the local journal by outcome (journaled, replayed, dropped, read).", ("outcome",)))
+VAGARO_EDGE_CACHE = REGISTRY.register(Counter(
+    "bstrong_vagaro_edge_cache_total", "Vagaro worker edge cache results by lookup (token, customer) and status (hit, miss, bypass, none).", ("lookup", "status")))
+COMPONENT_GAUGES = REGISTRY.register(Gauge(
+    "bstrong_component_value", "Internal component state (PIN index age, pool size, rate limiter waits).", ("component", "field")))
+
+
+@contextmanager
+def stage(route: str, name: str) -> Iterator[None]:
+    """Time one stage of a webhook as a histogram sample and a trace span."""
+    with span(f"{route}.{name}"), STAGE_SECONDS.time(route=route, stage=name):
+        yield
+
+
+def outcome(route: str, name: str) -> None:
+    OUTCOMES.inc(route=route, outcome=name)
+
+
+def vendor_call(vendor: str, operation: str | None = None) -> Callable:
+    """Decorator recording each call's latency and whether it raised, as a metric and a trace span."""
+    def decorate(func: Callable) -> Callable:
+        op = operation or func.__name__
+        span_name = f"{vendor}.{op}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                result = "error"
+                try:
+                    with span(span_name):
+                        value = await func(*args, **kwargs)
+                    result = "ok"
+                    return value
+                finally:
+                    VENDOR_SECONDS.observe(time.perf_counter() - started, vendor=vendor, operation=op, outcome=result)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            result = "error"
+            try:
+                with span(span_name):
+                    value = func(*args, **kwargs)
+                result = "ok"
+                return value
+            finally:
+                VENDOR_SECONDS.observe(time.perf_counter() - started, vendor=vendor, operation=op, outcome=result)
+        return wrapper
+    return decorate
+
+
+def render() -> str:
+    return REGISTRY.render()
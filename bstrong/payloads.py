@@ -0,0 +1,136 @@
+"""
+Early rejection and typed parsing of Vagaro webhook bodies.
+
+Most Vagaro events are purchases we ignore (retail, services, other forms),
+so the raw body is checked before it is decoded: oversized bodies are
+refused, and a precompiled byte scan of `purchaseType` (or `formId`) drops
+irrelevant events without building a dict. Bodies that pass are decoded
+with orjson when it is installed, then checked against a field schema
+compiled once per event type.
+"""
+import json, re
+from dataclasses import dataclass
+from typing import Any, Callable, Collection
+from .catalog import MembershipCatalog, MembershipProduct
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib decoder gives the same result, just slower
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson else "json"
+
+# The new-member waiver; every other Vagaro form is ignored.
+WAIVER_FORM_ID = "67842fd8f276412c07c20490"
+
+
+class InvalidPayload(ValueError):
+    """The body is not a Vagaro webhook envelope, or a field has the wrong type."""
+
+
+def loads(body: bytes) -> Any:
+    if orjson:
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError as e:
+            raise InvalidPayload(str(e)) from None
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise InvalidPayload(str(e)) from None
+
+
+def _scanner(field: str) -> Callable[[bytes], str | None]:
+    """
+    Read a top-level string field straight from the raw body. Only a single
+    plain (unescaped) occurrence counts; anything else returns None and the
+    caller falls back to a full parse.
+    """
+    pattern = re.compile(rb'"' + field.encode() + rb'"\s*:\s*"([^"\\]*)"')
+    key = b'"' + field.encode() + b'"'
+
+    def scan(body: bytes) -> str | None:
+        match = pattern.search(body)
+        if match is None or body.count(key) != 1:
+            return None
+        return match.group(1).decode("utf-8", "replace")
+    return scan
+
+
+_scan_purchase_type = _scanner("purchaseType")
+_scan_form_id = _scanner("formId")
+
+
+def ignorable_transaction(body: bytes, purchase_types: Collection[str]) -> bool:
+    """True when the body's purchaseType can be read without parsing and no membership admits it."""
+    purchase_type = _scan_purchase_type(body)
+    return purchase_type is not None and purchase_type not in purchase_types
+
+
+def ignorable_form(body: bytes) -> bool:
+    """True when the body's formId can be read without parsing and is not the waiver."""
+    form_id = _scan_form_id(body)
+    return form_id is not None and form_id != WAIVER_FORM_ID
+
+
+def _schema(**fields: tuple[type, ...]) -> Callable[[Any], dict[str, Any]]:
+    """Validator for a `{"payload": {...}}` envelope: listed fields must be absent, null or of the given types."""
+    checks = tuple(fields.items())
+
+    def validate(data: Any) -> dict[str, Any]:
+        if not isinstance(data, dict) or not isinstance(data.get("payload"), dict):
+            raise InvalidPayload("missing payload object")
+        payload = data["payload"]
+        for name, types in checks:
+            value = payload.get(name)
+            if value is not None and not isinstance(value, types):
+                raise InvalidPayload(f"{name} must be {' or '.join(t.__name__ for t in types)}")
+        return payload
+    return validate
+
+
+_validate_transaction = _schema(
+    itemSold=(str,), customerId=(str,), purchaseType=(str,), userPaymentId=(str, int), transactionId=(str, int),
+)
+_validate_form = _schema(formId=(str,), customerId=(str,), questionsAndAnswers=(list,))
+
+
+@dataclass(frozen=True, slots=True)
+class TransactionEvent:
+    item_sold: str
+    customer_id: str | None
+    purchase_type: str | None
+    unique_id: str | None
+    product: MembershipProduct
+
+    @property
+    def relevant(self) -> bool:
+        return self.purchase_type in self.product.purchase_types
+
+
+@dataclass(frozen=True, slots=True)
+class FormEvent:
+    form_id: str | None
+    customer_id: str | None
+    questions: list[dict] | None
+
+
+def _id(value: str | int | None) -> str | None:
+    return str(value) if value not in (None, "") else None
+
+
+def parse_transaction(body: bytes, catalog: MembershipCatalog) -> TransactionEvent:
+    payload = _validate_transaction(loads(body))
+    item_sold = (payload.get("itemSold") or "").lower()
+    return TransactionEvent(
+        item_sold=item_sold,
+        customer_id=payload.get("customerId"),
+        purchase_type=payload.get("purchaseType"),
+        unique_id=_id(payload.get("userPaymentId")) or _id(payload.get("transactionId")),
+        product=catalog.classify(item_sold),
+    )
+
+
+def parse_form(body: bytes) -> FormEvent:
+    payload = _validate_form(loads(body))
+    return FormEvent(payload.get("formId"), payload.get("customerId"), payload.get("questionsAndAnswers"))
@@ -0,0 +1,150 @@
+import threading, time, logging
+from datetime import datetime, timezone
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def _ended(attributes: dict[str, Any], now: datetime) -> bool:
+    ends_at = attributes.get("ends_at")
+    if not ends_at:
+        return False
+    try:
+        return datetime.fromisoformat(ends_at.replace("Z", "+00:00")) < now
+    except ValueError:
+        return False
+
+
+class PinIndex:
+    """
+    Local mirror of the PINs in use on our RemoteLock account, so PIN change
+    requests can be checked (and alternatives offered) without an update_pin
+    round trip that ends in a 422. Rebuilt from RemoteLock listings and kept
+    current by RemoteLockClient on every create and update.
+
+    The index is advisory: guests deleted or changed outside this service only
+    drop out at the next rebuild, so callers should only trust a "taken"
+    answer while the index is fresh() and leave the final say to RemoteLock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_guest: dict[str, str] = {}
+        self._holders: dict[str, set[str]] = {}
+        self._refused: dict[str, set[str]] = {}  # pin -> guests RemoteLock refused it for, holder not listed yet
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self.built_at: float | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.built_at is not None
+
+    def staleness(self) -> float | None:
+        """Seconds since the last full rebuild, or None if never built."""
+        return None if self.built_at is None else time.time() - self.built_at
+
+    def fresh(self, max_age: float) -> bool:
+        """True if the last full rebuild is at most `max_age` seconds old."""
+        age = self.staleness()
+        return age is not None and age <= max_age
+
+    def stats(self) -> dict[str, Any]:
+        age = self.staleness()
+        return {
+            "pins": len(self._holders),
+            "guests": len(self._by_guest),
+            "age_seconds": None if age is None else round(age, 1),
+        }
+
+    def rebuild(self, rl_client: Any, per_page: int = 100) -> int:
+        """Replace the index with a full RemoteLock listing. Returns the number of PINs."""
+        now = datetime.now(timezone.utc)
+        by_guest: dict[str, str] = {}
+        page, total_pages = 1, 1
+        while page <= total_pages:
+            persons, total_pages = rl_client.list_access_persons(page=page, per_page=per_page)
+            for person in persons:
+                attributes = person.get("attributes", {})
+                if attributes.get("pin") and not _ended(attributes, now):
+                    by_guest[person["id"]] = str(attributes["pin"])
+            page += 1
+
+        holders: dict[str, set[str]] = {}
+        for guest_id, pin in by_guest.items():
+            holders.setdefault(pin, set()).add(guest_id)
+
+        with self._lock:
+            self._by_guest = by_guest
+            self._holders = holders
+            self._refused = {}
+            self.built_at = time.time()
+        logger.info("PIN index rebuilt: %s PINs across %s guests.", len(holders), len(by_guest))
+        return len(holders)
+
+    def record(self, guest_id: str, pin: str) -> None:
+        """Record a guest's current PIN after a create or update."""
+        with self._lock:
+            old = self._by_guest.get(guest_id)
+            if old:
+                self._holders.get(old, set()).discard(guest_id)
+                if not self._holders.get(old):
+                    self._holders.pop(old, None)
+            self._by_guest[guest_id] = pin
+            self._holders.setdefault(pin, set()).add(guest_id)
+            self._refused.pop(pin, None)
+
+    def forget(self, guest_id: str) -> None:
+        """Drop a deleted guest's PIN."""
+        with self._lock:
+            pin = self._by_guest.pop(guest_id, None)
+            if pin:
+                self._holders.get(pin, set()).discard(guest_id)
+                if not self._holders.get(pin):
+                    self._holders.pop(pin, None)
+
+    def mark_taken(self, pin: str, guest_id: str) -> None:
+        """Record that RemoteLock refused `pin` for `guest_id`: another guest we have not listed holds it."""
+        with self._lock:
+            self._refused.setdefault(pin, set()).add(guest_id)
+
+    def is_taken(self, pin: str, guest_id: str | None = None) -> bool:
+        """True if the PIN belongs to any guest other than `guest_id`."""
+        holders = self._holders.get(pin)
+        return (bool(holders) and holders != {guest_id}) or pin in self._refused
+
+    def suggest(self, pin: str, count: int = 3) -> list[str]:
+        """Free PINs of the same length, closest to the requested one first."""
+        length = len(pin)
+        modulo = 10 ** length
+        value = int(pin)
+        suggestions: list[str] = []
+        for step in range(1, modulo):
+            for candidate in (value + step, value - step):
+                code = f"{candidate % modulo:0{length}d}"
+                if len(set(code)) > 1 and code not in suggestions and not self.is_taken(code):
+                    suggestions.append(code)
+                    if len(suggestions) == count:
+                        return suggestions
+        return suggestions
+
+    def start_refresh(self, rl_client: Any, interval: float) -> None:
+        """Rebuild now and then every `interval` seconds on a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+
+        def run():
+            while True:
+                try:
+                    self.rebuild(rl_client)
+                except Exception as e:
+                    logger.error("PIN index rebuild failed (age %ss): %s", self.stats()['age_seconds'], e)
+                if self._stop.wait(interval):
+                    return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="pin-index-refresh", daemon=True)
+        self._thread.start()
+
+    def stop_refresh(self) -> None:
+        self._stop.set()
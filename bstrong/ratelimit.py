@@ -0,0 +1,176 @@
+import threading, time, logging
+from typing import Any, Callable
+import requests
+from .config import VENDOR_RATE_LIMITS, RATE_LIMIT_TIMEOUT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_COLLECTION = "rate_limits"
+
+
+class RateLimitExceeded(requests.exceptions.RequestException):
+    """Raised when a blocking acquire times out. Subclasses RequestException so
+    existing vendor error handling treats it like any other failed call."""
+    pass
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most
+    `capacity`. rate <= 0 means unlimited. Tracks how long callers waited.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float | None = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = clock()
+        self.acquired = 0
+        self.rejected = 0
+        self.waited_seconds = 0.0
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _take(self, tokens: float) -> float:
+        """Take tokens if available. Returns 0 on success, else seconds until they will be."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def _record(self, acquired: int = 0, rejected: int = 0, waited: float = 0.0) -> None:
+        with self._lock:
+            self.acquired += acquired
+            self.rejected += rejected
+            self.waited_seconds += waited
+
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens without waiting. Returns False if the bucket is empty."""
+        if self.unlimited or self._take(tokens) == 0:
+            self._record(acquired=1)
+            return True
+        self._record(rejected=1)
+        return False
+
+    def acquire(self, tokens: float = 1, timeout: float | None = None) -> bool:
+        """Block until tokens are available or `timeout` seconds pass. Returns False on timeout."""
+        if self.unlimited:
+            self._record(acquired=1)
+            return True
+
+        started = self._clock()
+        while True:
+            delay = self._take(tokens)
+            if delay == 0:
+                self._record(acquired=1)
+                return True
+            waited = self._clock() - started
+            if timeout is not None and waited + delay > timeout:
+                self._record(rejected=1)
+                return False
+            self._sleep(delay)
+            self._record(waited=delay)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "capacity": self.capacity,
+                "acquired": self.acquired,
+                "rejected": self.rejected,
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
+
+
+class FirestoreTokenBucket(TokenBucket):
+    """
+    Token bucket shared across Cloud Run instances through a Firestore
+    document. Each instance leases up to `lease` tokens per transaction and
+    spends them locally, so most acquires never touch Firestore.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float | None, db: Any, lease: int = 5, **kwargs):
+        super().__init__(name, rate, capacity, **kwargs)
+        self.db = db
+        self.lease = lease
+        self._local = 0.0
+        self._lease_lock = threading.Lock()
+
+    def _lease_tokens(self, wanted: float) -> float:
+        """Move up to `wanted` tokens from the shared bucket. Returns the number granted."""
+        from google.cloud import firestore
+        reference = self.db.getReference(RATE_LIMIT_COLLECTION, self.name)
+        now = time.time()
+
+        @firestore.transactional
+        def lease(transaction):
+            snapshot = reference.get(transaction=transaction)
+            data = snapshot.to_dict() if snapshot.exists else {}
+            tokens = data.get("tokens", self.capacity)
+            tokens = min(self.capacity, tokens + (now - data.get("updated", now)) * self.rate)
+            granted = min(wanted, tokens)
+            transaction.set(reference, {"tokens": tokens - granted, "updated": now})
+            return granted
+
+        return lease(self.db.getTransaction())
+
+    def _take(self, tokens: float) -> float:
+        with self._lease_lock:
+            if self._local < tokens:
+                try:
+                    self._local += self._lease_tokens(max(tokens, self.lease) - self._local)
+                except Exception as e:
+                    logger.warning("Shared rate limit '%s' unavailable, using local bucket: %s", self.name, e)
+                    return super()._take(tokens)
+            if self._local >= tokens:
+                self._local -= tokens
+                return 0.0
+        return max(tokens - self._local, 1.0) / self.rate
+
+
+_limiters: dict[str, TokenBucket] = {}
+_limiters_lock = threading.Lock()
+_shared_db: Any = None
+
+
+def use_firestore_backend(db: Any) -> None:
+    """Coordinate vendor buckets through Firestore from now on (see RATE_LIMIT_BACKEND)."""
+    global _shared_db
+    with _limiters_lock:
+        _shared_db = db
+        _limiters.clear()
+
+
+def get_limiter(vendor: str) -> TokenBucket:
+    limiter = _limiters.get(vendor)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(vendor)
+            if limiter is None:
+                rate, capacity = VENDOR_RATE_LIMITS.get(vendor, (0.0, 1.0))
+                if _shared_db is not None and rate > 0:
+                    limiter = FirestoreTokenBucket(vendor, rate, capacity, _shared_db)
+                else:
+                    limiter = TokenBucket(vendor, rate, capacity)
+                _limiters[vendor] = limiter
+    return limiter
+
+
+def throttle(vendor: str, timeout: float | None = None) -> None:
+    """Block until the vendor's bucket allows a call. Raises RateLimitExceeded on timeout."""
+    limiter = get_limiter(vendor)
+    timeout = RATE_LIMIT_TIMEOUT_SECONDS if timeout is None else timeout
+    if not limiter.acquire(timeout=timeout):
+        logger.warning("Rate limit wait for %s exceeded %ss.", vendor, timeout)
+        raise RateLimitExceeded(f"{vendor} rate limit exceeded")
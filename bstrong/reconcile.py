@@ -0,0 +1,172 @@
+"""
+Reconcile `active_autopays` against RemoteLock access guests.
+
+Every autopay document should point at a RemoteLock guest whose `ends_at`
+is 10:00 PM ("fake UTC") on the Eastern date of its Firestore `expireAt`.
+Failed extensions leave the two sides out of step; this tool reports the
+drift and, with --repair, pushes the Firestore expiry back to RemoteLock
+through extend_access.
+
+    python -m bstrong.reconcile                               # report only
+    python -m bstrong.reconcile --repair --checkpoint rc.progress
+"""
+import argparse, json, sys, logging
+from dataclasses import dataclass, asdict
+from typing import Any, Iterator
+from .api_clients import RemoteLockClient
+from .ratelimit import TokenBucket
+from .batch import Checkpoint, Throughput, run_bounded
+from .services import AccessWindowPlanner, access_planner, format_remotelock_time, parse_remotelock_time
+
+logger = logging.getLogger(__name__)
+
+OK = "ok"
+MISSING_GUEST = "missing_guest"
+MISSING_EXPIRY = "missing_expiry"
+ENDS_AT_DRIFT = "ends_at_drift"
+
+
+@dataclass
+class Finding:
+    customer_id: str
+    guest_id: str | None
+    status: str
+    expected_ends_at: str | None = None
+    remote_ends_at: str | None = None
+    repaired: bool = False
+    error: str | None = None
+
+
+class Reconciler:
+    def __init__(
+        self,
+        db: Any,
+        rl_client: RemoteLockClient,
+        planner: AccessWindowPlanner = access_planner,
+        concurrency: int = 4,
+        rate: float = 5.0,
+        per_page: int = 100,
+        repair: bool = False,
+        dry_run: bool = False,
+        checkpoint: Checkpoint | None = None,
+    ):
+        self.db = db
+        self.rl_client = rl_client
+        self.planner = planner
+        self.concurrency = concurrency
+        self.per_page = per_page
+        self.repair = repair
+        self.dry_run = dry_run
+        self.limiter = TokenBucket("reconcile", rate, capacity=1)
+        self.checkpoint = checkpoint or Checkpoint(None)
+        self.stats = Throughput()
+        self.findings: list[Finding] = []
+
+    def _fetch_page(self, page: int) -> tuple[list[dict[str, Any]], int]:
+        self.limiter.acquire()
+        persons, total_pages = self.rl_client.list_access_persons(page=page, per_page=self.per_page)
+        self.stats.incr("pages")
+        return persons, total_pages
+
+    def fetch_guests(self) -> dict[str, dict[str, Any]]:
+        """All RemoteLock access persons keyed by id, pages 2..N fetched concurrently."""
+        persons, total_pages = self._fetch_page(1)
+        guests = {p["id"]: p.get("attributes", {}) for p in persons}
+
+        for page, result, error in run_bounded(self._fetch_page, range(2, total_pages + 1), self.concurrency):
+            if error:
+                raise RuntimeError(f"Failed to fetch RemoteLock page {page}: {error}")
+            guests.update({p["id"]: p.get("attributes", {}) for p in result[0]})
+
+        self.stats.incr("guests", len(guests))
+        return guests
+
+    def diff(self, customer_id: str, data: dict[str, Any], guests: dict[str, dict[str, Any]]) -> Finding:
+        guest_id = data.get("remote_lock_id")
+        guest = guests.get(guest_id) if guest_id else None
+        if guest is None:
+            return Finding(customer_id, guest_id, MISSING_GUEST)
+
+        expire_at = data.get("expireAt")
+        if expire_at is None:
+            return Finding(customer_id, guest_id, MISSING_EXPIRY, remote_ends_at=guest.get("ends_at"))
+
+        expected = self.planner.remotelock_end(expire_at)
+        remote = parse_remotelock_time(guest.get("ends_at"))
+        status = OK if remote == expected else ENDS_AT_DRIFT
+        return Finding(customer_id, guest_id, status, format_remotelock_time(expected), guest.get("ends_at"))
+
+    def _settle(self, finding: Finding) -> Finding:
+        if finding.status == ENDS_AT_DRIFT and self.repair and not self.dry_run:
+            self.limiter.acquire()
+            self.rl_client.extend_access(finding.guest_id, finding.expected_ends_at)
+            finding.repaired = True
+        return finding
+
+    def _pending(self, guests: dict[str, dict[str, Any]]) -> Iterator[Finding]:
+        for doc in self.db.getCollection("active_autopays"):
+            if doc.id in self.checkpoint:
+                self.stats.incr("skipped")
+                continue
+            yield self.diff(doc.id, doc.to_dict(), guests)
+
+    def run(self) -> dict[str, Any]:
+        guests = self.fetch_guests()
+
+        for finding, _, error in run_bounded(self._settle, self._pending(guests), self.concurrency):
+            self.stats.incr("checked")
+            self.stats.incr(finding.status)
+            if error:
+                finding.error = str(error)
+                self.stats.incr("repair_failed")
+                logger.error("Failed to repair guest %s for customer %s: %s", finding.guest_id, finding.customer_id, error)
+            else:
+                if finding.repaired:
+                    self.stats.incr("repaired")
+                self.checkpoint.mark(finding.customer_id)
+            if finding.status != OK:
+                self.findings.append(finding)
+                logger.warning("%s: customer %s guest %s expected=%s remote=%s", finding.status, finding.customer_id,
+                               finding.guest_id, finding.expected_ends_at, finding.remote_ends_at)
+
+        summary = self.stats.summary("checked")
+        summary["dry_run"] = self.dry_run or not self.repair
+        return summary
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m bstrong.reconcile", description=__doc__.split("\n\n")[0])
+    parser.add_argument("--repair", action="store_true", help="extend drifted RemoteLock guests to the Firestore expiry")
+    parser.add_argument("--dry-run", action="store_true", help="report what --repair would change without calling RemoteLock")
+    parser.add_argument("--concurrency", type=int, default=4, help="max RemoteLock calls in flight (default 4)")
+    parser.add_argument("--rate", type=float, default=5.0, help="max RemoteLock requests per second, 0 for unlimited (default 5)")
+    parser.add_argument("--per-page", type=int, default=100, help="RemoteLock list page size (default 100)")
+    parser.add_argument("--checkpoint", help="progress file; reruns skip customers already recorded in it")
+    parser.add_argument("--report", help="write non-ok findings to this JSON-lines file")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s %(message)s")
+    from .database import Database
+
+    checkpoint = Checkpoint(args.checkpoint)
+    reconciler = Reconciler(
+        Database(), RemoteLockClient(),
+        concurrency=args.concurrency, rate=args.rate, per_page=args.per_page,
+        repair=args.repair, dry_run=args.dry_run, checkpoint=checkpoint,
+    )
+    try:
+        summary = reconciler.run()
+    finally:
+        checkpoint.close()
+
+    if args.report:
+        with open(args.report, "w") as f:
+            for finding in reconciler.findings:
+                f.write(json.dumps(asdict(finding)) + "\n")
+
+    print(json.dumps(summary, indent=2))
+    return 1 if summary.get("repair_failed") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
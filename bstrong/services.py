@@ -1,72 +1,267 @@
 import pytz, requests, calendar, logging
-from .config import MEMBERSHIP_DURATIONS, Config
+from typing import Iterable, NamedTuple
+from .catalog import MembershipCatalog, membership_catalog, DAY_PASS, MONTHLY, UNKNOWN
 from .utils import send_Dev, send_sms
 from .api_clients import RemoteLockClient
-from datetime import datetime, timedelta, time
+from .guest_pool import GuestPool
+from .topology import get_topology, grant_locks
+from datetime import date, datetime, timedelta, time
 
 logger = logging.getLogger(__name__)
 
+ACCESS_START = time(4, 0)
+ACCESS_END = time(22, 0)
+FIRESTORE_EXPIRY = time(22, 5)
 
-def create_door_code(first: str, last: str, phone: str, membership_type: str, rl_client: RemoteLockClient, force_end_utc: datetime | None = None) -> tuple[bool, str | None]:
-    lock_id = Config.get("LOCK_ID")
-    if not lock_id:
-        logger.error("Missing LOCK_ID in config.")
-        return (False, None)
 
-    est = pytz.timezone("US/Eastern")
-    current_time_est = datetime.now(est)
-
-    if current_time_est.hour < 22:
-        start_day = current_time_est.date()
-    else:
-        start_day = current_time_est.date() + timedelta(days=1)
-
-    start_time_est = est.localize(datetime.combine(start_day, time(4, 0)))
-    start_utc = start_time_est.replace(tzinfo=pytz.UTC)
-
-    if force_end_utc:
-        end_utc = force_end_utc
-    elif "day pass" in membership_type.lower():
-        end_time_est = est.localize(datetime.combine(start_day, time(22, 0)))
-        end_utc = end_time_est.replace(tzinfo=pytz.UTC)
-    elif "1 month" in membership_type.lower():
-        rl_time, _ = get_next_month_anniversary()
-        end_utc = rl_time
-    else:
-        duration = MEMBERSHIP_DURATIONS.get(membership_type.lower())
-        if duration is None:
-            logger.warning(f"Unknown membership type '{membership_type}' for {first} {last}. Defaulting to same-day access.")
-            send_Dev(f"Unknown membership type received: '{membership_type}' for {first} {last}. Defaulted to same-day access.")
-            duration = timedelta(days=0)
-        end_moment_est = start_time_est + duration
-        end_time_est = est.localize(datetime.combine(end_moment_est.date(), time(22, 0)))
-        end_utc = end_time_est.replace(tzinfo=pytz.UTC)
-
-    logger.info(f"RemoteLock time window for {first} {last}: start={start_utc.isoformat()} end={end_utc.isoformat()} (membership='{membership_type}')")
+def format_remotelock_time(value: datetime) -> str:
+    return value.isoformat().replace("+00:00", "Z")
 
+
+def parse_remotelock_time(value: str | None) -> datetime | None:
+    if not value:
+        return None
     try:
-        guest_id, pin = rl_client.create_access_person(
-            name=f"{first} {last}",
-            starts_at=start_utc.isoformat(),
-            ends_at=end_utc.isoformat().replace("+00:00", "Z")
-        )
-        logger.info(f"RemoteLock access_person created for {first} {last}: guest_id={guest_id}, pin={pin}")
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+class AccessWindow(NamedTuple):
+    start_utc: datetime
+    end_utc: datetime
+    kind: str
+
+
+class _DayBoundaries(NamedTuple):
+    midnight: datetime  # true UTC instant of local midnight
+    cutoff: datetime    # true UTC instant of local 10:00 PM, purchases after this start tomorrow
+    start: datetime     # RemoteLock start: 4:00 AM "fake UTC"
+    end: datetime       # RemoteLock end: 10:00 PM "fake UTC"
+    expiry: datetime    # Firestore expiry: 10:05 PM true EST/EDT
+
+
+class AccessWindowPlanner:
+    """
+    Computes RemoteLock access windows. Zone data, per-day boundaries (DST
+    aware) and month anniversaries are cached, and memberships are classified
+    through the compiled MembershipCatalog, so repeated and batched calls skip
+    the pytz localize/combine work.
+    """
+
+    def __init__(self, tz_name: str = "US/Eastern", catalog: MembershipCatalog | None = None):
+        self.tz = pytz.timezone(tz_name)
+        self.catalog = membership_catalog if catalog is None else catalog
+        self._days: dict[date, _DayBoundaries] = {}
+        self._anniversaries: dict[date, date] = {}
+
+    def precompute(self, first_day: date, days: int) -> None:
+        """Warm the boundary cache for a range of days (e.g. ahead of a bulk import)."""
+        for offset in range(days + 1):
+            self._day(first_day + timedelta(days=offset))
+
+    def _day(self, day: date) -> _DayBoundaries:
+        bounds = self._days.get(day)
+        if bounds is None:
+            bounds = _DayBoundaries(
+                midnight=self.tz.localize(datetime.combine(day, time(0, 0))).astimezone(pytz.utc),
+                cutoff=self.tz.localize(datetime.combine(day, ACCESS_END)).astimezone(pytz.utc),
+                start=datetime.combine(day, ACCESS_START, tzinfo=pytz.UTC),
+                end=datetime.combine(day, ACCESS_END, tzinfo=pytz.UTC),
+                expiry=self.tz.localize(datetime.combine(day, FIRESTORE_EXPIRY)),
+            )
+            self._days[day] = bounds
+        return bounds
+
+    def local_date(self, moment: datetime) -> date:
+        """Eastern calendar date of an aware datetime, resolved against cached midnights."""
+        day = (moment.astimezone(pytz.utc) - timedelta(hours=5)).date()
+        if moment < self._day(day).midnight:
+            return day - timedelta(days=1)
+        if moment >= self._day(day + timedelta(days=1)).midnight:
+            return day + timedelta(days=1)
+        return day
+
+    def start_day(self, moment: datetime | None = None) -> date:
+        """Access starts today, or tomorrow if purchased at or after 10 PM Eastern."""
+        if moment is None:
+            moment = datetime.now(pytz.utc)
+        day = self.local_date(moment)
+        if moment < self._day(day).cutoff:
+            return day
+        return day + timedelta(days=1)
+
+    def anniversary(self, start_date: date) -> date:
+        """Same day next month, clamped to the last day of shorter months."""
+        target = self._anniversaries.get(start_date)
+        if target is None:
+            next_month = (start_date.month % 12) + 1
+            next_year = start_date.year + (start_date.month // 12)
+            _, max_days = calendar.monthrange(next_year, next_month)
+            target = date(next_year, next_month, min(start_date.day, max_days))
+            self._anniversaries[start_date] = target
+        return target
+
+    def next_month_anniversary(self, existing_expiry: datetime | None = None, now: datetime | None = None) -> tuple[datetime, datetime]:
+        """Returns (remotelock_expiry, firestore_expiry) one month after the expiry or start day."""
+        if existing_expiry:
+            start_date = self.local_date(existing_expiry)
+        else:
+            start_date = self.start_day(now)
+        bounds = self._day(self.anniversary(start_date))
+        return bounds.end, bounds.expiry
+
+    def remotelock_end(self, expire_at: datetime) -> datetime:
+        """RemoteLock 10:00 PM "fake UTC" end matching a Firestore 10:05 PM Eastern expiry."""
+        return self._day(self.local_date(expire_at)).end
+
+    def expiry_on(self, day: date) -> tuple[datetime, datetime]:
+        """(remotelock_expiry, firestore_expiry) for access ending on an Eastern calendar date."""
+        bounds = self._day(day)
+        return bounds.end, bounds.expiry
+
+    def shift_expiry(self, expire_at: datetime, days: int) -> tuple[datetime, datetime]:
+        """Move a Firestore expiry by whole days. Returns (remotelock_expiry, firestore_expiry)."""
+        bounds = self._day(self.local_date(expire_at) + timedelta(days=days))
+        return bounds.end, bounds.expiry
+
+    def next_month_anniversaries(self, expiries: Iterable[datetime]) -> list[tuple[datetime, datetime]]:
+        """Batch form of next_month_anniversary for existing expiries (reconciliation, bulk extends)."""
+        return [self.next_month_anniversary(expiry) for expiry in expiries]
+
+    def _window(self, membership_type: str, start_date: date, force_end_utc: datetime | None = None) -> AccessWindow:
+        product = self.catalog.classify(membership_type)
+        kind = product.kind
+        bounds = self._day(start_date)
+
+        if force_end_utc:
+            end_utc = force_end_utc
+        elif kind == DAY_PASS:
+            end_utc = bounds.end
+        elif kind == MONTHLY:
+            end_utc = self._day(self.anniversary(start_date)).end
+        else:
+            end_utc = self._day((bounds.start + product.duration).date()).end
+        return AccessWindow(bounds.start, end_utc, kind)
+
+    def plan(self, membership_type: str, now: datetime | None = None, force_end_utc: datetime | None = None) -> AccessWindow:
+        """Access window for one purchase made at `now` (defaults to the current time)."""
+        return self._window(membership_type, self.start_day(now), force_end_utc)
 
-        rl_client.grant_lock_access(guest_id, lock_id)
-        logger.info(f"RemoteLock lock access granted for guest {guest_id}")
+    def plan_many(self, membership_types: Iterable[str], now: datetime | None = None) -> list[AccessWindow]:
+        """
+        Access windows for many purchases made at the same moment. The start day
+        is resolved once and each distinct membership type is computed once.
+        """
+        start_date = self.start_day(now)
+        computed: dict[str, AccessWindow] = {}
+        windows = []
+        for membership_type in membership_types:
+            window = computed.get(membership_type)
+            if window is None:
+                window = computed[membership_type] = self._window(membership_type, start_date)
+            windows.append(window)
+        return windows
 
+
+access_planner = AccessWindowPlanner()
+
+
+def door_code_sms_body(pin: str, window: AccessWindow) -> str:
+    """The member's door-code text; day passes get no expiry or PIN-change offer."""
+    if window.kind == DAY_PASS:
+        return f"Your B-STRONG door code is {pin}#. Be sure to hit the # after the numbers. Access hours are 4am-10pm. Busiest times are 8am-11am, so if you arrive at 9, plan for it to be busy. Please don't share your code with others or let anyone else in. Questions? Text Craig at 774-255-0465 or Heather at 508-685-8888. Enjoy your workout!"
+
+    exp_date = window.end_utc.astimezone(access_planner.tz).strftime('%Y-%m-%d')
+    return f"Your B-STRONG door code is {pin}#. Be sure to hit the # after the numbers. If you'd like to change your door code please respond to this text with the 4 or 5 digits to set it. Your code will expire {exp_date} at 10:00 pm. Access hours are 4am-10pm. Busiest times are 8am-11am, so if you arrive at 9, plan for it to be busy. Please don't share your code with others or let anyone else in. Questions? Text Craig at 774-255-0465 or Heather at 508-685-8888. Enjoy your workout!"
+
+
+def delete_guest(rl_client: RemoteLockClient, guest_id: str, reason: str) -> bool:
+    """Delete a guest that must not be left behind (e.g. one that never got its locks). False if it is still there."""
+    try:
+        rl_client.delete_access_person(guest_id)
+        logger.info("Deleted RemoteLock guest %s: %s", guest_id, reason)
+        return True
     except (RuntimeError, requests.exceptions.RequestException) as e:
-        logger.error(f"RemoteLock API error creating code for {first} {last}: {e}")
-        send_Dev(f"RemoteLock API error for {first} {last}: {e}")
+        logger.error("Could not delete RemoteLock guest %s (%s): %s", guest_id, reason, e)
+        send_Dev(f"Could not delete RemoteLock guest {guest_id} ({reason}): {e}. Delete it in RemoteLock.")
+        return False
+
+
+def create_door_code(first: str, last: str, phone: str, membership_type: str, rl_client: RemoteLockClient, force_end_utc: datetime | None = None, guest_pool: GuestPool | None = None, guest_id: str | None = None) -> tuple[bool, str | None]:
+    """
+    Create a guest with lock access and text the member its PIN. Returns
+    (texted, guest_id); guest_id is only set once the guest holds its locks,
+    so (False, guest_id) means only the text failed. Passing that guest_id
+    back in resends the text for the same guest instead of creating another.
+    """
+    topology = get_topology()
+    if topology is None:
+        logger.error("Missing LOCK_ID in config.")
         return (False, None)
 
-    exp_date = end_utc.astimezone(est).strftime('%Y-%m-%d')
+    window = access_planner.plan(membership_type, force_end_utc=force_end_utc)
+    start_utc, end_utc = window.start_utc, window.end_utc
+
+    if guest_id:
+        try:
+            pin = rl_client.get_access_person(guest_id)["pin"]
+        except (RuntimeError, KeyError, requests.exceptions.RequestException) as e:
+            logger.error("Could not read RemoteLock guest %s to resend the code for %s %s: %s", guest_id, first, last, e)
+            return (False, guest_id)
+        logger.info("Resending the door code of RemoteLock guest %s to %s %s", guest_id, first, last)
+        sms_sent = send_sms(to_phone_number=phone, body=door_code_sms_body(pin, window), first_name=first, last_name=last)
+        return (sms_sent, guest_id)
 
-    if "day pass" in membership_type.lower():
-        sms_body = f"Your B-STRONG door code is {pin}#. Be sure to hit the # after the numbers. Access hours are 4am-10pm. Busiest times are 8am-11am, so if you arrive at 9, plan for it to be busy. Please don't share your code with others or let anyone else in. Questions? Text Craig at 774-255-0465 or Heather at 508-685-8888. Enjoy your workout!"
-    else:
-        sms_body = f"Your B-STRONG door code is {pin}#. Be sure to hit the # after the numbers. If you'd like to change your door code please respond to this text with the 4 or 5 digits to set it. Your code will expire {exp_date} at 10:00 pm. Access hours are 4am-10pm. Busiest times are 8am-11am, so if you arrive at 9, plan for it to be busy. Please don't share your code with others or let anyone else in. Questions? Text Craig at 774-255-0465 or Heather at 508-685-8888. Enjoy your workout!"
+    if window.kind == UNKNOWN and not force_end_utc:
+        logger.warning("Unknown membership type '%s' for %s %s. Defaulting to same-day access.", membership_type, first, last)
+        send_Dev(f"Unknown membership type received: '{membership_type}' for {first} {last}. Defaulted to same-day access.")
 
+    logger.info("RemoteLock time window for %s %s: start=%s end=%s (membership='%s')", first, last, start_utc.isoformat(), end_utc.isoformat(), membership_type)
+
+    starts_at = start_utc.isoformat()
+    ends_at = end_utc.isoformat().replace("+00:00", "Z")
+
+    locks = topology.locks_for(access_planner.catalog.classify(membership_type))
+    # Pooled guests already hold the default locks, so only members who should open all of them can take one.
+    pool_locks = topology.default_locks()
+    pooled = guest_pool.claim() if guest_pool and set(pool_locks) <= set(locks) else None
+    if pooled:
+        try:
+            rl_client.update_access_person(pooled.guest_id, f"{first} {last}", starts_at, ends_at)
+            guest_id, pin = pooled
+            logger.info("Pooled RemoteLock guest %s activated for %s %s, pin=%s", guest_id, first, last, pin)
+        except (RuntimeError, requests.exceptions.RequestException) as e:
+            logger.warning("Could not activate pooled guest %s for %s %s, creating a new one: %s", pooled.guest_id, first, last, e)
+            # The update may have applied anyway, so the guest cannot go back to the pool.
+            delete_guest(rl_client, pooled.guest_id, f"activation failed for {first} {last}")
+            pooled = None
+
+    if not pooled:
+        try:
+            guest_id, pin = rl_client.create_access_person(
+                name=f"{first} {last}",
+                starts_at=starts_at,
+                ends_at=ends_at
+            )
+            logger.info("RemoteLock access_person created for %s %s: guest_id=%s, pin=%s", first, last, guest_id, pin)
+        except (RuntimeError, requests.exceptions.RequestException) as e:
+            logger.error("RemoteLock API error creating code for %s %s: %s", first, last, e)
+            send_Dev(f"RemoteLock API error for {first} {last}: {e}")
+            return (False, None)
+
+    grants = grant_locks(rl_client, guest_id, locks, held=pool_locks if pooled else ())
+    if not grants.ok:
+        logger.error("RemoteLock API error granting locks for %s %s: %s", first, last, grants.describe_failures())
+        send_Dev(f"RemoteLock API error for {first} {last}: {grants.describe_failures()}")
+        delete_guest(rl_client, guest_id, f"lock grants failed for {first} {last}")
+        return (False, None)
+    if grants.failed:
+        logger.warning("Guest %s for %s %s is missing locks: %s", guest_id, first, last, grants.describe_failures())
+        send_Dev(f"{first} {last} got a door code but could not be granted: {grants.describe_failures()}. Grant these in RemoteLock.")
+    logger.info("RemoteLock lock access granted for guest %s: %s", guest_id, ", ".join(lock.label for lock in grants.granted))
+
+    sms_body = door_code_sms_body(pin, window)
     sms_sent = send_sms(to_phone_number=phone, body=sms_body, first_name=first, last_name=last)
     return (sms_sent, guest_id)
 
@@ -79,41 +274,18 @@ def extend_remotelock_code(
     try:
         ends_at = new_expiration_datetime.isoformat().replace("+00:00", "Z")
         rl_client.extend_access(guest_id, ends_at)
-        logger.info(f"RemoteLock code extended for guest {guest_id} to {new_expiration_datetime.isoformat()}")
+        logger.info("RemoteLock code extended for guest %s to %s", guest_id, new_expiration_datetime.isoformat())
         return True
 
     except (RuntimeError, requests.exceptions.RequestException) as e:
-        logger.error(f"RemoteLock API error extending guest {guest_id}: {e}")
+        logger.error("RemoteLock API error extending guest %s: %s", guest_id, e)
         send_Dev(f"RemoteLock API error extending {guest_id}: {e}")
         return False
 
 
 def get_next_month_anniversary(existing_expiry: datetime | None = None) -> tuple[datetime, datetime]:
-    est = pytz.timezone("US/Eastern")
-
-    if existing_expiry:
-        # Convert Firestore UTC to EST before extracting the date to avoid
-        # 10:00 PM rolling over into the next day in UTC.
-        est_time = existing_expiry.astimezone(est)
-        start_date = est_time.date()
-    else:
-        current_time_est = datetime.now(est)
-        if current_time_est.hour < 22:
-            start_date = current_time_est.date()
-        else:
-            start_date = current_time_est.date() + timedelta(days=1)
-
-    next_month = (start_date.month % 12) + 1
-    next_year = start_date.year + (start_date.month // 12)
-
-    _, max_days = calendar.monthrange(next_year, next_month)
-    target_day = min(start_date.day, max_days)
-    target_date = datetime(next_year, next_month, target_day).date()
-
+    # existing_expiry is converted from Firestore UTC to EST before extracting the
+    # date, so 10:00 PM does not roll over into the next day in UTC.
     # REMOTELOCK TIME: 10:00 PM "Fake UTC" — RemoteLock reads 22:00 UTC as 10 PM display time
-    remotelock_expiry = datetime.combine(target_date, time(22, 0)).replace(tzinfo=pytz.UTC)
-
     # FIRESTORE TIME: 10:05 PM True EST/EDT for accurate expiry comparisons
-    firestore_expiry = est.localize(datetime.combine(target_date, time(22, 5)))
-
-    return remotelock_expiry, firestore_expiry
+    return access_planner.next_month_anniversary(existing_expiry)
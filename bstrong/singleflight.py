@@ -0,0 +1,164 @@
+import asyncio, threading, time, uuid, logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, TypeVar
+from .metrics import SINGLE_FLIGHT
+
+logger = logging.getLogger(__name__)
+
+LEASE_COLLECTION = "flight_leases"
+
+# Identifies this instance as a lease owner.
+INSTANCE_ID = uuid.uuid4().hex
+
+T = TypeVar("T")
+
+
+class _Lease:
+    """A Firestore lease per key, so one instance at a time runs the work for it."""
+
+    def __init__(self, name: str, db: Any, seconds: float, poll: float):
+        self.name = name
+        self.db = db
+        self.seconds = seconds
+        self.poll = poll
+
+    def acquire(self, key: str) -> bool:
+        """Wait for the lease and take it. False if Firestore is unavailable or the wait runs too long."""
+        lease_key = f"{self.name}:{key}"
+        # Another holder's lease expires on its own, so waiting past two lease periods means Firestore is misbehaving.
+        deadline = time.monotonic() + 2 * self.seconds
+        waited = False
+        try:
+            while True:
+                now = datetime.now(timezone.utc)
+                if self.db.acquireLease(LEASE_COLLECTION, lease_key, INSTANCE_ID, now, now + timedelta(seconds=self.seconds)):
+                    return True
+                if time.monotonic() > deadline:
+                    logger.warning("Gave up waiting for the %s lease; running without it.", lease_key)
+                    return False
+                if not waited:
+                    SINGLE_FLIGHT.inc(flight=self.name, role="lease_wait")
+                    waited = True
+                time.sleep(self.poll)
+        except Exception as e:
+            logger.warning("Single-flight lease for %s unavailable, continuing in-process only: %s", lease_key, e)
+            return False
+
+    def release(self, key: str) -> None:
+        try:
+            self.db.releaseLease(LEASE_COLLECTION, f"{self.name}:{key}", INSTANCE_ID)
+        except Exception as e:
+            logger.warning("Could not release the %s:%s lease (it expires on its own): %s", self.name, key, e)
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Keyed single-flight. The first caller for a key (the leader) runs the
+    work; callers that arrive while it runs (followers) wait for it and get
+    its result, or its exception, instead of repeating the I/O.
+
+    With `db` and `lease_seconds`, the leader also holds a Firestore lease on
+    the key, so leaders on other instances wait their turn. They do not see
+    this instance's result; they run the work afterwards, so it must be safe
+    to repeat (e.g. it checks processed_transactions first). If Firestore is
+    unavailable the flight stays in-process.
+    """
+
+    def __init__(self, name: str, db: Any = None, lease_seconds: float = 0.0, poll: float = 0.2):
+        self.name = name
+        self._lease = _Lease(name, db, lease_seconds, poll) if db is not None and lease_seconds > 0 else None
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], T]) -> tuple[T, bool]:
+        """Run fn() once per concurrent burst of callers for `key`. Returns (result, shared)."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            SINGLE_FLIGHT.inc(flight=self.name, role="follower")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        SINGLE_FLIGHT.inc(flight=self.name, role="leader")
+        held = self._lease.acquire(key) if self._lease else False
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            if held:
+                self._lease.release(key)
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        return len(self._calls)
+
+
+class _LeaderCancelled(Exception):
+    """Set on an AsyncSingleFlight call whose leader was cancelled; its followers run the work again."""
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop (the ASGI app). The lease is
+    taken in a worker thread. A cancelled leader (its client went away) does not
+    cancel its followers: the first of them runs the work again for the rest.
+    """
+
+    def __init__(self, name: str, db: Any = None, lease_seconds: float = 0.0, poll: float = 0.2):
+        self.name = name
+        self._lease = _Lease(name, db, lease_seconds, poll) if db is not None and lease_seconds > 0 else None
+        self._calls: dict[str, asyncio.Future] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> tuple[T, bool]:
+        call = self._calls.get(key)
+        if call is not None:
+            SINGLE_FLIGHT.inc(flight=self.name, role="follower")
+            try:
+                return await asyncio.shield(call), True
+            except _LeaderCancelled:
+                return await self.do(key, fn)
+
+        call = self._calls[key] = asyncio.get_running_loop().create_future()
+        SINGLE_FLIGHT.inc(flight=self.name, role="leader")
+        try:
+            held = await asyncio.to_thread(self._lease.acquire, key) if self._lease else False
+            try:
+                result = await fn()
+            finally:
+                if held:
+                    await asyncio.to_thread(self._lease.release, key)
+        except asyncio.CancelledError:
+            call.set_exception(_LeaderCancelled())
+            call.exception()
+            raise
+        except BaseException as e:
+            call.set_exception(e)
+            call.exception()  # retrieved here so an exception nobody else awaited is not logged again
+            raise
+        finally:
+            del self._calls[key]
+        call.set_result(result)
+        return result, False
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -0,0 +1,210 @@
+import hashlib, math, sys, threading, time, logging
+from typing import Any, Iterable
+
+logger = logging.getLogger(__name__)
+
+TICKET_COLLECTION = "pin_change_tickets"
+_SATURATED = 255
+
+
+class TicketFilter:
+    """
+    Counting Bloom filter of the phone numbers that have a PIN change ticket,
+    so /webhook-sms can answer texts from everyone else (spam, STOP, members
+    whose window closed) without a Firestore read. A "no" is definite; a
+    "maybe" falls through to Firestore. Until the first rebuild every lookup
+    is a "maybe".
+
+    Kept current by local ticket writes, a Firestore listener on the ticket
+    collection and periodic rebuilds. Only the changes since the listing
+    the filter was built from are kept as phones: those added since are
+    counted once and decremented when removed, since decrementing for a
+    phone that was never counted could turn a real ticket into a false "no".
+    Any other removal is held in a small set that answers "no" for it until
+    the next rebuild drops it from the listing. Changes that arrive while a
+    rebuild lists the collection are replayed onto the new filter.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float):
+        self.capacity = capacity
+        self.fp_rate = fp_rate
+        self._lock = threading.Lock()
+        self._counters, self._hashes = self._allocate(capacity)
+        self._entries = 0
+        self._added: set[str] = set()
+        self._removed: set[str] = set()
+        self._added_during_rebuild: set[str] | None = None
+        self._removed_during_rebuild: set[str] | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._watch: Any = None
+        self.built_at: float | None = None
+        self.lookups = 0
+        self.skipped = 0
+        self.false_positives = 0
+
+    def _allocate(self, expected: int) -> tuple[bytearray, int]:
+        size = max(64, math.ceil(-expected * math.log(self.fp_rate) / math.log(2) ** 2))
+        hashes = max(1, round(size / expected * math.log(2)))
+        return bytearray(size), hashes
+
+    @staticmethod
+    def _positions(phone: str, size: int, hashes: int) -> list[int]:
+        digest = hashlib.blake2b(phone.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], "little"), int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % size for i in range(hashes)]
+
+    @property
+    def ready(self) -> bool:
+        return self.built_at is not None
+
+    def add(self, phone: str) -> None:
+        with self._lock:
+            if self._added_during_rebuild is not None:
+                self._added_during_rebuild.add(phone)
+                self._removed_during_rebuild.discard(phone)
+            self._removed.discard(phone)
+            if phone not in self._added:
+                self._added.add(phone)
+                self._increment(self._counters, self._hashes, phone)
+                self._entries += 1
+
+    def discard(self, phone: str) -> None:
+        """Remove a phone's ticket; only phones added since the last rebuild are decremented."""
+        with self._lock:
+            if self._removed_during_rebuild is not None:
+                self._removed_during_rebuild.add(phone)
+                self._added_during_rebuild.discard(phone)
+            if phone in self._added:
+                self._added.remove(phone)
+                self._decrement(self._counters, self._hashes, phone)
+                self._entries -= 1
+            if self._counted(self._counters, self._hashes, phone):
+                self._removed.add(phone)
+
+    @classmethod
+    def _increment(cls, counters: bytearray, hashes: int, phone: str) -> None:
+        for pos in cls._positions(phone, len(counters), hashes):
+            if counters[pos] < _SATURATED:
+                counters[pos] += 1
+
+    @classmethod
+    def _decrement(cls, counters: bytearray, hashes: int, phone: str) -> None:
+        for pos in cls._positions(phone, len(counters), hashes):
+            if 0 < counters[pos] < _SATURATED:
+                counters[pos] -= 1
+
+    @classmethod
+    def _counted(cls, counters: bytearray, hashes: int, phone: str) -> bool:
+        return all(counters[pos] for pos in cls._positions(phone, len(counters), hashes))
+
+    def might_contain(self, phone: str | None) -> bool:
+        """False only when `phone` definitely has no ticket."""
+        if not self.ready or not phone:
+            return True
+        found = phone not in self._removed and self._counted(self._counters, self._hashes, phone)
+        self.lookups += 1
+        if not found:
+            self.skipped += 1
+        return found
+
+    def record_false_positive(self) -> None:
+        """Count a "maybe" that Firestore answered with no ticket."""
+        if self.ready:
+            self.false_positives += 1
+
+    def rebuild(self, db: Any) -> int:
+        """Replace the filter with the ticket collection's current keys. Returns the entry count."""
+        with self._lock:
+            self._added_during_rebuild, self._removed_during_rebuild = set(), set()
+        try:
+            phones = set(db.listKeys(TICKET_COLLECTION))
+            counters, hashes = self._allocate(max(self.capacity, 2 * len(phones)))
+            for phone in phones:
+                self._increment(counters, hashes, phone)
+        except Exception:
+            with self._lock:
+                self._added_during_rebuild = self._removed_during_rebuild = None
+            raise
+
+        with self._lock:
+            added = self._added_during_rebuild - phones
+            for phone in added:
+                self._increment(counters, hashes, phone)
+            removed = self._removed_during_rebuild & phones
+            for phone in removed:
+                self._decrement(counters, hashes, phone)
+            self._counters, self._hashes = counters, hashes
+            self._entries = len(phones) + len(added) - len(removed)
+            self._added, self._removed = added, set()
+            self._added_during_rebuild = self._removed_during_rebuild = None
+            self.built_at = time.time()
+        logger.info("Ticket filter rebuilt: %s tickets in %s counters.", self._entries, len(counters))
+        return self._entries
+
+    def apply_changes(self, added: Iterable[str], removed: Iterable[str]) -> None:
+        """Listener callback: ticket documents created or deleted anywhere."""
+        for phone in added:
+            self.add(phone)
+        for phone in removed:
+            self.discard(phone)
+
+    def estimated_fp_rate(self) -> float:
+        size, hashes = len(self._counters), self._hashes
+        return (1 - math.exp(-hashes * self._entries / size)) ** hashes
+
+    def observed_fp_rate(self) -> float | None:
+        """False "maybe"s as a share of all phones without a ticket that were looked up."""
+        negatives = self.false_positives + self.skipped
+        return self.false_positives / negatives if negatives else None
+
+    def memory_bytes(self) -> int:
+        """The counters plus the phones changed since the last rebuild."""
+        with self._lock:
+            phones = [*self._added, *self._removed]
+            tracking = sys.getsizeof(self._added) + sys.getsizeof(self._removed)
+        return len(self._counters) + tracking + sum(sys.getsizeof(p) for p in phones)
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "entries": self._entries,
+            "removed": len(self._removed),
+            "counters": len(self._counters),
+            "hashes": self._hashes,
+            "memory_bytes": self.memory_bytes(),
+            "estimated_fp_rate": round(self.estimated_fp_rate(), 6),
+            "observed_fp_rate": self.observed_fp_rate(),
+            "lookups": self.lookups,
+            "skipped": self.skipped,
+            "false_positives": self.false_positives,
+            "age_seconds": None if self.built_at is None else round(time.time() - self.built_at, 1),
+        }
+
+    def start_refresh(self, db: Any, interval: float, watch: bool = True) -> None:
+        """Rebuild now and every `interval` seconds on a daemon thread, optionally listening for changes."""
+        if self._thread and self._thread.is_alive():
+            return
+        if watch:
+            try:
+                self._watch = db.watchCollection(TICKET_COLLECTION, self.apply_changes)
+            except Exception as e:
+                logger.error("Ticket filter listener failed to start, relying on rebuilds: %s", e)
+
+        def run():
+            while True:
+                try:
+                    self.rebuild(db)
+                except Exception as e:
+                    logger.error("Ticket filter rebuild failed: %s", e)
+                if self._stop.wait(interval):
+                    return
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="ticket-filter-refresh", daemon=True)
+        self._thread.start()
+
+    def stop_refresh(self) -> None:
+        self._stop.set()
+        if self._watch is not None:
+            self._watch.unsubscribe()
+            self._watch = None
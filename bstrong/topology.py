@@ -0,0 +1,159 @@
+import json, time, logging, requests
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from dataclasses import dataclass, field
+from typing import Any, Iterable
+from .api_clients import LOCK_SCHEDULE_ID
+from .catalog import MembershipProduct
+from .config import Config, LOCK_TOPOLOGY, LOCK_GRANT_ATTEMPTS, LOCK_GRANT_BACKOFF_SECONDS, LOCK_GRANT_CONCURRENCY
+from .metrics import LOCK_GRANTS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LOCATION = "main"
+DEFAULT_RULE = "default"
+
+
+@dataclass(frozen=True)
+class Lock:
+    lock_id: str
+    name: str
+    location: str = DEFAULT_LOCATION
+    schedule_id: str = LOCK_SCHEDULE_ID
+    # A member whose required lock could not be granted gets no code at all.
+    required: bool = False
+
+    @property
+    def label(self) -> str:
+        return f"{self.location}/{self.name}"
+
+
+class LockTopology:
+    """
+    Locations, their locks and which locks each membership opens. Rules are
+    looked up by normalized item name, then by access kind, then "default";
+    a rule lists location names (every lock there) or "location/lock" labels.
+    With no "default" rule every lock is granted.
+    """
+
+    def __init__(self, locks: Iterable[Lock], rules: dict[str, list[str]] | None = None):
+        self.locks = tuple(locks)
+        self._by_label = {lock.label: lock for lock in self.locks}
+        self._rules = {key: self._resolve(targets) for key, targets in (rules or {}).items()}
+
+    def _resolve(self, targets: list[str]) -> tuple[Lock, ...]:
+        resolved: dict[str, Lock] = {}
+        for target in targets:
+            if target in self._by_label:
+                matched = [self._by_label[target]]
+            else:
+                matched = [lock for lock in self.locks if lock.location == target]
+            if not matched:
+                raise ValueError(f"Lock topology rule names unknown location or lock '{target}'.")
+            resolved.update((lock.label, lock) for lock in matched)
+        return tuple(resolved.values())
+
+    @classmethod
+    def single(cls, lock_id: str) -> "LockTopology":
+        """The original one-door setup: LOCK_ID on the shared access schedule."""
+        return cls([Lock(lock_id, "door", required=True)])
+
+    @classmethod
+    def from_spec(cls, spec: dict[str, Any]) -> "LockTopology":
+        """
+        Build from {"locations": {location: {lock name: {"id", "schedule_id",
+        "required"}}}, "memberships": {item | kind | "default": [targets]}}.
+        """
+        locks = [
+            Lock(
+                lock_id=attrs["id"],
+                name=name,
+                location=location,
+                schedule_id=attrs.get("schedule_id", LOCK_SCHEDULE_ID),
+                required=bool(attrs.get("required", False)),
+            )
+            for location, location_locks in spec.get("locations", {}).items()
+            for name, attrs in location_locks.items()
+        ]
+        if not locks:
+            raise ValueError("Lock topology has no locks.")
+        return cls(locks, spec.get("memberships"))
+
+    def default_locks(self) -> tuple[Lock, ...]:
+        return self._rules.get(DEFAULT_RULE, self.locks)
+
+    def locks_for(self, product: MembershipProduct | None) -> tuple[Lock, ...]:
+        if product is not None:
+            for key in (product.key, product.kind):
+                if key in self._rules:
+                    return self._rules[key]
+        return self.default_locks()
+
+
+_parsed: dict[str, LockTopology] = {}
+
+
+def get_topology() -> LockTopology | None:
+    """The LOCK_TOPOLOGY spec if set, otherwise the single LOCK_ID. None when neither is configured."""
+    if LOCK_TOPOLOGY:
+        if LOCK_TOPOLOGY not in _parsed:
+            _parsed[LOCK_TOPOLOGY] = LockTopology.from_spec(json.loads(LOCK_TOPOLOGY))
+        return _parsed[LOCK_TOPOLOGY]
+    lock_id = Config.get("LOCK_ID")
+    return LockTopology.single(lock_id) if lock_id else None
+
+
+@dataclass
+class GrantResult:
+    granted: list[Lock] = field(default_factory=list)
+    failed: dict[Lock, Exception] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        """Usable code: no required lock failed and at least one lock opens."""
+        return bool(self.granted) and not any(lock.required for lock in self.failed)
+
+    def describe_failures(self) -> str:
+        return ", ".join(f"{lock.label} ({err})" for lock, err in self.failed.items())
+
+
+_grant_executor = ThreadPoolExecutor(max_workers=LOCK_GRANT_CONCURRENCY, thread_name_prefix="lock-grant")
+
+
+def _grant_one(rl_client: Any, guest_id: str, lock: Lock, attempts: int) -> Exception | None:
+    attempts = max(1, attempts)
+    for attempt in range(attempts):
+        try:
+            rl_client.grant_lock_access(guest_id, lock.lock_id, lock.schedule_id)
+            LOCK_GRANTS.inc(location=lock.location, outcome="granted")
+            return None
+        except (RuntimeError, requests.exceptions.RequestException) as e:
+            error = e
+            if attempt + 1 < attempts:
+                LOCK_GRANTS.inc(location=lock.location, outcome="retried")
+                logger.warning("Granting %s to guest %s failed (attempt %d), retrying: %s", lock.label, guest_id, attempt + 1, e)
+                time.sleep(LOCK_GRANT_BACKOFF_SECONDS * 2 ** attempt)
+    LOCK_GRANTS.inc(location=lock.location, outcome="failed")
+    return error
+
+
+def grant_locks(rl_client: Any, guest_id: str, locks: Iterable[Lock], held: Iterable[Lock] = (), attempts: int = LOCK_GRANT_ATTEMPTS) -> GrantResult:
+    """
+    Grant a guest every lock in `locks` at once, retrying each lock on its own
+    so one bad lock neither delays nor fails the others. Locks in `held` are
+    already granted (e.g. a pooled guest) and are only counted.
+    """
+    locks, held = tuple(locks), set(held)
+    result = GrantResult(granted=[lock for lock in locks if lock in held])
+    pending = [lock for lock in locks if lock not in held]
+    if len(pending) == 1:
+        errors = [_grant_one(rl_client, guest_id, pending[0], attempts)]
+    else:
+        futures = [_grant_executor.submit(copy_context().run, _grant_one, rl_client, guest_id, lock, attempts) for lock in pending]
+        errors = [future.result() for future in futures]
+    for lock, error in zip(pending, errors):
+        if error is None:
+            result.granted.append(lock)
+        else:
+            result.failed[lock] = error
+    return result
@@ -0,0 +1,173 @@
+"""
+Request-scoped tracing. Each inbound request gets a trace ID that is stamped on
+log records and outbound vendor requests; I/O calls become timed spans, and the
+finished trace is handed to an exporter (discarded unless TRACE_EXPORTER=jsonl).
+"""
+import json, logging, os, re, threading, time, uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from typing import Any, Iterator, Protocol
+
+logger = logging.getLogger(__name__)
+
+TRACE_HEADER = "X-Trace-Id"
+_VALID_TRACE_ID = re.compile(r"[A-Za-z0-9-]{8,64}")
+
+_current_trace: ContextVar["Trace | None"] = ContextVar("bstrong_trace", default=None)
+_current_span: ContextVar[str | None] = ContextVar("bstrong_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: str | None
+    start: float
+    duration_ms: float = 0.0
+    error: str | None = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Trace:
+    trace_id: str
+    name: str
+    started_at: float = field(default_factory=time.time)
+    duration_ms: float = 0.0
+    status: int | None = None
+    spans: list[Span] = field(default_factory=list)
+    perf_start: float = field(default_factory=time.perf_counter, repr=False)
+
+    def to_dict(self) -> dict[str, Any]:
+        data = asdict(self)
+        data.pop("perf_start")
+        return data
+
+
+class Exporter(Protocol):
+    def export(self, trace: Trace) -> None: ...
+
+
+class NullExporter:
+    def export(self, trace: Trace) -> None:
+        pass
+
+
+class JsonLinesExporter:
+    """
+    Appends one JSON object per finished trace to a local file. Once the file
+    reaches `max_bytes` it is moved to `<path>.1` (replacing the previous one),
+    so at most twice `max_bytes` is kept -- on Cloud Run /tmp is memory.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 10 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace) -> None:
+        line = json.dumps(trace.to_dict(), default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                full = f.tell() >= self.max_bytes
+            if full:
+                os.replace(self.path, self.path + ".1")
+
+
+def _default_exporter() -> Exporter:
+    if os.getenv("TRACE_EXPORTER", "none") != "jsonl":
+        return NullExporter()
+    return JsonLinesExporter(os.getenv("TRACE_EXPORT_PATH", "/tmp/bstrong-traces.jsonl"),
+                             int(os.getenv("TRACE_EXPORT_MAX_BYTES", str(10 * 1024 * 1024))))
+
+
+_exporter: Exporter = _default_exporter()
+
+
+def set_exporter(exporter: Exporter) -> None:
+    global _exporter
+    _exporter = exporter
+
+
+def new_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id() -> str | None:
+    trace = _current_trace.get()
+    return trace.trace_id if trace else None
+
+
+def trace_headers() -> dict[str, str]:
+    """Headers to add to outbound requests so vendor-side logs can be correlated."""
+    trace = _current_trace.get()
+    return {TRACE_HEADER: trace.trace_id} if trace else {}
+
+
+def begin_trace(name: str, trace_id: str | None = None) -> tuple[Trace, Any]:
+    """Start a trace in the current context; pass the returned token to end_trace()."""
+    if not trace_id or not _VALID_TRACE_ID.fullmatch(trace_id):
+        trace_id = new_id()
+    trace = Trace(trace_id=trace_id, name=name)
+    return trace, _current_trace.set(trace)
+
+
+def end_trace(trace: Trace, token: Any, status: int | None = None) -> None:
+    trace.duration_ms = round((time.perf_counter() - trace.perf_start) * 1000, 3)
+    trace.status = status
+    try:
+        _current_trace.reset(token)
+    except ValueError:
+        # Ended from a different context (e.g. teardown on another thread); nothing to restore.
+        pass
+    try:
+        _exporter.export(trace)
+    except Exception as e:
+        logger.warning("Failed to export trace %s: %s", trace.trace_id, e)
+
+
+@contextmanager
+def start_trace(name: str, trace_id: str | None = None) -> Iterator[Trace]:
+    trace, token = begin_trace(name, trace_id)
+    try:
+        yield trace
+    finally:
+        end_trace(trace, token)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Span | None]:
+    """Time a block as a child of the current span. A no-op outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    current = Span(name=name, span_id=new_id(), parent_id=_current_span.get(), start=time.time(), attributes=attributes)
+    token = _current_span.set(current.span_id)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration_ms = round((time.perf_counter() - started) * 1000, 3)
+        _current_span.reset(token)
+        trace.spans.append(current)
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds `trace_id` to every record ("-" outside a trace) for use in log formats."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = current_trace_id() or "-"
+        return True
+
+
+def install_log_filter(logger_: logging.Logger | None = None) -> None:
+    for handler in (logger_ or logging.getLogger()).handlers:
+        if not any(isinstance(f, TraceIdFilter) for f in handler.filters):
+            handler.addFilter(TraceIdFilter())
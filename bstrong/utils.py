@@ -1,16 +1,34 @@
-import phonenumbers, logging
+import atexit, os, re, phonenumbers, logging
 from typing import TypedDict
 from twilio.rest import Client
 from .config import Config
+from .ratelimit import throttle
+from .metrics import vendor_call
+from .alerts import AlertDispatcher
 
 logger = logging.getLogger(__name__)
 
+# Overridable so load tests can send SMS to a local stand-in.
+TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL")
+
 
 class PhoneResult(TypedDict):
     valid: bool
     number: str | None
 
 
+class FormAnswers(TypedDict):
+    first_name: str | None
+    last_name: str | None
+    phone_number: str | None
+
+
+_HTML_TAG = re.compile(r'<[^>]+>')
+# Substring of the Vagaro form question -> FormAnswers key.
+_FORM_FIELDS = (("First Name", "first_name"), ("Last Name", "last_name"), ("CELL #", "phone_number"))
+
+
+@vendor_call("twilio")
 def send_sms(
     to_phone_number: str,
     body: str,
@@ -27,30 +45,52 @@ def send_sms(
         return False
 
     client = Client(sid, token)
+    if TWILIO_API_BASE_URL:
+        client.api.base_url = TWILIO_API_BASE_URL
     primary_sender = from_num if to_phone_number.startswith("+1") else "B-STRONG"
 
     try:
+        throttle("twilio")
         client.messages.create(body=body, from_=primary_sender, to=to_phone_number)
 
         if to_phone_number_2:
             secondary_sender = from_num if to_phone_number_2.startswith("+1") else "B-STRONG"
+            throttle("twilio")
             client.messages.create(body=body, from_=secondary_sender, to=to_phone_number_2)
-            logger.info(f"SMS sent to OWNERS ({to_phone_number} and {to_phone_number_2})")
+            logger.info("SMS sent to OWNERS (%s and %s)", to_phone_number, to_phone_number_2)
         else:
-            logger.info(f"SMS sent to {to_phone_number} via {primary_sender}")
+            logger.info("SMS sent to %s via %s", to_phone_number, primary_sender)
         return True
 
     except Exception as e:
-        logger.error(f"Failed SMS to {first_name or ''} {last_name or ''} ({to_phone_number}): {e}")
+        logger.error("Failed SMS to %s %s (%s): %s", first_name or '', last_name or '', to_phone_number, e)
         return False
 
 
-def send_Dev(body: str) -> bool:
+def _deliver_alert(to_phone_number: str, body: str) -> bool:
+    return send_sms(to_phone_number=to_phone_number, body=body)
+
+
+alerts = AlertDispatcher(_deliver_alert)
+atexit.register(alerts.flush)
+
+
+def send_Dev(body: str, key: str | None = None) -> bool:
+    """Alert the developer: coalesced with repeats and sent off the calling thread."""
     dev_phone = Config.get("DEVELOPER_PHONE_NUMBER")
     if not dev_phone:
         logger.error("DEVELOPER_PHONE_NUMBER not configured — dev alert dropped.")
         return False
-    return send_sms(to_phone_number=dev_phone, body=body)
+    alerts.submit((dev_phone,), body, key)
+    return True
+
+
+def send_Owners(owners: tuple[str | None, ...], body: str, key: str | None = None) -> None:
+    """
+    Alert the gym owners, through the same coalescing and budgets as send_Dev.
+    Owner alerts name a member left without a door code, so digests list every one.
+    """
+    alerts.submit([o for o in owners if o], body, key, complete=True)
 
 
 def fix_phone_number(raw_phone_number: str | None) -> PhoneResult:
@@ -74,5 +114,21 @@ def fix_phone_number(raw_phone_number: str | None) -> PhoneResult:
             }
 
     except Exception as e:
-        logger.warning(f"Phone parsing error for '{raw_phone_number}': {e}")
+        logger.warning("Phone parsing error for '%s': %s", raw_phone_number, e)
     return {'valid': False, 'number': raw_phone_number}
+
+
+def parse_form_answers(questions: list[dict]) -> FormAnswers:
+    """Pull the member's name and cell number out of Vagaro questionsAndAnswers, stripping HTML."""
+    answers: FormAnswers = {"first_name": None, "last_name": None, "phone_number": None}
+    for q in questions:
+        answers_list = q.get("answer", [])
+        if not answers_list:
+            continue
+
+        question_text = q.get("question", "")
+        for label, key in _FORM_FIELDS:
+            if label in question_text:
+                answers[key] = _HTML_TAG.sub('', answers_list[0]).strip()
+                break
+    return answers
@@ -1,48 +1,189 @@
+/**
+ * Vagaro proxy for the Cloud Run service. Requests name their Vagaro endpoint
+ * in X-Target-Url; token requests get the client credentials added here so
+ * the secret never leaves Cloudflare.
+ *
+ * Access tokens are cached at the edge until TOKEN_REFRESH_MARGIN_SECONDS
+ * (default 300) before they expire, first in the isolate and then in the
+ * colo's Cache API, and served with `expires_in` counted down to what is left.
+ * Customer lookups are cached for CUSTOMER_CACHE_TTL_SECONDS (default 0, off),
+ * keyed by a hash of the caller's access token so that a lookup is only served
+ * back to the token that made it.
+ * Both answer with X-Cache-Status: HIT, MISS or BYPASS. A request sent with
+ * `Cache-Control: no-cache` skips the cache and stores the fresh response.
+ */
+const TOKEN_URL = "https://api.vagaro.com/us03/api/v2/merchants/generate-access-token";
+// Cache API keys must be URLs; this host is never fetched.
+const CACHE_ORIGIN = "https://vagaro-proxy.cache";
+const CACHE_STATUS = "X-Cache-Status";
+const CACHED_AT = "X-Cached-At";
+
+// Tokens this isolate has fetched, by scope: {body, expiresAt}. Isolates are reused across requests.
+const isolateTokens = new Map();
+
+function header(request, name) {
+  return request.headers.get(name) || request.headers.get(name.toLowerCase());
+}
+
+function seconds(value, fallback) {
+  const parsed = Number(value);
+  return Number.isFinite(parsed) && parsed >= 0 ? parsed : fallback;
+}
+
+function json(body, status, cacheStatus) {
+  return new Response(typeof body === "string" ? body : JSON.stringify(body), {
+    status,
+    headers: { "Content-Type": "application/json", [CACHE_STATUS]: cacheStatus },
+  });
+}
+
+function withCacheStatus(response, cacheStatus) {
+  const tagged = new Response(response.body, response);
+  tagged.headers.set(CACHE_STATUS, cacheStatus);
+  return tagged;
+}
+
+function edgeCache() {
+  return typeof caches === "undefined" ? null : caches.default;
+}
+
+function store(ctx, key, text, ttl, now) {
+  const cache = edgeCache();
+  if (!cache || ttl <= 0) return;
+  const put = cache.put(key, new Response(text, {
+    headers: { "Content-Type": "application/json", "Cache-Control": `max-age=${Math.floor(ttl)}`, [CACHED_AT]: String(now) },
+  }));
+  if (ctx && ctx.waitUntil) ctx.waitUntil(put);
+}
+
+function upstreamRequest(request, targetUrl, body) {
+  const cleanHeaders = new Headers();
+  cleanHeaders.set("Content-Type", "application/json");
+  cleanHeaders.set("Accept", "application/json");
+  cleanHeaders.set("User-Agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36");
+
+  const vagaroToken = header(request, "accessToken");
+  if (vagaroToken) {
+    cleanHeaders.set("accessToken", vagaroToken);
+  }
+
+  return new Request(targetUrl, {
+    method: request.method === "OPTIONS" ? "OPTIONS" : "POST",
+    headers: cleanHeaders,
+    body: body || "{}",
+  });
+}
+
+async function sha256(text) {
+  const digest = await crypto.subtle.digest("SHA-256", new TextEncoder().encode(text));
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, "0")).join("");
+}
+
+function remainingToken(body, expiresAt, now) {
+  const data = { ...body.data, expires_in: Math.max(0, Math.floor((expiresAt - now) / 1000)) };
+  return { ...body, data };
+}
+
+async function accessToken(request, env, ctx, targetUrl) {
+  const scope = header(request, "X-Scope") || "read access";
+  const margin = seconds(env.TOKEN_REFRESH_MARGIN_SECONDS, 300);
+  const key = new Request(`${CACHE_ORIGIN}/token?scope=${encodeURIComponent(scope)}`);
+  const bypass = (header(request, "Cache-Control") || "").includes("no-cache");
+  const now = Date.now();
+
+  if (!bypass) {
+    const held = isolateTokens.get(scope);
+    if (held && held.expiresAt - margin * 1000 > now) {
+      return json(remainingToken(held.body, held.expiresAt, now), 200, "HIT");
+    }
+    const cache = edgeCache();
+    const cached = cache && await cache.match(key);
+    if (cached) {
+      const body = await cached.json();
+      const expiresAt = Number(cached.headers.get(CACHED_AT)) + body.data.expires_in * 1000;
+      isolateTokens.set(scope, { body, expiresAt });
+      return json(remainingToken(body, expiresAt, now), 200, "HIT");
+    }
+  }
+
+  const credentials = JSON.stringify({
+    clientId: env.VAGARO_CLIENT_ID,
+    clientSecretKey: env.VAGARO_CLIENT_SECRET,
+    scope,
+  });
+  const upstream = await fetch(upstreamRequest(request, targetUrl, credentials));
+  if (!upstream.ok) {
+    return withCacheStatus(upstream, "MISS");
+  }
+
+  const text = await upstream.text();
+  const body = JSON.parse(text);
+  const expiresIn = seconds(body.data && body.data.expires_in, 0);
+  if (body.data && body.data.access_token && expiresIn > margin) {
+    isolateTokens.set(scope, { body, expiresAt: now + expiresIn * 1000 });
+    store(ctx, key, text, expiresIn - margin, now);
+  }
+  return json(text, upstream.status, "MISS");
+}
+
+async function customer(request, env, ctx, targetUrl) {
+  const text = await request.text();
+  const ttl = seconds(env.CUSTOMER_CACHE_TTL_SECONDS, 0);
+  const cache = edgeCache();
+  let lookup = {};
+  try {
+    lookup = JSON.parse(text || "{}");
+  } catch (e) {
+    // Not ours to validate; Vagaro answers it.
+  }
+
+  // Only requests that carry a token are answered from the cache, as Vagaro would refuse the rest.
+  if (!ttl || !cache || !lookup.customerId || !header(request, "accessToken")) {
+    return withCacheStatus(await fetch(upstreamRequest(request, targetUrl, text)), "BYPASS");
+  }
+
+  const tokenHash = await sha256(header(request, "accessToken"));
+  const key = new Request(`${CACHE_ORIGIN}/customers/${tokenHash}/${encodeURIComponent(lookup.businessId || "")}/${encodeURIComponent(lookup.customerId)}`);
+  const bypass = (header(request, "Cache-Control") || "").includes("no-cache");
+  const cached = !bypass && await cache.match(key);
+  if (cached) {
+    return json(await cached.text(), 200, "HIT");
+  }
+
+  const upstream = await fetch(upstreamRequest(request, targetUrl, text));
+  if (!upstream.ok) {
+    return withCacheStatus(upstream, "MISS");
+  }
+  const body = await upstream.text();
+  if (JSON.parse(body).data) {
+    store(ctx, key, body, ttl, Date.now());
+  }
+  return json(body, upstream.status, "MISS");
+}
+
 export default {
-  // 1. ADD 'env' HERE
-  async fetch(request, env) {
+  async fetch(request, env, ctx) {
     try {
-      const targetUrlHeader = request.headers.get("X-Target-Url") || request.headers.get("x-target-url");
-      const targetUrl = targetUrlHeader || "https://api.vagaro.com/us03/api/v2/merchants/generate-access-token";
-      
-      const authPayload = {
-        clientId: env.VAGARO_CLIENT_ID,
-        clientSecretKey: env.VAGARO_CLIENT_SECRET,
-        scope: request.headers.get("X-Scope") || request.headers.get("x-scope") || "read access"
-      };
-
-      let finalBody = null;
+      const targetUrl = header(request, "X-Target-Url") || TOKEN_URL;
+
       if (targetUrl.includes("generate-access-token")) {
-        finalBody = JSON.stringify(authPayload);
-      } else {
-        if (request.method === "POST" || request.method === "PUT") {
-             finalBody = await request.text();
-        }
+        return await accessToken(request, env, ctx, targetUrl);
       }
-
-      const cleanHeaders = new Headers();
-      cleanHeaders.set("Content-Type", "application/json");
-      cleanHeaders.set("Accept", "application/json");
-      cleanHeaders.set("User-Agent", "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36");
-
-      const vagaroToken = request.headers.get("accessToken") || request.headers.get("accesstoken");
-      if (vagaroToken) {
-         cleanHeaders.set("accessToken", vagaroToken);
+      if (request.method === "POST" && new URL(targetUrl).pathname.endsWith("/customers")) {
+        return await customer(request, env, ctx, targetUrl);
       }
 
-      const newRequest = new Request(targetUrl, {
-        method: request.method === "OPTIONS" ? "OPTIONS" : "POST", 
-        headers: cleanHeaders,
-        body: finalBody || "{}"
-      });
+      let body = null;
+      if (request.method === "POST" || request.method === "PUT") {
+        body = await request.text();
+      }
+      return await fetch(upstreamRequest(request, targetUrl, body));
 
-      return await fetch(newRequest);
-      
     } catch (e) {
-      return new Response(JSON.stringify({ error: "Worker Proxy Error", details: e.message }), { 
+      return new Response(JSON.stringify({ error: "Worker Proxy Error", details: e.message }), {
         status: 500,
         headers: { "Content-Type": "application/json" }
       });
     }
   }
-};
\ No newline at end of file
+};
@@ -0,0 +1,244 @@
+// Runs the worker in Node against a local stand-in for Vagaro:  cd cloudflare && npm test
+import { after, before, beforeEach, describe, test } from "node:test";
+import assert from "node:assert/strict";
+import http from "node:http";
+
+import worker from "../cloudflare_worker.js";
+
+/** The Workers Cache API on a Map: GET keys only, expiring on the stored Cache-Control max-age. */
+class MemoryCache {
+  constructor() {
+    this.entries = new Map();
+  }
+
+  async match(request) {
+    const entry = this.entries.get(request.url);
+    if (!entry || entry.expiresAt <= Date.now()) return undefined;
+    return new Response(entry.body, { headers: entry.headers });
+  }
+
+  async put(request, response) {
+    const maxAge = Number(/max-age=(\d+)/.exec(response.headers.get("Cache-Control"))[1]);
+    this.entries.set(request.url, {
+      body: await response.text(),
+      headers: Object.fromEntries(response.headers),
+      expiresAt: Date.now() + maxAge * 1000,
+    });
+  }
+}
+
+const env = { VAGARO_CLIENT_ID: "client-id", VAGARO_CLIENT_SECRET: "client-secret", CUSTOMER_CACHE_TTL_SECONDS: "60" };
+const realNow = Date.now;
+let clock = 0;
+let upstream;
+let baseUrl;
+let calls;
+let tokenStatus;
+let scopeCounter = 0;
+
+function ctx() {
+  const pending = [];
+  return { waitUntil: (promise) => pending.push(promise), settle: () => Promise.all(pending) };
+}
+
+async function call(target, { body = {}, headers = {}, context = ctx() } = {}) {
+  const request = new Request("https://worker.example/", {
+    method: "POST",
+    headers: { "Content-Type": "application/json", "X-Target-Url": `${baseUrl}${target}`, ...headers },
+    body: JSON.stringify(body),
+  });
+  const response = await worker.fetch(request, env, context);
+  await context.settle();
+  return { status: response.status, cache: response.headers.get("X-Cache-Status"), body: await response.json() };
+}
+
+function token(scope, headers = {}) {
+  return call("/us03/api/v2/merchants/generate-access-token", { headers: { "X-Scope": scope, ...headers } });
+}
+
+function customer(customerId, headers = { accessToken: "t" }) {
+  return call("/us03/api/v2/customers", { body: { businessId: "B1", customerId }, headers });
+}
+
+before(async () => {
+  upstream = http.createServer((req, res) => {
+    let raw = "";
+    req.on("data", (chunk) => { raw += chunk; });
+    req.on("end", () => {
+      const body = JSON.parse(raw || "{}");
+      calls.push({ path: req.url, body, accessToken: req.headers.accesstoken });
+      let status = 200;
+      let payload;
+      if (req.url.endsWith("/generate-access-token")) {
+        status = tokenStatus;
+        payload = status === 200 ? { data: { access_token: `token-${calls.length}`, expires_in: 3600 } } : { error: "denied" };
+      } else if (body.customerId === "missing") {
+        status = 404;
+        payload = { error: "customer not found" };
+      } else {
+        payload = { data: { customerFirstName: "Jane", customerId: body.customerId } };
+      }
+      res.writeHead(status, { "Content-Type": "application/json" });
+      res.end(JSON.stringify(payload));
+    });
+  });
+  await new Promise((resolve) => upstream.listen(0, "127.0.0.1", resolve));
+  baseUrl = `http://127.0.0.1:${upstream.address().port}`;
+  Date.now = () => clock;
+});
+
+after(() => {
+  Date.now = realNow;
+  upstream.close();
+});
+
+beforeEach(() => {
+  globalThis.caches = { default: new MemoryCache() };
+  calls = [];
+  tokenStatus = 200;
+  clock = 1_000_000;
+});
+
+describe("access token", () => {
+  // Each test uses its own scope so tokens held by the module's isolate cache don't leak between tests.
+  const scope = () => `scope-${++scopeCounter}`;
+
+  test("is fetched with the worker's credentials and then served from the cache", async () => {
+    const s = scope();
+    const first = await token(s);
+    clock += 600_000;
+    const second = await token(s);
+
+    assert.equal(first.cache, "MISS");
+    assert.equal(second.cache, "HIT");
+    assert.equal(second.body.data.access_token, first.body.data.access_token);
+    assert.equal(second.body.data.expires_in, 3000);
+    assert.equal(calls.length, 1);
+    assert.deepEqual(calls[0].body, { clientId: "client-id", clientSecretKey: "client-secret", scope: s });
+  });
+
+  test("is refreshed once it is within the margin of expiring", async () => {
+    const s = scope();
+    await token(s);
+    clock += (3600 - 300) * 1000;
+    const refreshed = await token(s);
+
+    assert.equal(refreshed.cache, "MISS");
+    assert.equal(refreshed.body.data.expires_in, 3600);
+    assert.equal(calls.length, 2);
+  });
+
+  test("is stored in the edge cache and read from it by other isolates", async () => {
+    const s = scope();
+    await token(s);
+    const [entry] = globalThis.caches.default.entries.values();
+    assert.equal(entry.expiresAt, clock + (3600 - 300) * 1000);
+
+    // A token cached by another isolate twenty minutes ago.
+    const other = scope();
+    const key = new Request(`https://vagaro-proxy.cache/token?scope=${other}`);
+    globalThis.caches.default.entries.set(key.url, {
+      body: JSON.stringify({ data: { access_token: "from-edge", expires_in: 3600 } }),
+      headers: { "content-type": "application/json", "x-cached-at": String(clock - 1_200_000) },
+      expiresAt: clock + 1_000_000,
+    });
+    const hit = await token(other);
+
+    assert.equal(hit.cache, "HIT");
+    assert.deepEqual(hit.body.data, { access_token: "from-edge", expires_in: 2400 });
+    assert.equal(calls.length, 1);
+  });
+
+  test("no-cache forces a new token", async () => {
+    const s = scope();
+    await token(s);
+    const forced = await token(s, { "Cache-Control": "no-cache" });
+
+    assert.equal(forced.cache, "MISS");
+    assert.equal(calls.length, 2);
+  });
+
+  test("errors are passed through and never cached", async () => {
+    const s = scope();
+    tokenStatus = 401;
+    const denied = await token(s);
+    tokenStatus = 200;
+    const retried = await token(s);
+
+    assert.equal(denied.status, 401);
+    assert.equal(denied.cache, "MISS");
+    assert.equal(retried.status, 200);
+    assert.equal(calls.length, 2);
+  });
+});
+
+describe("customer lookup", () => {
+  test("is cached for the configured TTL", async () => {
+    const first = await customer("C1");
+    const second = await customer("C1");
+    clock += 61_000;
+    const expired = await customer("C1");
+
+    assert.deepEqual([first.cache, second.cache, expired.cache], ["MISS", "HIT", "MISS"]);
+    assert.equal(second.body.data.customerId, "C1");
+    assert.equal(calls.length, 2);
+    assert.equal(calls[0].accessToken, "t");
+  });
+
+  test("is keyed per customer", async () => {
+    await customer("C1");
+    const other = await customer("C2");
+
+    assert.equal(other.cache, "MISS");
+    assert.equal(other.body.data.customerId, "C2");
+  });
+
+  test("is keyed per access token", async () => {
+    await customer("C1", { accessToken: "t" });
+    const other = await customer("C1", { accessToken: "u" });
+    const again = await customer("C1", { accessToken: "t" });
+
+    assert.deepEqual([other.cache, again.cache], ["MISS", "HIT"]);
+    assert.deepEqual(calls.map((c) => c.accessToken), ["t", "u"]);
+  });
+
+  test("keeps the access token itself out of the cache key", async () => {
+    await customer("C1", { accessToken: "secret-token" });
+    const [key] = globalThis.caches.default.entries.keys();
+
+    assert.ok(!key.includes("secret-token"));
+    assert.match(key, /\/customers\/[0-9a-f]{64}\/B1\/C1$/);
+  });
+
+  test("misses are not cached", async () => {
+    const first = await customer("missing");
+    const second = await customer("missing");
+
+    assert.equal(first.status, 404);
+    assert.equal(second.cache, "MISS");
+    assert.equal(calls.length, 2);
+  });
+
+  test("requests without a token bypass the cache", async () => {
+    await customer("C1");
+    const anonymous = await customer("C1", {});
+
+    assert.equal(anonymous.cache, "BYPASS");
+    assert.equal(calls.length, 2);
+  });
+
+  test("is not cached unless a TTL is configured", async () => {
+    const context = ctx();
+    const request = () => new Request("https://worker.example/", {
+      method: "POST",
+      headers: { "X-Target-Url": `${baseUrl}/us03/api/v2/customers`, accessToken: "t" },
+      body: JSON.stringify({ businessId: "B1", customerId: "C1" }),
+    });
+    const noTtl = { ...env, CUSTOMER_CACHE_TTL_SECONDS: undefined };
+    await worker.fetch(request(), noTtl, context);
+    const response = await worker.fetch(request(), noTtl, context);
+
+    assert.equal(response.headers.get("X-Cache-Status"), "BYPASS");
+    assert.equal(calls.length, 2);
+  });
+});
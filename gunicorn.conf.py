@@ -0,0 +1,16 @@
+# gunicorn settings for Cloud Run. GUNICORN_WORKER_CLASS selects the worker:
+#   gthread (default): 1 process x GUNICORN_THREADS OS threads
+#   gevent: 1 process x up to GUNICORN_WORKER_CONNECTIONS greenlets; I/O-bound
+#           webhooks then stop queueing behind a fixed thread count.
+# The gevent worker patches the stdlib before importing app.py, which then calls
+# bstrong.compat.init_cooperative() to make gRPC yield to the gevent hub.
+# Logging is set up by app.py itself as it is imported (LOG_CONFIGURE_ON_IMPORT),
+# so the lines it logs while loading are formatted like every other.
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+workers = 1
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100"))
+timeout = 60
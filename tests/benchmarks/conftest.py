@@ -0,0 +1,120 @@
+import gc
+import json
+import os
+import time
+import pytest
+
+# Benchmarks are opt-in so the regular suite stays fast:
+#   BSTRONG_BENCHMARKS=1 python3 -m pytest tests/benchmarks -v
+BENCHMARKS_ENABLED = os.getenv("BSTRONG_BENCHMARKS") == "1"
+
+# Baselines are speed-ups over a reference implementation timed in the same run, so a busy or slower
+# machine moves both sides and the ratio holds. Refresh them after an intended change with
+#   BSTRONG_BENCHMARKS=1 BSTRONG_BENCH_UPDATE=1 python3 -m pytest tests/benchmarks
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+UPDATE_BASELINES = os.getenv("BSTRONG_BENCH_UPDATE") == "1"
+# A benchmark fails when its speed-up falls this fraction below its baseline. Over five runs on an
+# idle machine the worst speed-up came in 18% under its median (fix_phone_number, logging 16%).
+REGRESSION_THRESHOLD = float(os.getenv("BSTRONG_BENCH_THRESHOLD", "0.25"))
+
+_results: list[tuple[str, float, int]] = []
+_speedups: list[tuple[str, float]] = []
+_updated: dict[str, float] = {}
+
+
+def _load_baselines() -> dict[str, float]:
+    try:
+        with open(BASELINE_PATH) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+_baselines = _load_baselines()
+
+
+def pytest_collection_modifyitems(config, items):
+    if BENCHMARKS_ENABLED:
+        return
+    skip = pytest.mark.skip(reason="set BSTRONG_BENCHMARKS=1 to run benchmarks")
+    for item in items:
+        if "benchmarks" in item.nodeid:
+            item.add_marker(skip)
+
+
+def measure(name: str, func, iterations: int, repeat: int = 3) -> float:
+    """Run func() `iterations` times, `repeat` rounds, and return the best ops/sec."""
+    best = 0.0
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for _ in range(iterations):
+                func()
+            elapsed = time.perf_counter() - started
+            best = max(best, iterations / elapsed if elapsed else float("inf"))
+    finally:
+        gc.enable()
+    _results.append((name, best, iterations))
+    return best
+
+
+def measure_speedup(name: str, func, reference, iterations: int, repeat: int = 5, settle=None) -> float:
+    """
+    Best ops/sec of func() over the best of reference(), a plain implementation
+    of the same work. Rounds alternate between the two so both see the same
+    machine load; settle(), if given, runs untimed before each round.
+    """
+    best = {func: 0.0, reference: 0.0}
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            for candidate in (reference, func):
+                if settle:
+                    settle()
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    candidate()
+                elapsed = time.perf_counter() - started
+                best[candidate] = max(best[candidate], iterations / elapsed if elapsed else float("inf"))
+    finally:
+        gc.enable()
+    _results.append((f"{name} (reference)", best[reference], iterations))
+    _results.append((name, best[func], iterations))
+    return best[func] / best[reference]
+
+
+def check_baseline(name: str, speedup: float) -> None:
+    """Fail if `speedup` regressed past REGRESSION_THRESHOLD, or record it when updating baselines."""
+    _speedups.append((name, speedup))
+    if UPDATE_BASELINES:
+        _updated[name] = float(f"{speedup:.3g}")
+        return
+    baseline = _baselines.get(name)
+    if baseline and speedup < baseline * (1 - REGRESSION_THRESHOLD):
+        pytest.fail(f"{name}: {speedup:.2f}x its reference is {1 - speedup / baseline:.0%} below the {baseline:.2f}x "
+                    f"baseline (threshold {REGRESSION_THRESHOLD:.0%})")
+
+
+def pytest_sessionfinish(session):
+    if UPDATE_BASELINES and _updated:
+        baselines = {**_load_baselines(), **_updated}
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=2)
+            f.write("\n")
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not _results:
+        return
+    terminalreporter.section("benchmark throughput")
+    for name, ops, iterations in _results:
+        terminalreporter.write_line(f"{name:<62} {ops:>14,.0f} ops/s  ({iterations} iterations)")
+    for name, speedup in _speedups:
+        baseline = _baselines.get(name)
+        change = f"  {speedup / baseline - 1:+.0%} vs baseline" if baseline else ""
+        terminalreporter.write_line(f"{name:<62} {speedup:>13.2f}x reference{change}")
+    if _updated:
+        terminalreporter.write_line(f"updated {len(_updated)} baselines in {BASELINE_PATH}")
@@ -0,0 +1,445 @@
+"""
+Load-test harness for the webhook routes.
+
+Serves app:app the way Cloud Run runs it (one process, a fixed pool of request
+threads) against local stand-ins for RemoteLock, the Vagaro worker, Twilio and
+Firestore, drives /webhook-transaction, /webhook-form and /webhook-sms at a
+target rate, and reports latency percentiles, error rates and saturation.
+
+    python -m tests.benchmarks.loadtest --rate 20 --duration 30 --out load.json
+    python -m tests.benchmarks.loadtest --rate 20 --duration 30 --compare load.json
+
+Latency is measured from each request's scheduled send time, so time spent
+queued behind a saturated server is included.
+"""
+import argparse, importlib, json, math, os, random, subprocess, sys, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import dataclass, field, asdict
+from unittest.mock import patch
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+import requests
+from twilio.request_validator import RequestValidator
+
+from tests.fakes import InMemoryDatabase
+from tests.stubs import RemoteLockStub, VagaroWorkerStub, TwilioStub
+
+ROUTES = {"transaction": "/webhook-transaction", "form": "/webhook-form", "sms": "/webhook-sms"}
+FORM_ID = "67842fd8f276412c07c20490"
+FORWARDED_HOST = "loadtest.local"
+ITEMS = ["1 month gym membership", "monthly autopay membership", "day pass", "1 week pass", "weekend warrior"]
+
+LOCAL_CONFIG = {
+    "OWNER_PHONE_NUMBER_1": "+10000000001",
+    "OWNER_PHONE_NUMBER_2": "+10000000002",
+    "DEVELOPER_PHONE_NUMBER": "+10000000003",
+    "MISC_PERSON_CUSTID": "MISC_LOAD_ID",
+    "TRANSACTION_TOKEN": "load-transaction-token",
+    "FORUM_TOKEN": "load-form-token",
+    "LOCK_ID": "load-lock-id",
+    "REMOTELOCK_CLIENT_ID": "load-rl-client",
+    "REMOTELOCK_CLIENT_SECRET": "load-rl-secret",
+    "TWILIO_ACCOUNT_SID": "AC00000000000000000000000000000000",
+    "TWILIO_AUTH_TOKEN": "load-twilio-token",
+    "TWILIO_PHONE_NUMBER": "+15005550006",
+}
+
+
+@dataclass
+class LoadOptions:
+    rate: float = 10.0
+    duration: float = 10.0
+    threads: int = 8
+    mix: dict[str, float] = field(default_factory=lambda: {"transaction": 0.5, "form": 0.35, "sms": 0.15})
+    firestore_latency: float = 0.01
+    remotelock_latency: float = 0.1
+    vagaro_latency: float = 0.15
+    twilio_latency: float = 0.1
+    error_rate: float = 0.0
+    duplicate_rate: float = 0.05
+    max_in_flight: int = 256
+    seed: int = 7
+
+
+@dataclass
+class Sample:
+    kind: str
+    status: int
+    latency_ms: float
+    dispatch_lag_ms: float
+
+
+class BoundedWSGIServer(WSGIServer):
+    """wsgiref server that hands connections to a fixed thread pool, like gunicorn's gthread worker."""
+
+    request_queue_size = 2048
+
+    def __init__(self, address, handler, threads: int):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="wsgi")
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+class Workload:
+    """Generates a realistic mix of webhook bodies; transactions reuse customers from earlier forms."""
+
+    def __init__(self, options: LoadOptions, vagaro: VagaroWorkerStub):
+        self.rng = random.Random(options.seed)
+        self.options = options
+        self.vagaro = vagaro
+        self.kinds = list(options.mix)
+        self.weights = [options.mix[k] for k in self.kinds]
+        self.validator = RequestValidator(LOCAL_CONFIG["TWILIO_AUTH_TOKEN"])
+        self.pending_forms: list[tuple[str, str]] = []
+        self.ticket_phones: list[str] = []
+        self.payment_ids: list[str] = []
+        self._seq = 0
+
+    def _customer(self) -> tuple[str, str]:
+        self._seq += 1
+        return f"LOAD{self._seq:07d}", f"617{self.rng.randint(2000000, 9999999)}"
+
+    def next(self) -> tuple[str, dict]:
+        kind = self.rng.choices(self.kinds, self.weights)[0]
+        return kind, getattr(self, kind)()
+
+    def form(self) -> dict:
+        customer_id, phone = self._customer()
+        self.pending_forms.append((customer_id, phone))
+        answers = [("First Name", "Load"), ("Last Name", customer_id), ("CELL #", phone)]
+        return {
+            "json": {"payload": {"formId": FORM_ID, "customerId": customer_id, "questionsAndAnswers": [
+                {"question": q, "answer": [f"<p>{a}</p>"]} for q, a in answers]}},
+            "headers": {"X-Vagaro-Signature": LOCAL_CONFIG["FORUM_TOKEN"]},
+        }
+
+    def transaction(self) -> dict:
+        if self.payment_ids and self.rng.random() < self.options.duplicate_rate:
+            payment_id = self.rng.choice(self.payment_ids)
+            customer_id, phone = "LOADDUP", ""
+        else:
+            if self.pending_forms:
+                customer_id, phone = self.pending_forms.pop(0)
+            else:
+                customer_id, phone = self._customer()
+                self.vagaro.customers[customer_id] = {
+                    "customerFirstName": "Load", "customerLastName": customer_id, "mobilePhone": phone}
+            payment_id = f"PAY-{customer_id}"
+            self.payment_ids.append(payment_id)
+            self.ticket_phones.append(f"+1{phone}")
+        return {
+            "json": {"payload": {"itemSold": self.rng.choice(ITEMS), "customerId": customer_id,
+                                 "purchaseType": "Membership", "userPaymentId": payment_id}},
+            "headers": {"X-Vagaro-Signature": LOCAL_CONFIG["TRANSACTION_TOKEN"]},
+        }
+
+    def sms(self) -> dict:
+        phone = self.rng.choice(self.ticket_phones) if self.ticket_phones else "+16170000000"
+        params = {"From": phone, "Body": f"{self.rng.randint(1000, 99999)}#"}
+        # The app validates against its full_path ("...?"); the validator normalizes that away.
+        url = f"https://{FORWARDED_HOST}{ROUTES['sms']}"
+        return {
+            "data": params,
+            "headers": {"X-Forwarded-Host": FORWARDED_HOST,
+                        "X-Twilio-Signature": self.validator.compute_signature(url, params)},
+        }
+
+
+def percentile(values: list[float], q: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)], 2)
+
+
+def _latency_summary(samples: list[Sample], elapsed: float) -> dict:
+    latencies = [s.latency_ms for s in samples]
+    errors = sum(1 for s in samples if s.status == 0 or s.status >= 500)
+    statuses: dict[str, int] = {}
+    for s in samples:
+        statuses[str(s.status)] = statuses.get(str(s.status), 0) + 1
+    return {
+        "count": len(samples),
+        "statuses": statuses,
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": round(max(latencies), 2) if latencies else None,
+    }
+
+
+def summarize(samples: list[Sample], options: LoadOptions, elapsed: float, busy: list[float], stubs: dict) -> dict:
+    """Build the JSON report; `busy` (sampled in-flight counts) is empty when the server runs out of process."""
+    overall = _latency_summary(samples, elapsed)
+    utilization = round(sum(busy) / len(busy) / options.threads, 3) if busy else None
+    max_lag = max((s.dispatch_lag_ms for s in samples), default=0.0)
+    # Latency climbing from the first to the last fifth of the run means a queue is building.
+    # Each sample is scaled by its route's median so the request mix does not skew the ratio.
+    medians = {kind: percentile([s.latency_ms for s in samples if s.kind == kind], 50) for kind in options.mix}
+    relative = [s.latency_ms / medians[s.kind] if medians.get(s.kind) else 1.0 for s in samples]
+    fifth = max(1, len(relative) // 5)
+    head = percentile(relative[:fifth], 50) or 0.0
+    tail = percentile(relative[-fifth:], 50) or 0.0
+    growth = round(tail / head, 2) if head else 1.0
+    return {
+        "options": asdict(options),
+        "revision": _git_revision(),
+        "elapsed_seconds": round(elapsed, 2),
+        "target_rps": options.rate,
+        "achieved_rps": overall["rps"],
+        "overall": overall,
+        "routes": {kind: _latency_summary([s for s in samples if s.kind == kind], elapsed) for kind in options.mix},
+        "saturation": {
+            "worker_utilization": utilization,
+            "peak_busy_workers": max(busy, default=None),
+            "max_dispatch_lag_ms": round(max_lag, 2),
+            "latency_growth": growth,
+            "saturated": (utilization or 0.0) > 0.9 or growth > 2.0,
+        },
+        "vendor_requests": stubs,
+    }
+
+
+def _git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class VendorStubs:
+    """RemoteLock, Vagaro worker and Twilio stand-ins with the configured latency and error rate."""
+
+    def __init__(self, options: LoadOptions):
+        self.remotelock = RemoteLockStub()
+        self.vagaro = VagaroWorkerStub()
+        self.twilio = TwilioStub()
+        self.remotelock.latency = options.remotelock_latency
+        self.vagaro.latency = options.vagaro_latency
+        self.twilio.latency = options.twilio_latency
+        for stub in self.all:
+            stub.error_rate = options.error_rate
+
+    @property
+    def all(self) -> tuple:
+        return self.remotelock, self.vagaro, self.twilio
+
+    def __enter__(self) -> "VendorStubs":
+        for stub in self.all:
+            stub.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        for stub in self.all:
+            stub.__exit__(*exc)
+
+    def env(self) -> dict[str, str]:
+        """The URL overrides that point a separately started app at these stubs."""
+        return {"REMOTELOCK_BASE_URL": self.remotelock.url, "REMOTELOCK_TOKEN_URL": f"{self.remotelock.url}/oauth/token",
+                "VAGARO_WORKER_URL": self.vagaro.url, "TWILIO_API_BASE_URL": self.twilio.url}
+
+    def counts(self) -> dict:
+        return {"remotelock": len(self.remotelock.requests), "vagaro": len(self.vagaro.requests),
+                "twilio": len(self.twilio.requests)}
+
+
+def wire_app(stack: ExitStack, urls: dict[str, str], db: InMemoryDatabase):
+    """Import app (without real Google clients) and point its singletons at local stand-ins."""
+    from bstrong.config import Config
+    stack.enter_context(patch.dict(Config._secrets, LOCAL_CONFIG))
+    with patch("google.cloud.firestore.Client"), patch("google.cloud.secretmanager.SecretManagerServiceClient"):
+        app = importlib.import_module("app")
+    from bstrong import api_clients, utils
+
+    stack.enter_context(patch.object(api_clients, "REMOTELOCK_BASE_URL", urls["REMOTELOCK_BASE_URL"]))
+    stack.enter_context(patch.object(api_clients, "REMOTELOCK_TOKEN_URL", urls["REMOTELOCK_TOKEN_URL"]))
+    stack.enter_context(patch.object(api_clients, "VAGARO_WORKER_URL", urls["VAGARO_WORKER_URL"]))
+    stack.enter_context(patch.object(utils, "TWILIO_API_BASE_URL", urls["TWILIO_API_BASE_URL"]))
+    for name, value in (("Owner1", LOCAL_CONFIG["OWNER_PHONE_NUMBER_1"]), ("Owner2", LOCAL_CONFIG["OWNER_PHONE_NUMBER_2"]),
+                        ("miscCustomerID", LOCAL_CONFIG["MISC_PERSON_CUSTID"]), ("dataBase", db),
+                        ("rl_client", api_clients.RemoteLockClient(pin_index=app.pin_index)),
+                        ("vagaro_client", api_clients.VagaroClient()), ("guest_pool", None)):
+        stack.enter_context(patch.object(app, name, value))
+    # A ready ticket filter, as in production, built from the in-memory tickets.
+    from bstrong.ticket_filter import TicketFilter
+    ticket_filter = TicketFilter(app.ticket_filter.capacity, app.ticket_filter.fp_rate)
+    ticket_filter.rebuild(db)
+    stack.enter_context(patch.object(app, "ticket_filter", ticket_filter))
+    stack.enter_context(patch.object(app.dead_letters, "db", db))
+    return app
+
+
+def drive(url: str, workload: Workload, options: LoadOptions, sample_busy=None) -> tuple[list[Sample], float, list[float]]:
+    """Offer options.rate requests/sec for options.duration seconds, open loop; optionally sample busy workers."""
+    sessions = threading.local()
+    busy: list[float] = []
+    done = threading.Event()
+
+    def sampler():
+        while not done.wait(0.05):
+            busy.append(sample_busy())
+
+    def send(kind: str, kwargs: dict, scheduled: float) -> Sample:
+        session = getattr(sessions, "session", None) or requests.Session()
+        sessions.session = session
+        sent = time.perf_counter()
+        try:
+            status = session.post(f"{url}{ROUTES[kind]}", timeout=60, **kwargs).status_code
+        except requests.RequestException:
+            status = 0
+        finished = time.perf_counter()
+        return Sample(kind, status, (finished - scheduled) * 1000, (sent - scheduled) * 1000)
+
+    total = max(1, int(options.rate * options.duration))
+    if sample_busy:
+        threading.Thread(target=sampler, daemon=True).start()
+    started = time.perf_counter()
+    futures = []
+    with ThreadPoolExecutor(max_workers=options.max_in_flight, thread_name_prefix="load") as pool:
+        for i in range(total):
+            scheduled = started + i / options.rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            kind, kwargs = workload.next()
+            futures.append(pool.submit(send, kind, kwargs, scheduled))
+        samples = [f.result() for f in futures]
+    done.set()
+    return samples, time.perf_counter() - started, busy
+
+
+class LocalStack:
+    """Context manager wiring the app's singletons to local stand-ins and serving it on a bounded pool."""
+
+    def __init__(self, options: LoadOptions):
+        self.options = options
+        self.vendors = VendorStubs(options)
+        self.db = InMemoryDatabase(latency=options.firestore_latency)
+
+    def __enter__(self) -> "LocalStack":
+        self._stack = ExitStack()
+        self._stack.enter_context(self.vendors)
+        self.app_module = wire_app(self._stack, self.vendors.env(), self.db)
+        self.server = BoundedWSGIServer(("127.0.0.1", 0), _QuietHandler, self.options.threads)
+        self.server.set_app(self.app_module.app)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+        self._stack.callback(self.server.server_close)
+        self._stack.callback(self.server.shutdown)
+        return self
+
+    def __exit__(self, *exc):
+        self._stack.close()
+
+    def run(self) -> dict:
+        workload = Workload(self.options, self.vendors.vagaro)
+        samples, elapsed, busy = drive(self.url, workload, self.options, self.app_module.metrics.IN_FLIGHT.total)
+        return summarize(samples, self.options, elapsed, busy, self.vendors.counts())
+
+
+def run_load(options: LoadOptions) -> dict:
+    with LocalStack(options) as stack:
+        return stack.run()
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    lines = []
+    for kind in ("overall", *current["routes"]):
+        old = baseline["overall"] if kind == "overall" else baseline["routes"].get(kind)
+        new = current["overall"] if kind == "overall" else current["routes"][kind]
+        if not old:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "error_rate"):
+            if old[metric] is None or new[metric] is None:
+                continue
+            delta = new[metric] - old[metric]
+            pct = f" ({delta / old[metric]:+.0%})" if old[metric] else ""
+            lines.append(f"{kind:<12} {metric:<10} {old[metric]:>10} -> {new[metric]:>10}{pct}")
+    return lines
+
+
+def _parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        if kind not in ROUTES:
+            raise argparse.ArgumentTypeError(f"unknown route {kind!r}; choose from {', '.join(ROUTES)}")
+        mix[kind] = float(weight)
+    return mix
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Drive the webhooks against local vendor stand-ins.")
+    parser.add_argument("--rate", type=float, default=10.0, help="Requests per second to offer")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to run")
+    parser.add_argument("--threads", type=int, default=8, help="Request threads in the app server")
+    parser.add_argument("--mix", type=_parse_mix, default=None, help="e.g. transaction=0.5,form=0.35,sms=0.15")
+    parser.add_argument("--firestore-latency", type=float, default=0.01)
+    parser.add_argument("--remotelock-latency", type=float, default=0.1)
+    parser.add_argument("--vagaro-latency", type=float, default=0.15)
+    parser.add_argument("--twilio-latency", type=float, default=0.1)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of vendor calls answered with 503")
+    parser.add_argument("--no-rate-limits", action="store_true", help="Disable the vendor token buckets")
+    parser.add_argument("--log-level", default="WARNING", help="App log level during the run")
+    parser.add_argument("--out", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Baseline JSON report to diff against")
+    args = parser.parse_args(argv)
+
+    # Read by bstrong.config, so set before anything imports it.
+    os.environ.setdefault("LOG_LEVEL", args.log_level.upper())
+    os.environ.setdefault("LOG_FORMAT", "text")
+    from bstrong.logs import configure_logging
+    configure_logging()
+    # Background refreshers and trace files only add noise to a load run.
+    os.environ.setdefault("CATALOG_REFRESH_SECONDS", "0")
+    os.environ.setdefault("PIN_INDEX_REFRESH_SECONDS", "0")
+    os.environ.setdefault("TICKET_FILTER_REFRESH_SECONDS", "0")
+    os.environ.setdefault("DEAD_LETTER_REPLAY_SECONDS", "0")
+    os.environ.setdefault("TRACE_EXPORTER", "none")
+    if args.no_rate_limits:
+        for vendor in ("REMOTELOCK", "VAGARO", "TWILIO"):
+            os.environ[f"RATE_LIMIT_{vendor}"] = "0"
+
+    options = LoadOptions(rate=args.rate, duration=args.duration, threads=args.threads,
+                          firestore_latency=args.firestore_latency, remotelock_latency=args.remotelock_latency,
+                          vagaro_latency=args.vagaro_latency, twilio_latency=args.twilio_latency,
+                          error_rate=args.error_rate)
+    if args.mix:
+        options.mix = args.mix
+
+    report = run_load(options)
+    print(json.dumps(report, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print("\n".join(compare(json.load(f), report)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
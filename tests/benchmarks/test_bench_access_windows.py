@@ -0,0 +1,38 @@
+import pytz
+from datetime import datetime, time, timedelta
+
+from bstrong.config import MEMBERSHIP_DURATIONS
+from bstrong.services import AccessWindowPlanner
+from tests.benchmarks.conftest import measure
+
+EST = pytz.timezone('US/Eastern')
+MEMBERSHIPS = ['day pass', '1 month gym membership', '1 week pass', 'weekend warrior', '3 week pass']
+NOW = pytz.utc.localize(datetime(2026, 4, 29, 14, 0))
+
+
+def _legacy_window(membership_type):
+    """The original per-call computation from create_door_code."""
+    est = pytz.timezone("US/Eastern")
+    current_time_est = NOW.astimezone(est)
+    start_day = current_time_est.date() if current_time_est.hour < 22 else current_time_est.date() + timedelta(days=1)
+    start_time_est = est.localize(datetime.combine(start_day, time(4, 0)))
+    duration = MEMBERSHIP_DURATIONS.get(membership_type.lower(), timedelta(days=0))
+    end_time_est = est.localize(datetime.combine((start_time_est + duration).date(), time(22, 0)))
+    return start_time_est.replace(tzinfo=pytz.UTC), end_time_est.replace(tzinfo=pytz.UTC)
+
+
+class TestAccessWindowThroughput:
+    def test_legacy_per_call(self):
+        ops = measure("access window: legacy pytz per call", lambda: [_legacy_window(m) for m in MEMBERSHIPS], 2000)
+        assert ops > 0
+
+    def test_planner_per_call(self):
+        planner = AccessWindowPlanner()
+        ops = measure("access window: planner.plan per call", lambda: [planner.plan(m, now=NOW) for m in MEMBERSHIPS], 2000)
+        assert ops > 0
+
+    def test_planner_batch(self):
+        planner = AccessWindowPlanner()
+        batch = MEMBERSHIPS * 200
+        ops = measure("access window: planner.plan_many x1000", lambda: planner.plan_many(batch, now=NOW), 50)
+        assert ops > 0
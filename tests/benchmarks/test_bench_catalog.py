@@ -0,0 +1,40 @@
+import random
+
+from bstrong.catalog import MembershipCatalog
+from bstrong.config import MEMBERSHIP_DURATIONS
+from tests.benchmarks.conftest import measure
+
+CORPUS = [
+    ('Membership', '1 month gym membership'), ('Membership', 'monthly autopay membership'),
+    ('Package', 'day pass'), ('Class', 'day pass (not a class) - 4am-10pm for one individual, for one calendar day.'),
+    ('Membership', '1 week pass'), ('Membership', 'weekend warrior'), ('Service', 'personal training 60 min'),
+    ('Class', 'spin class'), ('Product', 'protein shake'), ('Membership', 'best rate!!! one year (pif)'),
+]
+EVENTS = [random.Random(7).choice(CORPUS) for _ in range(1000)]
+
+
+def _legacy(purchase_type, item):
+    item_sold = item.lower()
+    relevant = (purchase_type == "Membership"
+                or (purchase_type == "Class" and "day pass" in item_sold and "4am-10pm" in item_sold)
+                or (purchase_type == "Package" and item_sold == "day pass"))
+    autopay = "monthly" in item_sold and "autopay" in item_sold
+    day_pass = "day pass" in item_sold
+    month = "1 month" in item_sold
+    return relevant, autopay, day_pass, month, MEMBERSHIP_DURATIONS.get(item_sold)
+
+
+def _compiled(catalog, purchase_type, item):
+    product = catalog.classify(item)
+    return purchase_type in product.purchase_types, product.autopay, product.kind, product.duration
+
+
+class TestCatalogClassificationThroughput:
+    def test_legacy_substring_scans(self):
+        ops = measure("classify x1000: legacy substring scans", lambda: [_legacy(p, i) for p, i in EVENTS], 200)
+        assert ops > 0
+
+    def test_compiled_catalog(self):
+        catalog = MembershipCatalog()
+        ops = measure("classify x1000: compiled catalog", lambda: [_compiled(catalog, p, i) for p, i in EVENTS], 200)
+        assert ops > 0
@@ -0,0 +1,153 @@
+"""
+Per-request pure functions, each timed against a plain reference
+implementation that returns the same results without the caches, compiled
+indexes and precompiled patterns; the speed-up is checked against
+tests/benchmarks/baselines.json. Each test first asserts that both sides
+agree. Everything here runs offline: no Secret Manager, Firestore or Twilio.
+"""
+import calendar
+import hashlib
+import logging
+import random
+import re
+from datetime import datetime, timedelta
+
+import phonenumbers
+import pytz
+
+from bstrong.catalog import DAY_PASS, MembershipCatalog, compile_product, normalize_item
+from bstrong.config import MEMBERSHIP_DURATIONS
+from bstrong.services import access_planner, door_code_sms_body, get_next_month_anniversary
+from bstrong.ticket_filter import TicketFilter
+from bstrong.utils import fix_phone_number, parse_form_answers
+from tests.benchmarks.conftest import check_baseline, measure_speedup
+
+rng = random.Random(33)
+EST = pytz.timezone('US/Eastern')
+
+PHONES = [fmt.format(a=rng.randint(201, 989), b=rng.randint(200, 999), c=rng.randint(0, 9999))
+          for fmt in ["({a}) {b}-{c:04d}", "{a}.{b}.{c:04d}", "{a}{b}{c:04d}", "+1 {a} {b} {c:04d}",
+                      "1-{a}-{b}-{c:04d}", "+44 20 7946 {c:04d}", "{a}-{b}", "not a number"]
+          for _ in range(25)]
+
+FORMS = [[
+    {'question': 'First Name', 'answer': [f'<p>Member{i}</p>']},
+    {'question': 'Last Name', 'answer': [f'<span style="x">Last{i}</span> ']},
+    {'question': 'CELL # (we text your door code here)', 'answer': [f'<b>{PHONES[i % len(PHONES)]}</b>']},
+    {'question': 'Date of Birth', 'answer': ['01/02/1990']},
+    {'question': 'Emergency Contact', 'answer': ['<p>Someone</p>']},
+    {'question': 'How did you hear about us?', 'answer': []},
+    {'question': 'Liability waiver', 'answer': ['<p>I agree to the terms &amp; conditions</p>']},
+] for i in range(200)]
+
+ITEMS = ['1 month gym membership', 'Monthly Autopay Membership', 'day pass', '1 week pass', 'weekend warrior',
+         'Day Pass (not a class) - 4am-10pm for one individual, for one calendar day.', 'personal training 60 min',
+         'best rate!!! one year (pif)', '2 week pass', 'protein shake']
+EVENTS = [rng.choice(ITEMS) for _ in range(1000)]
+
+NOW = datetime(2026, 1, 31, 15, 0, tzinfo=pytz.utc)
+EXPIRIES = [EST.localize(datetime(2026, 1, 1, 22, 5) + timedelta(days=rng.randint(0, 365))) for _ in range(200)]
+WINDOWS = [access_planner.plan(item, now=NOW) for item in ITEMS[:6]] * 50
+PINS = [f"{rng.randint(0, 99999):05d}" for _ in range(len(WINDOWS))]
+
+
+# ---- Reference implementations: the same results computed the plain way, per call --------
+
+_REFERENCE_DURATIONS = {normalize_item(name): duration for name, duration in MEMBERSHIP_DURATIONS.items()}
+_SMS_TAIL = ("Access hours are 4am-10pm. Busiest times are 8am-11am, so if you arrive at 9, plan for it to be busy. "
+             "Please don't share your code with others or let anyone else in. "
+             "Questions? Text Craig at 774-255-0465 or Heather at 508-685-8888. Enjoy your workout!")
+
+def _reference_anniversary(expiry):
+    local = expiry.astimezone(EST)
+    year, month = local.year + local.month // 12, local.month % 12 + 1
+    day = min(local.day, calendar.monthrange(year, month)[1])
+    return datetime(year, month, day, 22, tzinfo=pytz.utc), EST.localize(datetime(year, month, day, 22, 5))
+
+
+def _reference_phone(raw):
+    clean = raw.strip()
+    try:
+        parsed = phonenumbers.parse(clean, "US")
+        if not phonenumbers.is_valid_number(parsed):
+            parsed = phonenumbers.parse(clean if clean.startswith("+") else "+" + clean, None)
+        if phonenumbers.is_valid_number(parsed):
+            return {'valid': True, 'number': phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)}
+    except phonenumbers.NumberParseException as e:
+        logging.getLogger('bstrong.utils').warning("Phone parsing error for '%s': %s", raw, e)
+    return {'valid': False, 'number': raw}
+
+
+def _reference_form(questions):
+    answers = {"first_name": None, "last_name": None, "phone_number": None}
+    for q in questions:
+        for label, key in (("First Name", "first_name"), ("Last Name", "last_name"), ("CELL #", "phone_number")):
+            if label in q.get("question", "") and q.get("answer"):
+                answers[key] = re.sub(r'<[^>]+>', '', q["answer"][0]).strip()
+                break
+    return answers
+
+
+def _reference_classify(item):
+    key = normalize_item(item)
+    return compile_product(key, _REFERENCE_DURATIONS.get(key))
+
+
+def _reference_sms_body(pin, window):
+    if window.kind == DAY_PASS:
+        return f"Your B-STRONG door code is {pin}#. Be sure to hit the # after the numbers. {_SMS_TAIL}"
+    expires = window.end_utc.astimezone(EST).strftime('%Y-%m-%d')
+    return (f"Your B-STRONG door code is {pin}#. Be sure to hit the # after the numbers. If you'd like to change your "
+            f"door code please respond to this text with the 4 or 5 digits to set it. Your code will expire {expires} "
+            f"at 10:00 pm. {_SMS_TAIL}")
+
+
+def _reference_bloom(phones, size, hashes):
+    """A textbook Bloom filter of the same size: one bit per slot, one SHA-256 per probe."""
+    def probes(phone):
+        return [int.from_bytes(hashlib.sha256(f"{i}:{phone}".encode()).digest()[:8], "little") % size for i in range(hashes)]
+    bits = bytearray(size)
+    for phone in phones:
+        for pos in probes(phone):
+            bits[pos] = 1
+    return lambda phone: all(bits[pos] for pos in probes(phone))
+
+
+def check_hot_path(name, func, reference, iterations):
+    assert func() == reference(), f"{name}: the reference does not compute the same results"
+    check_baseline(name, measure_speedup(name, func, reference, iterations))
+
+
+class TestHotPathBaselines:
+    def test_get_next_month_anniversary(self):
+        check_hot_path("hot path: get_next_month_anniversary x200", lambda: [get_next_month_anniversary(e) for e in EXPIRIES],
+                       lambda: [_reference_anniversary(e) for e in EXPIRIES], 50)
+
+    def test_fix_phone_number(self):
+        check_hot_path("hot path: fix_phone_number x200", lambda: [fix_phone_number(p) for p in PHONES],
+                       lambda: [_reference_phone(p) for p in PHONES], 20)
+
+    def test_parse_form_answers(self):
+        check_hot_path("hot path: parse_form_answers x200", lambda: [parse_form_answers(f) for f in FORMS],
+                       lambda: [_reference_form(f) for f in FORMS], 150)
+
+    def test_membership_classification(self):
+        catalog = MembershipCatalog()
+        check_hot_path("hot path: catalog.classify x1000", lambda: [catalog.classify(i) for i in EVENTS],
+                       lambda: [_reference_classify(i) for i in EVENTS], 1000)
+
+    def test_door_code_sms_body(self):
+        check_hot_path("hot path: door_code_sms_body x300", lambda: [door_code_sms_body(p, w) for p, w in zip(PINS, WINDOWS)],
+                       lambda: [_reference_sms_body(p, w) for p, w in zip(PINS, WINDOWS)], 100)
+
+    def test_ticket_filter_lookup(self):
+        tickets = TicketFilter(capacity=20000, fp_rate=0.01)
+        phones = {f"+1508555{i:04d}" for i in range(5000)}
+        for phone in phones:
+            tickets.add(phone)
+        tickets.built_at = 0.0
+        texts = [f"+1{rng.randint(2000000000, 9899999999)}" for _ in range(1000)]
+        reference = _reference_bloom(phones, len(tickets._counters), tickets._hashes)
+        name = "hot path: ticket_filter.might_contain x1000"
+        check_baseline(name, measure_speedup(name, lambda: [tickets.might_contain(p) for p in texts],
+                                             lambda: [reference(p) for p in texts], 200))
@@ -0,0 +1,27 @@
+import json
+import os
+
+from tests.benchmarks.loadtest import LoadOptions, run_load
+
+# Short runs so the suite stays quick; use `python -m tests.benchmarks.loadtest` for real numbers.
+FAST_VENDORS = dict(firestore_latency=0.002, remotelock_latency=0.02, vagaro_latency=0.02, twilio_latency=0.02)
+
+
+class TestWebhookLoad:
+    def test_steady_load_report(self, tmp_path):
+        report = run_load(LoadOptions(rate=20, duration=2, **FAST_VENDORS))
+
+        assert report["overall"]["count"] == 40
+        assert report["overall"]["error_rate"] == 0
+        assert set(report["routes"]) == {"transaction", "form", "sms"}
+        assert report["routes"]["transaction"]["p99_ms"] >= report["routes"]["transaction"]["p50_ms"]
+        assert report["vendor_requests"]["remotelock"] > 0
+        assert not report["saturation"]["saturated"]
+
+        path = os.getenv("BSTRONG_LOAD_REPORT") or tmp_path / "load.json"
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    def test_injected_vendor_errors_surface_as_5xx(self):
+        report = run_load(LoadOptions(rate=20, duration=1, error_rate=0.5, mix={"transaction": 1.0}, **FAST_VENDORS))
+        assert report["routes"]["transaction"]["errors"] > 0
@@ -0,0 +1,118 @@
+"""
+Per-request logging overhead on the request thread, before and after the
+queue handler: the old synchronous basicConfig-style handler formatting
+f-strings inline, against LazyQueueHandler with a background JSON writer.
+The slow-sink cases stand in for a stderr pipe that is momentarily full.
+"""
+import logging
+import os
+import queue
+import tempfile
+import time
+from logging.handlers import QueueListener
+
+import pytest
+
+from bstrong.logs import JsonFormatter, LazyQueueHandler, SamplingFilter, TEXT_FORMAT
+from bstrong.tracing import TraceIdFilter, start_trace
+from tests.benchmarks.conftest import check_baseline, measure, measure_speedup
+
+# The INFO lines one successful /webhook-transaction writes (Firestore path, new door code).
+REQUEST_LINES = [
+    ("Received VALID transaction %s: '%s' for customer %s", ('PAY123', '1 month gym membership', 'CUST123')),
+    ("Found pending form data for customer %s in Firestore.", ('CUST123',)),
+    ("Valid phone number '%s' found in Firestore for customer %s.", ('+15085551234', 'CUST123')),
+    ("Processing '%s' for %s %s (%s), transaction %s", ('1 month gym membership', 'John', 'Doe', '+15085551234', 'PAY123')),
+    ("RemoteLock time window for %s %s: start=%s end=%s (membership='%s')",
+     ('John', 'Doe', '2026-01-31T20:00:00', '2026-03-01T03:00:00', '1 month gym membership')),
+    ("RemoteLock access_person created for %s %s: guest_id=%s, pin=%s", ('John', 'Doe', 'guest-123', '48213')),
+    ("SMS sent to %s via %s", ('+15085551234', '+18005550000')),
+    ("PIN change ticket created for %s %s (%s), RemoteLock guest %s", ('John', 'Doe', '+15085551234', 'guest-123')),
+]
+
+
+class SlowSink(logging.Handler):
+    """A sink whose writes take `delay` seconds, like a stderr pipe the collector is behind on."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+
+    def emit(self, record):
+        self.format(record)
+        time.sleep(self.delay)
+
+
+@pytest.fixture
+def sink_file():
+    fd, path = tempfile.mkstemp(suffix='.log')
+    os.close(fd)
+    with open(path, 'a') as stream:
+        yield stream
+    os.remove(path)
+
+
+def isolated_logger(name, handler):
+    logger = logging.getLogger(f'bench.logging.{name}')
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def synchronous(name, output):
+    """The old setup: basicConfig's handler, trace filter, formatted and written inline."""
+    output.setFormatter(logging.Formatter(TEXT_FORMAT))
+    output.addFilter(TraceIdFilter())
+    logger = isolated_logger(name, output)
+
+    def one_request():
+        for fmt, args in REQUEST_LINES:
+            logger.info(fmt % args)  # f-string: built before the call
+    return one_request, lambda: None
+
+
+def queued(name, output, records=None):
+    output.setFormatter(JsonFormatter())
+    handler = LazyQueueHandler(records or queue.Queue())
+    handler.addFilter(TraceIdFilter())
+    handler.addFilter(SamplingFilter())
+    listener = QueueListener(handler.queue, output)
+    listener.start()
+    logger = isolated_logger(name, handler)
+
+    def one_request():
+        for fmt, args in REQUEST_LINES:
+            logger.info(fmt, *args)
+    return one_request, listener.stop
+
+
+def run(name, setup, output, iterations):
+    one_request, stop = setup(name, output)
+    try:
+        with start_trace('bench'):
+            return measure(f"logging: {name} per request", one_request, iterations, repeat=5)
+    finally:
+        stop()
+
+
+class TestLoggingOverhead:
+    def test_file_sink(self, sink_file):
+        # Alternating rounds, each starting once the listener has written out the previous one.
+        records = queue.Queue()
+        before, _ = synchronous("synchronous text, file", logging.StreamHandler(sink_file))
+        after, stop = queued("queued json, file", logging.StreamHandler(sink_file), records)
+        name = "logging: queued json, file per request"
+        try:
+            with start_trace('bench'):
+                speedup = measure_speedup(name, after, before, 2000, settle=records.join)
+        finally:
+            stop()
+        check_baseline(name, speedup)
+        # The listener competes for the GIL, so the request thread pays about the same as before on a fast sink.
+        assert speedup > 0.5
+
+    def test_slow_sink(self):
+        before = run("synchronous text, slow sink", synchronous, SlowSink(0.0002), 50)
+        after = run("queued json, slow sink", queued, SlowSink(0.0002), 50)
+        assert after > before * 2
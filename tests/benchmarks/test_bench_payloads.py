@@ -0,0 +1,81 @@
+"""
+Webhook body handling on a corpus shaped like live Vagaro traffic: most
+events are retail, service and class sales that end as "Not a relevant
+purchase type", with a minority of membership purchases.
+"""
+import json
+import random
+from unittest.mock import patch
+
+from bstrong import payloads
+from bstrong.catalog import MembershipCatalog
+from bstrong.payloads import ignorable_transaction, parse_transaction
+from tests.benchmarks.conftest import measure
+
+rng = random.Random(45)
+
+RELEVANT = [('Membership', '1 month gym membership'), ('Membership', 'Monthly Autopay Membership'),
+            ('Package', 'day pass'), ('Membership', '1 week pass')]
+IRRELEVANT = [('Product', 'protein shake'), ('Service', 'personal training 60 min'), ('Class', 'spin class'),
+              ('Product', 'B-Strong tank top'), ('Service', 'massage 30 min'), ('GiftCard', 'gift card $50')]
+
+
+def _event(purchase_type, item):
+    return json.dumps({
+        'type': 'transaction', 'createdDate': '2026-04-29T14:00:00Z',
+        'payload': {
+            'itemSold': item, 'purchaseType': purchase_type, 'customerId': f'C{rng.randint(1, 9999)}',
+            'userPaymentId': f'P{rng.randint(1, 10 ** 9)}', 'transactionId': f'T{rng.randint(1, 10 ** 9)}',
+            'businessId': 'B-STRONG', 'quantity': 1, 'amount': round(rng.uniform(5, 120), 2),
+            'tax': 0.0, 'tip': 0.0, 'discount': 0.0, 'paymentMethod': 'Credit Card',
+            'employeeName': 'Front Desk', 'locationName': 'B-Strong Fitness',
+        },
+    }).encode()
+
+
+# Four in five events are ignored.
+CORPUS = [_event(*rng.choice(RELEVANT if rng.random() < 0.2 else IRRELEVANT)) for _ in range(1000)]
+
+
+def _legacy(catalog, body):
+    payload = json.loads(body)["payload"]
+    item_sold = payload.get("itemSold", "").lower()
+    product = catalog.classify(item_sold)
+    payload.get("customerId")
+    return payload.get("purchaseType") in product.purchase_types
+
+
+def _prefiltered(catalog, body):
+    if ignorable_transaction(body, catalog.purchase_types):
+        return False
+    return parse_transaction(body, catalog).relevant
+
+
+class TestWebhookPayloadThroughput:
+    def test_corpus_agrees(self):
+        catalog = MembershipCatalog()
+        assert [_legacy(catalog, b) for b in CORPUS] == [_prefiltered(catalog, b) for b in CORPUS]
+
+    def test_legacy_full_parse(self):
+        catalog = MembershipCatalog()
+        ops = measure("webhook x1000: json.loads then filter", lambda: [_legacy(catalog, b) for b in CORPUS], 20)
+        assert ops > 0
+
+    def test_prefilter_then_stdlib_parse(self):
+        catalog = MembershipCatalog()
+        with patch.object(payloads, "orjson", None):
+            ops = measure("webhook x1000: prefilter + json", lambda: [_prefiltered(catalog, b) for b in CORPUS], 20)
+        assert ops > 0
+
+    def test_prefilter_then_fast_parse(self):
+        catalog = MembershipCatalog()
+        ops = measure(f"webhook x1000: prefilter + {payloads.JSON_BACKEND}",
+                      lambda: [_prefiltered(catalog, b) for b in CORPUS], 20)
+        assert ops > 0
+
+    def test_parse_past_the_prefilter(self):
+        catalog = MembershipCatalog()
+        passed = [b for b in CORPUS if not ignorable_transaction(b, catalog.purchase_types)]
+        ops = measure(f"webhook x{len(passed)} past the prefilter: typed parse ({payloads.JSON_BACKEND})",
+                      lambda: [parse_transaction(b, catalog) for b in passed], 100)
+        assert ops > 0
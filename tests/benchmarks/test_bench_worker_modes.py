@@ -0,0 +1,18 @@
+import pytest
+
+pytest.importorskip("gevent")
+
+from tests.benchmarks.loadtest import LoadOptions  # noqa: E402
+from tests.benchmarks.worker_modes import compare_modes  # noqa: E402
+
+
+class TestWorkerModes:
+    def test_gevent_keeps_up_where_gthread_queues(self):
+        latency = 0.25
+        options = LoadOptions(rate=20, duration=5, firestore_latency=latency / 4, remotelock_latency=latency,
+                              vagaro_latency=latency, twilio_latency=latency)
+        results = compare_modes(options)
+
+        for report in results.values():
+            assert report["overall"]["error_rate"] == 0
+        assert results["gevent"]["overall"]["p95_ms"] < results["gthread"]["overall"]["p95_ms"]
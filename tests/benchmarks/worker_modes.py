@@ -0,0 +1,98 @@
+"""
+Compare gunicorn worker classes under the same simulated vendor latency.
+
+Each mode runs app:app in its own gunicorn process (so gevent's monkeypatching
+cannot leak into the other run) against shared vendor stubs in this process:
+
+    python -m tests.benchmarks.worker_modes --rate 30 --duration 15 --latency 0.25 --out modes.json
+"""
+import argparse, json, os, socket, subprocess, sys, time
+
+import requests
+
+from tests.benchmarks.loadtest import LoadOptions, VendorStubs, Workload, drive, summarize
+
+MODES = ("gthread", "gevent")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_until_up(url: str, proc: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"worker exited with {proc.returncode} before becoming healthy")
+        try:
+            if requests.get(f"{url}/health", timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"{url} did not become healthy within {timeout}s")
+
+
+def run_mode(mode: str, options: LoadOptions, vendors: VendorStubs) -> dict:
+    port = _free_port()
+    env = {
+        **os.environ, **vendors.env(),
+        "PORT": str(port), "BENCH_WORKER_CLASS": mode, "GUNICORN_THREADS": str(options.threads),
+        "BENCH_FIRESTORE_LATENCY": str(options.firestore_latency),
+        "CATALOG_REFRESH_SECONDS": "0", "PIN_INDEX_REFRESH_SECONDS": "0", "TICKET_FILTER_REFRESH_SECONDS": "0", "DEAD_LETTER_REPLAY_SECONDS": "0",
+        "TRACE_EXPORTER": "none",
+        # The vendor token buckets would cap both modes at the same rate and hide the difference.
+        "RATE_LIMIT_REMOTELOCK": "0", "RATE_LIMIT_VAGARO": "0", "RATE_LIMIT_TWILIO": "0",
+    }
+    proc = subprocess.Popen([sys.executable, "-m", "tests.benchmarks.worker_server"], env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_until_up(url, proc)
+        before = vendors.counts()
+        samples, elapsed, _ = drive(url, Workload(options, vendors.vagaro), options)
+        after = vendors.counts()
+        report = summarize(samples, options, elapsed, [], {k: after[k] - before[k] for k in after})
+        report["worker_class"] = mode
+        return report
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def compare_modes(options: LoadOptions, modes: tuple[str, ...] = MODES) -> dict:
+    with VendorStubs(options) as vendors:
+        return {mode: run_mode(mode, options, vendors) for mode in modes}
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare gunicorn gthread and gevent workers.")
+    parser.add_argument("--rate", type=float, default=20.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--threads", type=int, default=8, help="gthread threads (the production setting)")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated latency of every vendor call")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--out", help="Write the JSON comparison here")
+    args = parser.parse_args(argv)
+
+    options = LoadOptions(rate=args.rate, duration=args.duration, threads=args.threads,
+                          firestore_latency=args.latency / 4, remotelock_latency=args.latency,
+                          vagaro_latency=args.latency, twilio_latency=args.latency)
+    results = compare_modes(options, tuple(args.modes.split(",")))
+    for mode, report in results.items():
+        overall = report["overall"]
+        print(f"{mode:<8} {report['achieved_rps']:>6} rps  p50 {overall['p50_ms']}ms  p95 {overall['p95_ms']}ms  "
+              f"p99 {overall['p99_ms']}ms  errors {overall['error_rate']:.1%}  saturated {report['saturation']['saturated']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""
+Child process for the worker-mode benchmark: runs app:app under a real gunicorn
+worker (BENCH_WORKER_CLASS) with vendor URLs taken from the environment and an
+in-memory Firestore. Monkeypatching has to happen before anything else imports
+socket or ssl, so this module patches first and imports the harness after.
+"""
+import os
+
+if os.getenv("BENCH_WORKER_CLASS") == "gevent":
+    from gevent import monkey
+    monkey.patch_all()
+
+from contextlib import ExitStack  # noqa: E402
+
+from gunicorn.app.base import BaseApplication  # noqa: E402
+
+
+class BenchApplication(BaseApplication):
+    def load_config(self):
+        self.cfg.set("bind", f"127.0.0.1:{os.environ['PORT']}")
+        self.cfg.set("workers", 1)
+        self.cfg.set("worker_class", os.environ["BENCH_WORKER_CLASS"])
+        self.cfg.set("threads", int(os.getenv("GUNICORN_THREADS", "8")))
+        self.cfg.set("worker_connections", int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "100")))
+        self.cfg.set("timeout", 60)
+        self.cfg.set("loglevel", "warning")
+
+    def load(self):
+        from tests.benchmarks.loadtest import wire_app
+        from tests.fakes import InMemoryDatabase
+        self._stack = ExitStack()
+        db = InMemoryDatabase(latency=float(os.getenv("BENCH_FIRESTORE_LATENCY", "0.01")))
+        return wire_app(self._stack, os.environ, db).app
+
+
+if __name__ == "__main__":
+    BenchApplication().run()
@@ -1,6 +1,19 @@
+import os
 import pytest
 from unittest.mock import patch, MagicMock
 
+# No background refresh threads in tests; fixtures install fresh instances.
+os.environ.setdefault('CATALOG_REFRESH_SECONDS', '0')
+os.environ.setdefault('PIN_INDEX_REFRESH_SECONDS', '0')
+os.environ.setdefault('TICKET_FILTER_REFRESH_SECONDS', '0')
+os.environ.setdefault('DEAD_LETTER_REPLAY_SECONDS', '0')
+os.environ.setdefault('TRACE_EXPORTER', 'none')
+# Keep pytest's log capture instead of the app's queue handler.
+os.environ.setdefault('LOG_CONFIGURE_ON_IMPORT', '0')
+# Vendor rate limits off by default; test_ratelimit covers the buckets.
+for _vendor in ('REMOTELOCK', 'VAGARO', 'TWILIO'):
+    os.environ.setdefault(f'RATE_LIMIT_{_vendor}', '0')
+
 # ---- Test values ----
 # Owner numbers are fake — texts to them are silently dropped.
 # Developer number is real — send_Dev() will actually text you during test runs.
@@ -12,6 +25,8 @@ TEST_CONFIG = {
     'TRANSACTION_TOKEN': 'test-transaction-token',
     'FORUM_TOKEN':       'test-forum-token',
     'CLEANUP_TOKEN':     'test-cleanup-token',
+    'BULK_OPS_TOKEN':    'test-bulk-token',
+    'METRICS_TOKEN':     'test-metrics-token',
     'LOCK_ID':           'test-lock-id',
     'REMOTELOCK_CLIENT_ID':     'test-rl-client-id',
     'REMOTELOCK_CLIENT_SECRET': 'test-rl-secret',
@@ -59,10 +74,14 @@ def selective_sms():
         # All other numbers (test member phones) — fake success, no real call
         return True
 
+    # Alerts are delivered on a background thread; start each test with fresh
+    # windows and budgets, and deliver what it queued before unpatching.
+    flask_app.alerts.reset()
     with patch('bstrong.utils.send_sms',    guarded), \
          patch('app.send_sms',              guarded), \
          patch('bstrong.services.send_sms', guarded):
         yield
+        flask_app.alerts.flush()
 
 
 @pytest.fixture
@@ -78,6 +97,7 @@ def app_client(monkeypatch):
 
     mock_db = MagicMock()
     monkeypatch.setattr(flask_app, 'dataBase',      mock_db)
+    monkeypatch.setattr(flask_app.dead_letters, 'db', mock_db)
 
     mock_rl = MagicMock()
     monkeypatch.setattr(flask_app, 'rl_client',     mock_rl)
@@ -85,10 +105,31 @@ def app_client(monkeypatch):
     mock_vagaro = MagicMock()
     monkeypatch.setattr(flask_app, 'vagaro_client', mock_vagaro)
 
+    from bstrong.pin_index import PinIndex
+    monkeypatch.setattr(flask_app, 'pin_index',     PinIndex())
+
+    # Never built, so every inbound SMS still reads its ticket from mock_db.
+    from bstrong.ticket_filter import TicketFilter
+    monkeypatch.setattr(flask_app, 'ticket_filter', TicketFilter(capacity=100, fp_rate=0.01))
+
     with flask_app.app.test_client() as client:
         yield client, mock_db, mock_rl, mock_vagaro
 
 
+FAKE_TOKEN = "fake-access-token"
+
+
+@pytest.fixture
+def rl_client():
+    """RemoteLockClient with a pre-loaded token so _get_token() never hits the network."""
+    from datetime import datetime, timedelta, timezone
+    from bstrong.api_clients import RemoteLockClient
+    client = RemoteLockClient()
+    client._token = FAKE_TOKEN
+    client._token_expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+    return client
+
+
 def make_firestore_doc(exists=True, data=None):
     """Return a mock Firestore document snapshot."""
     doc = MagicMock()
@@ -0,0 +1,158 @@
+"""In-memory stand-in for bstrong.database.Database, for tests and local benchmarks."""
+import threading, time
+from datetime import datetime, timezone
+from typing import Any, NamedTuple
+from google.api_core import exceptions as api_exceptions
+from google.cloud import firestore
+
+
+class Reference(NamedTuple):
+    collection: str
+    key: str
+
+
+class Snapshot:
+    def __init__(self, reference: Reference, data: dict | None):
+        self.reference = reference
+        self.id = reference.key
+        self.exists = data is not None
+        self._data = dict(data) if data is not None else None
+
+    def to_dict(self) -> dict | None:
+        return dict(self._data) if self._data is not None else None
+
+
+def _resolve(data: dict) -> dict:
+    now = datetime.now(timezone.utc)
+    return {k: now if v is firestore.SERVER_TIMESTAMP else v for k, v in data.items()}
+
+
+class FakeBatch:
+    def __init__(self, db: "InMemoryDatabase"):
+        self.db = db
+        self.ops: list[tuple[str, Reference, dict | None]] = []
+        self.commits = 0
+
+    def set(self, reference, data):
+        self.ops.append(("set", reference, data))
+
+    def update(self, reference, data):
+        self.ops.append(("update", reference, data))
+
+    def delete(self, reference):
+        self.ops.append(("delete", reference, None))
+
+    def commit(self):
+        self.db.maybe_sleep()
+        for op, reference, data in self.ops:
+            if op == "set":
+                self.db.add(reference.collection, reference.key, data)
+            elif op == "update":
+                self.db.update(reference.collection, reference.key, data)
+            else:
+                self.db.delete(reference.collection, reference.key)
+        self.db.batch_commits += 1
+        self.ops = []
+
+
+class InMemoryDatabase:
+    """Implements the Database interface on dicts. `latency` adds a per-call delay."""
+
+    def __init__(self, latency: float = 0.0):
+        self.collections: dict[str, dict[str, dict]] = {}
+        self.latency = latency
+        self.batch_commits = 0
+        self._lock = threading.Lock()
+
+    def maybe_sleep(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _docs(self, collection: str) -> dict[str, dict]:
+        return self.collections.setdefault(collection, {})
+
+    def checkIfExists(self, collection: str, key: str) -> bool:
+        self.maybe_sleep()
+        return key in self._docs(collection)
+
+    def add(self, collection: str, key: str, data: dict[str, Any] | None = None, timeout: float | None = None) -> None:
+        self.maybe_sleep()
+        with self._lock:
+            self._docs(collection)[key] = _resolve(data or {})
+
+    def update(self, collection: str, key: str, data: dict[str, Any], timeout: float | None = None) -> None:
+        self.maybe_sleep()
+        with self._lock:
+            if key not in self._docs(collection):
+                raise api_exceptions.NotFound(f"No document to update: {collection}/{key}")
+            self._docs(collection)[key].update(_resolve(data))
+
+    def getData(self, collection: str, key: str) -> Snapshot:
+        self.maybe_sleep()
+        return Snapshot(Reference(collection, key), self._docs(collection).get(key))
+
+    def getCollection(self, collection: str) -> list[Snapshot]:
+        self.maybe_sleep()
+        return [Snapshot(Reference(collection, k), v) for k, v in list(self._docs(collection).items())]
+
+    def delete(self, collection: str, key: str, timeout: float | None = None) -> None:
+        self.maybe_sleep()
+        with self._lock:
+            self._docs(collection).pop(key, None)
+
+    def listKeys(self, collection: str) -> list[str]:
+        self.maybe_sleep()
+        return list(self._docs(collection))
+
+    def countDocuments(self, collection: str) -> int:
+        return len(self._docs(collection))
+
+    def claimOne(self, collection: str) -> Snapshot | None:
+        self.maybe_sleep()
+        with self._lock:
+            docs = self._docs(collection)
+            if not docs:
+                return None
+            key = next(iter(docs))
+            return Snapshot(Reference(collection, key), docs.pop(key))
+
+    def claimDue(self, collection: str, now: datetime, lease_until: datetime) -> Snapshot | None:
+        self.maybe_sleep()
+        with self._lock:
+            due = [(data['next_attempt'], key) for key, data in self._docs(collection).items()
+                   if data.get('status') == 'pending' and data['next_attempt'] <= now]
+            if not due:
+                return None
+            key = min(due)[1]
+            data = self._docs(collection)[key]
+            snapshot = Snapshot(Reference(collection, key), dict(data))
+            data['next_attempt'] = lease_until
+            return snapshot
+
+    def acquireLease(self, collection: str, key: str, owner: str, now: datetime, until: datetime) -> bool:
+        self.maybe_sleep()
+        with self._lock:
+            data = self._docs(collection).get(key)
+            if data and data['owner'] != owner and data['expires'] > now:
+                return False
+            self._docs(collection)[key] = {'owner': owner, 'expires': until, 'timestamp': now}
+            return True
+
+    def releaseLease(self, collection: str, key: str, owner: str) -> None:
+        self.maybe_sleep()
+        with self._lock:
+            if self._docs(collection).get(key, {}).get('owner') == owner:
+                del self._docs(collection)[key]
+
+    def getReference(self, collection: str, key: str) -> Reference:
+        return Reference(collection, key)
+
+    def getBatch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+    def getAllOldDocs(self) -> list[Snapshot]:
+        return []
+
+    def getExpiredAutopays(self) -> list[Snapshot]:
+        now = datetime.now(timezone.utc)
+        return [s for s in self.getCollection('active_autopays') if s.to_dict().get('expireAt') and s.to_dict()['expireAt'] <= now]
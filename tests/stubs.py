@@ -0,0 +1,184 @@
+"""
+Local HTTP stand-ins for vendor APIs, served from a background thread so
+tests can exercise the real clients end to end.
+"""
+import json, random, re, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubServer:
+    """
+    Base stub: subclasses implement handle(method, path, query, body) -> (status, json_body).
+    `latency` delays every response; `error_rate` answers that fraction of requests with a 503.
+    """
+
+    latency = 0.0
+    error_rate = 0.0
+
+    def __init__(self):
+        self.requests: list[tuple[str, str]] = []
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _dispatch(self, method):
+                parsed = urlparse(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length) if length else b""
+                if self.headers.get("Content-Type", "").startswith("application/x-www-form-urlencoded"):
+                    body = {k: v[0] for k, v in parse_qs(raw.decode()).items()}
+                else:
+                    try:
+                        body = json.loads(raw) if raw else {}
+                    except ValueError:
+                        body = {"_raw": raw.decode(errors="replace")}
+                with stub._lock:
+                    stub.requests.append((method, parsed.path))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                if stub.error_rate and random.random() < stub.error_rate:
+                    status, payload = 503, {"error": "injected failure"}
+                else:
+                    status, payload = stub.handle(method, parsed.path, parse_qs(parsed.query), body, self.headers)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._dispatch("GET")
+
+            def do_POST(self):
+                self._dispatch("POST")
+
+            def do_PUT(self):
+                self._dispatch("PUT")
+
+            def do_DELETE(self):
+                self._dispatch("DELETE")
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+
+    def handle(self, method, path, query, body, headers):
+        return 404, {"error": "not found"}
+
+    def count(self, method: str, path_prefix: str) -> int:
+        with self._lock:
+            return sum(1 for m, p in self.requests if m == method and p.startswith(path_prefix))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RemoteLockStub(StubServer):
+    """Minimal RemoteLock Connect API: oauth token, paginated access_persons, updates, deletes and accesses."""
+
+    def __init__(self, guests: dict[str, dict] | None = None):
+        super().__init__()
+        self.guests: dict[str, dict] = guests or {}
+        self.accesses: dict[str, list[dict]] = {}
+        self.fail_ids: set[str] = set()
+        self._next_id = 0
+
+    def add_guest(self, guest_id: str, **attributes) -> None:
+        self.guests[guest_id] = {"name": guest_id, "pin": None, **attributes}
+
+    def handle(self, method, path, query, body, headers):
+        if path == "/oauth/token":
+            return 200, {"access_token": "stub-token", "expires_in": 7200}
+
+        if path == "/access_persons" and method == "GET":
+            page = int(query.get("page", ["1"])[0])
+            per_page = int(query.get("per_page", ["50"])[0])
+            ids = sorted(self.guests)
+            chunk = ids[(page - 1) * per_page: page * per_page]
+            total_pages = max(1, -(-len(ids) // per_page))
+            return 200, {
+                "data": [{"id": i, "type": "access_guest", "attributes": self.guests[i]} for i in chunk],
+                "meta": {"page": page, "per_page": per_page, "total_pages": total_pages, "total_count": len(ids)},
+            }
+
+        if path == "/access_persons" and method == "POST":
+            with self._lock:
+                self._next_id += 1
+                guest_id = f"stub-guest-{self._next_id}"
+            attributes = dict(body.get("attributes", {}))
+            if attributes.pop("generate_pin", False):
+                attributes["pin"] = f"{(self._next_id * 7919) % 100000:05d}"
+            self.guests[guest_id] = attributes
+            return 201, {"data": {"id": guest_id, "type": "access_guest", "attributes": attributes}}
+
+        match = re.fullmatch(r"/access_persons/([^/]+)(/accesses)?", path)
+        if match:
+            guest_id, accesses = match.groups()
+            if guest_id in self.fail_ids:
+                return 500, {"error": "stub failure"}
+            if guest_id not in self.guests:
+                return 404, {"error": "not found"}
+            if accesses and method == "POST":
+                self.accesses.setdefault(guest_id, []).append(body.get("attributes", {}))
+                return 201, {"data": {"attributes": body.get("attributes", {})}}
+            if method == "GET":
+                return 200, {"data": {"id": guest_id, "type": "access_guest", "attributes": self.guests[guest_id]}}
+            if method == "DELETE" and not accesses:
+                del self.guests[guest_id]
+                self.accesses.pop(guest_id, None)
+                return 200, {}
+            if method == "PUT":
+                pin = body.get("attributes", {}).get("pin")
+                if pin and any(g.get("pin") == pin for i, g in self.guests.items() if i != guest_id):
+                    return 422, {"errors": [{"pin": "has already been taken"}]}
+                self.guests[guest_id].update(body.get("attributes", {}))
+                return 200, {"data": {"id": guest_id, "attributes": self.guests[guest_id]}}
+
+        return 404, {"error": "not found"}
+
+
+class VagaroWorkerStub(StubServer):
+    """The Cloudflare Vagaro proxy: routes on X-Target-Url like the real worker."""
+
+    def __init__(self, customers: dict[str, dict] | None = None):
+        super().__init__()
+        self.customers: dict[str, dict] = customers or {}
+
+    def handle(self, method, path, query, body, headers):
+        target = headers.get("X-Target-Url", "")
+        if target.endswith("/generate-access-token"):
+            return 200, {"data": {"access_token": "stub-vagaro-token", "expires_in": 3600}}
+        if target.endswith("/customers"):
+            customer = self.customers.get(body.get("customerId"))
+            if customer is None:
+                return 404, {"error": "customer not found"}
+            return 200, {"data": customer}
+        return 404, {"error": "unknown target"}
+
+
+class TwilioStub(StubServer):
+    """Twilio Messages API: records every message that would have been sent."""
+
+    def __init__(self):
+        super().__init__()
+        self.messages: list[dict] = []
+
+    def handle(self, method, path, query, body, headers):
+        match = re.fullmatch(r"/2010-04-01/Accounts/([^/]+)/Messages.json", path)
+        if not match or method != "POST":
+            return 404, {"error": "not found"}
+        with self._lock:
+            self.messages.append(body)
+            sid = f"SM{len(self.messages):032d}"
+        return 201, {"sid": sid, "account_sid": match.group(1), "status": "queued",
+                     "to": body.get("To"), "from": body.get("From"), "body": body.get("Body")}
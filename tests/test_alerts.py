@@ -0,0 +1,194 @@
+import threading
+import pytest
+from unittest.mock import patch
+
+from bstrong.alerts import AlertDispatcher, fingerprint
+from tests.conftest import make_firestore_doc, TEST_CONFIG, flask_app
+
+DEV = '+15550000001'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def sent():
+    return []
+
+
+@pytest.fixture
+def dispatcher(clock, sent):
+    d = AlertDispatcher(lambda to, body: sent.append((to, body)) or True, window=300, budget=3, clock=clock)
+    yield d
+    d.stop()
+
+
+# ---- Coalescing -----------------------------------------------------------
+
+class TestCoalescing:
+    def test_fingerprint_ignores_ids_and_quoted_values(self):
+        assert fingerprint("Firestore access error for 12345: timeout") == fingerprint("Firestore access error for 999: timeout")
+        assert fingerprint("Unknown membership type received: 'gold'") == fingerprint("Unknown membership type received: 'x'")
+        assert fingerprint("RemoteLock API error") != fingerprint("Vagaro API error")
+
+    def test_first_alert_sent_repeats_folded_into_digest(self, dispatcher, sent):
+        for i in range(4):
+            dispatcher.submit([DEV], f"RemoteLock API error extending guest-{i}: 503")
+        dispatcher.flush()
+        assert sent[0] == (DEV, "RemoteLock API error extending guest-0: 503")
+        assert len(sent) == 2
+        assert all(f"1x RemoteLock API error extending guest-{i}: 503" in sent[1][1] for i in (1, 2, 3))
+
+    def test_digest_keeps_some_distinct_repeats_and_counts_the_rest(self, dispatcher, sent):
+        for i in range(12):
+            dispatcher.submit([DEV], f"Firestore access error for {i % 8}: timeout")
+        dispatcher.flush()
+        digest = sent[1][1]
+        assert "2x Firestore access error for 1: timeout" in digest
+        assert "Firestore access error for 6" not in digest
+        assert digest.endswith("- ...and 3 more")
+
+    def test_digest_sent_when_window_closes(self, dispatcher, sent, clock):
+        dispatcher.submit([DEV], "Vagaro down 1")
+        dispatcher.submit([DEV], "Vagaro down 2")
+        dispatcher.flush()
+        sent.clear()
+        dispatcher.submit([DEV], "Vagaro down 3")
+        dispatcher._flush_digests()
+        assert dispatcher.stats()["coalescing"] == 1  # window still open
+
+        clock.now += 301
+        dispatcher._flush_digests()
+        dispatcher.flush()
+        assert len(sent) == 1 and "1x Vagaro down 3" in sent[0][1]
+
+    def test_alert_after_quiet_window_sent_immediately(self, dispatcher, sent, clock):
+        dispatcher.submit([DEV], "Cron failed")
+        clock.now += 301
+        dispatcher.submit([DEV], "Cron failed")
+        dispatcher.flush()
+        assert sent == [(DEV, "Cron failed"), (DEV, "Cron failed")]
+
+    def test_explicit_key_overrides_fingerprint(self, dispatcher, sent):
+        dispatcher.submit([DEV], "Token refresh failed: a", key="token")
+        dispatcher.submit([DEV], "Token refresh failed: b", key="token")
+        dispatcher.flush()
+        assert len(sent) == 2 and "1x" in sent[1][1]
+
+
+# ---- Budgets --------------------------------------------------------------
+
+class TestBudget:
+    def test_over_budget_alerts_held_then_sent_together(self, dispatcher, sent, clock):
+        for name in ["a", "b", "c", "d", "e"]:
+            dispatcher.submit([DEV], f"{name} didn't get a door code")
+        dispatcher.flush()
+        assert len(sent) == 3
+        assert dispatcher.stats()["held"] == 2
+
+        clock.now += 3601
+        dispatcher._flush_digests()
+        dispatcher.flush()
+        assert sent[3][1].startswith("2 alerts held back")
+        assert "d didn't get a door code" in sent[3][1] and "e didn't get a door code" in sent[3][1]
+        assert dispatcher.stats()["held"] == 0
+
+    def test_held_alerts_are_capped_and_counted(self, dispatcher, sent, clock):
+        for i in range(23):
+            dispatcher.submit([DEV], f"Cron {i} failed", key=str(i))
+        assert dispatcher.stats()["held"] == 20
+        assert len(dispatcher._held[DEV].counts) == 5
+
+        clock.now += 3601
+        dispatcher._flush_digests()
+        dispatcher.flush()
+        assert sent[3][1].startswith("20 alerts held back")
+        assert "- Cron 7 failed" in sent[3][1] and sent[3][1].endswith("- ...and 15 more")
+
+    def test_owner_alerts_are_never_folded_into_a_count(self, dispatcher, sent, clock):
+        names = [f"Member{i:03d} Lastname" for i in range(60)]
+        for name in names:
+            dispatcher.submit([DEV], f"{name} didn't get a door code", key=name, complete=True)
+        clock.now += 3601
+        dispatcher._flush_digests()
+        dispatcher.flush()
+        digests = [body for _, body in sent[3:]]
+        assert len(digests) > 1 and all(len(body) <= 1600 for body in digests)
+        assert all(body.startswith("57 alerts held back") for body in digests)
+        assert all(any(f"- {name} didn't get a door code" in body for body in digests) for name in names[3:])
+
+    def test_budget_is_per_recipient(self, dispatcher, sent):
+        for name in ["a", "b", "c", "d"]:
+            dispatcher.submit([DEV, "+15550000002"], f"{name} failed")
+        dispatcher.flush()
+        assert sum(1 for to, _ in sent if to == DEV) == 3
+        assert sum(1 for to, _ in sent if to == "+15550000002") == 3
+
+
+# ---- Delivery -------------------------------------------------------------
+
+class TestDelivery:
+    def test_submit_does_not_wait_for_delivery(self, clock):
+        release, delivered = threading.Event(), threading.Event()
+
+        def slow(to, body):
+            release.wait(5)
+            delivered.set()
+            return True
+
+        d = AlertDispatcher(slow, window=300, budget=10, clock=clock)
+        d.submit([DEV], "slow vendor")
+        assert not delivered.is_set()
+        release.set()
+        d.flush()
+        assert delivered.is_set()
+        d.stop()
+
+    def test_delivery_errors_are_contained(self, clock):
+        d = AlertDispatcher(lambda to, body: 1 / 0, window=300, budget=10, clock=clock)
+        d.submit([DEV], "boom")
+        d.flush()
+        d.stop()
+
+    def test_send_dev_goes_through_dispatcher(self):
+        with patch('bstrong.utils.send_sms', return_value=True) as mock_sms:
+            from bstrong.utils import send_Dev
+            assert send_Dev("Firestore access error for 1: x") is True
+            assert send_Dev("Firestore access error for 2: x") is True
+            flask_app.alerts.flush()
+        dev = TEST_CONFIG['DEVELOPER_PHONE_NUMBER']
+        assert mock_sms.call_args_list[0].kwargs == {'to_phone_number': dev, 'body': "Firestore access error for 1: x"}
+        assert "1x Firestore access error for 2: x" in mock_sms.call_args_list[1].kwargs['body']
+
+
+class TestOwnerAlertsDuringOutage:
+    def test_repeated_fallback_failures_coalesced(self, app_client):
+        client, mock_db, _, mock_vagaro = app_client
+        mock_db.checkIfExists.return_value = False
+        mock_db.getData.return_value = make_firestore_doc(exists=False)
+        mock_vagaro.get_customer_details.side_effect = RuntimeError("Vagaro down")
+        # Firestore is down too, so the failures cannot be dead-lettered and the owners are alerted at once.
+        mock_db.add.side_effect = RuntimeError("Firestore down")
+
+        with patch('bstrong.utils.send_sms', return_value=True) as mock_sms:
+            for i in range(3):
+                resp = client.post('/webhook-transaction',
+                    json={'payload': {'itemSold': '1 month gym membership', 'customerId': f'C{i}',
+                                      'purchaseType': 'Membership', 'userPaymentId': f'P{i}'}},
+                    headers={'X-Vagaro-Signature': TEST_CONFIG['TRANSACTION_TOKEN']})
+                assert resp.status_code == 500
+            flask_app.alerts.flush()
+
+        owner1 = [c.kwargs['body'] for c in mock_sms.call_args_list if c.kwargs['to_phone_number'] == TEST_CONFIG['OWNER_PHONE_NUMBER_1']]
+        assert owner1[0] == "Failed to send code to Unknown Customer"
+        assert len(owner1) == 2 and "2x Failed to send code to Unknown Customer" in owner1[1]
@@ -1,25 +1,15 @@
 import pytest
 import requests as req_lib
-from datetime import datetime, timezone, timedelta
 from unittest.mock import patch, MagicMock
 
-from bstrong.api_clients import RemoteLockClient, PinConflictError
+from bstrong.api_clients import VagaroClient, PinConflictError
+from bstrong.metrics import VAGARO_EDGE_CACHE
 
-FAKE_TOKEN = "fake-access-token"
 
-
-@pytest.fixture
-def rl_client():
-    """RemoteLockClient with a pre-loaded token so _get_token() never hits the network."""
-    client = RemoteLockClient()
-    client._token = FAKE_TOKEN
-    client._token_expiry = datetime.now(timezone.utc) + timedelta(hours=1)
-    return client
-
-
-def mock_response(status_code: int = 200, json_data: dict = None) -> MagicMock:
+def mock_response(status_code: int = 200, json_data: dict = None, headers: dict = None) -> MagicMock:
     resp = MagicMock()
     resp.status_code = status_code
+    resp.headers = headers or {}
     resp.json.return_value = json_data or {}
     resp.raise_for_status.return_value = None
     return resp
@@ -162,3 +152,74 @@ class TestExtendAccess:
         ]) as mock_req, patch('bstrong.api_clients.time.sleep'):
             rl_client.extend_access("guest-123", "2026-06-01T22:00:00Z")
         assert mock_req.call_count == 2
+
+
+# ---- list_access_persons ------------------------------------------------
+
+class TestListAccessPersons:
+    def test_returns_persons_and_total_pages(self, rl_client):
+        with patch('bstrong.api_clients.requests.request', return_value=mock_response(json_data={
+            "data": [{"id": "g1", "attributes": {"pin": "1234"}}],
+            "meta": {"page": 2, "per_page": 1, "total_pages": 3},
+        })) as mock_req:
+            persons, total_pages = rl_client.list_access_persons(page=2, per_page=1)
+        assert persons[0]["id"] == "g1"
+        assert total_pages == 3
+        assert mock_req.call_args.kwargs['params'] == {"page": 2, "per_page": 1}
+
+
+# ---- Vagaro worker edge cache -------------------------------------------
+
+class TestVagaroEdgeCache:
+    def test_cached_token_keeps_its_remaining_lifetime(self):
+        client = VagaroClient()
+        hits = VAGARO_EDGE_CACHE.value(lookup="token", status="hit")
+        with patch('bstrong.api_clients.requests.post', return_value=mock_response(
+                json_data={"data": {"access_token": "edge-token", "expires_in": 900}}, headers={"X-Cache-Status": "HIT"})), \
+             patch('bstrong.api_clients.time.time', return_value=1000.0):
+            assert client._get_token() == "edge-token"
+
+        assert client._token_expiry == 1900.0
+        assert VAGARO_EDGE_CACHE.value(lookup="token", status="hit") == hits + 1
+
+    def test_customer_lookup_status_is_recorded(self):
+        client = VagaroClient()
+        client._token, client._token_expiry = "t", float("inf")
+        misses = VAGARO_EDGE_CACHE.value(lookup="customer", status="miss")
+        legacy = VAGARO_EDGE_CACHE.value(lookup="customer", status="none")
+        responses = [mock_response(json_data={"data": {"customerId": "C1"}}, headers={"X-Cache-Status": "MISS"}),
+                     mock_response(json_data={"data": {"customerId": "C1"}})]
+
+        with patch('bstrong.api_clients.requests.post', side_effect=responses):
+            assert client.get_customer_details("C1") == {"customerId": "C1"}
+            client.get_customer_details("C1")
+
+        assert VAGARO_EDGE_CACHE.value(lookup="customer", status="miss") == misses + 1
+        assert VAGARO_EDGE_CACHE.value(lookup="customer", status="none") == legacy + 1
+
+    def test_refused_token_is_refreshed_past_the_edge_cache_once(self):
+        client = VagaroClient()
+        client._token, client._token_expiry = "stale", float("inf")
+        responses = [mock_response(401),
+                     mock_response(json_data={"data": {"access_token": "fresh", "expires_in": 3600}}),
+                     mock_response(json_data={"data": {"customerId": "C1"}})]
+
+        with patch('bstrong.api_clients.requests.post', side_effect=responses) as post:
+            assert client.get_customer_details("C1") == {"customerId": "C1"}
+
+        refresh, retry = post.call_args_list[1:]
+        assert refresh.kwargs['headers']['Cache-Control'] == 'no-cache'
+        assert retry.kwargs['headers']['accessToken'] == 'fresh'
+        assert client._token == "fresh"
+
+    def test_second_refusal_is_not_retried(self):
+        client = VagaroClient()
+        client._token, client._token_expiry = "stale", float("inf")
+        refused = mock_response(401)
+        refused.raise_for_status.side_effect = req_lib.exceptions.HTTPError(response=refused)
+        responses = [refused, mock_response(json_data={"data": {"access_token": "fresh", "expires_in": 3600}}), refused]
+
+        with patch('bstrong.api_clients.requests.post', side_effect=responses) as post, \
+             patch('bstrong.api_clients.send_Dev'):
+            assert client.get_customer_details("C1") is None
+        assert post.call_count == 3
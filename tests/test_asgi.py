@@ -0,0 +1,208 @@
+"""
+The ASGI entry point must answer exactly like the Flask app. The route suites
+from test_routes run again here against asgi.app, with the same mocks.
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import Response
+
+from tests import test_routes
+from tests.conftest import make_firestore_doc, flask_app
+
+with patch('google.cloud.firestore.AsyncClient'):
+    import asgi
+
+TRANSACTION_TOKEN = test_routes.TRANSACTION_TOKEN
+
+
+def _scope(environ):
+    headers = [(k[5:].replace('_', '-').lower(), v) for k, v in environ.items() if k.startswith('HTTP_')]
+    headers += [(k.replace('_', '-').lower(), environ[k]) for k in ('CONTENT_TYPE', 'CONTENT_LENGTH') if environ.get(k)]
+    return {
+        'type': 'http', 'http_version': '1.1', 'scheme': 'http',
+        'method': environ['REQUEST_METHOD'], 'path': environ['PATH_INFO'],
+        'query_string': environ['QUERY_STRING'].encode(), 'root_path': '',
+        'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+        'server': ('localhost', 80), 'client': ('127.0.0.1', 5000),
+    }
+
+
+async def _call(scope, body):
+    sent = []
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            return {'type': 'http.disconnect'}
+        received = True
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi.app(scope, receive, send)
+    return sent
+
+
+class AsgiClient:
+    """Enough of Flask's test client (post/get with json=, data=, headers=) to drive asgi.app."""
+
+    def open(self, path, method, **kwargs):
+        environ = EnvironBuilder(path, method=method, **kwargs).get_environ()
+        sent = asyncio.run(_call(_scope(environ), environ['wsgi.input'].read()))
+        start, body = sent[0], b''.join(m.get('body', b'') for m in sent[1:])
+        headers = [(k.decode('latin-1'), v.decode('latin-1')) for k, v in start['headers']]
+        return Response(body, status=start['status'], headers=headers)
+
+    def post(self, path, **kwargs):
+        return self.open(path, 'POST', **kwargs)
+
+    def get(self, path, **kwargs):
+        return self.open(path, 'GET', **kwargs)
+
+
+class AsyncDatabaseStub:
+    """Awaitable front for the MagicMock the Flask suites configure and assert on."""
+
+    def __init__(self, mock_db):
+        self.mock_db = mock_db
+
+    def __getattr__(self, name):
+        method = getattr(self.mock_db, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+@pytest.fixture
+def app_client(app_client, monkeypatch):
+    """Same (client, mock_db, mock_rl, mock_vagaro) as conftest, answered by asgi.app."""
+    _, mock_db, mock_rl, mock_vagaro = app_client
+    monkeypatch.setattr(asgi, 'dataBase', AsyncDatabaseStub(mock_db))
+    # The suites patch app.RequestValidator; resolve it at call time.
+    monkeypatch.setattr(asgi, 'RequestValidator', lambda token: flask_app.RequestValidator(token))
+    yield AsgiClient(), mock_db, mock_rl, mock_vagaro
+
+
+# ---- Route parity -------------------------------------------------------
+
+class TestAsgiTransactionWebhook(test_routes.TestTransactionWebhook):
+    pass
+
+
+class TestAsgiSMSPINWebhook(test_routes.TestSMSPINWebhook):
+    pass
+
+
+class TestAsgiFormWebhook(test_routes.TestFormWebhook):
+    pass
+
+
+class TestAsgiHealthEndpoint(test_routes.TestHealthEndpoint):
+    pass
+
+
+class TestAsgiCronExpire(test_routes.TestCronExpire):
+    pass
+
+
+class TestAsgiMetrics(test_routes.TestMetrics):
+    pass
+
+
+# ---- ASGI specifics -----------------------------------------------------
+
+class TestAsgiApp:
+    def test_prefetch_reads_overlap(self, app_client):
+        client, mock_db, *_ = app_client
+        started, release = [], asyncio.Event()
+
+        class Gated(AsyncDatabaseStub):
+            async def checkIfExists(self, *args):
+                started.append('dedupe')
+                await release.wait()
+                return True
+
+            async def getData(self, *args):
+                started.append('pending')
+                release.set()
+                return make_firestore_doc(exists=False)
+
+        with patch.object(asgi, 'dataBase', Gated(mock_db)):
+            resp = client.post('/webhook-transaction', json=test_routes.transaction_payload(),
+                headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+        assert resp.status_code == 200
+        assert sorted(started) == ['dedupe', 'pending']
+
+    def test_trace_id_echoed(self, app_client):
+        client, *_ = app_client
+        resp = client.post('/webhook-transaction', json=test_routes.transaction_payload(purchaseType='Refund'),
+            headers={'X-Vagaro-Signature': TRANSACTION_TOKEN, 'X-Trace-Id': 'abcdef123456'})
+        assert resp.headers['X-Trace-Id'] == 'abcdef123456'
+
+    def test_unknown_route_falls_through_to_flask(self, app_client):
+        client, *_ = app_client
+        assert client.post('/bulk-operations', json={'action': 'extend'},
+            headers={'Authorization': 'Bearer wrong'}).status_code == 403
+        assert client.get('/nope').status_code == 404
+        assert client.get('/webhook-transaction').status_code == 405
+
+    def test_unhandled_error_returns_500(self, app_client):
+        client, mock_db, *_ = app_client
+        mock_db.checkIfExists.side_effect = RuntimeError("firestore down")
+        resp = client.post('/webhook-transaction', json=test_routes.transaction_payload(),
+            headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+        assert resp.status_code == 500
+
+    def streamed(self, headers, chunks):
+        """Post `chunks` to /webhook-transaction; returns the status and how many chunks were received."""
+        scope = {'type': 'http', 'method': 'POST', 'path': '/webhook-transaction', 'query_string': b'',
+                 'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers.items()]}
+        received = []
+
+        async def receive():
+            received.append(1)
+            return {'type': 'http.request', 'body': chunks[len(received) - 1], 'more_body': len(received) < len(chunks)}
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        asyncio.run(asgi.app(scope, receive, send))
+        return sent[0]['status'], len(received)
+
+    def test_oversized_content_length_is_refused_unread(self, app_client):
+        headers = {'content-type': 'application/json', 'content-length': str(asgi.WEBHOOK_MAX_BYTES + 1),
+                   'x-vagaro-signature': TRANSACTION_TOKEN}
+        assert self.streamed(headers, [b'{}']) == (413, 0)
+
+    def test_oversized_stream_is_cut_off(self, app_client):
+        _, mock_db, *_ = app_client
+        headers = {'content-type': 'application/json', 'x-vagaro-signature': TRANSACTION_TOKEN}
+        chunk = b' ' * (asgi.WEBHOOK_MAX_BYTES // 2)
+        assert self.streamed(headers, [chunk] * 10) == (413, 3)
+        mock_db.checkIfExists.assert_not_called()
+
+    def test_body_is_not_read_before_the_signature_check(self, app_client):
+        headers = {'content-type': 'application/json', 'x-vagaro-signature': 'wrong'}
+        assert self.streamed(headers, [b'{}']) == (403, 0)
+
+    def test_lifespan(self):
+        messages = iter([{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}])
+        sent = []
+
+        async def receive():
+            return next(messages)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        with patch.object(asgi, 'shutdown_logging') as shutdown:
+            asyncio.run(asgi.app({'type': 'lifespan'}, receive, send))
+        shutdown.assert_called_once_with()
+        assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
@@ -0,0 +1,134 @@
+import pytest
+import pytz
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from bstrong.api_clients import RemoteLockClient
+from bstrong.bulk_ops import BulkOperation, main, EXTEND, REVOKE, JOB_COLLECTION
+from tests.fakes import InMemoryDatabase
+from tests.stubs import RemoteLockStub
+
+EST = pytz.timezone('US/Eastern')
+
+
+@pytest.fixture
+def remotelock(monkeypatch):
+    with RemoteLockStub() as stub:
+        monkeypatch.setattr('bstrong.api_clients.REMOTELOCK_BASE_URL', stub.url)
+        monkeypatch.setattr('bstrong.api_clients.REMOTELOCK_TOKEN_URL', f"{stub.url}/oauth/token")
+        yield stub
+
+
+@pytest.fixture
+def gym(remotelock):
+    """Two autopay members and one weekly member with an open PIN ticket."""
+    db = InMemoryDatabase()
+    remotelock.add_guest('g-a1', ends_at='2026-05-15T22:00:00Z')
+    remotelock.add_guest('g-a2', ends_at='2026-03-07T22:00:00Z')
+    remotelock.add_guest('g-w1', ends_at='2026-05-06T22:00:00Z')
+    db.add('active_autopays', 'C1', {'remote_lock_id': 'g-a1', 'expireAt': EST.localize(datetime(2026, 5, 15, 22, 5))})
+    db.add('active_autopays', 'C2', {'remote_lock_id': 'g-a2', 'expireAt': EST.localize(datetime(2026, 3, 7, 22, 5))})
+    db.add('pin_change_tickets', '+15085551234', {'remote_lock_id': 'g-w1'})
+    db.add('pin_change_tickets', '+15085559999', {'remote_lock_id': 'g-a1'})  # same guest as C1
+    return remotelock, db
+
+
+class TestBulkExtend:
+    def test_extends_autopays_in_remotelock_and_firestore(self, gym):
+        stub, db = gym
+        summary = BulkOperation(db, RemoteLockClient(), EXTEND, days=2, rate=0).run()
+
+        assert summary['status'] == 'completed'
+        assert summary['succeeded'] == 2
+        assert stub.guests['g-a1']['ends_at'] == '2026-05-17T22:00:00Z'
+        assert db.collections['active_autopays']['C1']['expireAt'] == EST.localize(datetime(2026, 5, 17, 22, 5))
+
+    def test_extension_across_dst_keeps_1005_pm_eastern(self, gym):
+        _, db = gym
+        BulkOperation(db, RemoteLockClient(), EXTEND, days=2, rate=0).run()
+        expiry = db.collections['active_autopays']['C2']['expireAt']
+        assert expiry.astimezone(EST).hour == 22 and expiry.astimezone(EST).minute == 5
+        assert expiry.utcoffset() == timedelta(hours=-4)
+
+    def test_firestore_writes_are_batched(self, gym):
+        _, db = gym
+        BulkOperation(db, RemoteLockClient(), EXTEND, days=1, rate=0).run()
+        assert db.batch_commits == 1
+
+    def test_ticket_codes_extended_from_remotelock_ends_at_once_per_guest(self, gym):
+        stub, db = gym
+        summary = BulkOperation(db, RemoteLockClient(), EXTEND, days=1, rate=0,
+                                collections=('active_autopays', 'pin_change_tickets')).run()
+
+        assert summary['processed'] == 3
+        assert stub.guests['g-w1']['ends_at'] == '2026-05-07T22:00:00Z'
+        assert stub.guests['g-a1']['ends_at'] == '2026-05-16T22:00:00Z'
+
+    def test_partial_failure_keeps_going_and_is_reported(self, gym):
+        stub, db = gym
+        stub.fail_ids.add('g-a1')
+        operation = BulkOperation(db, RemoteLockClient(), EXTEND, days=2, rate=0, job_id='job-1')
+
+        summary = operation.run()
+
+        assert summary['status'] == 'completed_with_errors'
+        assert summary['failed'] == 1 and summary['succeeded'] == 1
+        assert stub.guests['g-a2']['ends_at'] == '2026-03-09T22:00:00Z'
+        job = db.collections[JOB_COLLECTION]['job-1']
+        assert job['status'] == 'completed_with_errors'
+        assert job['errors'][0]['guest_id'] == 'g-a1'
+
+    def test_dry_run_changes_nothing(self, gym):
+        stub, db = gym
+        summary = BulkOperation(db, RemoteLockClient(), EXTEND, days=2, rate=0, dry_run=True).run()
+        assert summary['succeeded'] == 2
+        assert stub.count('PUT', '/access_persons') == 0
+        assert db.collections['active_autopays']['C1']['expireAt'].day == 15
+
+
+class TestBulkRevoke:
+    def test_revoke_ends_access_now_and_removes_tracking(self, gym):
+        stub, db = gym
+        BulkOperation(db, RemoteLockClient(), REVOKE, rate=0).run()
+
+        ends = datetime.fromisoformat(stub.guests['g-a1']['ends_at'].replace('Z', '+00:00'))
+        eastern_wall_time = datetime.now(EST).replace(tzinfo=timezone.utc)
+        assert abs(ends - eastern_wall_time) < timedelta(minutes=1)
+        assert db.collections['active_autopays'] == {}
+
+    def test_revoke_removes_every_document_for_a_guest_once(self, gym):
+        stub, db = gym
+        summary = BulkOperation(db, RemoteLockClient(), REVOKE, rate=0,
+                                collections=('active_autopays', 'pin_change_tickets')).run()
+
+        assert summary['processed'] == 3
+        assert stub.count('PUT', '/access_persons/g-a1') == 1
+        assert db.collections['active_autopays'] == {}
+        assert db.collections['pin_change_tickets'] == {}
+
+    def test_revoke_never_ends_before_access_starts(self, gym):
+        stub, db = gym
+        starts = (datetime.now(EST) + timedelta(days=1)).replace(microsecond=0, tzinfo=timezone.utc)
+        stub.guests['g-a2']['starts_at'] = starts.isoformat().replace('+00:00', 'Z')
+        BulkOperation(db, RemoteLockClient(), REVOKE, rate=0).run()
+
+        assert stub.guests['g-a2']['ends_at'] == stub.guests['g-a2']['starts_at']
+
+
+class TestBulkValidation:
+    @pytest.mark.parametrize('kwargs', [
+        {'action': 'explode'},
+        {'action': EXTEND, 'days': 0},
+        {'action': EXTEND, 'days': 1, 'collections': ('processed_transactions',)},
+    ])
+    def test_invalid_requests_rejected(self, kwargs):
+        with pytest.raises(ValueError):
+            BulkOperation(MagicMock(), MagicMock(), **kwargs)
+
+
+class TestBulkCli:
+    def test_cli_extend(self, gym, monkeypatch, capsys):
+        stub, db = gym
+        monkeypatch.setattr('bstrong.database.Database', lambda: db)
+        assert main(['extend', '--days', '3', '--rate', '0']) == 0
+        assert stub.guests['g-a1']['ends_at'] == '2026-05-18T22:00:00Z'
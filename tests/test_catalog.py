@@ -0,0 +1,110 @@
+import pytest
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+from bstrong.catalog import MembershipCatalog, DAY_PASS, MONTHLY, FIXED, UNKNOWN
+from bstrong.config import MEMBERSHIP_DURATIONS
+
+ITEMS = [
+    'day pass', 'Day Pass', 'day pass (not a class) - 4am-10pm for one individual, for one calendar day.',
+    '1 month gym membership', 'monthly autopay membership', 'Monthly AutoPay - 4am-10pm',
+    '1 week pass', '2 week pass', '3 week pass', 'weekend warrior', 'best rate!!! one year (pif)',
+    'yoga class', 'mystery plan', '',
+]
+
+
+def _legacy_relevant(purchase_type, item_sold):
+    return (purchase_type == "Membership"
+            or (purchase_type == "Class" and "day pass" in item_sold and "4am-10pm" in item_sold)
+            or (purchase_type == "Package" and item_sold == "day pass"))
+
+
+def _legacy_kind(item_sold):
+    if "day pass" in item_sold:
+        return DAY_PASS
+    if "1 month" in item_sold:
+        return MONTHLY
+    return FIXED if item_sold in MEMBERSHIP_DURATIONS else UNKNOWN
+
+
+def _firestore_docs(*entries):
+    docs = []
+    for entry in entries:
+        doc = MagicMock()
+        doc.to_dict.return_value = entry
+        docs.append(doc)
+    db = MagicMock()
+    db.getCollection.return_value = docs
+    return db
+
+
+class TestMembershipCatalog:
+    @pytest.mark.parametrize('item', ITEMS)
+    def test_matches_legacy_substring_rules(self, item):
+        catalog = MembershipCatalog()
+        item_sold = item.lower()
+        product = catalog.classify(item)
+
+        assert product.kind == _legacy_kind(item_sold)
+        assert product.autopay == ("monthly" in item_sold and "autopay" in item_sold)
+        assert product.is_day_pass == ("day pass" in item_sold)
+        for purchase_type in ('Membership', 'Class', 'Package', 'Service', None):
+            assert catalog.is_relevant(purchase_type, item) == _legacy_relevant(purchase_type, item_sold)
+
+    def test_fixed_durations_compiled(self):
+        catalog = MembershipCatalog()
+        assert catalog.classify('2 Week Pass').duration == timedelta(weeks=2)
+
+    def test_whitespace_normalized(self):
+        catalog = MembershipCatalog()
+        assert catalog.classify('  1   week  pass ').kind == FIXED
+
+    def test_fallback_result_memoized(self):
+        catalog = MembershipCatalog()
+        first = catalog.classify('Summer 1 Month Special')
+        assert catalog.classify('Summer 1 Month Special') is first
+        assert catalog.classify('summer  1 month special') == first
+        assert first.kind == MONTHLY
+
+    def test_learned_cache_is_bounded(self):
+        catalog = MembershipCatalog(max_learned=3)
+        for i in range(10):
+            catalog.classify(f'mystery {i}')
+        assert len(catalog._learned) <= 3
+
+    def test_firestore_entries_add_new_products(self):
+        catalog = MembershipCatalog()
+        assert catalog.classify('6 week challenge').kind == UNKNOWN
+
+        loaded = catalog.load(_firestore_docs({'name': '6 Week Challenge', 'kind': FIXED, 'days': 42}))
+
+        product = catalog.classify('6 week challenge')
+        assert loaded == 1
+        assert product.kind == FIXED
+        assert product.duration == timedelta(days=42)
+
+    def test_firestore_entries_can_widen_purchase_types(self):
+        catalog = MembershipCatalog()
+        catalog.load(_firestore_docs({'name': 'open gym', 'kind': DAY_PASS, 'purchase_types': ['Class']}))
+        assert catalog.is_relevant('Class', 'Open Gym')
+        assert catalog.is_relevant('Membership', 'Open Gym')
+
+    def test_load_failure_keeps_current_index(self):
+        catalog = MembershipCatalog()
+        catalog.load(_firestore_docs({'name': 'open gym', 'kind': DAY_PASS}))
+        db = MagicMock()
+        db.getCollection.side_effect = Exception("Firestore down")
+
+        assert catalog.load(db) == 0
+        assert catalog.classify('open gym').kind == DAY_PASS
+
+    def test_background_refresh_loads_and_stops(self):
+        catalog = MembershipCatalog()
+        db = _firestore_docs({'name': 'open gym', 'kind': DAY_PASS})
+        catalog.start_refresh(db, interval=60)
+        catalog.stop_refresh()
+        catalog._thread.join(timeout=5)
+
+        assert not catalog._thread.is_alive()
+        db.getCollection.assert_called_with('membership_catalog')
+        assert catalog.classify('open gym').kind == DAY_PASS
@@ -0,0 +1,16 @@
+"""
+The Cloudflare worker's own suite (cloudflare/test, node:test against a local
+Vagaro stand-in), run here so it is part of the regular test run.
+"""
+import os
+import shutil
+import subprocess
+import pytest
+
+WORKER_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cloudflare")
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node is not installed")
+def test_worker_suite():
+    result = subprocess.run(["node", "--test", "test/"], cwd=WORKER_DIR, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stdout + result.stderr
@@ -0,0 +1,100 @@
+import threading
+import time
+from unittest.mock import patch
+
+from bstrong import compat
+from bstrong.api_clients import RemoteLockClient
+from bstrong.config import Config, CONFIG_FAILURE_TTL_SECONDS
+from tests.test_api_clients import mock_response
+
+
+def _concurrently(func, count=8):
+    barrier = threading.Barrier(count)
+    results = []
+
+    def run():
+        barrier.wait()
+        results.append(func())
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+# ---- gevent detection -----------------------------------------------------
+
+class TestCooperativeDetection:
+    def test_not_cooperative_without_monkeypatching(self):
+        assert compat.cooperative() is False
+        assert compat.init_cooperative() is False
+
+    def test_init_switches_grpc_once(self):
+        with patch.object(compat, 'cooperative', return_value=True), \
+             patch.object(compat, '_initialized', False), \
+             patch('grpc.experimental.gevent.init_gevent') as init_gevent:
+            assert compat.init_cooperative() is True
+            assert compat.init_cooperative() is True
+        init_gevent.assert_called_once()
+
+
+# ---- Shared state under concurrent callers ---------------------------------
+
+class TestConcurrentFirstUse:
+    def test_config_fetches_each_secret_once(self):
+        def slow_secret(key):
+            time.sleep(0.05)
+            return f'value-{key}'
+
+        with patch('bstrong.config.get_secret', side_effect=slow_secret) as get_secret, \
+             patch.dict(Config._secrets, clear=False):
+            Config._secrets.pop('COMPAT_TEST_KEY', None)
+            results = _concurrently(lambda: Config.get('COMPAT_TEST_KEY'))
+
+        assert set(results) == {'value-COMPAT_TEST_KEY'}
+        get_secret.assert_called_once_with('COMPAT_TEST_KEY')
+
+    def test_slow_secret_does_not_hold_up_other_keys(self):
+        release = threading.Event()
+
+        def secret(key):
+            if key == 'COMPAT_SLOW_KEY':
+                release.wait(5)
+            return f'value-{key}'
+
+        with patch('bstrong.config.get_secret', side_effect=secret), patch.dict(Config._secrets, clear=False):
+            for key in ('COMPAT_SLOW_KEY', 'COMPAT_FAST_KEY'):
+                Config._secrets.pop(key, None)
+            slow = threading.Thread(target=Config.get, args=('COMPAT_SLOW_KEY',))
+            slow.start()
+            try:
+                assert Config.get('COMPAT_FAST_KEY') == 'value-COMPAT_FAST_KEY'
+            finally:
+                release.set()
+                slow.join(5)
+
+    def test_failed_fetch_is_remembered_briefly(self):
+        with patch('bstrong.config.get_secret', side_effect=RuntimeError("denied")) as get_secret, \
+             patch.dict(Config._failures, clear=True), patch('bstrong.config.time.monotonic', return_value=1000.0) as now:
+            assert Config.get('COMPAT_MISSING_KEY') is None
+            assert Config.get('COMPAT_MISSING_KEY') is None
+            assert get_secret.call_count == 1
+
+            now.return_value += CONFIG_FAILURE_TTL_SECONDS
+            assert Config.get('COMPAT_MISSING_KEY') is None
+            assert get_secret.call_count == 2
+
+    def test_remotelock_token_refreshed_once(self):
+        client = RemoteLockClient()
+
+        def slow_post(*args, **kwargs):
+            time.sleep(0.05)
+            return mock_response(200, {'access_token': 'tok', 'expires_in': 3600})
+
+        with patch('bstrong.api_clients.requests.post', side_effect=slow_post) as post:
+            results = _concurrently(client._get_token)
+
+        assert set(results) == {'tok'}
+        post.assert_called_once()
@@ -0,0 +1,301 @@
+import pytest
+import requests as req_lib
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+
+from bstrong.deadletter import DeadLetterQueue, PermanentFailure, DEAD_LETTER_COLLECTION, PENDING, RESOLVED, FAILED
+from tests.conftest import TEST_CONFIG, flask_app
+from tests.fakes import InMemoryDatabase
+
+T0 = datetime(2026, 4, 29, 14, 0, tzinfo=timezone.utc)
+BULK_TOKEN = TEST_CONFIG['BULK_OPS_TOKEN']
+TRANSACTION_TOKEN = TEST_CONFIG['TRANSACTION_TOKEN']
+
+
+class Clock:
+    def __init__(self):
+        self.now = T0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+def make_queue(db, clock, replay=None, **kwargs):
+    give_up = MagicMock()
+    queue = DeadLetterQueue(db, replay or MagicMock(), give_up, backoff=60, max_backoff=300, clock=clock, **kwargs)
+    return queue, give_up
+
+
+def entry(db, key):
+    return db.collections[DEAD_LETTER_COLLECTION][key]
+
+
+class TestDeadLetterQueue:
+    def test_capture_records_context_due_after_backoff(self, clock):
+        db = InMemoryDatabase()
+        queue, _ = make_queue(db, clock)
+
+        queue.capture('P1', {'customer_id': 'C1'}, 'create_door_code', 'Timeout')
+
+        assert entry(db, 'P1') | {'created': None} == {
+            'customer_id': 'C1', 'stage': 'create_door_code', 'error': 'Timeout', 'status': PENDING,
+            'attempts': 0, 'next_attempt': T0 + timedelta(seconds=60), 'created': None,
+        }
+        assert queue.replay_due() == {PENDING: 0, RESOLVED: 0, FAILED: 0}
+
+    def test_due_entry_is_replayed_and_resolved(self, clock):
+        db = InMemoryDatabase()
+        replay = MagicMock()
+        queue, give_up = make_queue(db, clock, replay)
+        queue.capture('P1', {'customer_id': 'C1'}, 'create_door_code', 'Timeout')
+        clock.advance(60)
+
+        assert queue.replay_due()[RESOLVED] == 1
+        replay.assert_called_once()
+        assert replay.call_args.args[0] == 'P1'
+        assert (entry(db, 'P1')['status'], entry(db, 'P1')['attempts']) == (RESOLVED, 1)
+        give_up.assert_not_called()
+
+    def test_failures_back_off_exponentially_up_to_the_cap(self, clock):
+        db = InMemoryDatabase()
+        queue, _ = make_queue(db, clock, MagicMock(side_effect=RuntimeError("still down")), max_attempts=10)
+        queue.capture('P1', {}, 'create_door_code', 'Timeout')
+
+        delays = []
+        for _ in range(4):
+            clock.now = entry(db, 'P1')['next_attempt']
+            assert queue.replay_due()[PENDING] == 1
+            delays.append((entry(db, 'P1')['next_attempt'] - clock.now).total_seconds())
+
+        assert delays == [120, 240, 300, 300]
+        assert entry(db, 'P1')['error'] == 'still down'
+
+    def test_gives_up_after_max_attempts_and_reports_once(self, clock):
+        db = InMemoryDatabase()
+        queue, give_up = make_queue(db, clock, MagicMock(side_effect=RuntimeError("still down")), max_attempts=2)
+        queue.capture('P1', {'first_name': 'John'}, 'create_door_code', 'Timeout')
+
+        for _ in range(3):
+            clock.advance(3600)
+            queue.replay_due()
+
+        assert entry(db, 'P1')['status'] == FAILED
+        give_up.assert_called_once()
+        key, failed = give_up.call_args.args
+        assert (key, failed['first_name'], failed['attempts']) == ('P1', 'John', 2)
+
+    def test_permanent_failure_is_not_retried(self, clock):
+        db = InMemoryDatabase()
+        replay = MagicMock(side_effect=PermanentFailure("no phone"))
+        queue, give_up = make_queue(db, clock, replay)
+        queue.capture('P1', {}, 'vagaro_fallback', 'Vagaro down')
+        clock.advance(60)
+
+        assert queue.replay_due()[FAILED] == 1
+        assert entry(db, 'P1')['error'] == 'no phone'
+        give_up.assert_called_once()
+
+    def test_claimed_entry_is_leased(self, clock):
+        db = InMemoryDatabase()
+        queue, _ = make_queue(db, clock)
+        queue.capture('P1', {}, 'create_door_code', 'Timeout')
+
+        now = T0 + timedelta(seconds=60)
+        assert db.claimDue(DEAD_LETTER_COLLECTION, now, now + timedelta(seconds=300)).id == 'P1'
+        assert db.claimDue(DEAD_LETTER_COLLECTION, now, now + timedelta(seconds=300)) is None
+        assert db.claimDue(DEAD_LETTER_COLLECTION, now + timedelta(seconds=300), now).id == 'P1'
+
+    def test_requeue_makes_entries_due_and_revives_failed_on_request(self, clock):
+        db = InMemoryDatabase()
+        queue, _ = make_queue(db, clock)
+        for key in ('P1', 'P2', 'P3'):
+            queue.capture(key, {}, 'create_door_code', 'Timeout')
+        db.update(DEAD_LETTER_COLLECTION, 'P2', {'status': FAILED, 'attempts': 6})
+        db.update(DEAD_LETTER_COLLECTION, 'P3', {'status': RESOLVED})
+
+        assert queue.requeue(['P1', 'P2']) == 1
+        assert queue.requeue(include_failed=True) == 2
+        assert (entry(db, 'P2')['status'], entry(db, 'P2')['attempts']) == (PENDING, 0)
+        assert entry(db, 'P1')['next_attempt'] == T0
+        assert [e['id'] for e in queue.entries(PENDING)] == ['P1', 'P2']
+
+
+def transaction(customer_id='CUST1', payment_id='PAY1', item='1 week pass'):
+    return {'payload': {'itemSold': item, 'customerId': customer_id, 'purchaseType': 'Membership', 'userPaymentId': payment_id}}
+
+
+@pytest.fixture
+def dead_letter_app(app_client, monkeypatch):
+    """The Flask app on an in-memory Firestore, with one member's form already submitted."""
+    client, _, mock_rl, mock_vagaro = app_client
+    db = InMemoryDatabase()
+    db.add('pending_customers', 'CUST1', {'first_name': 'John', 'last_name': 'Doe', 'phone_number': '5085551234'})
+    monkeypatch.setattr(flask_app, 'dataBase', db)
+    monkeypatch.setattr(flask_app.dead_letters, 'db', db)
+    return client, db, mock_rl, mock_vagaro
+
+
+def post_transaction(client, **kwargs):
+    return client.post('/webhook-transaction', json=transaction(**kwargs), headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+
+
+def replay_now(db):
+    db.update(DEAD_LETTER_COLLECTION, 'PAY1', {'next_attempt': datetime.now(timezone.utc)})
+    return flask_app.dead_letters.replay_due()
+
+
+class TestTransactionDeadLetters:
+    def test_failed_provisioning_is_dead_lettered_without_alerting_owners(self, dead_letter_app):
+        client, db, mock_rl, _ = dead_letter_app
+        mock_rl.create_access_person.side_effect = req_lib.exceptions.RequestException("Timeout")
+
+        with patch('app.alert_owners') as mock_owners:
+            resp = post_transaction(client)
+
+        assert resp.status_code == 500
+        mock_owners.assert_not_called()
+        letter = entry(db, 'PAY1')
+        assert {k: letter[k] for k in ('customer_id', 'item_sold', 'first_name', 'last_name', 'phone', 'stage', 'status')} == {
+            'customer_id': 'CUST1', 'item_sold': '1 week pass', 'first_name': 'John', 'last_name': 'Doe',
+            'phone': '+15085551234', 'stage': 'create_door_code', 'status': PENDING,
+        }
+        assert letter['owner_message'] == "John Doe didn't get a door code."
+
+    def test_replay_provisions_once_the_vendor_recovers(self, dead_letter_app):
+        client, db, mock_rl, _ = dead_letter_app
+        mock_rl.create_access_person.side_effect = req_lib.exceptions.RequestException("Timeout")
+        post_transaction(client)
+
+        mock_rl.create_access_person.side_effect = None
+        mock_rl.create_access_person.return_value = ('guest-1', '4321')
+        with patch('bstrong.services.send_sms', return_value=True) as mock_sms:
+            assert replay_now(db)[RESOLVED] == 1
+
+        assert '4321' in mock_sms.call_args.kwargs['body']
+        assert db.collections['processed_transactions']['PAY1']['provisioned'] is True
+        assert db.collections['pin_change_tickets']['+15085551234']['remote_lock_id'] == 'guest-1'
+        assert entry(db, 'PAY1')['status'] == RESOLVED
+
+    def test_replay_resends_the_text_for_the_guest_already_created(self, dead_letter_app):
+        client, db, mock_rl, _ = dead_letter_app
+        mock_rl.create_access_person.return_value = ('guest-1', '4321')
+        mock_rl.get_access_person.return_value = {'pin': '4321'}
+        with patch('bstrong.services.send_sms', return_value=False):
+            post_transaction(client)
+            assert (entry(db, 'PAY1')['stage'], entry(db, 'PAY1')['guest_id']) == ('send_sms', 'guest-1')
+            assert replay_now(db)[PENDING] == 1
+
+        with patch('bstrong.services.send_sms', return_value=True) as mock_sms:
+            assert replay_now(db)[RESOLVED] == 1
+
+        mock_rl.create_access_person.assert_called_once()
+        mock_rl.grant_lock_access.assert_called_once()
+        assert '4321' in mock_sms.call_args.kwargs['body']
+        assert db.collections['pin_change_tickets']['+15085551234']['remote_lock_id'] == 'guest-1'
+
+    def test_guest_created_on_replay_is_kept_for_the_next_one(self, dead_letter_app):
+        client, db, mock_rl, _ = dead_letter_app
+        mock_rl.create_access_person.side_effect = req_lib.exceptions.RequestException("Timeout")
+        post_transaction(client)
+
+        mock_rl.create_access_person.side_effect = None
+        mock_rl.create_access_person.return_value = ('guest-1', '4321')
+        with patch('bstrong.services.send_sms', return_value=False):
+            assert replay_now(db)[PENDING] == 1
+
+        assert (entry(db, 'PAY1')['stage'], entry(db, 'PAY1')['guest_id']) == ('send_sms', 'guest-1')
+
+    def test_replay_skips_transactions_already_provisioned(self, dead_letter_app):
+        client, db, mock_rl, _ = dead_letter_app
+        mock_rl.create_access_person.side_effect = req_lib.exceptions.RequestException("Timeout")
+        post_transaction(client)
+        db.add('processed_transactions', 'PAY1', {'provisioned': True})
+        mock_rl.reset_mock()
+
+        assert replay_now(db)[RESOLVED] == 1
+        mock_rl.create_access_person.assert_not_called()
+
+    def test_vagaro_outage_is_replayed_through_the_profile_lookup(self, dead_letter_app):
+        client, db, mock_rl, mock_vagaro = dead_letter_app
+        mock_vagaro.get_customer_details.side_effect = RuntimeError("Vagaro down")
+        post_transaction(client, customer_id='CUST2')
+        assert (entry(db, 'PAY1')['stage'], entry(db, 'PAY1')['phone']) == ('vagaro_fallback', None)
+
+        mock_vagaro.get_customer_details.side_effect = None
+        mock_vagaro.get_customer_details.return_value = {'customerFirstName': 'Ann', 'customerLastName': 'Lee', 'mobilePhone': '5085559876'}
+        mock_rl.create_access_person.return_value = ('guest-2', '1111')
+
+        assert replay_now(db)[RESOLVED] == 1
+        assert mock_rl.create_access_person.call_args.kwargs['name'] == 'Ann Lee'
+
+    def test_permanent_failure_alerts_the_owners(self, dead_letter_app, monkeypatch):
+        client, db, mock_rl, _ = dead_letter_app
+        monkeypatch.setattr(flask_app.dead_letters, 'max_attempts', 1)
+        mock_rl.create_access_person.side_effect = req_lib.exceptions.RequestException("Timeout")
+        post_transaction(client)
+
+        with patch('app.alert_owners') as mock_owners, patch('app.send_Dev') as mock_dev:
+            assert replay_now(db)[FAILED] == 1
+
+        mock_owners.assert_called_once_with("John Doe didn't get a door code.")
+        assert 'PAY1' in mock_dev.call_args.args[0]
+
+    def test_owners_are_alerted_at_once_when_capture_fails(self, app_client):
+        client, mock_db, mock_rl, mock_vagaro = app_client
+        mock_db.checkIfExists.return_value = False
+        mock_db.getData.return_value = MagicMock(exists=False)
+        mock_db.add.side_effect = RuntimeError("Firestore down")
+        mock_vagaro.get_customer_details.side_effect = RuntimeError("Vagaro down")
+
+        with patch('app.alert_owners') as mock_owners:
+            resp = post_transaction(client)
+
+        assert resp.status_code == 500
+        mock_owners.assert_called_once_with("Failed to send code to Unknown Customer")
+
+
+class TestDeadLetterEndpoints:
+    def test_bad_token_rejected(self, dead_letter_app):
+        client, *_ = dead_letter_app
+        assert client.get('/dead-letters', headers={'X-Bulk-Token': 'wrong'}).status_code == 403
+        assert client.post('/dead-letters/replay', json={}, headers={'X-Bulk-Token': 'wrong'}).status_code == 403
+
+    def test_lists_entries_by_status(self, dead_letter_app):
+        client, db, mock_rl, _ = dead_letter_app
+        mock_rl.create_access_person.side_effect = req_lib.exceptions.RequestException("Timeout")
+        post_transaction(client)
+
+        resp = client.get('/dead-letters?status=pending', headers={'X-Bulk-Token': BULK_TOKEN})
+
+        assert resp.status_code == 200
+        assert [e['id'] for e in resp.get_json()['dead_letters']] == ['PAY1']
+        assert client.get('/dead-letters?status=failed', headers={'X-Bulk-Token': BULK_TOKEN}).get_json() == {'dead_letters': []}
+
+    def test_bulk_replay_requeues_and_replays_in_background(self, dead_letter_app):
+        client, db, mock_rl, _ = dead_letter_app
+        mock_rl.create_access_person.side_effect = req_lib.exceptions.RequestException("Timeout")
+        post_transaction(client)
+        db.update(DEAD_LETTER_COLLECTION, 'PAY1', {'status': FAILED})
+        mock_rl.create_access_person.side_effect = None
+        mock_rl.create_access_person.return_value = ('guest-1', '4321')
+
+        with patch('app.threading.Thread') as mock_thread:
+            resp = client.post('/dead-letters/replay', json={'include_failed': True}, headers={'X-Bulk-Token': BULK_TOKEN})
+        assert (resp.status_code, resp.get_json()) == (202, {'requeued': 1})
+        mock_thread.return_value.start.assert_called_once()
+        mock_thread.call_args.kwargs['target'](**mock_thread.call_args.kwargs['kwargs'])
+
+        assert entry(db, 'PAY1')['status'] == RESOLVED
+
+    def test_invalid_ids_return_400(self, dead_letter_app):
+        client, *_ = dead_letter_app
+        resp = client.post('/dead-letters/replay', json={'ids': 'PAY1'}, headers={'X-Bulk-Token': BULK_TOKEN})
+        assert resp.status_code == 400
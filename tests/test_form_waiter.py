@@ -0,0 +1,85 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+from bstrong.form_waiter import FormWaiter, PENDING_COLLECTION
+from bstrong.metrics import FORM_WAIT
+
+
+class TestFormWaiter:
+    def test_notify_wakes_the_waiter(self):
+        waiter = FormWaiter(timeout=5)
+        threading.Timer(0.02, waiter.notify, ['C1']).start()
+
+        started = time.monotonic()
+        assert waiter.wait('C1') is True
+        assert time.monotonic() - started < 1
+        assert waiter.waiting() == 0
+
+    def test_wait_times_out(self):
+        waiter = FormWaiter(timeout=0.02)
+        assert waiter.wait('C1') is False
+        assert waiter.waiting() == 0
+
+    def test_other_customers_do_not_wake_it(self):
+        waiter = FormWaiter(timeout=0.05)
+        threading.Timer(0.01, waiter.notify, ['C2']).start()
+        assert waiter.wait('C1') is False
+
+    def test_every_waiter_for_a_customer_wakes(self):
+        waiter = FormWaiter(timeout=5)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(waiter.wait('C1'))) for _ in range(3)]
+        for t in threads:
+            t.start()
+        while waiter.waiting() < 3:
+            time.sleep(0.005)
+        waiter.notify('C1')
+        for t in threads:
+            t.join(5)
+        assert results == [True, True, True]
+
+    def test_form_stored_just_before_the_wait_counts(self):
+        waiter = FormWaiter(timeout=5)
+        waiter.notify('C1')
+        assert waiter.wait('C1') is True
+
+    def test_arrivals_are_forgotten_after_the_window(self):
+        waiter = FormWaiter(timeout=0.02)
+        waiter.notify('C1')
+        time.sleep(0.05)
+        waiter.notify('C2')
+        assert list(waiter._arrived) == ['C2']
+        assert waiter.wait('C1') is False
+
+    def test_disabled_waiter_ignores_notifications(self):
+        waiter = FormWaiter(timeout=0)
+        assert not waiter.enabled
+        waiter.notify('C1')
+        assert waiter._arrived == {}
+
+    def test_listener_notifies_added_forms(self):
+        waiter = FormWaiter(timeout=5)
+        db = MagicMock()
+        waiter.start_listening(db)
+        collection, on_change = db.watchCollection.call_args.args
+        assert collection == PENDING_COLLECTION
+
+        on_change(['C1'], ['C2'])
+        assert waiter.wait('C1') is True
+        waiter.stop()
+        db.watchCollection.return_value.unsubscribe.assert_called_once()
+
+    def test_listener_failure_is_not_fatal(self):
+        db = MagicMock()
+        db.watchCollection.side_effect = RuntimeError("no listener")
+        waiter = FormWaiter(timeout=5)
+        waiter.start_listening(db)
+        waiter.stop()
+
+    def test_record(self):
+        before = {r: FORM_WAIT.value(result=r) for r in ('avoided', 'unusable', 'missed')}
+        FormWaiter.record(True, True)
+        FormWaiter.record(True, False)
+        FormWaiter.record(False, False)
+        assert {r: FORM_WAIT.value(result=r) - before[r] for r in before} == {'avoided': 1, 'unusable': 1, 'missed': 1}
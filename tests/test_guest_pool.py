@@ -0,0 +1,131 @@
+import pytest
+import requests as req_lib
+from datetime import datetime, timedelta, timezone
+from freezegun import freeze_time
+from unittest.mock import MagicMock, patch
+
+from bstrong.api_clients import RemoteLockClient, LOCK_SCHEDULE_ID
+from bstrong.guest_pool import GuestPool, PooledGuest, POOL_COLLECTION, REPLENISH_LEASE_KEY
+from bstrong.singleflight import LEASE_COLLECTION
+from bstrong.services import create_door_code
+from tests.fakes import InMemoryDatabase
+from tests.stubs import RemoteLockStub
+
+
+@pytest.fixture
+def remotelock(monkeypatch):
+    with RemoteLockStub() as stub:
+        monkeypatch.setattr('bstrong.api_clients.REMOTELOCK_BASE_URL', stub.url)
+        monkeypatch.setattr('bstrong.api_clients.REMOTELOCK_TOKEN_URL', f"{stub.url}/oauth/token")
+        yield stub
+
+
+class TestGuestPool:
+    def test_replenish_fills_to_target_with_parked_guests(self, remotelock):
+        db = InMemoryDatabase()
+        pool = GuestPool(db, RemoteLockClient(), target_size=3)
+
+        assert pool.replenish() == 3
+        assert pool.replenish() == 0
+        assert db.countDocuments(POOL_COLLECTION) == 3
+        for guest_id in db.collections[POOL_COLLECTION]:
+            guest = remotelock.guests[guest_id]
+            assert guest['name'].startswith('B-STRONG POOL')
+            assert guest['starts_at'] > '2030'
+            assert remotelock.accesses[guest_id][0]['accessible_id'] == 'test-lock-id'
+
+    def test_replenish_waits_for_another_instances_lease(self):
+        db = InMemoryDatabase()
+        db.add(LEASE_COLLECTION, REPLENISH_LEASE_KEY, {'owner': 'other-instance', 'expires': datetime.now(timezone.utc) + timedelta(minutes=1)})
+        mock_rl = MagicMock()
+
+        assert GuestPool(db, mock_rl, target_size=3).replenish() == 0
+        mock_rl.create_access_person.assert_not_called()
+
+    def test_replenish_releases_its_lease(self):
+        db = InMemoryDatabase()
+        mock_rl = MagicMock()
+        mock_rl.create_access_person.return_value = ('g-1', '1234')
+
+        assert GuestPool(db, mock_rl, target_size=1).replenish() == 1
+        assert REPLENISH_LEASE_KEY not in db.collections[LEASE_COLLECTION]
+
+    def test_claim_returns_guest_and_wakes_replenisher(self):
+        db = InMemoryDatabase()
+        db.add(POOL_COLLECTION, 'g-1', {'pin': '1234'})
+        pool = GuestPool(db, MagicMock(), target_size=1)
+
+        assert pool.claim() == PooledGuest('g-1', '1234')
+        assert pool._wake.is_set()
+        assert pool.claimed == 1
+
+    def test_empty_pool_claim_returns_none(self):
+        pool = GuestPool(InMemoryDatabase(), MagicMock(), target_size=1)
+        assert pool.claim() is None
+        assert pool.misses == 1
+
+    def test_firestore_failure_degrades_to_none(self):
+        db = MagicMock()
+        db.claimOne.side_effect = Exception("Firestore down")
+        pool = GuestPool(db, MagicMock(), target_size=1)
+        assert pool.claim() is None
+
+    def test_ungranted_pool_guest_is_deleted(self, remotelock):
+        rl = RemoteLockClient()
+        pool = GuestPool(InMemoryDatabase(), rl, target_size=1)
+
+        with patch('bstrong.guest_pool.grant_locks') as grant:
+            grant.return_value.failed = {'lock': RuntimeError('offline')}
+            with pytest.raises(RuntimeError):
+                pool.provision_one()
+
+        assert remotelock.guests == {}
+
+
+class TestCreateDoorCodeWithPool:
+    @freeze_time("2026-04-29 14:00:00")
+    def test_pooled_guest_activated_with_one_update(self, remotelock):
+        db = InMemoryDatabase()
+        rl = RemoteLockClient()
+        pool = GuestPool(db, rl, target_size=1)
+        pool.replenish()
+        pooled_id = next(iter(db.collections[POOL_COLLECTION]))
+        creates_before = remotelock.count('POST', '/access_persons')
+
+        with patch('bstrong.services.send_sms', return_value=True) as mock_sms:
+            success, guest_id = create_door_code('John', 'Doe', '+15085551234', '1 week pass', rl, guest_pool=pool)
+
+        assert success is True
+        assert guest_id == pooled_id
+        assert remotelock.count('POST', '/access_persons') == creates_before
+        assert remotelock.count('PUT', '/access_persons') == 1
+        assert remotelock.guests[pooled_id]['name'] == 'John Doe'
+        assert remotelock.guests[pooled_id]['starts_at'].startswith('2026-04-29T04:00')
+        assert remotelock.guests[pooled_id]['pin'] in mock_sms.call_args.kwargs['body']
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_empty_pool_falls_back_to_create_and_grant(self):
+        mock_rl = MagicMock()
+        mock_rl.create_access_person.return_value = ('guest-new', '4321')
+        pool = GuestPool(InMemoryDatabase(), mock_rl, target_size=1)
+
+        with patch('bstrong.services.send_sms', return_value=True):
+            success, guest_id = create_door_code('John', 'Doe', '+15085551234', '1 week pass', mock_rl, guest_pool=pool)
+
+        assert (success, guest_id) == (True, 'guest-new')
+        mock_rl.grant_lock_access.assert_called_once_with('guest-new', 'test-lock-id', LOCK_SCHEDULE_ID)
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_failed_activation_falls_back_to_create(self):
+        db = InMemoryDatabase()
+        db.add(POOL_COLLECTION, 'g-pooled', {'pin': '1111'})
+        mock_rl = MagicMock()
+        mock_rl.update_access_person.side_effect = req_lib.exceptions.RequestException("Timeout")
+        mock_rl.create_access_person.return_value = ('guest-new', '4321')
+
+        with patch('bstrong.services.send_sms', return_value=True):
+            success, guest_id = create_door_code('John', 'Doe', '+15085551234', '1 week pass', mock_rl,
+                                                 guest_pool=GuestPool(db, mock_rl, target_size=1))
+
+        assert (success, guest_id) == (True, 'guest-new')
+        mock_rl.delete_access_person.assert_called_once_with('g-pooled')
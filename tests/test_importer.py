@@ -0,0 +1,231 @@
+import csv
+import json
+import pytest
+from datetime import date
+from freezegun import freeze_time
+from unittest.mock import MagicMock, patch
+
+from bstrong.api_clients import RemoteLockClient
+from bstrong.batch import Checkpoint
+from bstrong.importer import (
+    MemberImporter, MemberRow, main, normalize_phones, read_members,
+    IMPORTED, INVALID_PHONE, UNKNOWN_MEMBERSHIP, DUPLICATE, INCOMPLETE, EXPIRED, FAILED,
+)
+from bstrong.topology import get_topology
+from bstrong.utils import fix_phone_number
+from tests.fakes import InMemoryDatabase
+from tests.stubs import RemoteLockStub
+
+MEMBERS = [
+    {'customer_id': 'C1', 'first_name': 'John', 'last_name': 'Doe', 'phone': '(508) 555-1234', 'membership': '1 week pass', 'expires': ''},
+    {'customer_id': 'C2', 'first_name': 'Jane', 'last_name': 'Roe', 'phone': '508.555.9876', 'membership': 'monthly autopay membership', 'expires': ''},
+    {'customer_id': 'C3', 'first_name': 'Sam', 'last_name': 'Poe', 'phone': '5085550000', 'membership': 'Best Rate!!! One Year (PIF)', 'expires': '2026-12-31'},
+]
+
+
+@pytest.fixture
+def remotelock(monkeypatch):
+    with RemoteLockStub() as stub:
+        monkeypatch.setattr('bstrong.api_clients.REMOTELOCK_BASE_URL', stub.url)
+        monkeypatch.setattr('bstrong.api_clients.REMOTELOCK_TOKEN_URL', f"{stub.url}/oauth/token")
+        yield stub
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    return str(path)
+
+
+def row(customer_id, phone='5085551234', membership='1 week pass', expires=None, first='Pat'):
+    return MemberRow(customer_id, first, 'Smith', phone, membership, expires)
+
+
+def importer(db, rl_client, **kwargs):
+    return MemberImporter(db, rl_client, get_topology(), rate=0, **kwargs)
+
+
+class TestReadMembers:
+    def test_csv_and_jsonl_exports_map_to_rows(self, tmp_path):
+        csv_rows = list(read_members(write_csv(tmp_path / 'members.csv', MEMBERS)))
+        jsonl = tmp_path / 'members.jsonl'
+        jsonl.write_text(json.dumps({'customerId': 'C9', 'firstName': 'Al', 'lastName': 'Bo', 'mobilePhone': 5085551111,
+                                     'itemSold': 'day pass', 'expireAt': '2026-06-01T22:05:00-04:00'}) + '\n\n')
+
+        assert csv_rows[0] == MemberRow('C1', 'John', 'Doe', '(508) 555-1234', '1 week pass', None)
+        assert csv_rows[2].expires == date(2026, 12, 31)
+        assert list(read_members(str(jsonl))) == [MemberRow('C9', 'Al', 'Bo', '5085551111', 'day pass', date(2026, 6, 1))]
+
+    def test_each_distinct_phone_is_parsed_once(self):
+        rows = [row('C1'), row('C2'), row('C3', phone='not a phone')]
+        with patch('bstrong.importer.fix_phone_number', wraps=fix_phone_number) as fix:
+            phones = normalize_phones(rows)
+
+        assert phones == {'5085551234': '+15085551234', 'not a phone': None}
+        assert fix.call_count == 2
+
+
+class TestMemberImporter:
+    @freeze_time("2026-04-29 14:00:00")
+    def test_provisions_codes_and_writes_records(self, remotelock, tmp_path):
+        db = InMemoryDatabase()
+        checkpoint = Checkpoint(str(tmp_path / 'import.progress'))
+
+        summary = importer(db, RemoteLockClient(), checkpoint=checkpoint).run(read_members(write_csv(tmp_path / 'm.csv', MEMBERS)))
+        checkpoint.close()
+
+        assert summary[IMPORTED] == 3 and summary['processed'] == 3
+        assert remotelock.count('POST', '/access_persons') == 6  # create + grant each
+        by_name = {g['name']: g for g in remotelock.guests.values()}
+        assert by_name['Sam Poe']['ends_at'] == '2026-12-31T22:00:00Z'
+        assert by_name['John Doe']['ends_at'] == '2026-05-06T22:00:00Z'
+
+        autopay = db.collections['active_autopays']['C2']
+        assert autopay['phone'] == '+15085559876'
+        assert autopay['remote_lock_id'] in remotelock.guests
+        assert set(db.collections['active_autopays']) == {'C2'}
+        assert 'pin_change_tickets' not in db.collections
+        assert Checkpoint(str(tmp_path / 'import.progress')).done == {'C1', 'C2', 'C3'}
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_rerun_skips_members_in_the_checkpoint(self, remotelock, tmp_path):
+        path = write_csv(tmp_path / 'm.csv', MEMBERS)
+        progress = str(tmp_path / 'import.progress')
+        for _ in range(2):
+            checkpoint = Checkpoint(progress)
+            summary = importer(InMemoryDatabase(), RemoteLockClient(), checkpoint=checkpoint).run(read_members(path))
+            checkpoint.close()
+
+        assert summary['skipped'] == 3 and 'processed' not in summary
+        assert len(remotelock.guests) == 3
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_rerun_after_a_crash_mid_batch_reuses_the_guests(self, remotelock, tmp_path):
+        path = write_csv(tmp_path / 'm.csv', MEMBERS)
+        progress = str(tmp_path / 'import.progress')
+        checkpoint = Checkpoint(progress)
+        job = importer(InMemoryDatabase(), RemoteLockClient(), checkpoint=checkpoint, notify=True)
+        job.writer.flush = MagicMock(side_effect=RuntimeError("killed"))
+        with patch('bstrong.importer.send_sms', return_value=True), pytest.raises(RuntimeError):
+            job.run(read_members(path))
+        checkpoint.close()
+        pins = {g['name']: g['pin'] for g in remotelock.guests.values()}
+
+        db = InMemoryDatabase()
+        checkpoint = Checkpoint(progress)
+        with patch('bstrong.importer.send_sms', return_value=True) as mock_sms:
+            summary = importer(db, RemoteLockClient(), checkpoint=checkpoint, notify=True).run(read_members(path))
+        checkpoint.close()
+
+        assert summary[IMPORTED] == 3
+        assert {g['name']: g['pin'] for g in remotelock.guests.values()} == pins
+        assert pins['Jane Roe'] in [c.kwargs['body'] for c in mock_sms.call_args_list if c.kwargs['first_name'] == 'Jane'][0]
+        assert db.collections['active_autopays']['C2']['remote_lock_id'] in remotelock.guests
+        assert Checkpoint(progress).done == {'C1', 'C2', 'C3'}
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_ungranted_guest_is_deleted(self):
+        rl = MagicMock()
+        rl.create_access_person.return_value = ('guest-1', '1234')
+        rl.grant_lock_access.side_effect = RuntimeError("lock offline")
+        job = importer(InMemoryDatabase(), rl, concurrency=1)
+
+        with patch('bstrong.topology.time.sleep'), patch('bstrong.services.send_Dev'):
+            summary = job.run([row('C1')])
+
+        assert summary[FAILED] == 1
+        rl.delete_access_person.assert_called_once_with('guest-1')
+        assert job.checkpoint.noted('C1') is None
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_bad_rows_are_reported_and_not_checkpointed(self):
+        rl = MagicMock()
+        rl.create_access_person.return_value = ('guest-1', '1234')
+        checkpoint = Checkpoint(None)
+        job = importer(InMemoryDatabase(), rl, checkpoint=checkpoint)
+
+        summary = job.run([
+            row('C1'),
+            row('C1', first='Again'),
+            row('C2', phone='12'),
+            row('C3', membership='mystery plan'),
+            row('C4', expires=date(2026, 1, 1)),
+            row('', phone='5085550000'),
+        ])
+
+        assert summary[IMPORTED] == 1
+        statuses = {(r.customer_id, r.status) for r in job.failures}
+        assert statuses == {('C1', DUPLICATE), ('C2', INVALID_PHONE), ('C3', UNKNOWN_MEMBERSHIP), ('C4', EXPIRED), ('', INCOMPLETE)}
+        assert checkpoint.done == {'C1'}
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_failed_member_is_retried_on_rerun(self):
+        rl = MagicMock()
+        rl.create_access_person.side_effect = [('guest-1', '1111'), RuntimeError("RemoteLock down"), ('guest-3', '3333')]
+        checkpoint = Checkpoint(None)
+        job = importer(InMemoryDatabase(), rl, checkpoint=checkpoint, concurrency=1)
+
+        summary = job.run([row('C1'), row('C2'), row('C3')])
+
+        assert (summary[IMPORTED], summary[FAILED]) == (2, 1)
+        assert job.failures[0].customer_id == 'C2' and 'RemoteLock down' in job.failures[0].error
+        assert checkpoint.done == {'C1', 'C3'}
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_records_are_committed_in_batches_before_checkpointing(self):
+        db = InMemoryDatabase()
+        rl = MagicMock()
+        rl.create_access_person.side_effect = [(f'guest-{i}', '1234') for i in range(5)]
+        checkpoint = Checkpoint(None)
+        commits = []
+
+        job = importer(db, rl, checkpoint=checkpoint, batch_size=2, concurrency=1)
+        real_flush = job.writer.flush
+        job.writer.flush = lambda: (commits.append(set(checkpoint.done)), real_flush())
+
+        job.run([row(f'C{i}', membership='monthly autopay membership') for i in range(5)])
+
+        assert commits == [set(), {'C0', 'C1'}, {'C0', 'C1', 'C2', 'C3'}]
+        assert len(db.collections['active_autopays']) == 5
+        assert job.writer.committed == 5
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_notify_texts_the_code_and_opens_a_ticket(self):
+        db = InMemoryDatabase()
+        rl = MagicMock()
+        rl.create_access_person.return_value = ('guest-1', '4321')
+
+        with patch('bstrong.importer.send_sms', return_value=True) as mock_sms:
+            importer(db, rl, notify=True).run([row('C1')])
+
+        assert '4321' in mock_sms.call_args.kwargs['body']
+        assert db.collections['pin_change_tickets']['+15085551234']['remote_lock_id'] == 'guest-1'
+
+    def test_dry_run_calls_nothing(self):
+        db = MagicMock()
+        rl = MagicMock()
+
+        summary = importer(db, rl, dry_run=True).run([row('C1'), row('C2', phone='12')])
+
+        assert (summary[IMPORTED], summary[INVALID_PHONE], summary['dry_run']) == (1, 1, True)
+        rl.create_access_person.assert_not_called()
+        db.getBatch.assert_not_called()
+
+
+class TestMain:
+    @freeze_time("2026-04-29 14:00:00")
+    def test_cli_writes_report_and_fails_on_errors(self, tmp_path, capsys):
+        path = write_csv(tmp_path / 'm.csv', MEMBERS[:1] + [{**MEMBERS[1], 'phone': 'n/a'}])
+        report = tmp_path / 'report.jsonl'
+        rl = MagicMock()
+        rl.create_access_person.side_effect = RuntimeError("RemoteLock down")
+
+        with patch('bstrong.database.Database', return_value=InMemoryDatabase()), \
+             patch('bstrong.importer.RemoteLockClient', return_value=rl):
+            code = main([path, '--rate', '0', '--report', str(report)])
+
+        assert code == 1
+        assert json.loads(capsys.readouterr().out)[FAILED] == 1
+        assert sorted(json.loads(line)['status'] for line in report.read_text().splitlines()) == [FAILED, INVALID_PHONE]
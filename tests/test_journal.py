@@ -0,0 +1,297 @@
+import asyncio
+import threading
+import pytest
+from datetime import datetime, timezone
+from google.api_core import exceptions as api_exceptions
+from google.cloud import firestore
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from bstrong.async_database import AsyncDatabase
+from bstrong.database import Database
+from bstrong.journal import AsyncJournaledDatabase, JournaledDatabase, WriteJournal
+from bstrong.metrics import FIRESTORE_JOURNAL
+from tests.conftest import make_firestore_doc, TEST_CONFIG, flask_app
+from tests.fakes import InMemoryDatabase
+from tests.test_routes import VALID_CUSTOMER, transaction_payload
+
+
+class FlakyDatabase(InMemoryDatabase):
+    """InMemoryDatabase whose writes (and batch commits) fail while `down`."""
+
+    def __init__(self):
+        super().__init__()
+        self.down = False
+        self.timeouts: list[float | None] = []
+
+    def _check(self, timeout=None):
+        self.timeouts.append(timeout)
+        if self.down:
+            raise api_exceptions.ServiceUnavailable("Firestore unavailable")
+
+    def add(self, collection, key, data=None, timeout=None):
+        self._check(timeout)
+        super().add(collection, key, data)
+
+    def update(self, collection, key, data, timeout=None):
+        self._check(timeout)
+        super().update(collection, key, data)
+
+    def delete(self, collection, key, timeout=None):
+        self._check(timeout)
+        super().delete(collection, key)
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = WriteJournal(str(tmp_path / "journal.sqlite3"))
+    yield journal
+    journal.close()
+
+
+@pytest.fixture
+def firestore_db():
+    return FlakyDatabase()
+
+
+@pytest.fixture
+def db(firestore_db, journal):
+    return JournaledDatabase(firestore_db, journal, budget=2)
+
+
+class TestJournaledDatabase:
+    def test_healthy_writes_go_to_firestore(self, db, firestore_db, journal):
+        db.add('processed_transactions', 'T1', {'timestamp': firestore.SERVER_TIMESTAMP})
+        db.update('processed_transactions', 'T1', {'provisioned': True})
+
+        assert firestore_db.collections['processed_transactions']['T1']['provisioned'] is True
+        assert firestore_db.timeouts == [2, 2]
+        assert journal.pending() == 0
+
+    def test_failed_write_is_journaled_and_readable(self, db, firestore_db, journal):
+        firestore_db.down = True
+        journaled = FIRESTORE_JOURNAL.value(outcome="journaled")
+
+        db.add('processed_transactions', 'T1', {'timestamp': firestore.SERVER_TIMESTAMP})
+        db.add('pin_change_tickets', '+15085551234', {'remote_lock_id': 'guest-1'})
+
+        assert journal.pending() == 2
+        assert FIRESTORE_JOURNAL.value(outcome="journaled") == journaled + 2
+        assert db.checkIfExists('processed_transactions', 'T1') is True
+        ticket = db.getData('pin_change_tickets', '+15085551234')
+        assert ticket.exists and ticket.to_dict() == {'remote_lock_id': 'guest-1'}
+        assert isinstance(db.getData('processed_transactions', 'T1').to_dict()['timestamp'], datetime)
+        assert db.getData('pin_change_tickets', '+15085550000').exists is False
+
+    def test_later_writes_queue_behind_the_journal(self, db, firestore_db, journal):
+        firestore_db.down = True
+        db.add('pin_change_tickets', 'P1', {'remote_lock_id': 'guest-1'})
+        firestore_db.down = False
+        db.update('pin_change_tickets', 'P1', {'remote_lock_id': 'guest-2'})
+        db.delete('pending_customers', 'C1')
+
+        assert journal.pending() == 3
+        assert firestore_db.collections == {}
+        assert db.getData('pin_change_tickets', 'P1').to_dict() == {'remote_lock_id': 'guest-2'}
+        assert db.checkIfExists('pending_customers', 'C1') is False
+
+    def test_replay_applies_in_order_with_batched_commits(self, firestore_db, journal):
+        db = JournaledDatabase(firestore_db, journal, budget=2, batch_size=2)
+        firestore_db.down = True
+        db.add('pin_change_tickets', 'P1', {'remote_lock_id': 'guest-1'})
+        db.update('pin_change_tickets', 'P1', {'remote_lock_id': 'guest-2'})
+        db.add('processed_transactions', 'T1', {})
+        db.delete('pin_change_tickets', 'P1')
+        db.add('pin_change_tickets', 'P1', {'remote_lock_id': 'guest-3'})
+
+        assert db.replay() == 0
+        assert journal.pending() == 5
+
+        firestore_db.down = False
+        assert db.replay() == 5
+        assert journal.pending() == 0
+        assert firestore_db.batch_commits == 3
+        assert firestore_db.collections['pin_change_tickets'] == {'P1': {'remote_lock_id': 'guest-3'}}
+        assert 'T1' in firestore_db.collections['processed_transactions']
+
+        db.add('processed_transactions', 'T2', {})
+        assert journal.pending() == 0
+        assert 'T2' in firestore_db.collections['processed_transactions']
+
+    def test_replay_drops_what_firestore_refuses(self, db, firestore_db, journal):
+        firestore_db.down = True
+        db.update('pending_customers', 'C1', {'resolved': True})
+        db.add('processed_transactions', 'T1', {})
+        dropped = FIRESTORE_JOURNAL.value(outcome="dropped")
+
+        firestore_db.down = False
+        assert db.replay() == 1
+        assert journal.pending() == 0
+        assert FIRESTORE_JOURNAL.value(outcome="dropped") == dropped + 1
+        assert 'C1' not in firestore_db.collections.get('pending_customers', {})
+        assert 'T1' in firestore_db.collections['processed_transactions']
+
+    def test_permanent_errors_are_raised_not_journaled(self, db, journal):
+        with pytest.raises(api_exceptions.NotFound):
+            db.update('pending_customers', 'C1', {'resolved': True})
+        assert journal.pending() == 0
+
+    def test_updates_alone_fall_through_to_firestore(self, db, firestore_db, journal):
+        firestore_db.add('active_autopays', 'C1', {'remote_lock_id': 'guest-1', 'expireAt': 'old'})
+        firestore_db.down = True
+        db.update('active_autopays', 'C1', {'expireAt': 'new'})
+
+        assert journal.pending() == 1
+        assert db.getData('active_autopays', 'C1').to_dict() == {'remote_lock_id': 'guest-1', 'expireAt': 'old'}
+
+    def test_update_after_delete_stays_deleted(self, db, firestore_db, journal):
+        firestore_db.add('pending_customers', 'C1', {'resolved': False})
+        firestore_db.down = True
+        db.delete('pending_customers', 'C1')
+        db.update('pending_customers', 'C1', {'resolved': True})
+
+        assert db.getData('pending_customers', 'C1').exists is False
+        assert db.checkIfExists('pending_customers', 'C1') is False
+
+    def test_journal_survives_a_restart(self, tmp_path, firestore_db):
+        path = str(tmp_path / "journal.sqlite3")
+        expires = datetime(2026, 5, 1, 22, 0, tzinfo=timezone.utc)
+        first = WriteJournal(path)
+        firestore_db.down = True
+        JournaledDatabase(firestore_db, first, budget=2).add('active_autopays', 'C1', {'expireAt': expires})
+        first.close()
+
+        reopened = WriteJournal(path)
+        firestore_db.down = False
+        assert reopened.pending() == 1
+        assert JournaledDatabase(firestore_db, reopened, budget=2).replay() == 1
+        assert firestore_db.collections['active_autopays']['C1'] == {'expireAt': expires}
+        reopened.close()
+
+    def test_unjournalable_write_raises_the_firestore_error(self, db, firestore_db, journal):
+        firestore_db.down = True
+        with pytest.raises(api_exceptions.ServiceUnavailable):
+            db.add('pin_change_tickets', 'P1', {'guest': object()})
+        assert journal.pending() == 0
+
+    def test_other_calls_pass_through(self, db, firestore_db):
+        firestore_db.add('pin_change_tickets', 'P1', {})
+        assert db.listKeys('pin_change_tickets') == ['P1']
+
+
+class TestDatabaseWriteBudget:
+    def test_timeout_bounds_one_attempt(self):
+        database = Database()
+        database.database = MagicMock()
+        reference = database.database.collection.return_value.document.return_value
+
+        database.add('processed_transactions', 'T1', {'a': 1}, timeout=2)
+        database.delete('processed_transactions', 'T1')
+
+        reference.set.assert_called_once_with({'a': 1}, retry=None, timeout=2)
+        reference.delete.assert_called_once_with()
+
+    def test_async_timeout_bounds_one_attempt(self):
+        with patch('google.cloud.firestore.AsyncClient'):
+            database = AsyncDatabase()
+        reference = database.database.collection.return_value.document.return_value
+        reference.set, reference.update, reference.delete = AsyncMock(), AsyncMock(), AsyncMock()
+
+        async def run():
+            await database.add('processed_transactions', 'T1', {'a': 1}, timeout=2)
+            await database.update('processed_transactions', 'T1', {'a': 2}, timeout=2)
+            await database.delete('processed_transactions', 'T1')
+
+        asyncio.run(run())
+        reference.set.assert_awaited_once_with({'a': 1}, retry=None, timeout=2)
+        reference.update.assert_awaited_once_with({'a': 2}, retry=None, timeout=2)
+        reference.delete.assert_awaited_once_with()
+
+
+class TestAsyncDatabaseCleanup:
+    def test_covers_the_same_collections_as_database(self):
+        with patch('google.cloud.firestore.AsyncClient'):
+            database = AsyncDatabase()
+        database.database.collection.return_value.where.return_value.get = AsyncMock(return_value=[])
+        sync = Database()
+        sync.database = MagicMock()
+        sync.database.collection.return_value.where.return_value.get.return_value = []
+
+        asyncio.run(database.getAllOldDocs())
+        sync.getAllOldDocs()
+
+        collections = [c.args[0] for c in database.database.collection.call_args_list]
+        assert collections == [c.args[0] for c in sync.database.collection.call_args_list]
+        assert 'flight_leases' in collections
+
+
+class SlowAsyncDatabase:
+    def __init__(self, delay):
+        self.delay = delay
+        self.docs = {}
+        self.timeouts = []
+
+    async def add(self, collection, key, data=None, timeout=None):
+        self.timeouts.append(timeout)
+        await asyncio.sleep(self.delay)
+        self.docs[(collection, key)] = data
+
+    async def getData(self, collection, key):
+        return make_firestore_doc(exists=False)
+
+
+class TestAsyncJournaledDatabase:
+    def test_write_over_budget_is_journaled(self, journal):
+        db = AsyncJournaledDatabase(SlowAsyncDatabase(delay=1), journal, budget=0.01)
+
+        async def run():
+            await db.add('processed_transactions', 'T1', {'timestamp': firestore.SERVER_TIMESTAMP})
+            return await db.checkIfExists('processed_transactions', 'T1')
+
+        assert asyncio.run(run()) is True
+        assert journal.pending() == 1
+
+    def test_write_within_budget_goes_to_firestore(self, journal):
+        slow = SlowAsyncDatabase(delay=0)
+        db = AsyncJournaledDatabase(slow, journal, budget=1)
+
+        asyncio.run(db.add('processed_transactions', 'T1', {}))
+
+        assert slow.docs == {('processed_transactions', 'T1'): {}}
+        assert slow.timeouts == [1]
+        assert journal.pending() == 0
+
+
+    def test_journal_is_written_and_read_off_the_event_loop(self, journal, monkeypatch):
+        db = AsyncJournaledDatabase(SlowAsyncDatabase(delay=1), journal, budget=0.01)
+        threads = []
+        for name in ('append', 'lookup'):
+            method = getattr(journal, name)
+            monkeypatch.setattr(journal, name, lambda *args, m=method: threads.append(threading.get_ident()) or m(*args))
+
+        async def run():
+            await db.add('processed_transactions', 'T1', {})
+            await db.update('processed_transactions', 'T1', {'done': True})
+            return threading.get_ident(), await db.getData('processed_transactions', 'T1')
+
+        loop_thread, snapshot = asyncio.run(run())
+        assert snapshot.to_dict() == {'done': True}
+        assert len(threads) == 3 and loop_thread not in threads
+
+
+class TestFirestoreOutage:
+    def test_redelivery_deduped_from_the_journal(self, app_client, journal, monkeypatch):
+        client, mock_db, mock_rl, _ = app_client
+        monkeypatch.setattr(flask_app, 'dataBase', JournaledDatabase(mock_db, journal, budget=2))
+        mock_db.checkIfExists.return_value = False
+        mock_db.getData.return_value = make_firestore_doc(data=VALID_CUSTOMER)
+        mock_db.add.side_effect = api_exceptions.ServiceUnavailable("Firestore unavailable")
+        mock_rl.create_access_person.return_value = ('guest-123', '4567')
+        headers = {'X-Vagaro-Signature': TEST_CONFIG['TRANSACTION_TOKEN']}
+
+        first = client.post('/webhook-transaction', json=transaction_payload(), headers=headers)
+        again = client.post('/webhook-transaction', json=transaction_payload(), headers=headers)
+
+        assert first.status_code == 200
+        assert again.data == b'Duplicate transaction'
+        mock_rl.create_access_person.assert_called_once()
+        assert flask_app.dataBase.getData('pin_change_tickets', '+15085551234').exists
@@ -0,0 +1,145 @@
+import json
+import logging
+import queue
+import threading
+import sys
+import pytest
+from unittest.mock import patch
+
+from bstrong import logs
+from bstrong.config import _sample_rates
+from bstrong.logs import JsonFormatter, LazyQueueHandler, redact
+from bstrong.tracing import start_trace
+from tests.conftest import make_firestore_doc
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+@pytest.fixture
+def captured():
+    """Root logging through the queue into a list; detached again afterwards."""
+    output = ListHandler()
+    level = logging.getLogger().level
+    with patch.dict(logs._sample_rates):
+        logs.configure_logging(level="INFO", fmt="json", sample_rates={}, output=output)
+        yield output
+        logs.shutdown_logging()
+    logging.getLogger().setLevel(level)
+
+
+def flushed(output):
+    logs.shutdown_logging()
+    return [json.loads(line) for line in output.lines]
+
+
+def record(msg, *args, level=logging.INFO):
+    return logging.LogRecord('test', level, __file__, 1, msg, args, None)
+
+
+# ---- Redaction ------------------------------------------------------------
+
+class TestRedact:
+    @pytest.mark.parametrize('text, expected', [
+        ('SMS sent to +15085551234 via +18005550000', 'SMS sent to ***-***-1234 via ***-***-0000'),
+        ('call (508) 555-1234 or 508.555.1234', 'call ***-***-1234 or ***-***-1234'),
+        ('guest_id=abc, pin=12345', 'guest_id=abc, pin=****'),
+        ('PIN 4321 already in use', 'PIN **** already in use'),
+        ('changed their door code to 0042 via PIN change service', 'changed their door code to **** via PIN change service'),
+    ])
+    def test_masks_phones_and_pins(self, text, expected):
+        assert redact(text) == expected
+
+    def test_leaves_dates_and_ids_alone(self):
+        text = 'RemoteLock code extended for guest g-1 to 2026-05-29T22:00:00, transaction PAY123'
+        assert redact(text) == text
+
+
+# ---- Formatting -----------------------------------------------------------
+
+class TestJsonFormatter:
+    def test_fields(self):
+        rec = record('PIN %s set for %s', '1234', '+15085551234')
+        rec.trace_id = 'abc'
+        entry = json.loads(JsonFormatter().format(rec))
+        assert entry['severity'] == 'INFO'
+        assert entry['logger'] == 'test'
+        assert entry['trace_id'] == 'abc'
+        assert entry['message'] == 'PIN **** set for ***-***-1234'
+
+    def test_exception_included_and_redacted(self):
+        try:
+            raise ValueError('bad phone 5085551234')
+        except ValueError:
+            rec = logging.LogRecord('test', logging.ERROR, __file__, 1, 'failed', (), sys.exc_info())
+        entry = json.loads(JsonFormatter().format(rec))
+        assert 'ValueError: bad phone ***-***-1234' in entry['exception']
+
+
+# ---- Queue handler --------------------------------------------------------
+
+class TestLazyQueueHandler:
+    def test_message_formatted_off_the_calling_thread(self, captured):
+        formatted_on = []
+
+        class Probe:
+            def __str__(self):
+                formatted_on.append(threading.current_thread())
+                return 'probe'
+
+        logs._handler.handle(record('value %s', Probe()))
+        assert flushed(captured)[0]['message'] == 'value probe'
+        assert formatted_on and threading.current_thread() not in formatted_on
+
+    def test_full_queue_drops_instead_of_blocking(self):
+        handler = LazyQueueHandler(queue.Queue(1))
+        handler.handle(record('one'))
+        handler.handle(record('two'))
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 1
+
+    def test_trace_id_captured_on_the_calling_thread(self, captured):
+        with start_trace('req') as trace:
+            logging.getLogger('test').info('inside')
+        assert flushed(captured)[0]['trace_id'] == trace.trace_id
+
+
+# ---- Sampling -------------------------------------------------------------
+
+class TestSampling:
+    def test_unsampled_request_keeps_only_warnings(self, captured):
+        logs.configure_logging(fmt="json", sample_rates={'/webhook-sms': 0.0}, output=captured)
+        token = logs.sample_request('/webhook-sms')
+        logging.getLogger('test').info('dropped')
+        logging.getLogger('test').warning('kept')
+        logs.end_request(token)
+        logging.getLogger('test').info('outside a request')
+        assert [e['message'] for e in flushed(captured)] == ['kept', 'outside a request']
+
+    def test_unlisted_routes_always_sampled(self, captured):
+        logs.configure_logging(fmt="json", sample_rates={'/webhook-sms': 0.0}, output=captured)
+        logs.end_request(logs.sample_request('/webhook-transaction'))
+        token = logs.sample_request('/webhook-transaction')
+        logging.getLogger('test').info('kept')
+        logs.end_request(token)
+        assert [e['message'] for e in flushed(captured)] == ['kept']
+
+    def test_request_hooks_apply_route_rate(self, captured, app_client):
+        client, mock_db, *_ = app_client
+        logs.configure_logging(fmt="json", sample_rates={'/webhook-sms': 0.0}, output=captured)
+        mock_db.getData.return_value = make_firestore_doc(exists=False)
+        with patch('app.RequestValidator') as mock_val:
+            mock_val.return_value.validate.return_value = True
+            client.post('/webhook-sms', data={'From': '+15085551234', 'Body': '1234'},
+                        headers={'X-Twilio-Signature': 'fake-sig'})
+        assert not any('No PIN change ticket' in e['message'] for e in flushed(captured))
+
+    def test_parse_sample_rates(self):
+        assert _sample_rates(' /webhook-sms=0.25, /health=0 ,') == {'/webhook-sms': 0.25, '/health': 0.0}
+        assert _sample_rates('') == {}
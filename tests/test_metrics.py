@@ -0,0 +1,92 @@
+import pytest
+
+from bstrong.metrics import Counter, Gauge, Histogram, Registry, vendor_call, VENDOR_SECONDS
+
+
+# ---- Histogram ------------------------------------------------------------
+
+class TestHistogram:
+    def test_buckets_are_cumulative(self):
+        h = Histogram('h', 'help', ('stage',), buckets=(0.1, 1.0))
+        h.observe(0.05, stage='a')
+        h.observe(0.1, stage='a')
+        h.observe(3.0, stage='a')
+
+        lines = h.render()
+
+        assert 'h_bucket{stage="a",le="0.1"} 2' in lines
+        assert 'h_bucket{stage="a",le="1.0"} 2' in lines
+        assert 'h_bucket{stage="a",le="+Inf"} 3' in lines
+        assert 'h_count{stage="a"} 3' in lines
+
+    def test_time_records_even_on_error(self):
+        h = Histogram('h', 'help', ('stage',))
+        with pytest.raises(RuntimeError):
+            with h.time(stage='boom'):
+                raise RuntimeError
+        assert h.count(stage='boom') == 1
+
+
+# ---- Counter / Gauge ------------------------------------------------------
+
+class TestCounterAndGauge:
+    def test_counter_by_label(self):
+        c = Counter('c_total', 'help', ('outcome',))
+        c.inc(outcome='ok')
+        c.inc(2, outcome='ok')
+        assert c.value(outcome='ok') == 3
+        assert c.value(outcome='failure') == 0
+
+    def test_gauge_inc_dec(self):
+        g = Gauge('g', 'help', ('route',))
+        g.inc(route='/x')
+        g.inc(route='/x')
+        g.dec(route='/x')
+        assert g.value(route='/x') == 1
+
+    def test_gauge_callback_read_at_render(self):
+        g = Gauge('g', 'help', ('field',))
+        state = {'v': 1}
+        g.set_function(lambda: state['v'], field='size')
+        state['v'] = 7
+        assert 'g{field="size"} 7' in g.render()
+
+    def test_callback_none_or_error_is_skipped(self):
+        g = Gauge('g', 'help', ('field',))
+        g.set_function(lambda: None, field='none')
+        g.set_function(lambda: 1 / 0, field='error')
+        assert g.render() == ['# HELP g help', '# TYPE g gauge']
+
+    def test_label_values_escaped(self):
+        c = Counter('c_total', 'help', ('name',))
+        c.inc(name='a"b')
+        assert 'c_total{name="a\\"b"} 1' in c.render()
+
+
+# ---- Registry / vendor_call -------------------------------------------------
+
+class TestRegistry:
+    def test_render_includes_every_metric(self):
+        registry = Registry()
+        registry.register(Counter('a_total', 'a'))
+        registry.register(Gauge('b', 'b'))
+        text = registry.render()
+        assert '# TYPE a_total counter' in text
+        assert '# TYPE b gauge' in text
+        assert text.endswith('\n')
+
+
+class TestVendorCall:
+    def test_records_ok_and_error_outcomes(self):
+        @vendor_call('testvendor')
+        def flaky(fail):
+            if fail:
+                raise ValueError
+            return 'done'
+
+        assert flaky(False) == 'done'
+        with pytest.raises(ValueError):
+            flaky(True)
+
+        assert VENDOR_SECONDS.count(vendor='testvendor', operation='flaky', outcome='ok') == 1
+        assert VENDOR_SECONDS.count(vendor='testvendor', operation='flaky', outcome='error') == 1
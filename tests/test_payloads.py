@@ -0,0 +1,86 @@
+import json
+import pytest
+from unittest.mock import patch
+
+from bstrong import payloads
+from bstrong.catalog import MembershipCatalog
+from bstrong.payloads import (
+    InvalidPayload, WAIVER_FORM_ID, ignorable_form, ignorable_transaction, parse_form, parse_transaction,
+)
+
+
+def body(**payload):
+    return json.dumps({'payload': payload}).encode()
+
+
+@pytest.fixture
+def catalog():
+    return MembershipCatalog()
+
+
+class TestPrefilter:
+    def test_irrelevant_purchase_type_is_ignorable(self, catalog):
+        assert ignorable_transaction(body(purchaseType='Product', itemSold='protein shake'), catalog.purchase_types)
+        assert not ignorable_transaction(body(purchaseType='Membership'), catalog.purchase_types)
+        assert not ignorable_transaction(body(purchaseType='Package', itemSold='day pass'), catalog.purchase_types)
+
+    def test_whitespace_around_the_colon_is_scanned(self, catalog):
+        assert ignorable_transaction(b'{"payload": {"purchaseType" :  "Service"}}', catalog.purchase_types)
+
+    @pytest.mark.parametrize('raw', [
+        b'{"payload": {"purchaseType": "Serv\\u0069ce"}}',
+        b'{"payload": {"purchaseType": "Service", "extra": {"purchaseType": "Membership"}}}',
+        b'{"payload": {"purchaseType": null}}',
+        b'{"payload": {}}',
+    ])
+    def test_anything_unusual_falls_back_to_a_full_parse(self, catalog, raw):
+        assert not ignorable_transaction(raw, catalog.purchase_types)
+
+    def test_catalog_overrides_widen_the_relevant_types(self, catalog):
+        assert ignorable_transaction(body(purchaseType='Service'), catalog.purchase_types)
+
+        class Db:
+            def getCollection(self, name):
+                doc = type('Doc', (), {'to_dict': lambda self: {'name': 'spin bundle', 'purchase_types': ['Service']}})
+                return [doc()]
+
+        catalog.load(Db())
+        assert not ignorable_transaction(body(purchaseType='Service'), catalog.purchase_types)
+
+    def test_only_the_waiver_form_passes(self):
+        assert ignorable_form(body(formId='another-form'))
+        assert not ignorable_form(body(formId=WAIVER_FORM_ID))
+        assert not ignorable_form(body(customerId='C1'))
+
+
+class TestParse:
+    def test_transaction_is_typed_and_classified(self, catalog):
+        event = parse_transaction(body(itemSold='Day Pass', customerId='C1', purchaseType='Package', transactionId=42), catalog)
+
+        assert (event.item_sold, event.customer_id, event.unique_id) == ('day pass', 'C1', '42')
+        assert event.product.is_day_pass and event.relevant
+
+    def test_user_payment_id_wins_and_missing_fields_are_none(self, catalog):
+        event = parse_transaction(body(userPaymentId='P1', transactionId='T1'), catalog)
+
+        assert (event.unique_id, event.item_sold, event.purchase_type) == ('P1', '', None)
+        assert not event.relevant
+
+    @pytest.mark.parametrize('raw', [b'not json', b'[]', b'{"payload": "x"}', body(itemSold=5), body(customerId={'id': 1})])
+    def test_malformed_transactions_are_rejected(self, catalog, raw):
+        with pytest.raises(InvalidPayload):
+            parse_transaction(raw, catalog)
+
+    def test_form(self):
+        questions = [{'question': 'First Name', 'answer': ['Jo']}]
+        assert parse_form(body(formId=WAIVER_FORM_ID, customerId='C1', questionsAndAnswers=questions)) == \
+            payloads.FormEvent(WAIVER_FORM_ID, 'C1', questions)
+        with pytest.raises(InvalidPayload):
+            parse_form(body(questionsAndAnswers='none'))
+
+    def test_stdlib_backend_parses_the_same(self, catalog):
+        raw = body(itemSold='1 week pass', customerId='C1', purchaseType='Membership', userPaymentId='P1')
+        with patch.object(payloads, 'orjson', None):
+            assert parse_transaction(raw, catalog) == parse_transaction(raw, MembershipCatalog())
+            with pytest.raises(InvalidPayload):
+                payloads.loads(b'{')
@@ -0,0 +1,112 @@
+import pytest
+from unittest.mock import MagicMock, patch
+
+from bstrong.api_clients import PinConflictError
+from bstrong.pin_index import PinIndex
+from tests.test_api_clients import mock_response
+
+
+def _listing(pages):
+    """Mock RemoteLockClient whose list_access_persons serves the given pages."""
+    client = MagicMock()
+    client.list_access_persons.side_effect = [(page, len(pages)) for page in pages]
+    return client
+
+
+def _guest(guest_id, pin, ends_at='2099-01-01T22:00:00Z'):
+    return {'id': guest_id, 'attributes': {'pin': pin, 'ends_at': ends_at}}
+
+
+class TestPinIndex:
+    def test_rebuild_walks_every_page(self):
+        index = PinIndex()
+        count = index.rebuild(_listing([[_guest('g1', '1111'), _guest('g2', '2222')], [_guest('g3', '3333')]]))
+        assert count == 3
+        assert index.ready
+        assert index.is_taken('3333')
+
+    def test_expired_guests_are_not_in_use(self):
+        index = PinIndex()
+        index.rebuild(_listing([[_guest('g1', '1111', ends_at='2001-01-01T22:00:00Z')]]))
+        assert not index.is_taken('1111')
+
+    def test_own_pin_is_not_a_conflict(self):
+        index = PinIndex()
+        index.record('g1', '4321')
+        assert not index.is_taken('4321', 'g1')
+        assert index.is_taken('4321', 'g2')
+
+    def test_record_replaces_previous_pin(self):
+        index = PinIndex()
+        index.record('g1', '4321')
+        index.record('g1', '9876')
+        assert not index.is_taken('4321')
+        assert index.is_taken('9876')
+
+    def test_refused_pin_blocked_until_holder_known(self):
+        index = PinIndex()
+        index.mark_taken('5555', 'g1')
+        assert index.is_taken('5555', 'g1')
+        assert index.stats()['guests'] == 0
+        index.rebuild(_listing([[_guest('g2', '5555')]]))
+        assert index.is_taken('5555', 'g1')
+        assert not index.is_taken('5555', 'g2')
+
+    def test_fresh_only_within_max_age(self):
+        index = PinIndex()
+        assert not index.fresh(60)
+        index.rebuild(_listing([[]]))
+        assert index.fresh(60)
+        index.built_at -= 120
+        assert not index.fresh(60)
+
+    def test_suggestions_are_free_and_same_length(self):
+        index = PinIndex()
+        for pin in ('1234', '1235', '1233'):
+            index.record(f'g-{pin}', pin)
+        suggestions = index.suggest('1234')
+        assert len(suggestions) == 3
+        assert all(len(s) == 4 and not index.is_taken(s) for s in suggestions)
+        assert suggestions[0] in ('1236', '1232')
+
+    def test_suggestions_keep_leading_zeros_and_skip_repeats(self):
+        index = PinIndex()
+        assert index.suggest('00001', count=2) == ['00002', '00003']
+
+    def test_staleness_reported(self):
+        index = PinIndex()
+        assert index.staleness() is None
+        assert index.stats()['age_seconds'] is None
+        index.rebuild(_listing([[]]))
+        assert index.staleness() >= 0
+        assert index.stats()['pins'] == 0
+
+
+class TestClientKeepsIndexCurrent:
+    def test_create_records_generated_pin(self, rl_client):
+        rl_client.pin_index = PinIndex()
+        with patch('bstrong.api_clients.requests.request', return_value=mock_response(json_data={
+            "data": {"id": "guest-abc", "attributes": {"pin": "4321"}}
+        })):
+            rl_client.create_access_person("John Doe", "2026-05-01T04:00:00Z", "2026-06-01T22:00:00Z")
+        assert rl_client.pin_index.is_taken('4321')
+
+    def test_update_records_new_pin(self, rl_client):
+        rl_client.pin_index = PinIndex()
+        with patch('bstrong.api_clients.requests.request', return_value=mock_response()):
+            rl_client.update_pin("guest-123", "7777")
+        assert rl_client.pin_index.is_taken('7777', 'guest-other')
+
+    def test_conflict_marks_pin_taken(self, rl_client):
+        rl_client.pin_index = PinIndex()
+        with patch('bstrong.api_clients.requests.request', return_value=mock_response(422)):
+            with pytest.raises(PinConflictError):
+                rl_client.update_pin("guest-123", "8888")
+        assert rl_client.pin_index.is_taken('8888', 'guest-123')
+
+    def test_delete_forgets_pin_even_if_already_gone(self, rl_client):
+        rl_client.pin_index = PinIndex()
+        rl_client.pin_index.record('guest-123', '6666')
+        with patch('bstrong.api_clients.requests.request', return_value=mock_response(404)):
+            rl_client.delete_access_person("guest-123")
+        assert not rl_client.pin_index.is_taken('6666')
@@ -0,0 +1,143 @@
+import pytest
+import requests as req_lib
+from unittest.mock import MagicMock, patch
+
+from bstrong import ratelimit
+from bstrong.ratelimit import TokenBucket, FirestoreTokenBucket, RateLimitExceeded, get_limiter, throttle
+from tests.test_api_clients import mock_response
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def bucket(rate, capacity):
+    clock = FakeClock()
+    return TokenBucket('test', rate, capacity, clock=clock, sleep=clock.sleep), clock
+
+
+class TestTokenBucket:
+    def test_burst_then_try_acquire_fails(self):
+        b, _ = bucket(rate=1, capacity=3)
+        assert [b.try_acquire() for _ in range(4)] == [True, True, True, False]
+        assert b.rejected == 1
+
+    def test_refills_over_time(self):
+        b, clock = bucket(rate=2, capacity=2)
+        b.try_acquire(); b.try_acquire()
+        clock.now += 0.5
+        assert b.try_acquire()
+        assert not b.try_acquire()
+
+    def test_blocking_acquire_waits_and_counts_wait_time(self):
+        b, clock = bucket(rate=4, capacity=1)
+        assert b.acquire()
+        assert b.acquire()
+        assert clock.sleeps == [0.25]
+        assert b.stats()['waited_seconds'] == 0.25
+
+    def test_acquire_times_out(self):
+        b, _ = bucket(rate=0.1, capacity=1)
+        b.acquire()
+        assert b.acquire(timeout=1) is False
+
+    def test_zero_rate_is_unlimited(self):
+        b, clock = bucket(rate=0, capacity=1)
+        assert all(b.acquire() for _ in range(100))
+        assert clock.sleeps == []
+
+    def test_thread_safety_never_overspends(self):
+        import threading
+        b = TokenBucket('test', rate=0.001, capacity=50)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(b.try_acquire())) for _ in range(200)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert results.count(True) == 50
+        assert (b.acquired, b.rejected) == (50, 150)
+
+
+class TestRegistry:
+    def test_vendor_limits_come_from_config(self, monkeypatch):
+        monkeypatch.setattr(ratelimit, '_limiters', {})
+        monkeypatch.setitem(ratelimit.VENDOR_RATE_LIMITS, 'vagaro', (2.0, 5.0))
+        limiter = get_limiter('vagaro')
+        assert (limiter.rate, limiter.capacity) == (2.0, 5.0)
+        assert get_limiter('vagaro') is limiter
+
+    def test_throttle_raises_request_exception_on_timeout(self, monkeypatch, caplog):
+        b, _ = bucket(rate=0.01, capacity=1)
+        b.acquire()
+        monkeypatch.setattr(ratelimit, '_limiters', {'twilio': b})
+        with pytest.raises(req_lib.exceptions.RequestException):
+            throttle('twilio', timeout=1)
+        assert "Rate limit wait for twilio exceeded 1s." in caplog.text
+
+    def test_firestore_backend_builds_shared_buckets(self, monkeypatch):
+        monkeypatch.setattr(ratelimit, '_limiters', {})
+        monkeypatch.setitem(ratelimit.VENDOR_RATE_LIMITS, 'remotelock', (5.0, 10.0))
+        ratelimit.use_firestore_backend(MagicMock())
+        try:
+            assert isinstance(get_limiter('remotelock'), FirestoreTokenBucket)
+        finally:
+            ratelimit.use_firestore_backend(None)
+
+
+class TestFirestoreTokenBucket:
+    def test_leases_tokens_in_blocks(self):
+        b = FirestoreTokenBucket('remotelock', 5, 10, db=MagicMock(), lease=5)
+        with patch.object(b, '_lease_tokens', return_value=5) as lease:
+            assert all(b.try_acquire() for _ in range(5))
+        lease.assert_called_once_with(5)
+
+    def test_falls_back_to_local_bucket_when_firestore_fails(self):
+        b = FirestoreTokenBucket('remotelock', 5, 10, db=MagicMock())
+        with patch.object(b, '_lease_tokens', side_effect=Exception("Firestore down")):
+            assert b.try_acquire()
+
+
+class TestRemoteLock429:
+    def test_429_retried_after_retry_after(self, rl_client):
+        limited = mock_response(429)
+        limited.headers = {'Retry-After': '3'}
+        with patch('bstrong.api_clients.requests.request', side_effect=[limited, mock_response()]) as mock_req, \
+             patch('bstrong.api_clients.time.sleep') as mock_sleep:
+            resp = rl_client._request_with_retry('GET', 'https://example.com')
+        assert resp.status_code == 200
+        assert mock_req.call_count == 2
+        mock_sleep.assert_called_once_with(3.0)
+
+    def test_second_429_returned_to_caller(self, rl_client):
+        limited = mock_response(429)
+        limited.headers = {}
+        with patch('bstrong.api_clients.requests.request', return_value=limited) as mock_req, \
+             patch('bstrong.api_clients.time.sleep'):
+            resp = rl_client._request_with_retry('GET', 'https://example.com')
+        assert resp.status_code == 429
+        assert mock_req.call_count == 2
+
+    def test_calls_go_through_remotelock_bucket(self, rl_client):
+        with patch('bstrong.api_clients.throttle') as mock_throttle, \
+             patch('bstrong.api_clients.requests.request', return_value=mock_response()):
+            rl_client.extend_access('guest-1', '2026-06-01T22:00:00Z')
+        mock_throttle.assert_called_once_with('remotelock')
+
+    def test_rate_limit_timeout_is_not_retried(self, rl_client):
+        with patch('bstrong.api_clients.throttle', side_effect=RateLimitExceeded("remotelock rate limit exceeded")), \
+             patch('bstrong.api_clients.requests.request') as mock_req, \
+             patch('bstrong.api_clients.time.sleep') as mock_sleep:
+            with pytest.raises(RateLimitExceeded):
+                rl_client._request_with_retry('GET', 'https://example.com')
+        mock_req.assert_not_called()
+        mock_sleep.assert_not_called()
@@ -0,0 +1,142 @@
+import json
+import pytest
+import pytz
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from bstrong.api_clients import RemoteLockClient
+from bstrong.batch import Checkpoint
+from bstrong.reconcile import Reconciler, main, OK, MISSING_GUEST, ENDS_AT_DRIFT, MISSING_EXPIRY
+from tests.stubs import RemoteLockStub
+
+EST = pytz.timezone('US/Eastern')
+
+
+def autopay_doc(customer_id, guest_id, year, month, day):
+    doc = MagicMock()
+    doc.id = customer_id
+    doc.to_dict.return_value = {
+        'remote_lock_id': guest_id,
+        'expireAt': EST.localize(datetime(year, month, day, 22, 5)) if year else None,
+    }
+    return doc
+
+
+@pytest.fixture
+def remotelock(monkeypatch):
+    with RemoteLockStub() as stub:
+        monkeypatch.setattr('bstrong.api_clients.REMOTELOCK_BASE_URL', stub.url)
+        monkeypatch.setattr('bstrong.api_clients.REMOTELOCK_TOKEN_URL', f"{stub.url}/oauth/token")
+        yield stub
+
+
+@pytest.fixture
+def drifted(remotelock):
+    """Three in-sync guests, one drifted guest, one autopay whose guest is gone."""
+    remotelock.add_guest('g-ok-1', ends_at='2026-05-15T22:00:00Z')
+    remotelock.add_guest('g-ok-2', ends_at='2026-06-01T22:00:00Z')
+    remotelock.add_guest('g-ok-3', ends_at='2026-11-30T22:00:00Z')
+    remotelock.add_guest('g-drift', ends_at='2026-04-15T22:00:00Z')
+    for i in range(7):
+        remotelock.add_guest(f'unrelated-{i}', ends_at='2026-01-01T22:00:00Z')
+
+    db = MagicMock()
+    db.getCollection.return_value = [
+        autopay_doc('C1', 'g-ok-1', 2026, 5, 15),
+        autopay_doc('C2', 'g-ok-2', 2026, 6, 1),
+        autopay_doc('C3', 'g-ok-3', 2026, 11, 30),
+        autopay_doc('C4', 'g-drift', 2026, 5, 15),
+        autopay_doc('C5', 'g-gone', 2026, 5, 15),
+    ]
+    return remotelock, db
+
+
+class TestReconciler:
+    def test_fetches_every_page(self, drifted):
+        stub, db = drifted
+        reconciler = Reconciler(db, RemoteLockClient(), per_page=3, rate=0)
+        guests = reconciler.fetch_guests()
+        assert len(guests) == 11
+        assert stub.count('GET', '/access_persons') == 4
+
+    def test_dry_run_reports_without_repairing(self, drifted):
+        stub, db = drifted
+        reconciler = Reconciler(db, RemoteLockClient(), per_page=3, rate=0, repair=True, dry_run=True)
+
+        summary = reconciler.run()
+
+        assert summary['checked'] == 5
+        assert summary[OK] == 3
+        assert summary[ENDS_AT_DRIFT] == 1
+        assert summary[MISSING_GUEST] == 1
+        assert summary['dry_run'] is True
+        assert stub.count('PUT', '/access_persons') == 0
+        assert stub.guests['g-drift']['ends_at'] == '2026-04-15T22:00:00Z'
+
+    def test_repair_extends_drifted_guest(self, drifted):
+        stub, db = drifted
+        reconciler = Reconciler(db, RemoteLockClient(), per_page=3, rate=0, repair=True)
+
+        summary = reconciler.run()
+
+        assert summary['repaired'] == 1
+        assert stub.guests['g-drift']['ends_at'] == '2026-05-15T22:00:00Z'
+        assert stub.count('PUT', '/access_persons') == 1
+
+    def test_repair_failure_is_counted_and_not_checkpointed(self, drifted, tmp_path):
+        stub, db = drifted
+        stub.fail_ids.add('g-drift')
+        checkpoint = Checkpoint(str(tmp_path / 'progress'))
+        reconciler = Reconciler(db, RemoteLockClient(), rate=0, repair=True, checkpoint=checkpoint)
+
+        summary = reconciler.run()
+
+        assert summary['repair_failed'] == 1
+        assert 'C4' not in checkpoint
+        assert reconciler.findings[0].error or reconciler.findings[1].error
+
+    def test_checkpoint_resumes_where_it_left_off(self, drifted, tmp_path):
+        stub, db = drifted
+        path = str(tmp_path / 'progress')
+        (tmp_path / 'progress').write_text('C1\nC2\nC4\n')
+
+        checkpoint = Checkpoint(path)
+        summary = Reconciler(db, RemoteLockClient(), rate=0, repair=True, checkpoint=checkpoint).run()
+        checkpoint.close()
+
+        assert summary['skipped'] == 3
+        assert summary['checked'] == 2
+        assert stub.count('PUT', '/access_persons') == 0
+        assert set((tmp_path / 'progress').read_text().split()) == {'C1', 'C2', 'C3', 'C4', 'C5'}
+
+    def test_missing_expiry_reported(self, remotelock):
+        remotelock.add_guest('g-1', ends_at='2026-05-15T22:00:00Z')
+        db = MagicMock()
+        db.getCollection.return_value = [autopay_doc('C1', 'g-1', None, None, None)]
+
+        summary = Reconciler(db, RemoteLockClient(), rate=0).run()
+
+        assert summary[MISSING_EXPIRY] == 1
+
+    def test_summary_includes_throughput(self, drifted):
+        _, db = drifted
+        summary = Reconciler(db, RemoteLockClient(), rate=0).run()
+        assert summary['pages'] == 1
+        assert 'checked_per_second' in summary
+        assert summary['elapsed_seconds'] >= 0
+
+
+class TestReconcileCli:
+    def test_cli_dry_run_writes_report(self, drifted, tmp_path, monkeypatch, capsys):
+        stub, db = drifted
+        monkeypatch.setattr('bstrong.database.Database', lambda: db)
+        report = tmp_path / 'report.jsonl'
+
+        code = main(['--dry-run', '--repair', '--rate', '0', '--per-page', '5', '--report', str(report)])
+
+        assert code == 0
+        summary = json.loads(capsys.readouterr().out)
+        assert summary['checked'] == 5
+        statuses = sorted(json.loads(line)['status'] for line in report.read_text().splitlines())
+        assert statuses == [ENDS_AT_DRIFT, MISSING_GUEST]
+        assert stub.count('PUT', '/access_persons') == 0
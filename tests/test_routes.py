@@ -1,11 +1,14 @@
 import pytest
 import pytz
+import threading
 import requests as req_lib
 from datetime import datetime, timezone
 from unittest.mock import MagicMock, patch
 
 from bstrong.api_clients import PinConflictError
-from tests.conftest import make_firestore_doc, TEST_CONFIG
+from bstrong.form_waiter import FormWaiter
+from bstrong.metrics import FORM_WAIT
+from tests.conftest import make_firestore_doc, TEST_CONFIG, flask_app
 
 TRANSACTION_TOKEN = TEST_CONFIG['TRANSACTION_TOKEN']
 FORUM_TOKEN       = TEST_CONFIG['FORUM_TOKEN']
@@ -57,6 +60,31 @@ class TestTransactionWebhook:
         assert resp.status_code == 200
         mock_db.checkIfExists.assert_not_called()
 
+    def test_irrelevant_purchase_type_skips_parsing(self, app_client):
+        client, *_ = app_client
+        with patch('bstrong.payloads.loads') as mock_loads:
+            resp = client.post('/webhook-transaction',
+                json=transaction_payload(purchaseType='Product', itemSold='protein shake'),
+                headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+        assert resp.status_code == 200
+        mock_loads.assert_not_called()
+
+    def test_oversized_body_rejected(self, app_client):
+        client, mock_db, *_ = app_client
+        resp = client.post('/webhook-transaction',
+            json=transaction_payload(itemSold='x' * 70000),
+            headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+        assert resp.status_code == 413
+        mock_db.checkIfExists.assert_not_called()
+
+    def test_mistyped_field_rejected(self, app_client):
+        client, mock_db, *_ = app_client
+        resp = client.post('/webhook-transaction',
+            json=transaction_payload(customerId=['CUST123']),
+            headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+        assert resp.status_code == 400
+        mock_db.checkIfExists.assert_not_called()
+
     def test_duplicate_transaction_skipped(self, app_client):
         client, mock_db, mock_rl, *_ = app_client
         mock_db.checkIfExists.return_value = True
@@ -101,6 +129,73 @@ class TestTransactionWebhook:
         assert resp.status_code == 200
         mock_vagaro.get_customer_details.assert_called_once_with('CUST123')
 
+    def test_late_form_avoids_api_fallback(self, app_client, monkeypatch):
+        client, mock_db, mock_rl, mock_vagaro = app_client
+        waiter = FormWaiter(timeout=5)
+        monkeypatch.setattr(flask_app, 'form_waiter', waiter)
+        mock_db.checkIfExists.return_value = False
+        lookups = []
+
+        def pending(collection, key):
+            lookups.append(key)
+            if len(lookups) == 1:
+                # The form webhook lands while the transaction waits.
+                threading.Timer(0.02, waiter.notify, [key]).start()
+                return make_firestore_doc(exists=False)
+            return make_firestore_doc(data=VALID_CUSTOMER)
+        mock_db.getData.side_effect = pending
+        mock_rl.create_access_person.return_value = ('guest-123', '4567')
+        avoided = FORM_WAIT.value(result='avoided')
+
+        resp = client.post('/webhook-transaction',
+            json=transaction_payload(),
+            headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+
+        assert resp.status_code == 200
+        assert lookups == ['CUST123', 'CUST123']
+        mock_vagaro.get_customer_details.assert_not_called()
+        assert FORM_WAIT.value(result='avoided') == avoided + 1
+
+    def test_resolved_form_used_as_stored(self, app_client):
+        client, mock_db, mock_rl, mock_vagaro = app_client
+        mock_db.checkIfExists.return_value = False
+        mock_db.getData.return_value = make_firestore_doc(data={
+            'first_name': 'Jane', 'last_name': 'Smith', 'phone_number': 'see profile',
+            'phone': '+15085559876', 'resolved': True,
+        })
+        mock_rl.create_access_person.return_value = ('guest-456', '8901')
+
+        with patch.object(flask_app, 'fix_phone_number') as mock_fix:
+            resp = client.post('/webhook-transaction',
+                json=transaction_payload(),
+                headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+
+        assert resp.status_code == 200
+        mock_fix.assert_not_called()
+        mock_vagaro.get_customer_details.assert_not_called()
+
+    def test_form_wait_times_out_to_api_fallback(self, app_client, monkeypatch):
+        client, mock_db, mock_rl, mock_vagaro = app_client
+        monkeypatch.setattr(flask_app, 'form_waiter', FormWaiter(timeout=0.02))
+        mock_db.checkIfExists.return_value = False
+        mock_db.getData.return_value = make_firestore_doc(exists=False)
+        mock_vagaro.get_customer_details.return_value = {
+            'customerFirstName': 'Jane',
+            'customerLastName':  'Smith',
+            'mobilePhone':       '5085559876',
+        }
+        mock_rl.create_access_person.return_value = ('guest-456', '8901')
+        missed = FORM_WAIT.value(result='missed')
+
+        resp = client.post('/webhook-transaction',
+            json=transaction_payload(),
+            headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+
+        assert resp.status_code == 200
+        mock_db.getData.assert_called_once()
+        mock_vagaro.get_customer_details.assert_called_once_with('CUST123')
+        assert FORM_WAIT.value(result='missed') == missed + 1
+
     def test_remotelock_failure_returns_500(self, app_client):
         client, mock_db, mock_rl, _ = app_client
         mock_db.checkIfExists.return_value = False
@@ -287,6 +382,53 @@ class TestSMSPINWebhook:
         assert resp.status_code == 200
         assert b'PIN taken' in resp.data
 
+    def test_pin_known_taken_locally_skips_remotelock(self, app_client, monkeypatch):
+        client, mock_db, mock_rl, *_ = app_client
+        mock_db.getData.return_value = make_firestore_doc(data={
+            'remote_lock_id': 'guest-123',
+            'timestamp':      datetime.now(timezone.utc),
+        })
+        flask_app.pin_index.rebuild(MagicMock(list_access_persons=MagicMock(return_value=([
+            {'id': 'guest-other', 'attributes': {'pin': '7890'}},
+        ], 1))))
+
+        with patch('app.send_sms', return_value=True) as mock_sms:
+            resp = self._sms(client, '+15085551234', '7890')
+
+        assert resp.status_code == 200
+        assert b'PIN taken' in resp.data
+        mock_rl.update_pin.assert_not_called()
+        assert '7891' in mock_sms.call_args.kwargs['body']
+
+    def test_stale_index_leaves_the_decision_to_remotelock(self, app_client):
+        client, mock_db, mock_rl, *_ = app_client
+        mock_db.getData.return_value = make_firestore_doc(data={
+            'remote_lock_id': 'guest-123',
+            'timestamp':      datetime.now(timezone.utc),
+        })
+        flask_app.pin_index.rebuild(MagicMock(list_access_persons=MagicMock(return_value=([
+            {'id': 'guest-other', 'attributes': {'pin': '7890'}},
+        ], 1))))
+        flask_app.pin_index.built_at -= flask_app.PIN_INDEX_MAX_AGE_SECONDS + 60
+
+        resp = self._sms(client, '+15085551234', '7890')
+
+        assert b'PIN updated' in resp.data
+        mock_rl.update_pin.assert_called_once_with('guest-123', '7890')
+
+    def test_members_own_pin_is_not_blocked(self, app_client):
+        client, mock_db, mock_rl, *_ = app_client
+        mock_db.getData.return_value = make_firestore_doc(data={
+            'remote_lock_id': 'guest-123',
+            'timestamp':      datetime.now(timezone.utc),
+        })
+        flask_app.pin_index.record('guest-123', '7890')
+
+        resp = self._sms(client, '+15085551234', '7890')
+
+        assert b'PIN updated' in resp.data
+        mock_rl.update_pin.assert_called_once_with('guest-123', '7890')
+
     def test_remotelock_error_returns_500(self, app_client):
         client, mock_db, mock_rl, *_ = app_client
         mock_db.getData.return_value = make_firestore_doc(data={
@@ -322,6 +464,16 @@ class TestFormWebhook:
         assert resp.status_code == 200
         mock_db.add.assert_not_called()
 
+    def test_other_form_ignored_without_parsing(self, app_client):
+        client, mock_db, *_ = app_client
+        with patch('bstrong.payloads.loads') as mock_loads:
+            resp = client.post('/webhook-form',
+                json={'payload': {'formId': 'another-form', 'customerId': 'CUST123', 'questionsAndAnswers': []}},
+                headers={'X-Vagaro-Signature': FORUM_TOKEN})
+        assert resp.status_code == 200
+        mock_loads.assert_not_called()
+        mock_db.add.assert_not_called()
+
     def test_valid_form_stored_in_firestore(self, app_client):
         client, mock_db, *_ = app_client
         resp = client.post('/webhook-form', json={'payload': {
@@ -340,6 +492,28 @@ class TestFormWebhook:
         assert stored['first_name']   == 'John'
         assert stored['last_name']    == 'Doe'
         assert stored['phone_number'] == '5085551234'
+        assert stored['phone']        == '+15085551234'
+        assert stored['resolved'] is True
+
+    def test_unusable_form_prefetched_from_vagaro(self, app_client, monkeypatch):
+        client, mock_db, *_ = app_client
+        monkeypatch.setattr(flask_app, 'FORM_VAGARO_PREFETCH', True)
+        with patch.object(flask_app, 'start_prefetch') as mock_prefetch:
+            resp = client.post('/webhook-form', json={'payload': {
+                'formId':     '67842fd8f276412c07c20490',
+                'customerId': 'CUST123',
+                'questionsAndAnswers': [
+                    {'question': 'First Name', 'answer': ['John']},
+                    {'question': 'Last Name',  'answer': ['Doe']},
+                    {'question': 'CELL #',     'answer': ['123']},
+                ],
+            }}, headers={'X-Vagaro-Signature': FORUM_TOKEN})
+
+        assert resp.status_code == 200
+        stored = mock_db.add.call_args.kwargs['data']
+        assert stored['resolved'] is False
+        assert 'phone' not in stored
+        mock_prefetch.assert_called_once_with('CUST123', 'John', 'Doe')
 
     def test_empty_answers_skipped_gracefully(self, app_client):
         client, mock_db, *_ = app_client
@@ -358,6 +532,56 @@ class TestFormWebhook:
         stored = mock_db.add.call_args.kwargs['data']
         assert stored['first_name'] == 'Jane'
 
+    def test_stored_form_ends_a_transaction_wait(self, app_client, monkeypatch):
+        client, mock_db, *_ = app_client
+        waiter = FormWaiter(timeout=5)
+        monkeypatch.setattr(flask_app, 'form_waiter', waiter)
+        resp = client.post('/webhook-form', json={'payload': {
+            'formId':     '67842fd8f276412c07c20490',
+            'customerId': 'CUST123',
+            'questionsAndAnswers': [
+                {'question': 'First Name', 'answer': ['John']},
+                {'question': 'Last Name',  'answer': ['Doe']},
+                {'question': 'CELL #',     'answer': ['5085551234']},
+            ],
+        }}, headers={'X-Vagaro-Signature': FORUM_TOKEN})
+
+        assert resp.status_code == 200
+        assert waiter.wait('CUST123') is True
+
+
+class TestFormPrefetch:
+    def test_profile_stored_on_the_form(self, app_client):
+        _, mock_db, _, mock_vagaro = app_client
+        mock_vagaro.get_customer_details.return_value = {
+            'customerFirstName': 'Jane', 'customerLastName': 'Smith', 'mobilePhone': '5085559876',
+        }
+
+        flask_app.prefetch_customer('CUST123', None, 'Doe')
+
+        mock_db.update.assert_called_once_with('pending_customers', 'CUST123', {
+            'first_name': 'Jane', 'last_name': 'Doe', 'phone': '+15085559876', 'resolved': True,
+        })
+
+    def test_failed_lookup_leaves_the_form(self, app_client):
+        _, mock_db, _, mock_vagaro = app_client
+        mock_vagaro.get_customer_details.return_value = None
+        failed = flask_app.metrics.OUTCOMES.value(route='form', outcome='prefetch_failed')
+
+        flask_app.prefetch_customer('CUST123', 'John', 'Doe')
+
+        mock_db.update.assert_not_called()
+        assert flask_app.metrics.OUTCOMES.value(route='form', outcome='prefetch_failed') == failed + 1
+
+    def test_consumed_form_is_not_recreated(self, app_client):
+        _, mock_db, _, mock_vagaro = app_client
+        mock_vagaro.get_customer_details.return_value = {'mobilePhone': '5085559876'}
+        mock_db.update.side_effect = RuntimeError("404 No document to update")
+
+        flask_app.prefetch_customer('CUST123', 'John', 'Doe')
+
+        mock_db.add.assert_not_called()
+
 
 # ---- /cron-expire --------------------------------------------------------
 
@@ -430,3 +654,110 @@ class TestCleanupFirestore:
         assert b'3' in resp.data
         assert mock_batch.delete.call_count == 3
         mock_batch.commit.assert_called_once()
+
+
+# ---- /bulk-operations ----------------------------------------------------
+
+BULK_TOKEN = TEST_CONFIG['BULK_OPS_TOKEN']
+
+
+class TestBulkOperations:
+    def test_bad_token_rejected(self, app_client):
+        client, *_ = app_client
+        resp = client.post('/bulk-operations', json={'action': 'extend', 'days': 1},
+                           headers={'X-Bulk-Token': 'wrong'})
+        assert resp.status_code == 403
+
+    def test_invalid_action_returns_400(self, app_client):
+        client, *_ = app_client
+        resp = client.post('/bulk-operations', json={'action': 'explode'},
+                           headers={'X-Bulk-Token': BULK_TOKEN})
+        assert resp.status_code == 400
+
+    def test_starts_job_in_background(self, app_client):
+        client, *_ = app_client
+        with patch('app.threading.Thread') as mock_thread:
+            resp = client.post('/bulk-operations', json={'action': 'extend', 'days': 2},
+                               headers={'X-Bulk-Token': BULK_TOKEN})
+
+        assert resp.status_code == 202
+        assert resp.get_json()['job_id']
+        mock_thread.return_value.start.assert_called_once()
+        operation = mock_thread.call_args.kwargs['args'][0]
+        assert operation.days == 2
+
+    def test_status_returns_job_document(self, app_client):
+        client, mock_db, *_ = app_client
+        mock_db.getData.return_value = make_firestore_doc(data={'status': 'running', 'processed': 4})
+
+        resp = client.get('/bulk-operations/job-1', headers={'X-Bulk-Token': BULK_TOKEN})
+
+        assert resp.status_code == 200
+        assert resp.get_json()['processed'] == 4
+        mock_db.getData.assert_called_once_with('bulk_jobs', 'job-1')
+
+    def test_unknown_job_returns_404(self, app_client):
+        client, mock_db, *_ = app_client
+        mock_db.getData.return_value = make_firestore_doc(exists=False)
+        resp = client.get('/bulk-operations/nope', headers={'X-Bulk-Token': BULK_TOKEN})
+        assert resp.status_code == 404
+
+
+# ---- /metrics -------------------------------------------------------------
+
+METRICS_TOKEN = TEST_CONFIG['METRICS_TOKEN']
+
+
+class TestMetrics:
+    def test_bad_token_rejected(self, app_client):
+        client, *_ = app_client
+        resp = client.get('/metrics', headers={'Authorization': 'Bearer wrong'})
+        assert resp.status_code == 403
+
+    def test_renders_prometheus_text(self, app_client):
+        client, *_ = app_client
+        client.get('/health')
+
+        resp = client.get('/metrics', headers={'Authorization': f'Bearer {METRICS_TOKEN}'})
+
+        assert resp.status_code == 200
+        assert resp.content_type.startswith('text/plain')
+        body = resp.get_data(as_text=True)
+        assert '# TYPE bstrong_request_seconds histogram' in body
+        assert 'bstrong_request_seconds_count{route="/health",status="200"}' in body
+        assert 'bstrong_component_value{component="pin_index",field="pins"} 0' in body
+
+    def test_header_token_accepted(self, app_client):
+        client, *_ = app_client
+        resp = client.get('/metrics', headers={'X-Metrics-Token': METRICS_TOKEN})
+        assert resp.status_code == 200
+
+    def test_duplicate_transaction_counted(self, app_client):
+        from bstrong.metrics import OUTCOMES, STAGE_SECONDS
+        client, mock_db, *_ = app_client
+        mock_db.checkIfExists.return_value = True
+        before = OUTCOMES.value(route='transaction', outcome='duplicate')
+        stages_before = STAGE_SECONDS.count(route='transaction', stage='dedupe')
+
+        client.post('/webhook-transaction', json=transaction_payload(),
+                    headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+
+        assert OUTCOMES.value(route='transaction', outcome='duplicate') == before + 1
+        assert STAGE_SECONDS.count(route='transaction', stage='dedupe') == stages_before + 1
+
+    def test_fallback_counted(self, app_client):
+        from bstrong.metrics import OUTCOMES
+        client, mock_db, mock_rl, mock_vagaro = app_client
+        mock_db.checkIfExists.return_value = False
+        mock_db.getData.return_value = make_firestore_doc(exists=False)
+        mock_vagaro.get_customer_details.return_value = None
+        before = OUTCOMES.value(route='transaction', outcome='fallback_used')
+        failures = OUTCOMES.value(route='transaction', outcome='failure')
+
+        with patch('app.send_sms'):
+            resp = client.post('/webhook-transaction', json=transaction_payload(),
+                               headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+
+        assert resp.status_code == 500
+        assert OUTCOMES.value(route='transaction', outcome='fallback_used') == before + 1
+        assert OUTCOMES.value(route='transaction', outcome='failure') == failures + 1
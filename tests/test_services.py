@@ -1,11 +1,18 @@
 import pytest
 import pytz
+import calendar
 import requests as req_lib
-from datetime import datetime, timezone
+from datetime import date, datetime, time, timedelta, timezone
 from freezegun import freeze_time
 from unittest.mock import MagicMock, patch
 
-from bstrong.services import get_next_month_anniversary, create_door_code, extend_remotelock_code
+from bstrong.api_clients import LOCK_SCHEDULE_ID
+from bstrong.config import MEMBERSHIP_DURATIONS
+from bstrong.services import (
+    get_next_month_anniversary, create_door_code, extend_remotelock_code,
+    AccessWindowPlanner, DAY_PASS, MONTHLY, UNKNOWN,
+)
+from bstrong.catalog import FIXED
 
 EST = pytz.timezone('US/Eastern')
 
@@ -128,7 +135,7 @@ class TestCreateDoorCode:
         with patch('bstrong.services.send_sms', return_value=True):
             create_door_code('Jane', 'Smith', '+15085559876', '1 week pass', mock_rl)
 
-        mock_rl.grant_lock_access.assert_called_once_with('guest-4', 'test-lock-id')
+        mock_rl.grant_lock_access.assert_called_once_with('guest-4', 'test-lock-id', LOCK_SCHEDULE_ID)
 
     @freeze_time("2026-04-29 14:00:00")
     def test_day_pass_sms_does_not_mention_expiry_date(self):
@@ -152,6 +159,33 @@ class TestCreateDoorCode:
         sms_body = mock_sms.call_args.kwargs['body']
         assert 'expire' in sms_body.lower()
 
+    @freeze_time("2026-04-29 14:00:00")
+    def test_failed_grant_deletes_the_new_guest(self):
+        mock_rl = MagicMock()
+        mock_rl.create_access_person.return_value = ('guest-7', '6666')
+        mock_rl.grant_lock_access.side_effect = req_lib.exceptions.RequestException("Timeout")
+
+        with patch('bstrong.services.send_Dev'), patch('bstrong.topology.time.sleep'):
+            assert create_door_code('John', 'Doe', '+15085551234', '1 week pass', mock_rl) == (False, None)
+
+        mock_rl.delete_access_person.assert_called_once_with('guest-7')
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_failed_text_keeps_the_guest_for_a_resend(self):
+        mock_rl = MagicMock()
+        mock_rl.create_access_person.return_value = ('guest-8', '7777')
+        mock_rl.get_access_person.return_value = {'pin': '7777'}
+
+        with patch('bstrong.services.send_sms', return_value=False):
+            assert create_door_code('John', 'Doe', '+15085551234', '1 week pass', mock_rl) == (False, 'guest-8')
+        with patch('bstrong.services.send_sms', return_value=True) as mock_sms:
+            assert create_door_code('John', 'Doe', '+15085551234', '1 week pass', mock_rl, guest_id='guest-8') == (True, 'guest-8')
+
+        mock_rl.create_access_person.assert_called_once()
+        mock_rl.grant_lock_access.assert_called_once()
+        mock_rl.delete_access_person.assert_not_called()
+        assert '7777' in mock_sms.call_args.kwargs['body']
+
 
 class TestExtendRemoteLockCode:
     def test_success_returns_true(self):
@@ -184,3 +218,111 @@ class TestExtendRemoteLockCode:
 
         assert result is False
         mock_dev.assert_called_once()
+
+
+# ---- AccessWindowPlanner -------------------------------------------------
+# Reference implementation of the original per-call pytz logic. The planner
+# must agree with it for every half hour of a full year, DST days included.
+
+def _legacy_start_day(moment):
+    local = moment.astimezone(EST)
+    return local.date() if local.hour < 22 else local.date() + timedelta(days=1)
+
+
+def _legacy_anniversary(start_date):
+    next_month = (start_date.month % 12) + 1
+    next_year = start_date.year + (start_date.month // 12)
+    _, max_days = calendar.monthrange(next_year, next_month)
+    target = date(next_year, next_month, min(start_date.day, max_days))
+    return (datetime.combine(target, time(22, 0)).replace(tzinfo=pytz.UTC),
+            EST.localize(datetime.combine(target, time(22, 5))))
+
+
+def _legacy_window(membership_type, start_day):
+    start_est = EST.localize(datetime.combine(start_day, time(4, 0)))
+    start_utc = start_est.replace(tzinfo=pytz.UTC)
+    key = membership_type.lower()
+    if "day pass" in key:
+        end_day = start_day
+    elif "1 month" in key:
+        return start_utc, _legacy_anniversary(start_day)[0]
+    else:
+        end_day = (start_est + MEMBERSHIP_DURATIONS.get(key, timedelta(days=0))).date()
+    end_utc = EST.localize(datetime.combine(end_day, time(22, 0))).replace(tzinfo=pytz.UTC)
+    return start_utc, end_utc
+
+
+def _half_hours(year):
+    moment = pytz.utc.localize(datetime(year, 1, 1, 0, 0))
+    end = pytz.utc.localize(datetime(year + 1, 1, 1, 6, 0))
+    while moment < end:
+        yield moment
+        moment += timedelta(minutes=30)
+
+
+MEMBERSHIPS = ['day pass', '1 month gym membership', '1 week pass', 'Weekend Warrior',
+               'BEST RATE!!! ONE YEAR (PIF)', 'mystery plan']
+
+
+class TestAccessWindowPlanner:
+    def test_start_day_matches_legacy_for_full_year(self):
+        planner = AccessWindowPlanner()
+        for moment in _half_hours(2026):
+            assert planner.start_day(moment) == _legacy_start_day(moment), moment
+
+    def test_local_date_matches_astimezone_for_full_year(self):
+        planner = AccessWindowPlanner()
+        for moment in _half_hours(2026):
+            assert planner.local_date(moment) == moment.astimezone(EST).date(), moment
+
+    def test_windows_match_legacy_for_every_start_day(self):
+        planner = AccessWindowPlanner()
+        day = date(2026, 1, 1)
+        while day.year == 2026:
+            moment = EST.localize(datetime.combine(day, time(12, 0)))
+            for membership in MEMBERSHIPS:
+                window = planner.plan(membership, now=moment)
+                assert (window.start_utc, window.end_utc) == _legacy_window(membership, day), (membership, day)
+            day += timedelta(days=1)
+
+    def test_anniversary_matches_legacy_for_leap_and_common_years(self):
+        planner = AccessWindowPlanner()
+        for year in (2024, 2026):
+            day = date(year, 1, 1)
+            while day.year == year:
+                expiry = EST.localize(datetime.combine(day, time(22, 5)))
+                assert planner.next_month_anniversary(expiry) == _legacy_anniversary(day), day
+                day += timedelta(days=1)
+
+    def test_cutoff_follows_dst(self):
+        planner = AccessWindowPlanner()
+        # 10 PM EDT on Jul 1 is 02:00 UTC, 10 PM EST on Jan 1 is 03:00 UTC.
+        assert planner.start_day(pytz.utc.localize(datetime(2026, 7, 2, 1, 59))) == date(2026, 7, 1)
+        assert planner.start_day(pytz.utc.localize(datetime(2026, 7, 2, 2, 0))) == date(2026, 7, 2)
+        assert planner.start_day(pytz.utc.localize(datetime(2026, 1, 2, 2, 59))) == date(2026, 1, 1)
+        assert planner.start_day(pytz.utc.localize(datetime(2026, 1, 2, 3, 0))) == date(2026, 1, 2)
+
+    def test_firestore_expiry_offset_follows_dst(self):
+        planner = AccessWindowPlanner()
+        _, winter = planner.next_month_anniversary(_expiry(2026, 12, 10))
+        _, summer = planner.next_month_anniversary(_expiry(2026, 6, 10))
+        assert winter.utcoffset() == timedelta(hours=-5)
+        assert summer.utcoffset() == timedelta(hours=-4)
+
+    def test_kinds(self):
+        planner = AccessWindowPlanner()
+        now = EST.localize(datetime(2026, 4, 29, 10, 0))
+        kinds = [w.kind for w in planner.plan_many(['day pass', '1 month', '1 week pass', 'mystery'], now=now)]
+        assert kinds == [DAY_PASS, MONTHLY, FIXED, UNKNOWN]
+
+    def test_plan_many_matches_plan(self):
+        planner = AccessWindowPlanner()
+        now = pytz.utc.localize(datetime(2026, 3, 8, 3, 30))  # DST change night, after cutoff
+        batch = planner.plan_many(MEMBERSHIPS * 3, now=now)
+        assert batch == [planner.plan(m, now=now) for m in MEMBERSHIPS * 3]
+
+    def test_force_end_overrides_rules(self):
+        planner = AccessWindowPlanner()
+        forced = pytz.utc.localize(datetime(2026, 6, 1, 22, 0))
+        window = planner.plan('monthly autopay membership', now=_expiry(2026, 4, 29), force_end_utc=forced)
+        assert window.end_utc == forced
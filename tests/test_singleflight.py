@@ -0,0 +1,195 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from bstrong.metrics import SINGLE_FLIGHT
+from bstrong.singleflight import AsyncSingleFlight, SingleFlight, LEASE_COLLECTION, INSTANCE_ID
+from tests.conftest import make_firestore_doc, TEST_CONFIG, flask_app
+from tests.fakes import InMemoryDatabase
+from tests.test_routes import VALID_CUSTOMER, transaction_payload
+
+TRANSACTION_TOKEN = TEST_CONFIG['TRANSACTION_TOKEN']
+
+
+def wait_for_followers(flight, baseline, count=1, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while SINGLE_FLIGHT.value(flight=flight, role="follower") < baseline + count and time.monotonic() < deadline:
+        time.sleep(0.005)
+
+
+def run_concurrently(*targets):
+    results = [None] * len(targets)
+
+    def run(i, target):
+        results[i] = target()
+
+    threads = [threading.Thread(target=run, args=(i, t)) for i, t in enumerate(targets)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+class TestSingleFlight:
+    def test_followers_share_the_leaders_result(self):
+        flight = SingleFlight("test-share")
+        followers = SINGLE_FLIGHT.value(flight="test-share", role="follower")
+        calls = []
+
+        def work():
+            calls.append(1)
+            wait_for_followers("test-share", followers, count=2)
+            return "done"
+
+        results = run_concurrently(*[lambda: flight.do("C1", work)] * 3)
+
+        assert len(calls) == 1
+        assert sorted(results, key=lambda r: r[1]) == [("done", False), ("done", True), ("done", True)]
+        assert flight.in_flight() == 0
+
+    def test_followers_get_the_leaders_exception(self):
+        flight = SingleFlight("test-error")
+        followers = SINGLE_FLIGHT.value(flight="test-error", role="follower")
+
+        def work():
+            wait_for_followers("test-error", followers)
+            raise RuntimeError("Vagaro down")
+
+        def call():
+            try:
+                flight.do("C1", work)
+            except RuntimeError as e:
+                return str(e)
+
+        assert run_concurrently(call, call) == ["Vagaro down", "Vagaro down"]
+
+    def test_keys_and_later_calls_run_separately(self):
+        flight = SingleFlight("test-keys")
+        assert flight.do("C1", lambda: 1) == (1, False)
+        assert flight.do("C2", lambda: 2) == (2, False)
+        assert flight.do("C1", lambda: 3) == (3, False)
+
+
+class TestLease:
+    def test_leader_waits_for_another_instances_lease(self):
+        db = InMemoryDatabase()
+        now = datetime.now(timezone.utc)
+        db.add(LEASE_COLLECTION, "test-lease:T1", {'owner': 'other-instance', 'expires': now + timedelta(seconds=0.2)})
+        waits = SINGLE_FLIGHT.value(flight="test-lease", role="lease_wait")
+        held = []
+
+        flight = SingleFlight("test-lease", db, lease_seconds=5, poll=0.02)
+        result = flight.do("T1", lambda: held.append(dict(db.collections[LEASE_COLLECTION]["test-lease:T1"])) or "ok")
+
+        assert result == ("ok", False)
+        assert held[0]['owner'] == INSTANCE_ID
+        assert SINGLE_FLIGHT.value(flight="test-lease", role="lease_wait") == waits + 1
+        assert "test-lease:T1" not in db.collections[LEASE_COLLECTION]
+
+    def test_firestore_outage_falls_back_to_in_process(self):
+        db = MagicMock()
+        db.acquireLease.side_effect = RuntimeError("Firestore down")
+
+        assert SingleFlight("test-outage", db, lease_seconds=5).do("T1", lambda: "ok") == ("ok", False)
+        db.releaseLease.assert_not_called()
+
+
+class TestAsyncSingleFlight:
+    def test_coroutines_share_one_run(self):
+        flight = AsyncSingleFlight("test-async")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "done"
+
+        async def main():
+            return await asyncio.gather(*(flight.do("C1", work) for _ in range(3)))
+
+        assert asyncio.run(main()) == [("done", False), ("done", True), ("done", True)]
+        assert len(calls) == 1
+
+    def test_exception_reaches_every_caller(self):
+        flight = AsyncSingleFlight("test-async-error")
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("boom")
+
+        async def main():
+            return await asyncio.gather(*(flight.do("C1", work) for _ in range(2)), return_exceptions=True)
+
+        assert [str(r) for r in asyncio.run(main())] == ["boom", "boom"]
+        assert flight.in_flight() == 0
+
+    def test_cancelled_leader_hands_the_work_to_a_follower(self):
+        flight = AsyncSingleFlight("test-async-cancel")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def main():
+            leader = asyncio.create_task(flight.do("C1", work))
+            await asyncio.sleep(0.01)
+            followers = [asyncio.create_task(flight.do("C1", work)) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            results = await asyncio.gather(*followers)
+            return leader.cancelled(), results
+
+        cancelled, results = asyncio.run(main())
+        assert cancelled
+        assert sorted(results, key=lambda r: r[1]) == [("done", False), ("done", True)]
+        assert len(calls) == 2
+        assert flight.in_flight() == 0
+
+
+class TestTransactionCoalescing:
+    def post(self, **overrides):
+        client = flask_app.app.test_client()
+        resp = client.post('/webhook-transaction', json=transaction_payload(**overrides),
+                           headers={'X-Vagaro-Signature': TRANSACTION_TOKEN})
+        return resp.status_code, resp.data
+
+    def test_redelivery_in_flight_reuses_the_response(self, app_client):
+        _, mock_db, mock_rl, _ = app_client
+        mock_db.checkIfExists.return_value = False
+        mock_db.getData.return_value = make_firestore_doc(data=VALID_CUSTOMER)
+        followers = SINGLE_FLIGHT.value(flight="transaction", role="follower")
+        coalesced = flask_app.metrics.OUTCOMES.value(route="transaction", outcome="coalesced")
+
+        def create(*args, **kwargs):
+            wait_for_followers("transaction", followers)
+            return ('guest-1', '1234')
+        mock_rl.create_access_person.side_effect = create
+
+        results = run_concurrently(self.post, self.post)
+
+        assert results[0] == results[1] == (200, b'Door code created successfully')
+        mock_rl.create_access_person.assert_called_once()
+        assert flask_app.metrics.OUTCOMES.value(route="transaction", outcome="coalesced") == coalesced + 1
+
+    def test_same_customer_shares_one_vagaro_lookup(self, app_client):
+        _, mock_db, mock_rl, mock_vagaro = app_client
+        mock_db.checkIfExists.return_value = False
+        mock_db.getData.return_value = make_firestore_doc(exists=False)
+        mock_rl.create_access_person.return_value = ('guest-1', '1234')
+        followers = SINGLE_FLIGHT.value(flight="customer", role="follower")
+
+        def lookup(customer_id):
+            wait_for_followers("customer", followers)
+            return {'customerFirstName': 'Jane', 'customerLastName': 'Smith', 'mobilePhone': '5085559876'}
+        mock_vagaro.get_customer_details.side_effect = lookup
+
+        results = run_concurrently(lambda: self.post(userPaymentId='PAY1'), lambda: self.post(userPaymentId='PAY2'))
+
+        assert [status for status, _ in results] == [200, 200]
+        mock_vagaro.get_customer_details.assert_called_once_with('CUST123')
+        assert mock_rl.create_access_person.call_count == 2
@@ -0,0 +1,193 @@
+import random
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from bstrong.database import Database
+from bstrong.ticket_filter import TicketFilter, TICKET_COLLECTION
+from tests.conftest import make_firestore_doc, flask_app
+
+rng = random.Random(41)
+
+
+def phones(n):
+    return [f"+1{rng.randint(2000000000, 9899999999)}" for _ in range(n)]
+
+
+def _db(keys):
+    db = MagicMock()
+    db.listKeys.return_value = list(keys)
+    return db
+
+
+class TestTicketFilter:
+    def test_not_ready_says_maybe(self):
+        f = TicketFilter(capacity=100, fp_rate=0.01)
+        assert not f.ready
+        assert f.might_contain('+15085551234')
+        assert f.lookups == 0
+
+    def test_rebuild_contains_every_ticket(self):
+        tickets = phones(500)
+        f = TicketFilter(capacity=1000, fp_rate=0.01)
+        assert f.rebuild(_db(tickets)) == 500
+        assert f.ready
+        assert all(f.might_contain(p) for p in tickets)
+
+    def test_false_positive_rate_near_target(self):
+        tickets = set(phones(2000))
+        f = TicketFilter(capacity=2000, fp_rate=0.01)
+        f.rebuild(_db(tickets))
+        others = [p for p in phones(20000) if p not in tickets]
+        fp = sum(f.might_contain(p) for p in others) / len(others)
+        assert fp < 0.03
+        # Rebuilds size for twice the tickets found, leaving headroom for new ones.
+        assert f.estimated_fp_rate() < 0.01
+
+    def test_grows_past_capacity_on_rebuild(self):
+        f = TicketFilter(capacity=100, fp_rate=0.01)
+        small = f.stats()['counters']
+        f.rebuild(_db(phones(1000)))
+        assert f.stats()['counters'] > small * 10
+
+    def test_add_and_listener_changes(self):
+        f = TicketFilter(capacity=100, fp_rate=0.01)
+        f.rebuild(_db([]))
+        f.add('+15085551234')
+        f.apply_changes(added=['+15085550000'], removed=[])
+        assert f.might_contain('+15085551234') and f.might_contain('+15085550000')
+        f.apply_changes(added=[], removed=['+15085550000'])
+        assert not f.might_contain('+15085550000')
+        assert f.might_contain('+15085551234')
+
+    def test_add_during_rebuild_survives_swap(self):
+        f = TicketFilter(capacity=100, fp_rate=0.01)
+        db = MagicMock()
+
+        def listing(collection):
+            assert collection == TICKET_COLLECTION
+            f.add('+15085559999')  # written while the listing was in flight
+            return ['+15085551111']
+        db.listKeys.side_effect = listing
+        assert f.rebuild(db) == 2
+        assert f.might_contain('+15085559999')
+
+    def test_removal_during_rebuild_survives_swap(self):
+        f = TicketFilter(capacity=100, fp_rate=0.01)
+        f.rebuild(_db(['+15085551111']))
+        db = MagicMock()
+
+        def listing(collection):
+            f.discard('+15085551111')  # deleted after the listing was read
+            return ['+15085551111']
+        db.listKeys.side_effect = listing
+        assert f.rebuild(db) == 0
+        assert not f.might_contain('+15085551111')
+
+    def test_removal_of_unknown_phone_keeps_real_tickets(self):
+        tickets = phones(50)
+        f = TicketFilter(capacity=10, fp_rate=0.2)
+        f.rebuild(_db(tickets))
+        for phone in phones(500):
+            if phone not in tickets:
+                f.discard(phone)
+        f.apply_changes(added=[tickets[0]], removed=[])  # the listener echoing a local write
+        f.discard(tickets[0])
+        assert not f.might_contain(tickets[0])
+        assert all(f.might_contain(p) for p in tickets[1:])
+        # Only the phone counted since the rebuild was decremented; the rest are held as removals.
+        assert f.stats()['entries'] == 50
+
+    def test_removed_listed_phone_says_no_until_rebuild_drops_it(self):
+        f = TicketFilter(capacity=100, fp_rate=0.01)
+        f.rebuild(_db(['+15085551111', '+15085552222']))
+        f.discard('+15085551111')
+        assert not f.might_contain('+15085551111')
+        assert f.stats()['removed'] == 1
+        f.add('+15085551111')  # a new ticket for the same phone
+        assert f.might_contain('+15085551111')
+        f.discard('+15085551111')
+        f.rebuild(_db(['+15085552222']))
+        assert f.stats()['removed'] == 0
+        assert f.stats()['entries'] == 1
+        assert not f.might_contain('+15085551111')
+
+    def test_failed_rebuild_keeps_previous_filter(self):
+        f = TicketFilter(capacity=100, fp_rate=0.01)
+        f.rebuild(_db(['+15085551111']))
+        db = MagicMock()
+        db.listKeys.side_effect = RuntimeError('firestore down')
+        with pytest.raises(RuntimeError):
+            f.rebuild(db)
+        assert f.might_contain('+15085551111')
+        f.add('+15085552222')
+        assert f.might_contain('+15085552222')
+
+    def test_stats_report_memory_and_rates(self):
+        f = TicketFilter(capacity=1000, fp_rate=0.01)
+        f.rebuild(_db(['+15085551111']))
+        f.might_contain('+15085550000')
+        f.might_contain('+15085551111')
+        f.record_false_positive()
+        stats = f.stats()
+        assert stats['counters'] > 9000
+        assert stats['memory_bytes'] > stats['counters']
+        f.add('+15085552222')
+        f.discard('+15085551111')
+        assert f.stats()['memory_bytes'] > stats['memory_bytes']
+        assert stats['lookups'] == 2
+        assert stats['false_positives'] == 1
+        assert stats['observed_fp_rate'] == pytest.approx(1 / (1 + stats['skipped']))
+
+
+class TestWatchCollection:
+    def test_changes_split_into_added_and_removed(self):
+        db = Database.__new__(Database)
+        db.database = MagicMock()
+        seen = []
+        db.watchCollection(TICKET_COLLECTION, lambda added, removed: seen.append((added, removed)))
+        callback = db.database.collection.return_value.on_snapshot.call_args.args[0]
+
+        def change(kind, doc_id):
+            return SimpleNamespace(type=SimpleNamespace(name=kind), document=SimpleNamespace(id=doc_id))
+        callback([], [change('ADDED', 'a'), change('MODIFIED', 'b'), change('REMOVED', 'c')], None)
+        assert seen == [(['a'], ['c'])]
+
+
+class TestSmsWebhookFilter:
+    def _sms(self, client, from_number):
+        with patch('app.RequestValidator') as mock_val:
+            mock_val.return_value.validate.return_value = True
+            return client.post('/webhook-sms', data={'From': from_number, 'Body': '1234'},
+                               headers={'X-Twilio-Signature': 'fake-sig'})
+
+    def test_definite_no_skips_firestore(self, app_client):
+        client, mock_db, *_ = app_client
+        flask_app.ticket_filter.rebuild(_db(['+15085551111']))
+        resp = self._sms(client, '+15085550000')
+        assert resp.status_code == 200
+        assert b'No ticket' in resp.data
+        mock_db.getData.assert_not_called()
+
+    def test_maybe_reads_firestore_and_counts_false_positive(self, app_client):
+        client, mock_db, *_ = app_client
+        flask_app.ticket_filter.rebuild(_db(['+15085551111']))
+        mock_db.getData.return_value = make_firestore_doc(exists=False)
+        resp = self._sms(client, '+15085551111')
+        assert b'No ticket' in resp.data
+        mock_db.getData.assert_called_once_with('pin_change_tickets', '+15085551111')
+        assert flask_app.ticket_filter.false_positives == 1
+
+    def test_new_ticket_added_to_filter(self, app_client):
+        client, mock_db, mock_rl, _ = app_client
+        flask_app.ticket_filter.rebuild(_db([]))
+        mock_db.checkIfExists.return_value = False
+        mock_db.getData.return_value = make_firestore_doc(data={'first_name': 'John', 'last_name': 'Doe', 'phone_number': '5085551234'})
+        mock_rl.create_access_person.return_value = ('guest-1', '1234')
+        with patch('bstrong.services.send_sms', return_value=True):
+            resp = client.post('/webhook-transaction',
+                json={'payload': {'itemSold': '1 month gym membership', 'customerId': 'C1',
+                                  'purchaseType': 'Membership', 'userPaymentId': 'P1'}},
+                headers={'X-Vagaro-Signature': 'test-transaction-token'})
+        assert resp.status_code == 200
+        assert flask_app.ticket_filter.might_contain('+15085551234')
@@ -0,0 +1,218 @@
+import json
+import time
+import threading
+import pytest
+import requests as req_lib
+from freezegun import freeze_time
+from unittest.mock import MagicMock, patch
+
+from bstrong import topology
+from bstrong.api_clients import LOCK_SCHEDULE_ID
+from bstrong.catalog import compile_product
+from bstrong.guest_pool import GuestPool, POOL_COLLECTION
+from bstrong.services import create_door_code
+from bstrong.topology import Lock, LockTopology, get_topology, grant_locks
+from tests.fakes import InMemoryDatabase
+
+SPEC = {
+    "locations": {
+        "main": {
+            "front": {"id": "lock-front", "required": True},
+            "studio": {"id": "lock-studio", "schedule_id": "sched-studio"},
+        },
+        "north": {"front": {"id": "lock-north"}},
+    },
+    "memberships": {
+        "default": ["main"],
+        "day_pass": ["main/front"],
+        "best rate!!! one year (pif)": ["main", "north"],
+    },
+}
+
+
+@pytest.fixture
+def multi_site(monkeypatch):
+    monkeypatch.setattr(topology, "LOCK_TOPOLOGY", json.dumps(SPEC))
+    return get_topology()
+
+
+def fail_on(bad_lock_id):
+    def grant(guest_id, lock_id, schedule_id):
+        if lock_id == bad_lock_id:
+            raise RuntimeError("offline")
+    return grant
+
+
+def labels(locks):
+    return [lock.label for lock in locks]
+
+
+class TestLockTopology:
+    def test_rules_resolve_by_item_then_kind_then_default(self):
+        topo = LockTopology.from_spec(SPEC)
+
+        assert labels(topo.locks_for(compile_product("best rate!!! one year (pif)"))) == ["main/front", "main/studio", "north/front"]
+        assert labels(topo.locks_for(compile_product("day pass"))) == ["main/front"]
+        assert labels(topo.locks_for(compile_product("1 week pass"))) == ["main/front", "main/studio"]
+        assert labels(topo.locks_for(None)) == ["main/front", "main/studio"]
+
+    def test_lock_attributes_come_from_the_spec(self):
+        front, studio, north = LockTopology.from_spec(SPEC).locks
+
+        assert (front.required, front.schedule_id) == (True, LOCK_SCHEDULE_ID)
+        assert (studio.required, studio.schedule_id) == (False, "sched-studio")
+        assert north.location == "north"
+
+    def test_without_default_rule_every_lock_is_granted(self):
+        topo = LockTopology.from_spec({"locations": SPEC["locations"]})
+        assert len(topo.default_locks()) == 3
+
+    def test_unknown_rule_target_is_rejected(self):
+        with pytest.raises(ValueError, match="south"):
+            LockTopology.from_spec({**SPEC, "memberships": {"default": ["south"]}})
+
+    def test_unset_topology_is_the_single_lock_id(self):
+        topo = get_topology()
+        assert [(lock.lock_id, lock.schedule_id, lock.required) for lock in topo.locks] == [("test-lock-id", LOCK_SCHEDULE_ID, True)]
+
+    def test_missing_lock_id_means_no_topology(self):
+        with patch("bstrong.topology.Config.get", return_value=None):
+            assert get_topology() is None
+
+
+class TestGrantLocks:
+    def test_locks_are_granted_concurrently(self):
+        locks = [Lock(f"lock-{i}", f"door-{i}") for i in range(4)]
+        active, peak, guard = [0], [0], threading.Lock()
+
+        def grant(guest_id, lock_id, schedule_id):
+            with guard:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with guard:
+                active[0] -= 1
+
+        rl = MagicMock()
+        rl.grant_lock_access.side_effect = grant
+        result = grant_locks(rl, "guest-1", locks)
+
+        assert result.ok and labels(result.granted) == labels(locks)
+        assert peak[0] > 1
+
+    def test_each_lock_is_retried_on_its_own(self):
+        front, studio = Lock("lock-front", "front"), Lock("lock-studio", "studio")
+        failures = {"lock-studio": 2}
+
+        def grant(guest_id, lock_id, schedule_id):
+            if failures.get(lock_id):
+                failures[lock_id] -= 1
+                raise req_lib.exceptions.ConnectionError("reset")
+
+        rl = MagicMock()
+        rl.grant_lock_access.side_effect = grant
+        with patch("bstrong.topology.time.sleep"):
+            result = grant_locks(rl, "guest-1", [front, studio], attempts=3)
+
+        assert result.ok and not result.failed
+        calls = [c.args[1] for c in rl.grant_lock_access.call_args_list]
+        assert calls.count("lock-front") == 1
+        assert calls.count("lock-studio") == 3
+
+    def test_optional_lock_failure_is_partial_success(self):
+        front, studio = Lock("lock-front", "front", required=True), Lock("lock-studio", "studio")
+        rl = MagicMock()
+        rl.grant_lock_access.side_effect = fail_on("lock-studio")
+
+        with patch("bstrong.topology.time.sleep"):
+            result = grant_locks(rl, "guest-1", [front, studio], attempts=2)
+
+        assert result.ok
+        assert labels(result.granted) == ["main/front"]
+        assert "main/studio (offline)" in result.describe_failures()
+
+    def test_required_lock_failure_is_not_ok(self):
+        rl = MagicMock()
+        rl.grant_lock_access.side_effect = RuntimeError("offline")
+
+        result = grant_locks(rl, "guest-1", [Lock("lock-front", "front", required=True)], attempts=1)
+
+        assert not result.ok
+
+    def test_held_locks_are_not_granted_again(self):
+        front, studio = Lock("lock-front", "front"), Lock("lock-studio", "studio")
+        rl = MagicMock()
+
+        result = grant_locks(rl, "guest-1", [front, studio], held=[front])
+
+        rl.grant_lock_access.assert_called_once_with("guest-1", "lock-studio", LOCK_SCHEDULE_ID)
+        assert labels(result.granted) == ["main/front", "main/studio"]
+
+
+class TestCreateDoorCodeTopology:
+    @freeze_time("2026-04-29 14:00:00")
+    def test_membership_gets_every_mapped_lock(self, multi_site):
+        rl = MagicMock()
+        rl.create_access_person.return_value = ("guest-1", "1234")
+
+        with patch("bstrong.services.send_sms", return_value=True):
+            assert create_door_code("John", "Doe", "+15085551234", "Best Rate!!! One Year (PIF)", rl) == (True, "guest-1")
+
+        granted = sorted(c.args[1:] for c in rl.grant_lock_access.call_args_list)
+        assert granted == [("lock-front", LOCK_SCHEDULE_ID), ("lock-north", LOCK_SCHEDULE_ID), ("lock-studio", "sched-studio")]
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_failed_optional_lock_still_sends_code_and_alerts(self, multi_site):
+        rl = MagicMock()
+        rl.create_access_person.return_value = ("guest-1", "1234")
+        rl.grant_lock_access.side_effect = fail_on("lock-north")
+
+        with patch("bstrong.services.send_sms", return_value=True) as mock_sms, \
+             patch("bstrong.services.send_Dev") as mock_dev, \
+             patch("bstrong.topology.time.sleep"):
+            assert create_door_code("John", "Doe", "+15085551234", "Best Rate!!! One Year (PIF)", rl) == (True, "guest-1")
+
+        mock_sms.assert_called_once()
+        assert "north/front" in mock_dev.call_args[0][0]
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_failed_required_lock_fails_the_code(self, multi_site):
+        rl = MagicMock()
+        rl.create_access_person.return_value = ("guest-1", "1234")
+        rl.grant_lock_access.side_effect = RuntimeError("offline")
+
+        with patch("bstrong.services.send_sms") as mock_sms, \
+             patch("bstrong.services.send_Dev") as mock_dev, \
+             patch("bstrong.topology.time.sleep"):
+            assert create_door_code("John", "Doe", "+15085551234", "1 week pass", rl) == (False, None)
+
+        mock_sms.assert_not_called()
+        assert "main/front" in mock_dev.call_args[0][0]
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_pooled_guest_only_gets_locks_beyond_the_default(self, multi_site):
+        db = InMemoryDatabase()
+        db.add(POOL_COLLECTION, "g-pooled", {"pin": "1111"})
+        rl = MagicMock()
+
+        with patch("bstrong.services.send_sms", return_value=True):
+            result = create_door_code("John", "Doe", "+15085551234", "Best Rate!!! One Year (PIF)", rl,
+                                      guest_pool=GuestPool(db, rl, target_size=1))
+
+        assert result == (True, "g-pooled")
+        rl.grant_lock_access.assert_called_once_with("g-pooled", "lock-north", LOCK_SCHEDULE_ID)
+
+    @freeze_time("2026-04-29 14:00:00")
+    def test_pool_is_skipped_when_membership_opens_fewer_locks(self, multi_site):
+        db = InMemoryDatabase()
+        db.add(POOL_COLLECTION, "g-pooled", {"pin": "1111"})
+        rl = MagicMock()
+        rl.create_access_person.return_value = ("guest-new", "4321")
+
+        with patch("bstrong.services.send_sms", return_value=True):
+            result = create_door_code("John", "Doe", "+15085551234", "Day Pass", rl,
+                                      guest_pool=GuestPool(db, rl, target_size=1))
+
+        assert result == (True, "guest-new")
+        assert db.countDocuments(POOL_COLLECTION) == 1
+        rl.grant_lock_access.assert_called_once_with("guest-new", "lock-front", LOCK_SCHEDULE_ID)
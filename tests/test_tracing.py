@@ -0,0 +1,143 @@
+import json
+import logging
+import pytest
+from unittest.mock import patch
+
+from bstrong import tracing
+from bstrong.metrics import vendor_call
+from bstrong.tracing import (JsonLinesExporter, TraceIdFilter, current_trace_id, span,
+                             start_trace, trace_headers, TRACE_HEADER)
+from tests.conftest import TEST_CONFIG
+
+
+class ListExporter:
+    def __init__(self):
+        self.traces = []
+
+    def export(self, trace):
+        self.traces.append(trace)
+
+
+@pytest.fixture
+def exporter():
+    exporter = ListExporter()
+    with patch.object(tracing, '_exporter', exporter):
+        yield exporter
+
+
+# ---- Spans ----------------------------------------------------------------
+
+class TestSpans:
+    def test_span_outside_trace_is_noop(self, exporter):
+        with span('lonely') as s:
+            assert s is None
+        assert exporter.traces == []
+        assert trace_headers() == {}
+
+    def test_nested_spans_record_parent(self, exporter):
+        with start_trace('req') as trace:
+            with span('outer') as outer:
+                with span('inner') as inner:
+                    pass
+
+        assert exporter.traces == [trace]
+        assert [s.name for s in trace.spans] == ['inner', 'outer']
+        assert inner.parent_id == outer.span_id
+        assert outer.parent_id is None
+
+    def test_span_records_error(self, exporter):
+        with start_trace('req') as trace:
+            with pytest.raises(ValueError):
+                with span('boom'):
+                    raise ValueError('bad')
+        assert trace.spans[0].error == 'ValueError: bad'
+
+    def test_vendor_call_becomes_span(self, exporter):
+        @vendor_call('remotelock', 'grant_lock_access')
+        def grant():
+            return True
+
+        with start_trace('req') as trace:
+            grant()
+        assert trace.spans[0].name == 'remotelock.grant_lock_access'
+
+    def test_trace_context_cleared_after_trace(self, exporter):
+        with start_trace('req', trace_id='abcdef123456'):
+            assert current_trace_id() == 'abcdef123456'
+            assert trace_headers() == {TRACE_HEADER: 'abcdef123456'}
+        assert current_trace_id() is None
+
+    def test_invalid_inbound_trace_id_replaced(self, exporter):
+        with start_trace('req', trace_id='bad id\n') as trace:
+            pass
+        assert trace.trace_id != 'bad id\n'
+
+
+# ---- Exporters / logging ----------------------------------------------------
+
+class TestExportAndLogging:
+    def test_jsonl_exporter_writes_one_line_per_trace(self, tmp_path):
+        path = tmp_path / 'traces.jsonl'
+        with patch.object(tracing, '_exporter', JsonLinesExporter(str(path))):
+            with start_trace('req') as trace:
+                with span('firestore.getData'):
+                    pass
+            with start_trace('req2'):
+                pass
+
+        lines = path.read_text().splitlines()
+        assert len(lines) == 2
+        first = json.loads(lines[0])
+        assert first['trace_id'] == trace.trace_id
+        assert first['spans'][0]['name'] == 'firestore.getData'
+        assert 'perf_start' not in first
+
+    def test_jsonl_exporter_rotates_at_max_bytes(self, tmp_path):
+        path = tmp_path / 'traces.jsonl'
+        with patch.object(tracing, '_exporter', JsonLinesExporter(str(path), max_bytes=1)):
+            with start_trace('first'):
+                pass
+            with start_trace('second'):
+                pass
+
+        assert not path.exists()
+        assert json.loads((tmp_path / 'traces.jsonl.1').read_text())['name'] == 'second'
+
+    def test_default_exporter_is_off(self, monkeypatch):
+        monkeypatch.delenv('TRACE_EXPORTER', raising=False)
+        assert isinstance(tracing._default_exporter(), tracing.NullExporter)
+        monkeypatch.setenv('TRACE_EXPORTER', 'jsonl')
+        assert isinstance(tracing._default_exporter(), JsonLinesExporter)
+
+    def test_log_filter_adds_trace_id(self, exporter):
+        record = logging.LogRecord('x', logging.INFO, __file__, 1, 'msg', None, None)
+        TraceIdFilter().filter(record)
+        assert record.trace_id == '-'
+        with start_trace('req', trace_id='trace-0001'):
+            TraceIdFilter().filter(record)
+        assert record.trace_id == 'trace-0001'
+
+
+# ---- Request integration -----------------------------------------------------
+
+class TestRequestTracing:
+    def test_webhook_trace_exported_with_spans(self, app_client, exporter):
+        client, mock_db, *_ = app_client
+        mock_db.checkIfExists.return_value = True
+
+        resp = client.post('/webhook-transaction',
+                           json={'payload': {'itemSold': '1 month gym membership', 'customerId': 'C1',
+                                             'purchaseType': 'Membership', 'userPaymentId': 'P1'}},
+                           headers={'X-Vagaro-Signature': TEST_CONFIG['TRANSACTION_TOKEN'],
+                                    TRACE_HEADER: 'cloudflare-trace-1'})
+
+        assert resp.headers[TRACE_HEADER] == 'cloudflare-trace-1'
+        trace, = exporter.traces
+        assert trace.name == 'POST /webhook-transaction'
+        assert trace.status == 200
+        assert 'transaction.dedupe' in [s.name for s in trace.spans]
+
+    def test_health_not_traced(self, app_client, exporter):
+        client, *_ = app_client
+        client.get('/health')
+        assert exporter.traces == []
@@ -1,5 +1,5 @@
 import pytest
-from bstrong.utils import fix_phone_number
+from bstrong.utils import fix_phone_number, parse_form_answers
 
 
 class TestFixPhoneNumber:
@@ -43,3 +43,18 @@ class TestFixPhoneNumber:
     def test_developer_phone_number_valid(self):
         result = fix_phone_number('7745218808')
         assert result == {'valid': True, 'number': '+17745218808'}
+
+
+class TestParseFormAnswers:
+    def test_strips_html_and_maps_fields(self):
+        answers = parse_form_answers([
+            {'question': 'First Name', 'answer': ['<p>John</p>']},
+            {'question': 'Last Name', 'answer': [' Doe ']},
+            {'question': 'CELL # (mobile)', 'answer': ['<b>508-555-1234</b>']},
+            {'question': 'Emergency contact', 'answer': ['Jane']},
+        ])
+        assert answers == {'first_name': 'John', 'last_name': 'Doe', 'phone_number': '508-555-1234'}
+
+    def test_empty_answers_skipped(self):
+        answers = parse_form_answers([{'question': 'First Name', 'answer': []}])
+        assert answers['first_name'] is None